@@ -0,0 +1,308 @@
+# plugins/analytics.py
+"""
+Analytical SQL over a columnar mirror of the databases: /-/analytics?sql=...
+
+GROUP BY and other aggregate queries over large tables are slow in SQLite,
+which reads every row (body text and all) to aggregate a couple of columns,
+and they hold one of Datasette's few executor threads while they run. The
+refresh pipeline already writes each table as Parquet (scripts/
+export_artifacts.py, with ZEEKER_EXPORTS and pyarrow installed). This
+endpoint runs read-only SELECT queries over those files with an embedded
+DuckDB, which reads only the columns a query uses and runs on its own
+threads, never on the SQLite executor.
+
+Each mirrored table is a view named <database>.<table>; a table name found
+in only one database also works on its own. Results
+use Datasette's query JSON shape (columns, rows, truncated, query_ms) and
+its _shape=objects and _shape=array options. Without sql, the endpoint
+lists the mirrored tables.
+
+Only a single SELECT statement is accepted, and DuckDB itself is locked
+down: no file access outside the mirror, no extensions, no configuration
+changes. The views span every mirrored table, so queries need execute-sql
+and view-database permission on every mirrored database and view-table
+permission on every mirrored table; the listing shows only the tables the
+actor may view.
+Needs duckdb, from the columnar extra (uv sync --extra columnar).
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-analytics": {
+            "directory": "data/exports",   # default: exports/ beside the databases
+            "threads": 2,                  # DuckDB threads per query
+            "memory_limit": "1GB",
+            "max_concurrent": 2,           # queries running at once
+            "time_limit_ms": 10000,
+            "max_rows": null               # default: Datasette's max_returned_rows
+        }
+    }
+"""
+import asyncio
+import base64
+import datetime
+import decimal
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from datasette import hookimpl
+from datasette.utils.asgi import Forbidden, Response
+
+try:
+    from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME
+except ImportError:
+    # Loaded by Datasette from plugins_dir: the scripts package is beside it
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME
+
+PLUGIN_NAME = "zeeker-analytics"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "directory": None,
+    "threads": 2,
+    "memory_limit": "1GB",
+    "max_concurrent": 2,
+    "time_limit_ms": 10000,
+    "max_rows": None,
+}
+
+
+class AnalyticsError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _duckdb_identifier(name):
+    """DuckDB has no [name] quoting, so Datasette's escape_sqlite does not fit here"""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _literal(value):
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.timedelta, uuid.UUID)):
+        return str(value)
+    if isinstance(value, bytes):
+        return {"$base64": True, "encoded": base64.b64encode(value).decode("latin-1")}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ColumnarMirror:
+    """
+    A DuckDB connection with a view per mirrored table, rebuilt when the
+    export manifest changes.
+    """
+
+    def __init__(self, directory, threads=2, memory_limit="1GB"):
+        self.directory = Path(directory) if directory else None
+        self.threads = threads
+        self.memory_limit = memory_limit
+        self.tables = {}  # database → {table: parquet path}
+        self._connection = None
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def connection(self):
+        """The current connection (None without a mirror); reloads a changed manifest"""
+        if self.directory is None:
+            return None
+        try:
+            stat = (self.directory / MANIFEST_FILENAME).stat()
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                self._load(stamp)
+            return self._connection
+
+    def _load(self, stamp):
+        import duckdb
+
+        manifest = json.loads((self.directory / MANIFEST_FILENAME).read_text())
+        tables = {
+            database: {
+                table: self.directory.resolve() / info["files"]["parquet"]["path"]
+                for table, info in recorded["tables"].items() if "parquet" in info["files"]
+            }
+            for database, recorded in manifest.get("databases", {}).items()
+        }
+        tables = {database: files for database, files in tables.items() if files}
+        connection = duckdb.connect(":memory:", config={
+            "threads": int(self.threads), "memory_limit": str(self.memory_limit),
+        })
+        for database, files in tables.items():
+            connection.execute(f"CREATE SCHEMA {_duckdb_identifier(database)}")
+            for table, path in files.items():
+                view = f"{_duckdb_identifier(database)}.{_duckdb_identifier(table)}"
+                connection.execute(f"CREATE VIEW {view} AS SELECT * FROM read_parquet({_literal(path)})")
+        # Table names found in only one database also get a view in main
+        names = Counter(table for files in tables.values() for table in files)
+        for database, files in tables.items():
+            for table in files:
+                if names[table] == 1:
+                    qualified = f"{_duckdb_identifier(database)}.{_duckdb_identifier(table)}"
+                    connection.execute(f"CREATE VIEW {_duckdb_identifier(table)} AS SELECT * FROM {qualified}")
+        connection.execute(f"SET allowed_directories = [{_literal(str(self.directory.resolve()) + '/')}]")
+        connection.execute("SET enable_external_access = false")
+        connection.execute("SET autoinstall_known_extensions = false")
+        connection.execute("SET autoload_known_extensions = false")
+        connection.execute("SET lock_configuration = true")
+        if self._connection is not None:
+            logger.info("Columnar mirror reloaded")
+        self._connection, self.tables, self._stamp = connection, tables, stamp
+
+    def cursor(self, sql):
+        """A cursor for sql, once it is known to be a single SELECT statement"""
+        import duckdb
+
+        connection = self.connection()
+        if connection is None or not self.tables:
+            raise AnalyticsError("No columnar mirror is available", status=503)
+        try:
+            statements = connection.extract_statements(sql)
+        except duckdb.Error as e:
+            raise AnalyticsError(str(e))
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise AnalyticsError("Statement must be a single SELECT")
+        return connection.cursor()
+
+
+def run_query(cursor, sql, max_rows):
+    """(columns, rows, truncated); runs on an analytics thread"""
+    import duckdb
+
+    try:
+        cursor.execute(sql)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+    except duckdb.InterruptException:
+        raise
+    except duckdb.Error as e:
+        raise AnalyticsError(str(e))
+    finally:
+        cursor.close()
+    return columns, rows[:max_rows], len(rows) > max_rows
+
+
+class Analytics:
+    def __init__(self, datasette, config):
+        self.config = config
+        directory = config["directory"]
+        if not directory:
+            paths = [db.path for name, db in datasette.databases.items() if db.path and name != "_internal"]
+            directory = Path(paths[0]).parent / EXPORTS_DIRNAME if paths else None
+        self.mirror = ColumnarMirror(directory, config["threads"], config["memory_limit"])
+        self.executor = ThreadPoolExecutor(max_workers=int(config["max_concurrent"]),
+                                           thread_name_prefix="zeeker-analytics")
+        self.max_rows = int(config["max_rows"] or datasette.setting("max_returned_rows"))
+        self.queries = 0
+        self.timeouts = 0
+
+    async def execute(self, sql):
+        cursor = await asyncio.get_running_loop().run_in_executor(self.executor, self.mirror.cursor, sql)
+        future = asyncio.get_running_loop().run_in_executor(self.executor, run_query, cursor, sql, self.max_rows)
+        self.queries += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.config["time_limit_ms"] / 1000)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            cursor.interrupt()
+            await asyncio.gather(future, return_exceptions=True)
+            raise AnalyticsError("Analytics query took too long")
+
+    def stats(self):
+        return {"queries": self.queries, "timeouts": self.timeouts,
+                "tables": sum(len(files) for files in self.mirror.tables.values())}
+
+
+def get_analytics(datasette):
+    analytics = getattr(datasette, "_zeeker_analytics", None)
+    if analytics is None:
+        analytics = Analytics(datasette, dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {})))
+        datasette._zeeker_analytics = analytics
+    return analytics
+
+
+def error_response(message, status):
+    return Response.json({"ok": False, "error": message, "status": status, "title": None}, status=status)
+
+
+async def visible_tables(datasette, actor, tables):
+    """{database: [table]} of the mirrored tables actor may view, checked as the table page does"""
+    visible = {}
+    for database, files in tables.items():
+        for table in sorted(files):
+            allowed, _ = await datasette.check_visibility(
+                actor,
+                permissions=[("view-table", (database, table)), ("view-database", database), "view-instance"],
+            )
+            if allowed:
+                visible.setdefault(database, []).append(table)
+    return visible
+
+
+async def analytics_query(request, datasette):
+    await datasette.ensure_permissions(request.actor, ["view-instance"])
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return error_response("Analytics queries require duckdb to be installed", 501)
+    analytics = get_analytics(datasette)
+    sql = (request.args.get("sql") or "").strip()
+
+    try:
+        # Loads the manifest, so mirror.tables lists every table the query can read
+        await asyncio.get_running_loop().run_in_executor(analytics.executor, analytics.mirror.connection)
+        tables = analytics.mirror.tables
+        visible = await visible_tables(datasette, request.actor, tables)
+        if not sql:
+            return Response.json({"ok": True, "databases": visible})
+        for database in tables:
+            await datasette.ensure_permissions(
+                request.actor, [("execute-sql", database), ("view-database", database), "view-instance"]
+            )
+        if visible != {database: sorted(files) for database, files in tables.items()}:
+            raise Forbidden("view-table")
+        start = time.perf_counter()
+        columns, rows, truncated = await analytics.execute(sql)
+    except AnalyticsError as e:
+        return error_response(str(e), e.status)
+
+    shape = request.args.get("_shape", "arrays")
+    if shape in ("objects", "array"):
+        rows = [dict(zip(columns, row)) for row in rows]
+    if shape == "array":
+        data = rows
+    else:
+        data = {
+            "ok": True,
+            "rows": [list(row) for row in rows] if shape == "arrays" else rows,
+            "truncated": truncated,
+            "columns": columns,
+            "query": {"sql": sql, "params": {}},
+            "query_ms": (time.perf_counter() - start) * 1000,
+        }
+    return Response(json.dumps(data, default=_json_default), content_type="application/json; charset=utf-8")
+
+
+@hookimpl
+def register_routes():
+    return [
+        (r"^/-/analytics(\.json)?$", analytics_query),
+    ]
@@ -0,0 +1,516 @@
+# plugins/cross_search.py
+"""
+Cross-database full-text search at /-/search.json
+
+datasette-search-all discovers searchable tables one by one on every request
+and leaves the browser to query each table separately. This endpoint:
+
+- discovers FTS-enabled tables once per data version
+- runs the FTS query against every table concurrently
+- merges the hits by bm25 rank (FTS5; FTS3/4 hits rank last) under one limit
+- only searches the tables the actor may view, checking view-table,
+  view-database and view-instance as the table page does
+- caches results per normalized query in an LRU keyed by the data version
+  (each database file's size and mtime), so a refresh invalidates it, and
+  by the set of tables the actor may view, so results are never shared
+  with an actor who could not see them
+
+When the unified search index built by scripts/search_index.py is present
+(zeeker-search.sqlite next to the served databases, or the "index" setting),
+the per-table fan-out is replaced by one query against it, ranked by bm25
+over every database at once.
+
+Search-as-you-type suggestions come from the index's prefix-indexed suggest
+table (titles, and values of "suggest" columns such as party names), or from
+prefix queries against each table's FTS index when there is no unified index:
+
+    GET /-/search.json?q=contract+law&limit=20
+    GET /-/suggest.json?q=contr&limit=8
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-search": {
+            "limit": 20,          # default results per query
+            "max_limit": 100,     # upper bound for ?limit=
+            "cache_size": 256,    # cached queries
+            "suggest_limit": 8,   # default suggestions per query
+            "index": null         # unified index path, if not beside the databases
+        }
+    }
+"""
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from pathlib import Path
+from urllib.parse import urlencode
+
+from datasette import hookimpl
+from datasette.database import Results
+from datasette.utils import escape_fts, escape_sqlite, path_from_row_pks, sqlite_timelimit
+from datasette.utils.asgi import Response
+
+try:
+    from scripts.search_index import SEARCH_INDEX_FILENAME
+except ImportError:
+    # Loaded by Datasette from plugins_dir: the scripts package is beside it
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from scripts.search_index import SEARCH_INDEX_FILENAME
+
+PLUGIN_NAME = "zeeker-search"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "limit": 20,
+    "max_limit": 100,
+    "cache_size": 256,
+    "index": None,
+    "suggest_limit": 8,
+}
+
+# Shorter inputs match too much to be useful suggestions
+SUGGEST_MIN_LENGTH = 2
+
+# bm25 weights for the unified index's title and body columns
+_INDEX_WEIGHTS = "10.0, 1.0"
+
+# Snippet highlight markers, swapped for <mark> after HTML escaping
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Restricts unified index rows to the JSON list of [database, table] pairs in :visible
+_VISIBLE_FILTER = (
+    "(database, tbl) IN (SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:visible))"
+)
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, max_size):
+        self.max_size = int(max_size)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+class UnifiedIndex:
+    """
+    Read-only connections to one version of the unified index file, one per
+    executor thread. It is not added to datasette.databases, so the index is
+    never served itself; when the file is replaced the SearchIndex drops this
+    object, and its connections close with it.
+    """
+
+    def __init__(self, datasette, path):
+        self.datasette = datasette
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params):
+        conn = self._connection()
+        with sqlite_timelimit(conn, self.datasette.setting("sql_time_limit_ms")):
+            cursor = conn.execute(sql, params or {})
+            return Results(cursor.fetchall(), False, cursor.description)
+
+    async def execute(self, sql, params=None):
+        if self.datasette.executor is None:
+            return self._execute(sql, params)
+        return await asyncio.get_running_loop().run_in_executor(self.datasette.executor, self._execute, sql, params)
+
+
+class SearchIndex:
+    """Searchable tables and cached results for one Datasette instance"""
+
+    def __init__(self, config):
+        self.config = config
+        self.cache = LRUCache(config["cache_size"])
+        self.version = None
+        self.tables = []
+        self.served_tables = []
+        self.index_db = None
+
+    def index_path(self, datasette):
+        """Location of the unified search index"""
+        if self.config["index"]:
+            return Path(self.config["index"])
+        for db in datasette.databases.values():
+            if db.path:
+                return Path(db.path).parent / SEARCH_INDEX_FILENAME
+        return None
+
+    def data_version(self, datasette):
+        """Changes whenever a database or the unified index is added, removed or replaced"""
+        files = [(name, db.path) for name, db in sorted(datasette.databases.items())]
+        files.append((None, self.index_path(datasette)))
+        version = []
+        for name, path in files:
+            if path and os.path.exists(path):
+                stat = os.stat(path)
+                version.append((name, stat.st_size, stat.st_mtime_ns))
+            else:
+                version.append((name, None, None))
+        return tuple(version)
+
+    async def refresh(self, datasette):
+        """Rediscover tables and reopen the unified index when the data changed"""
+        version = self.data_version(datasette)
+        if version != self.version:
+            self.tables = await discover_tables(datasette)
+            self.served_tables = await served_tables(datasette)
+            path = self.index_path(datasette)
+            self.index_db = UnifiedIndex(datasette, path) if version[-1][1] is not None else None
+            self.version = version
+
+    async def searchable_tables(self, datasette):
+        """[{database, table, fts_table, fts5, pks, title}] for the current data"""
+        await self.refresh(datasette)
+        return self.tables
+
+    async def visible_tables(self, datasette, actor):
+        """frozenset of the (database, table) pairs actor may view, for the current data"""
+        await self.refresh(datasette)
+        visible = set()
+        for database, table in self.served_tables:
+            allowed, _ = await datasette.check_visibility(
+                actor,
+                permissions=[("view-table", (database, table)), ("view-database", database), "view-instance"],
+            )
+            if allowed:
+                visible.add((database, table))
+        return frozenset(visible)
+
+
+async def served_tables(datasette):
+    """(database, table) for every table of the served databases"""
+    tables = []
+    for name, db in datasette.databases.items():
+        if name == "_internal":
+            continue
+        tables.extend((name, table) for table in await db.table_names())
+    return tables
+
+
+async def discover_tables(datasette):
+    tables = []
+    for name, db in datasette.databases.items():
+        if name == "_internal":
+            continue
+        hidden = set(await db.hidden_table_names())
+        for table in await db.table_names():
+            if table in hidden:
+                continue
+            fts_table = await db.fts_table(table)
+            if not fts_table:
+                continue
+            fts_sql = (await db.execute(
+                "SELECT sql FROM sqlite_master WHERE name = ?", [fts_table]
+            )).first()[0] or ""
+            pks = await db.primary_keys(table)
+            tables.append({
+                "database": name,
+                "table": table,
+                "fts_table": fts_table,
+                "fts5": "fts5" in fts_sql.lower(),
+                "pks": pks,
+                "title": await db.label_column_for_table(table) or (await db.table_columns(fts_table))[0],
+            })
+    return tables
+
+
+def normalize_query(q):
+    return _WHITESPACE.sub(" ", q or "").strip().lower()
+
+
+def get_index(datasette):
+    """The SearchIndex for this Datasette instance, created on first use"""
+    index = getattr(datasette, "_zeeker_search", None)
+    if index is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        index = datasette._zeeker_search = SearchIndex(config)
+        # Reported on /-/perf
+        if not hasattr(datasette, "_zeeker_caches"):
+            datasette._zeeker_caches = {}
+        datasette._zeeker_caches["search"] = index.cache
+    return index
+
+
+def snippet_html(text):
+    escaped = html.escape(text or "")
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+async def search_table(datasette, info, query, limit):
+    """Top `limit` hits in one table, best (lowest bm25) first"""
+    fts = escape_sqlite(info["fts_table"])
+    table = escape_sqlite(info["table"])
+    key_columns = ", ".join(f"t.{escape_sqlite(pk)}" for pk in info["pks"]) or "t.rowid"
+    if info["fts5"]:
+        # FTS5 sorts by its rank column itself, so snippet() only runs for the rows returned
+        rank = f"{fts}.rank"
+        snippet = f"snippet({fts}, -1, '{_MARK_START}', '{_MARK_END}', '…', 16)"
+    else:
+        rank = "0"
+        snippet = f"snippet({fts}, '{_MARK_START}', '{_MARK_END}', '…', -1, 16)"
+    sql = (
+        f"SELECT t.rowid AS rowid, {key_columns}, t.{escape_sqlite(info['title'])} AS _title, "
+        f"{snippet} AS _snippet, {rank} AS _rank "
+        f"FROM {fts} JOIN {table} t ON t.rowid = {fts}.rowid "
+        f"WHERE {fts} MATCH :query ORDER BY {rank} LIMIT {int(limit)}"
+    )
+    db = datasette.get_database(info["database"])
+    results = await db.execute(sql, {"query": query})
+    hits = []
+    for row in results.rows:
+        path = path_from_row_pks(row, info["pks"], not info["pks"])
+        hits.append({
+            "database": info["database"],
+            "table": info["table"],
+            "key": [row[pk] for pk in info["pks"]] or [row["rowid"]],
+            "title": row["_title"],
+            "snippet": snippet_html(row["_snippet"]),
+            "rank": row["_rank"],
+            "url": datasette.urls.row(info["database"], info["table"], path),
+        })
+    return hits
+
+
+async def search_all(datasette, query, limit, visible):
+    """
+    Query every searchable table in `visible` concurrently and merge by rank.
+    Returns (hits, searched table count, errors).
+    """
+    tables = [
+        info for info in await get_index(datasette).searchable_tables(datasette)
+        if (info["database"], info["table"]) in visible
+    ]
+    results = await asyncio.gather(
+        *(search_table(datasette, info, query, limit) for info in tables), return_exceptions=True
+    )
+    hits, errors = [], []
+    for info, result in zip(tables, results):
+        if isinstance(result, Exception):
+            errors.append({"database": info["database"], "table": info["table"], "error": str(result)})
+        else:
+            hits.extend(result)
+    hits.sort(key=lambda hit: hit["rank"])
+    return hits[:limit], len(tables), errors
+
+
+async def search_unified(datasette, index_db, query, limit, visible):
+    """
+    One query against the unified index, restricted to the (database, table)
+    pairs in `visible`. Returns (hits, tables covered, errors) like search_all.
+    """
+    results = await index_db.execute(
+        f"SELECT database, tbl, row_key, title, "
+        f"snippet(search, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS _snippet, "
+        f"rank AS _rank FROM search "
+        f"WHERE search MATCH :query AND rank MATCH 'bm25({_INDEX_WEIGHTS})' AND {_VISIBLE_FILTER} "
+        f"ORDER BY rank LIMIT {int(limit)}",
+        {"query": query, "visible": json.dumps(sorted(visible))},
+    )
+    # sources.settings lists each database's indexed tables
+    sources = await index_db.execute("SELECT database, settings FROM sources")
+    covered = sum(
+        (row["database"], spec["table"]) in visible
+        for row in sources.rows for spec in json.loads(row["settings"])
+    )
+    hits = []
+    for row in results.rows:
+        key = json.loads(row["row_key"])
+        hits.append({
+            "database": row["database"],
+            "table": row["tbl"],
+            "key": key,
+            "title": row["title"],
+            "snippet": snippet_html(row["_snippet"]),
+            "rank": row["_rank"],
+            "url": datasette.urls.row(row["database"], row["tbl"], path_from_row_pks(key, range(len(key)), False)),
+        })
+    return hits, covered, []
+
+
+async def run_search(datasette, index, query, limit, visible):
+    """Search the unified index when present, falling back to the per-table fan-out"""
+    if index.index_db:
+        try:
+            return (*await search_unified(datasette, index.index_db, query, limit, visible), "index")
+        except Exception as e:
+            logger.warning(f"Unified search index failed, searching tables instead: {e}")
+    return (*await search_all(datasette, query, limit, visible), "tables")
+
+
+def prefix_query(q):
+    """FTS5 query matching q's words, the last one as a prefix"""
+    words = ['"{}"'.format(word.replace('"', '""')) for word in q.split()]
+    return " ".join(words) + "*"
+
+
+async def suggest_unified(datasette, index_db, query, limit, visible):
+    """
+    Suggestions from the unified index's suggest table, in index order (most
+    frequent values, then titles), from the (database, table) pairs in
+    `visible`. bm25 would have to score every match of a short prefix; rowid
+    order lets FTS5 stop after the first few.
+    """
+    results = await index_db.execute(
+        f"SELECT text, database, tbl, row_key, kind FROM suggest "
+        f"WHERE suggest MATCH :query AND {_VISIBLE_FILTER} "
+        f"ORDER BY rowid LIMIT {int(limit) * 2}",
+        {"query": query, "visible": json.dumps(sorted(visible))},
+    )
+    suggestions, seen = [], set()
+    for row in results.rows:
+        if row["row_key"] is None:
+            # A value such as a party name, shared by many rows: search for it
+            if (row["kind"], row["text"]) in seen:
+                continue
+            seen.add((row["kind"], row["text"]))
+            url = datasette.urls.path("/-/search") + "?" + urlencode({"q": row["text"]})
+        else:
+            key = json.loads(row["row_key"])
+            url = datasette.urls.row(row["database"], row["tbl"], path_from_row_pks(key, range(len(key)), False))
+        suggestions.append({
+            "text": row["text"],
+            "kind": row["kind"],
+            "database": row["database"],
+            "table": row["tbl"],
+            "url": url,
+        })
+    return suggestions[:limit]
+
+
+async def run_suggest(datasette, index, q, limit, visible):
+    """Suggestions from the unified index when present, else from table titles"""
+    query = prefix_query(q)
+    if index.index_db:
+        try:
+            return await suggest_unified(datasette, index.index_db, query, limit, visible), "index"
+        except Exception as e:
+            logger.warning(f"Unified search index failed, suggesting from tables instead: {e}")
+    hits, _, _ = await search_all(datasette, query, limit, visible)
+    return [
+        {"text": hit["title"], "kind": "title", "database": hit["database"], "table": hit["table"],
+         "url": hit["url"]}
+        for hit in hits
+    ], "tables"
+
+
+def parse_limit(request, default, maximum):
+    """?limit= clamped to 1..maximum; ValueError when it is not an integer"""
+    limit = int(request.args.get("limit") or default)
+    return max(1, min(limit, int(maximum)))
+
+
+async def suggest_json(request, datasette):
+    index = get_index(datasette)
+    q = normalize_query(request.args.get("q"))
+    try:
+        limit = parse_limit(request, index.config["suggest_limit"], index.config["max_limit"])
+    except ValueError:
+        return Response.json({"ok": False, "error": "limit must be an integer"}, status=400)
+
+    if len(q) < SUGGEST_MIN_LENGTH:
+        return Response.json({"ok": True, "q": q, "suggestions": []})
+
+    start = time.perf_counter()
+    visible = await index.visible_tables(datasette, request.actor)
+    key = ("suggest", q, limit, index.version, visible)
+    cached = index.cache.get(key)
+    if cached is None:
+        suggestions, source = await run_suggest(datasette, index, q, limit, visible)
+        cached = {"suggestions": suggestions, "source": source}
+        index.cache.set(key, cached)
+        hit = False
+    else:
+        hit = True
+
+    return Response.json(dict(
+        cached, ok=True, q=q, cached=hit,
+        duration_ms=(time.perf_counter() - start) * 1000,
+    ))
+
+
+async def search_json(request, datasette):
+    index = get_index(datasette)
+    q = normalize_query(request.args.get("q"))
+    try:
+        limit = parse_limit(request, index.config["limit"], index.config["max_limit"])
+    except ValueError:
+        return Response.json({"ok": False, "error": "limit must be an integer"}, status=400)
+
+    if not q:
+        return Response.json({"ok": True, "q": q, "results": [], "tables_searched": 0})
+
+    start = time.perf_counter()
+    visible = await index.visible_tables(datasette, request.actor)
+    key = (q, limit, index.version, visible)
+    cached = index.cache.get(key)
+    if cached is None:
+        hits, searched, errors, source = await run_search(datasette, index, escape_fts(q), limit, visible)
+        cached = {"results": hits, "tables_searched": searched, "errors": errors, "source": source}
+        if not errors:
+            index.cache.set(key, cached)
+        hit = False
+    else:
+        hit = True
+
+    return Response.json(dict(
+        cached, ok=True, q=q, limit=limit, cached=hit,
+        duration_ms=(time.perf_counter() - start) * 1000,
+    ))
+
+
+@hookimpl
+def register_routes():
+    return [
+        (r"^/-/search\.json$", search_json),
+        (r"^/-/suggest\.json$", suggest_json),
+    ]
@@ -0,0 +1,134 @@
+# plugins/keyset_pages.py
+"""
+Sorted table pages that cost one page of rows however deep they go
+
+Datasette pages tables with keyset _next tokens, so page N of
+/db/table?_sort=col asks SQLite for the rows after the previous page's last
+(col, primary key). With an index led by col that is an index range read of
+one page; without one, every page sorts the whole table again, and scrolling
+far into a large table gets slower than page one by the table's size.
+
+scripts/sort_indexes.py builds descending idx_zeeker_sort_* indexes on the
+sortable columns of large tables at download time (ZEEKER_SORT_INDEXES with
+the optimize stage). At startup this plugin finds the tables that have them
+and, through the get_metadata hook, limits their sortable_columns to the
+columns an index keeps in order: the primary key, the leading column of any
+index (SQLite walks an index in either direction), and the table's own
+sort/sort_desc. Sorting such a table
+by anything else (a body text column left unindexed because of its size) is
+rejected instead of re-sorting the whole table for each page. Tables with
+sortable_columns set in metadata.json keep them, and tables without sort
+indexes keep Datasette's default of every column.
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-keyset": {
+            "min_rows": 10000,        # smaller tables sort quickly, any column
+            "restrict_sorts": true    # false only reports the indexed columns
+        }
+    }
+"""
+import logging
+
+from datasette import hookimpl
+from datasette.utils import escape_sqlite
+
+PLUGIN_NAME = "zeeker-keyset"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "min_rows": 10000,
+    "restrict_sorts": True,
+}
+
+# Prefix of the indexes scripts/sort_indexes.py builds
+INDEX_PREFIX = "idx_zeeker_sort_"
+
+SKIP_DATABASES = {"_internal"}
+
+
+def indexed_sorts(conn, min_rows):
+    """
+    {table: columns kept in order by an index} for the tables with sort
+    indexes and at least min_rows rows; runs on a database connection.
+    """
+    rows = {}
+    if conn.execute("select 1 from sqlite_master where name = 'sqlite_stat1'").fetchone():
+        for table, stat in conn.execute("select tbl, stat from sqlite_stat1"):
+            if stat:
+                rows[table] = max(rows.get(table, 0), int(stat.split(" ")[0]))
+
+    tables = {}
+    for (table,) in conn.execute(
+        "select distinct tbl_name from sqlite_master where type = 'index' and name like ? escape '\\'",
+        [INDEX_PREFIX.replace("_", "\\_") + "%"],
+    ):
+        if table not in rows:
+            rows[table] = conn.execute(f"select count(*) from {escape_sqlite(table)}").fetchone()[0]
+        if rows[table] < min_rows:
+            continue
+        info = list(conn.execute(f"PRAGMA table_info({escape_sqlite(table)})"))
+        columns = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+        for index in conn.execute(f"PRAGMA index_list({escape_sqlite(table)})"):
+            keys = [key for key in conn.execute(f"PRAGMA index_xinfo({escape_sqlite(index[1])})") if key[5]]
+            if keys and keys[0][2]:
+                columns.append(keys[0][2])
+        tables[table] = list(dict.fromkeys(columns))
+    return tables
+
+
+class KeysetPages:
+    """Indexed sort columns per database, found at startup"""
+
+    def __init__(self, config):
+        self.config = config
+        self.sortable = {}  # database → {table: sortable columns}
+
+    async def scan(self, datasette):
+        sortable = {}
+        for name, db in datasette.databases.items():
+            if name in SKIP_DATABASES or db.is_memory:
+                continue
+            tables = await db.execute_fn(lambda conn: indexed_sorts(conn, int(self.config["min_rows"])))
+            for table, columns in tables.items():
+                table_metadata = datasette.table_metadata(name, table)
+                if "sortable_columns" in table_metadata:
+                    continue
+                extra = [table_metadata[key] for key in ("sort", "sort_desc") if table_metadata.get(key)]
+                sortable.setdefault(name, {})[table] = list(dict.fromkeys(columns + extra))
+                logger.info(f"{name}/{table}: sorting by {', '.join(sortable[name][table])}")
+        self.sortable = sortable
+
+    def metadata(self):
+        """The sortable_columns to merge into Datasette's metadata, as new dicts each time"""
+        if not self.config["restrict_sorts"] or not self.sortable:
+            return {}
+        return {"databases": {
+            database: {"tables": {table: {"sortable_columns": list(columns)} for table, columns in tables.items()}}
+            for database, tables in self.sortable.items()
+        }}
+
+
+def get_keyset_pages(datasette):
+    keyset = getattr(datasette, "_zeeker_keyset", None)
+    if keyset is None:
+        keyset = KeysetPages(dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {})))
+        datasette._zeeker_keyset = keyset
+    return keyset
+
+
+@hookimpl
+def startup(datasette):
+    async def inner():
+        await get_keyset_pages(datasette).scan(datasette)
+
+    return inner
+
+
+@hookimpl
+def get_metadata(datasette, key, database, table):
+    keyset = getattr(datasette, "_zeeker_keyset", None)
+    # Never a shared dict: Datasette merges local metadata into what this returns
+    return keyset.metadata() if keyset else {}
@@ -0,0 +1,184 @@
+# plugins/metrics.py
+"""
+Prometheus/OpenMetrics endpoint at /-/metrics
+
+Exposes:
+- request counts and latency histograms by route, and SQLite query time,
+  taken from the perf_monitor recorder (so they follow its sample_rate)
+- database file sizes
+- download and refresh run metrics from the snapshot that
+  scripts/download_from_s3.py and scripts/manage.py write after each run
+
+The snapshot is read from ZEEKER_METRICS_FILE, or .zeeker-metrics.json next
+to the served databases.
+
+The endpoint is deliberately public, so Prometheus can scrape it without
+credentials: it holds only aggregates (route labels, never query strings or SQL),
+file sizes and run outcomes. It follows the instance's view-instance
+permission, so a private instance keeps it private too.
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+from datasette import hookimpl
+from datasette.utils.asgi import Response
+
+try:
+    from scripts.download_from_s3 import METRICS_SNAPSHOT_FILENAME
+except ImportError:
+    # Loaded by Datasette from plugins_dir: the scripts package is beside it
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from scripts.download_from_s3 import METRICS_SNAPSHOT_FILENAME
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+class MetricsWriter:
+    """Builds an OpenMetrics text exposition, one metric family at a time"""
+
+    def __init__(self):
+        self.lines = []
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (
+            '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in labels.items()
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _value(value):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def family(self, name, kind, help_text, unit=None):
+        self.lines.append(f"# TYPE {name} {kind}")
+        if unit:
+            self.lines.append(f"# UNIT {name} {unit}")
+        self.lines.append(f"# HELP {name} {help_text}")
+
+    def sample(self, name, value, **labels):
+        self.lines.append(f"{name}{self._labels(labels)} {self._value(value)}")
+
+    def histogram(self, name, histogram, **labels):
+        """histogram: a perf_monitor Histogram (cumulative buckets, count, sum)"""
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            self.sample(f"{name}_bucket", count, **labels, le=le)
+        self.sample(f"{name}_count", histogram.count, **labels)
+        self.sample(f"{name}_sum", histogram.sum, **labels)
+
+    def render(self):
+        return "\n".join(self.lines + ["# EOF"]) + "\n"
+
+
+def snapshot_path(datasette):
+    """Location of the run metrics snapshot"""
+    if os.environ.get("ZEEKER_METRICS_FILE"):
+        return Path(os.environ["ZEEKER_METRICS_FILE"])
+    for db in datasette.databases.values():
+        if db.path:
+            return Path(db.path).parent / METRICS_SNAPSHOT_FILENAME
+    return None
+
+
+def load_snapshot(datasette):
+    path = snapshot_path(datasette)
+    if not path:
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def write_request_metrics(writer, recorder):
+    writer.family("zeeker_http_requests", "counter", "HTTP requests by route and status (sampled)")
+    for (route, status), count in sorted(recorder.statuses.items()):
+        writer.sample("zeeker_http_requests_total", count, route=route, status=status)
+
+    writer.family("zeeker_http_request_duration_seconds", "histogram",
+                  "HTTP request latency by route (sampled)", unit="seconds")
+    for route, histogram in sorted(recorder.routes.items()):
+        writer.histogram("zeeker_http_request_duration_seconds", histogram, route=route)
+
+    writer.family("zeeker_sqlite_query_duration_seconds", "histogram",
+                  "SQLite statement execution time (sampled)", unit="seconds")
+    writer.histogram("zeeker_sqlite_query_duration_seconds", recorder.query_time)
+
+    queries, seconds = {}, {}
+    for stats in recorder.queries.values():
+        queries[stats.database] = queries.get(stats.database, 0) + stats.count
+        seconds[stats.database] = seconds.get(stats.database, 0.0) + stats.total
+    writer.family("zeeker_sqlite_queries", "counter", "SQLite statements by database (sampled)")
+    for database, count in sorted(queries.items()):
+        writer.sample("zeeker_sqlite_queries_total", count, database=database)
+    writer.family("zeeker_sqlite_query_seconds", "counter", "SQLite time by database (sampled)",
+                  unit="seconds")
+    for database, total in sorted(seconds.items()):
+        writer.sample("zeeker_sqlite_query_seconds_total", total, database=database)
+
+    writer.family("zeeker_perf_sample_rate", "gauge", "Fraction of requests instrumented")
+    writer.sample("zeeker_perf_sample_rate", recorder.sample_rate)
+
+
+def write_database_metrics(writer, datasette):
+    writer.family("zeeker_database_size_bytes", "gauge", "Database file size", unit="bytes")
+    for name, db in sorted(datasette.databases.items()):
+        if db.path and os.path.exists(db.path):
+            writer.sample("zeeker_database_size_bytes", os.path.getsize(db.path), database=name)
+
+
+def write_job_metrics(writer, snapshot):
+    jobs = sorted((snapshot.get("jobs") or {}).items())
+
+    writer.family("zeeker_job_runs", "counter", "Download/refresh runs by outcome")
+    for job, entry in jobs:
+        for status, count in sorted(entry.get("runs_total", {}).items()):
+            writer.sample("zeeker_job_runs_total", count, job=job, status=status)
+
+    writer.family("zeeker_job_downloaded_bytes", "counter", "Bytes downloaded from S3", unit="bytes")
+    for job, entry in jobs:
+        writer.sample("zeeker_job_downloaded_bytes_total", entry.get("bytes_downloaded_total", 0), job=job)
+
+    gauges = [
+        ("zeeker_job_last_run_timestamp_seconds", "End of the most recent run", "last_run_timestamp"),
+        ("zeeker_job_last_success_timestamp_seconds", "Completion of the last successful run",
+         "last_success_timestamp"),
+        ("zeeker_job_last_success_duration_seconds", "Duration of the last successful run",
+         "last_success_duration_seconds"),
+    ]
+    for name, help_text, key in gauges:
+        writer.family(name, "gauge", help_text, unit="seconds")
+        for job, entry in jobs:
+            if key in entry:
+                writer.sample(name, entry[key], job=job)
+
+    # Remaining last-run values (duration, bytes, file counts) as one labelled gauge
+    writer.family("zeeker_job_last_run_value", "gauge", "Values recorded by the most recent run")
+    for job, entry in jobs:
+        for key, value in sorted((entry.get("last") or {}).items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                writer.sample("zeeker_job_last_run_value", value, job=job, field=key)
+
+
+async def metrics(request, datasette):
+    await datasette.ensure_permissions(request.actor, ["view-instance"])
+    writer = MetricsWriter()
+    recorder = getattr(datasette, "_zeeker_perf", None)  # Set by perf_monitor
+    if recorder is not None:
+        write_request_metrics(writer, recorder)
+    write_database_metrics(writer, datasette)
+    write_job_metrics(writer, load_snapshot(datasette))
+    return Response(writer.render(), content_type=CONTENT_TYPE)
+
+
+@hookimpl
+def register_routes():
+    return [(r"^/-/metrics$", metrics)]
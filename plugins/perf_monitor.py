@@ -0,0 +1,380 @@
+# plugins/perf_monitor.py
+"""
+Request timing and SQL instrumentation with a /-/perf dashboard
+
+Wraps the ASGI app to record per-route latency histograms, and Database.execute
+to record per-statement durations and slow-query samples. Everything is kept in
+bounded in-memory structures (fixed-bucket histograms, ring buffers, capped
+dictionaries), so memory use does not grow with traffic.
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-perf": {
+            "sample_rate": 1.0,     # fraction of requests instrumented, 0 disables
+            "slow_query_ms": 100,   # statements slower than this are sampled
+            "ring_size": 1000,      # recent latencies kept per route
+            "slow_samples": 50,     # slow queries kept
+            "allow": {"id": ["root", "ops"]}   # who may view /-/perf; default: root
+        }
+    }
+
+/-/perf and /-/perf.json show other visitors' SQL, so they need the
+view-perf permission, held by the actors that match the allow block (only
+root when it is not set). ZEEKER_PERF_SAMPLE_RATE overrides sample_rate.
+With sampling disabled the ASGI app is not wrapped and the execute wrapper
+costs a single context lookup.
+
+Other plugins report cache hit rates here by adding an object with a stats()
+method to datasette._zeeker_caches.
+"""
+import contextvars
+import math
+import os
+import random
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+
+from datasette import hookimpl
+from datasette.database import Database
+from datasette.utils import actor_matches_allow
+from datasette.utils.asgi import Forbidden, Response
+
+PLUGIN_NAME = "zeeker-perf"
+
+# Needed for /-/perf and /-/perf.json
+PERMISSION = "view-perf"
+
+DEFAULTS = {
+    "sample_rate": 1.0,
+    "slow_query_ms": 100,
+    "ring_size": 1000,
+    "slow_samples": 50,
+}
+
+# Histogram upper bounds in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Caps on distinct keys; further routes/statements are folded into "other"
+MAX_ROUTES = 200
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 500
+
+# Route label of the request being handled, or None when not sampled
+_current_route = contextvars.ContextVar("zeeker_perf_route", default=None)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram plus a ring buffer of recent samples"""
+
+    def __init__(self, ring_size):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=ring_size)
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, pct):
+        """Nearest-rank percentile over the recent samples"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+        return ordered[rank - 1]
+
+    def cumulative(self):
+        """[(upper bound, cumulative count)] ending with +Inf"""
+        total = 0
+        buckets = []
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.sum * 1000,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "buckets": [
+                {"le": "+Inf" if bound == float("inf") else bound, "count": count}
+                for bound, count in self.cumulative()
+            ],
+        }
+
+
+class QueryStats:
+    """Aggregate timings for one normalized SQL statement"""
+
+    __slots__ = ("database", "count", "total", "max", "errors")
+
+    def __init__(self, database):
+        self.database = database
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def to_dict(self):
+        return {
+            "database": self.database,
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PerfRecorder:
+    """In-memory store for request and SQL timings of one Datasette instance"""
+
+    def __init__(self, sample_rate=1.0, slow_query_ms=100, ring_size=1000, slow_samples=50):
+        self.sample_rate = float(sample_rate)
+        self.slow_query_seconds = float(slow_query_ms) / 1000
+        self.ring_size = int(ring_size)
+        self.started = time.time()
+        self.routes = {}
+        self.statuses = {}
+        self.queries = {}
+        self.query_time = Histogram(self.ring_size)
+        self.slow_queries = deque(maxlen=int(slow_samples))
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record_request(self, route, status, seconds):
+        if route not in self.routes and len(self.routes) >= MAX_ROUTES:
+            route = "other"
+        histogram = self.routes.get(route)
+        if histogram is None:
+            histogram = self.routes[route] = Histogram(self.ring_size)
+        histogram.observe(seconds)
+        key = (route, status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def record_query(self, database, sql, seconds, route=None, error=False):
+        statement = normalize_sql(sql)
+        key = (database, statement)
+        if key not in self.queries and len(self.queries) >= MAX_QUERIES:
+            key = (database, "other")
+        stats = self.queries.get(key)
+        if stats is None:
+            stats = self.queries[key] = QueryStats(database)
+        stats.count += 1
+        stats.total += seconds
+        stats.max = max(stats.max, seconds)
+        stats.errors += error
+        self.query_time.observe(seconds)
+
+        if seconds >= self.slow_query_seconds:
+            self.slow_queries.append({
+                "database": database,
+                "sql": statement,
+                "duration_ms": seconds * 1000,
+                "route": route,
+                "error": error,
+                "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            })
+
+    def snapshot(self, top=50):
+        """JSON-serializable summary; queries sorted by total time"""
+        queries = sorted(self.queries.items(), key=lambda item: item[1].total, reverse=True)
+        return {
+            "sample_rate": self.sample_rate,
+            "uptime_s": time.time() - self.started,
+            "routes": {
+                route: dict(
+                    histogram.to_dict(),
+                    statuses={str(status): count for (r, status), count in self.statuses.items() if r == route},
+                )
+                for route, histogram in sorted(self.routes.items())
+            },
+            "sql": {
+                "time": self.query_time.to_dict(),
+                "distinct_statements": len(self.queries),
+                "top": [dict(stats.to_dict(), sql=sql) for (_, sql), stats in queries[:top]],
+                "slow_query_ms": self.slow_query_seconds * 1000,
+                "slow": list(reversed(self.slow_queries)),
+            },
+        }
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and truncate so equivalent statements share a key"""
+    statement = _WHITESPACE.sub(" ", sql).strip()
+    if len(statement) > MAX_SQL_LENGTH:
+        statement = statement[:MAX_SQL_LENGTH] + "…"
+    return statement
+
+
+def route_label(path, database_names):
+    """
+    Group a request path into a bounded route label
+
+    /mydb -> database, /mydb/table.json -> table.json, /mydb/table/1 -> row;
+    custom pages and /-/ endpoints keep their own path.
+    """
+    if path.startswith("/static/"):
+        return "static"
+    if path.startswith("/-/"):
+        return "/".join(path.split("/")[:3])
+
+    segments = [segment for segment in path.split("/") if segment]
+    if not segments:
+        return "index"
+
+    suffix = ""
+    stem, dot, extension = segments[-1].rpartition(".")
+    if dot and extension in ("json", "csv"):
+        segments[-1] = stem
+        suffix = f".{extension}"
+
+    if segments[0] in database_names:
+        kinds = {1: "database", 2: "table", 3: "row"}
+        return kinds.get(len(segments), "other") + suffix
+
+    return "/" + segments[0] + suffix
+
+
+def get_recorder(datasette):
+    """The PerfRecorder for this Datasette instance, created on first use"""
+    recorder = getattr(datasette, "_zeeker_perf", None)
+    if recorder is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        if os.environ.get("ZEEKER_PERF_SAMPLE_RATE"):
+            config["sample_rate"] = os.environ["ZEEKER_PERF_SAMPLE_RATE"]
+        recorder = PerfRecorder(**{key: config[key] for key in DEFAULTS})
+        datasette._zeeker_perf = recorder
+    return recorder
+
+
+_original_execute = Database.execute
+
+
+async def _timed_execute(self, sql, *args, **kwargs):
+    route = _current_route.get()
+    if route is None:
+        return await _original_execute(self, sql, *args, **kwargs)
+
+    start = time.perf_counter()
+    error = False
+    try:
+        return await _original_execute(self, sql, *args, **kwargs)
+    except Exception:
+        error = True
+        raise
+    finally:
+        get_recorder(self.ds).record_query(self.name, sql, time.perf_counter() - start, route, error)
+
+
+@hookimpl
+def startup(datasette):
+    if get_recorder(datasette).enabled and Database.execute is not _timed_execute:
+        Database.execute = _timed_execute
+
+
+@hookimpl
+def asgi_wrapper(datasette):
+    def wrap_with_timing(app):
+        recorder = get_recorder(datasette)
+        if not recorder.enabled:
+            return app
+
+        async def timed_app(scope, receive, send):
+            if scope["type"] != "http" or not recorder.should_sample():
+                return await app(scope, receive, send)
+
+            route = route_label(scope["path"], datasette.databases)
+            status = 500
+
+            async def capture_status(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                await send(message)
+
+            token = _current_route.set(route)
+            start = time.perf_counter()
+            try:
+                await app(scope, receive, capture_status)
+            finally:
+                recorder.record_request(route, status, time.perf_counter() - start)
+                _current_route.reset(token)
+
+        return timed_app
+
+    return wrap_with_timing
+
+
+@hookimpl
+def permission_allowed(datasette, actor, action):
+    if action != PERMISSION:
+        return None
+    allow = (datasette.plugin_config(PLUGIN_NAME) or {}).get("allow")
+    if allow is not None:
+        return actor_matches_allow(actor, allow)
+    return bool(actor and actor.get("id") == "root")
+
+
+async def ensure_can_view(request, datasette):
+    await datasette.ensure_permissions(request.actor, ["view-instance"])
+    if not await datasette.permission_allowed(request.actor, PERMISSION, default=False):
+        raise Forbidden(PERMISSION)
+
+
+@hookimpl
+def register_routes():
+    return [
+        (r"^/-/perf\.json$", perf_json),
+        (r"^/-/perf$", perf_page),
+    ]
+
+
+def perf_snapshot(datasette):
+    """Recorder snapshot plus the stats of caches other plugins registered"""
+    caches = getattr(datasette, "_zeeker_caches", {})
+    return dict(
+        get_recorder(datasette).snapshot(),
+        caches={name: cache.stats() for name, cache in sorted(caches.items())},
+    )
+
+
+async def perf_json(request, datasette):
+    await ensure_can_view(request, datasette)
+    return Response.json(perf_snapshot(datasette))
+
+
+async def perf_page(request, datasette):
+    await ensure_can_view(request, datasette)
+    return Response.html(
+        await datasette.render_template(
+            "perf.html",
+            {
+                "perf": perf_snapshot(datasette),
+                "request": request,
+            },
+            request=request,
+        )
+    )
@@ -0,0 +1,307 @@
+# plugins/query_cache.py
+"""
+Result cache for custom SQL against immutable databases
+
+Every database is served --immutable, so the response to /db?sql=... (and its
+.json/.csv forms) is a pure function of the SQL, its parameters and the
+database file. Responses are cached in a byte-bounded in-memory LRU, with an
+optional on-disk tier that survives restarts. The key includes the file's
+size and mtime, so a refresh never serves stale results.
+
+Not cached: mutable databases, non-GET requests, requests with cookies or
+credentials, responses other than 200, responses that set cookies, and
+responses larger than max_entry_bytes. Responses carry X-Zeeker-Cache:
+hit/miss, and hit rates are shown on /-/perf.
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-query-cache": {
+            "max_bytes": 67108864,        # memory tier size
+            "max_entry_bytes": 1048576,   # larger responses are not cached
+            "disk_dir": null,             # e.g. "/data/.query-cache" enables the disk tier
+            "disk_max_bytes": 536870912   # disk tier size
+        }
+    }
+
+max_bytes 0 disables the cache.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+from datasette import hookimpl
+
+PLUGIN_NAME = "zeeker-query-cache"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "max_bytes": 64 * 1024 * 1024,
+    "max_entry_bytes": 1024 * 1024,
+    "disk_dir": None,
+    "disk_max_bytes": 512 * 1024 * 1024,
+}
+
+CACHE_HEADER = b"x-zeeker-cache"
+
+# /db, /db.json and /db.csv (the arbitrary SQL query views)
+_QUERY_PATH = re.compile(r"^/([^/]+?)(?:\.(?:json|csv))?$")
+
+# Request headers that may change the response for the same URL
+_PRIVATE_HEADERS = (b"cookie", b"authorization")
+
+
+class ByteLRU:
+    """LRU of bytes-sized entries bounded by their total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry, size):
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (entry, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+
+class DiskTier:
+    """
+    Cached responses as files in a directory, bounded by total size and
+    evicted least recently used first (by access order in this process,
+    then file mtime from earlier runs)
+
+    Reads and writes run on executor threads, so the index is only used
+    under self.lock; each write goes to its own temporary file.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index = ByteLRU(max_bytes)
+        self.lock = threading.Lock()
+        files = sorted(self.directory.glob("*.cache"), key=lambda path: path.stat().st_mtime)
+        for path in files:
+            self.index.set(path.stem, path, path.stat().st_size)
+        self._remove_evicted()
+
+    def _remove_evicted(self):
+        for path in self.directory.glob("*.cache"):
+            if path.stem not in self.index.entries:
+                path.unlink(missing_ok=True)
+
+    def read(self, key):
+        """(status, headers, body) or None"""
+        with self.lock:
+            if self.index.get(key) is None:
+                return None
+        try:
+            meta, _, body = (self.directory / f"{key}.cache").read_bytes().partition(b"\n")
+            meta = json.loads(meta)
+        except (OSError, ValueError):
+            with self.lock:
+                self.index.discard(key)
+            return None
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in meta["headers"]]
+        return meta["status"], headers, body
+
+    def write(self, key, status, headers, body):
+        meta = json.dumps({
+            "status": status,
+            "headers": [(name.decode("latin-1"), value.decode("latin-1")) for name, value in headers],
+        }).encode()
+        path = self.directory / f"{key}.cache"
+        with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f".{key}.", suffix=".tmp", delete=False) as temp:
+            temp.write(meta + b"\n" + body)
+        try:
+            os.replace(temp.name, path)
+        except OSError:
+            os.unlink(temp.name)
+            raise
+        size = len(meta) + 1 + len(body)
+        with self.lock:
+            evictions = self.index.evictions
+            self.index.set(key, path, size)
+            if self.index.evictions != evictions or key not in self.index.entries:
+                self._remove_evicted()
+
+
+class QueryCache:
+    """Memory and disk tiers plus hit/miss counters for one Datasette instance"""
+
+    def __init__(self, max_bytes, max_entry_bytes, disk_dir=None, disk_max_bytes=0):
+        self.memory = ByteLRU(max_bytes)
+        self.max_entry_bytes = int(max_entry_bytes)
+        self.disk = None
+        if disk_dir:
+            try:
+                self.disk = DiskTier(disk_dir, disk_max_bytes)
+            except OSError as e:
+                logger.warning(f"Query cache disk tier disabled, cannot use {disk_dir}: {e}")
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.too_large = 0
+
+    @property
+    def enabled(self):
+        return self.memory.max_bytes > 0
+
+    async def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        if self.disk:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, self.disk.read, key)
+            if response is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, response, len(response[2]))
+                return response
+        self.misses += 1
+        return None
+
+    async def set(self, key, status, headers, body):
+        self.memory.set(key, (status, headers, body), len(body))
+        if self.disk:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.disk.write, key, status, headers, body)
+            except OSError as e:
+                logger.warning(f"Could not write query cache entry: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.memory.entries),
+            "bytes": self.memory.bytes,
+            "max_bytes": self.memory.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.memory.evictions,
+            "too_large": self.too_large,
+            "disk_hits": self.disk_hits,
+            "disk_entries": len(self.disk.index.entries) if self.disk else None,
+            "disk_bytes": self.disk.index.bytes if self.disk else None,
+        }
+
+
+def get_cache(datasette):
+    """The QueryCache for this Datasette instance, created on first use"""
+    cache = getattr(datasette, "_zeeker_query_cache", None)
+    if cache is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        cache = datasette._zeeker_query_cache = QueryCache(**{key: config[key] for key in DEFAULTS})
+        # Reported on /-/perf
+        if not hasattr(datasette, "_zeeker_caches"):
+            datasette._zeeker_caches = {}
+        datasette._zeeker_caches["query"] = cache
+    return cache
+
+
+def cache_key(datasette, scope):
+    """Key for a cacheable SQL query request, else None"""
+    if scope["method"] != "GET" or any(name in _PRIVATE_HEADERS for name, _ in scope["headers"]):
+        return None
+    match = _QUERY_PATH.match(scope["path"])
+    db = datasette.databases.get(match.group(1)) if match else None
+    if db is None or db.is_mutable or not db.path:
+        return None
+    params = sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True))
+    if not any(name == "sql" for name, _ in params):
+        return None
+    try:
+        stat = os.stat(db.path)
+    except OSError:
+        return None
+    key = json.dumps([scope["path"], params, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@hookimpl
+def startup(datasette):
+    get_cache(datasette)
+
+
+@hookimpl
+def asgi_wrapper(datasette):
+    def wrap_with_cache(app):
+        async def cached_app(scope, receive, send):
+            cache = get_cache(datasette)
+            key = cache_key(datasette, scope) if scope["type"] == "http" and cache.enabled else None
+            if key is None:
+                return await app(scope, receive, send)
+
+            response = await cache.get(key)
+            if response is not None:
+                status, headers, body = response
+                await send({"type": "http.response.start", "status": status,
+                            "headers": headers + [(CACHE_HEADER, b"hit")]})
+                await send({"type": "http.response.body", "body": body})
+                return
+
+            start = None
+            chunks = []
+            size = 0
+
+            async def capture(message):
+                nonlocal start, size
+                if message["type"] == "http.response.start":
+                    start = message
+                    message = dict(message, headers=list(message.get("headers", [])) + [(CACHE_HEADER, b"miss")])
+                elif message["type"] == "http.response.body":
+                    body = message.get("body", b"")
+                    size += len(body)
+                    # Past the limit the response still streams, just uncached
+                    if size <= cache.max_entry_bytes:
+                        chunks.append(body)
+                    else:
+                        chunks.clear()
+                await send(message)
+
+            await app(scope, receive, capture)
+
+            if start is None or start["status"] != 200:
+                return
+            headers = list(start.get("headers", []))
+            if any(name.lower() == b"set-cookie" for name, _ in headers):
+                return
+            if size > cache.max_entry_bytes:
+                cache.too_large += 1
+                return
+            await cache.set(key, start["status"], headers, b"".join(chunks))
+
+        return cached_app
+
+    return wrap_with_cache
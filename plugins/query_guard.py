@@ -0,0 +1,393 @@
+# plugins/query_guard.py
+"""
+Admission control for custom SQL, based on EXPLAIN QUERY PLAN
+
+One pathological /db?sql=... query (a cross join, an unindexed LIKE over a
+large text column) holds a Datasette executor thread until the time limit and
+leaves fewer threads for everyone else. Before a custom query runs, the guard
+asks SQLite for its query plan and estimates how many rows it will visit:
+
+- a full SCAN of a table costs its row count (from sqlite_stat1, which the
+  optimization stage creates, else Datasette's table counts, else max(rowid)
+  for tables too large to count), a SEARCH on an index costs about log2 of
+  it, and nested loops multiply
+- correlated subqueries are multiplied by the loops around them, other
+  subqueries and temporary sort B-trees add to the total
+- a lone SCAN with no WHERE, ORDER BY, grouping or aggregates stops after
+  the rows Datasette returns, so it costs at most max_returned_rows
+
+Queries estimated above queue_cost share heavy_slots (default 1): they wait
+in FIFO order, so cheap queries keep the remaining executor threads. When
+max_queued queries are already waiting, or one has waited queue_timeout
+seconds, the response is 503 with Retry-After. Queries above max_cost are
+rejected with a 400 explaining which scans made them expensive. Admitted
+queries carry X-Zeeker-Query-Cost. Nothing is planned for actors without
+execute-sql on the database; Datasette answers those with its own 403.
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-query-guard": {
+            "queue_cost": 1000000,       # estimated rows visited; null admits everything
+            "max_cost": 1000000000,      # null never rejects
+            "heavy_slots": 1,
+            "max_queued": 8,
+            "queue_timeout": 10          # seconds
+        }
+    }
+"""
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+from datasette import hookimpl
+from datasette.plugins import pm
+from datasette.utils import await_me_maybe, derive_named_parameters, escape_sqlite
+from datasette.utils.asgi import Forbidden, Request, Response
+
+PLUGIN_NAME = "zeeker-query-guard"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "queue_cost": 1_000_000,
+    "max_cost": 1_000_000_000,
+    "heavy_slots": 1,
+    "max_queued": 8,
+    "queue_timeout": 10,
+}
+
+COST_HEADER = b"x-zeeker-query-cost"
+
+# Rows assumed for plan names that are not tables (CTEs, subquery aliases)
+UNKNOWN_ROWS = 1000
+
+# Time limit for counting a table without sqlite_stat1, in milliseconds
+COUNT_TIME_LIMIT_MS = 1000
+
+# Rows assumed for a table that could not be counted in COUNT_TIME_LIMIT_MS
+# and has no rowid to estimate from
+UNCOUNTED_ROWS = 100_000_000
+
+# /db, /db.json and /db.csv (the arbitrary SQL query views)
+_QUERY_PATH = re.compile(r"^/([^/]+?)(?:\.(json|csv))?$")
+
+_IDENT = r'(?:\[([^\]]+)\]|"([^"]+)"|`([^`]+)`|([A-Za-z_]\w*))'
+_TABLE_ALIAS = re.compile(r"(?:\bfrom|\bjoin|,)\s+" + _IDENT + r"(?:\s+(?:as\s+)?" + _IDENT + ")?", re.I)
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_NOT_ALIASES = {
+    "where", "join", "left", "right", "inner", "outer", "cross", "natural", "on", "using", "group",
+    "order", "limit", "union", "intersect", "except", "having", "window", "indexed", "not",
+}
+# Anything that makes SQLite read past the rows it returns
+_FULL_READ = re.compile(
+    r"\b(?:where|group|order|distinct|having|join|union|intersect|except|window|over)\b"
+    r"|\b(?:count|sum|avg|min|max|total|group_concat)\s*\(",
+    re.I,
+)
+_LIMIT = re.compile(r"\blimit\s+(\d+)\s*;?\s*$", re.I)
+_RANGE = re.compile(r"\([^)]*[<>][^)]*\)")
+
+
+def strip_sql(sql):
+    """sql without comments and string literals (which may contain keywords)"""
+    return _STRING.sub("''", _COMMENT.sub(" ", sql))
+
+
+def table_aliases(sql, tables):
+    """{alias: table} for the tables in sql named by an alias in the query plan"""
+    aliases = {}
+    for match in _TABLE_ALIAS.finditer(strip_sql(sql)):
+        table = next((group for group in match.groups()[:4] if group), None)
+        alias = next((group for group in match.groups()[4:] if group), None)
+        if table in tables and alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def plan_tree(plan):
+    """{parent id: [(id, detail)]} from EXPLAIN QUERY PLAN rows"""
+    children = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    return children
+
+
+class CostEstimate:
+    """Estimated rows visited by one statement, and the scans behind it"""
+
+    def __init__(self, plan, counts, aliases=None):
+        self.counts = counts
+        self.names = dict({table: table for table in counts}, **(aliases or {}))
+        self.scans = []
+        self.children = plan_tree(plan)
+        self.cost = self._group(0)
+
+    def _rows(self, rest):
+        """(table, rows) for the name at the start of a SCAN/SEARCH detail"""
+        name = max((name for name in self.names if rest == name or rest.startswith(name + " ")),
+                   key=len, default=rest.split(" ")[0])
+        table = self.names.get(name)
+        rows = self.counts.get(table) if table else None
+        return table or name, UNKNOWN_ROWS if rows is None else max(rows, 1)
+
+    def _loop(self, detail):
+        """(rows per outer iteration, one-off cost) of a SCAN or SEARCH"""
+        kind, _, rest = detail.partition(" ")
+        if rest == "CONSTANT ROW":
+            return 1, 0
+        table, rows = self._rows(rest)
+        if kind == "SCAN":
+            # FTS5 and other virtual tables with constraints (e.g. MATCH) use their own index
+            constrained = re.search(r"VIRTUAL TABLE INDEX \d+:\S", rest)
+            if constrained:
+                return math.sqrt(rows), 0
+            self.scans.append((table, rows))
+            return rows, 0
+        lookup = math.log2(rows + 1) + 1
+        if "AUTOMATIC" in rest:
+            # The index is built once per statement from a full scan
+            self.scans.append((table, rows))
+            return lookup, rows
+        if _RANGE.search(rest):
+            return rows / 4, 0
+        return lookup, 0
+
+    def _group(self, parent):
+        loops, total = 1.0, 0.0
+        for node_id, detail in self.children.get(parent, []):
+            if detail.startswith(("SCAN ", "SEARCH ")):
+                factor, once = self._loop(detail)
+                loops *= factor
+                total += once + loops * self._group(node_id)
+            elif detail.startswith("USE TEMP B-TREE"):
+                total += loops
+            elif detail.startswith("CORRELATED"):
+                total += loops * self._group(node_id)
+            else:
+                total += self._group(node_id)
+        return total + loops if self.children.get(parent) else total
+
+    def describe(self):
+        """The largest scans, for the rejection message"""
+        scans = sorted(Counter(self.scans).items(), key=lambda item: -item[0][1])[:3]
+        return ", ".join(
+            f"a full scan of {table} ({rows:,} rows)" if times == 1
+            else f"{times} full scans of {table} ({rows:,} rows each)"
+            for (table, rows), times in scans
+        )
+
+
+async def table_rows(db):
+    """{table: rows} from sqlite_stat1, else Datasette's (cached for immutable files) counts"""
+    counts = {}
+    if await db.table_exists("sqlite_stat1"):
+        result = await db.execute("select tbl, stat from sqlite_stat1")
+        for table, stat in result.rows:
+            if stat:
+                counts[table] = max(counts.get(table, 0), int(stat.split(" ")[0]))
+    missing = [table for table in await db.table_names() if table not in counts]
+    if missing:
+        counted = await db.table_counts(limit=COUNT_TIME_LIMIT_MS)
+        for table in missing:
+            counts[table] = counted.get(table)
+            if counts[table] is None:
+                # Timed out, so large: max(rowid) is one index lookup and close for append-only tables
+                try:
+                    result = await db.execute(f"select max(rowid) from {escape_sqlite(table)}")
+                    counts[table] = result.first()[0] or 0
+                except Exception:
+                    counts[table] = UNCOUNTED_ROWS
+    return counts
+
+
+class QueryGuard:
+    """Cost thresholds, heavy query slots and counters for one Datasette instance"""
+
+    def __init__(self, queue_cost, max_cost, heavy_slots, max_queued, queue_timeout):
+        self.queue_cost = queue_cost
+        self.max_cost = max_cost
+        self.slots = max(int(heavy_slots), 1)
+        self._semaphore = None
+        self.max_queued = int(max_queued)
+        self.queue_timeout = float(queue_timeout)
+        self.counts = {}
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.throttled = 0
+        self.rejected = 0
+
+    @property
+    def heavy_slots(self):
+        """Semaphore for expensive queries, bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(self.slots))
+        return self._semaphore[1]
+
+    async def counts_for(self, db):
+        mtime = db.mtime_ns if db.path else None
+        cached = self.counts.get(db.name)
+        if cached is None or cached[0] != mtime:
+            cached = self.counts[db.name] = (mtime, await table_rows(db))
+        return cached[1]
+
+    async def estimate(self, datasette, db, sql, params):
+        """CostEstimate for sql, or None when SQLite cannot plan it (Datasette reports the error)"""
+        names = await derive_named_parameters(db, sql)
+        bound = {name: params.get(name, "") for name in names}
+        try:
+            plan = (await db.execute(f"explain query plan {sql}", bound)).rows
+        except Exception:
+            return None
+        counts = await self.counts_for(db)
+        estimate = CostEstimate([tuple(row) for row in plan], counts, table_aliases(sql, counts))
+        stripped = strip_sql(sql)
+        if len(plan) == 1 and estimate.scans and not _FULL_READ.search(stripped) and "_stream" not in params:
+            limit = _LIMIT.search(stripped)
+            returned = datasette.setting("max_returned_rows") + 1
+            estimate.cost = min(estimate.cost, int(limit.group(1)) if limit else returned, returned)
+        return estimate
+
+    def stats(self):
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+        }
+
+
+def get_guard(datasette):
+    """The QueryGuard for this Datasette instance, created on first use"""
+    guard = getattr(datasette, "_zeeker_query_guard", None)
+    if guard is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        guard = datasette._zeeker_query_guard = QueryGuard(**{key: config[key] for key in DEFAULTS})
+    return guard
+
+
+async def ensure_can_execute(datasette, db, scope, receive):
+    """Raise Forbidden unless the request's actor may run SQL on db"""
+    request = Request(scope, receive)
+    actor = scope.get("actor")
+    # Resolved the way Datasette's router does, which has not run yet
+    for candidate in pm.hook.actor_from_request(datasette=datasette, request=request):
+        candidate = await await_me_maybe(candidate)
+        if candidate:
+            actor = candidate
+            break
+    await datasette.ensure_permissions(
+        actor, [("execute-sql", db.name), ("view-database", db.name), "view-instance"]
+    )
+
+
+async def error_response(datasette, scope, extension, status, title, message, headers=None):
+    """A Datasette-style error in the format the client asked for"""
+    if extension == "json":
+        return Response.json({"ok": False, "error": message, "status": status, "title": title},
+                             status=status, headers=headers)
+    if extension == "csv":
+        return Response.text(message, status=status, headers=headers)
+    html = await datasette.render_template(
+        [f"{status}.html", "error.html"], {"ok": False, "error": message, "status": status, "title": title}
+    )
+    return Response.html(html, status=status, headers=headers)
+
+
+@hookimpl
+def startup(datasette):
+    get_guard(datasette)
+
+
+# tryfirst makes this the innermost wrapper, so cached responses never wait for a slot
+@hookimpl(tryfirst=True)
+def asgi_wrapper(datasette):
+    def wrap_with_guard(app):
+        async def guarded_app(scope, receive, send):
+            match = _QUERY_PATH.match(scope["path"]) if scope["type"] == "http" else None
+            db = datasette.databases.get(match.group(1)) if match else None
+            params = dict(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)) if db else {}
+            if not params.get("sql"):
+                return await app(scope, receive, send)
+
+            # Wrapped outside Datasette's own startup, which planning and error pages need
+            await datasette.invoke_startup()
+            try:
+                # Estimates and rejection messages reveal table sizes
+                await ensure_can_execute(datasette, db, scope, receive)
+            except Forbidden:
+                return await app(scope, receive, send)
+            guard = get_guard(datasette)
+            estimate = await guard.estimate(datasette, db, params["sql"], params)
+            if estimate is None:
+                return await app(scope, receive, send)
+            cost = int(estimate.cost)
+            extension = match.group(2)
+
+            if guard.max_cost is not None and cost > guard.max_cost:
+                guard.rejected += 1
+                logger.warning(f"Rejected query on {db.name} with estimated cost {cost:,}")
+                message = (
+                    f"This query would visit about {cost:,} rows"
+                    + (f", including {estimate.describe()}" if estimate.scans else "")
+                    + ", more than this server runs for one request. Filter or join on indexed columns, "
+                    "use full-text search (?_search= on a table page), or download the database "
+                    f"({datasette.urls.database(db.name)}.db) and run it locally."
+                )
+                response = await error_response(datasette, scope, extension, 400, "Query too expensive", message)
+                return await response.asgi_send(send)
+
+            async def send_with_cost(message):
+                if message["type"] == "http.response.start":
+                    message = dict(message, headers=list(message.get("headers", [])) + [
+                        (COST_HEADER, str(cost).encode())
+                    ])
+                await send(message)
+
+            if guard.queue_cost is None or cost <= guard.queue_cost:
+                guard.admitted += 1
+                return await app(scope, receive, send_with_cost)
+
+            retry_after = str(max(int(guard.queue_timeout), 1))
+            if guard.waiting >= guard.max_queued:
+                guard.throttled += 1
+                response = await error_response(
+                    datasette, scope, extension, 503, "Too many expensive queries",
+                    f"{guard.waiting} expensive queries are already waiting to run. Try again shortly.",
+                    headers={"Retry-After": retry_after},
+                )
+                return await response.asgi_send(send)
+
+            guard.waiting += 1
+            guard.queued += 1
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(guard.heavy_slots.acquire(), guard.queue_timeout)
+            except asyncio.TimeoutError:
+                guard.throttled += 1
+                response = await error_response(
+                    datasette, scope, extension, 503, "Too many expensive queries",
+                    f"This query waited {time.perf_counter() - start:.1f}s for other expensive queries "
+                    "to finish. Try again shortly.",
+                    headers={"Retry-After": retry_after},
+                )
+                return await response.asgi_send(send)
+            finally:
+                guard.waiting -= 1
+            try:
+                guard.admitted += 1
+                await app(scope, receive, send_with_cost)
+            finally:
+                guard.heavy_slots.release()
+
+        return guarded_app
+
+    return wrap_with_guard
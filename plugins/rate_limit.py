@@ -0,0 +1,325 @@
+# plugins/rate_limit.py
+"""
+Per-client rate limiting and fair scheduling of requests
+
+Scrapers paging through /db/table.json?_next=... in tight loops can take
+every executor thread, and interactive users then wait behind them. Two
+mechanisms keep one client from setting everyone else's latency:
+
+- A token bucket per client: each request spends tokens according to its
+  route (custom SQL and exports cost more than a table page; static files
+  are free), and buckets refill at rate tokens per second up to burst. An
+  empty bucket gets 429 with Retry-After set to when enough tokens return.
+- A fair-share queue in front of Datasette: at most max_active requests are
+  being answered. A request holds its slot until its response starts, so a
+  long CSV or /-/export stream is paid for by its token cost, not by a slot
+  held for the whole download. Waiting requests are admitted round-robin across clients, not
+  first come first served, so a client with fifty queued requests delays a
+  client with one by at most one turn. A client with max_queued_per_client
+  requests already waiting gets 429.
+
+Clients are identified by API key (Authorization: Bearer ... or
+X-Api-Key) when the key is one of the configured clients, else by IP
+address; unknown keys are ignored, so a scraper cannot get a fresh bucket by
+sending a new key with each request. The container only
+listens on localhost behind a reverse proxy, so when the peer is a private
+or loopback address the client is the last public address in
+X-Forwarded-For. Requests from private or loopback addresses without
+X-Forwarded-For (the healthcheck, datasette.client calls made by plugins
+and templates) are local and neither limited nor queued.
+
+Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-rate-limit": {
+            "rate": 10,                   # tokens per second, null disables the limiter
+            "burst": 100,
+            "costs": {"sql": 5, "export": 10, "default": 1},
+            "max_active": 8,              # null disables the fair-share queue
+            "max_queued_per_client": 16,
+            "trust_forwarded": true,
+            "exempt_local": true,
+            "clients": {"203.0.113.7": {"rate": 50, "burst": 500}, "api-key": {"rate": null}}
+        }
+    }
+
+Entries under "clients" (an IP address or API key) override rate and burst;
+a null rate exempts that client from the token bucket, and a rate of 0
+blocks it once its burst is spent (Retry-After is then MAX_RETRY_AFTER).
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from urllib.parse import parse_qsl
+
+from datasette import hookimpl
+
+PLUGIN_NAME = "zeeker-rate-limit"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "rate": 10,
+    "burst": 100,
+    "costs": {"sql": 5, "export": 10, "default": 1},
+    "max_active": 8,
+    "max_queued_per_client": 16,
+    "trust_forwarded": True,
+    "exempt_local": True,
+    "clients": {},
+}
+
+# Buckets kept for at most this many clients, least recently seen dropped first
+MAX_CLIENTS = 10_000
+
+# Longest Retry-After sent, for buckets that refill slowly or (rate 0) never
+MAX_RETRY_AFTER = 3600
+
+# Paths that never touch a database
+_FREE_PREFIXES = ("/-/static", "/static/", "/favicon.ico")
+
+
+def route_cost(scope, costs):
+    """Tokens a request spends: 0 for static files, else by route class"""
+    path = scope["path"]
+    if path.startswith(_FREE_PREFIXES):
+        return 0
+    params = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    if path.endswith(".csv") or "_stream" in params or path.startswith("/-/export"):
+        return costs["export"]
+    if "sql" in params:
+        return costs["sql"]
+    return costs["default"]
+
+
+def _is_public(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return not (ip.is_private or ip.is_loopback)
+
+
+def client_id(scope, trust_forwarded=True, exempt_local=True, clients=None):
+    """(bucket key, configured name) of the client that sent the request, None for exempt local requests"""
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    api_key = headers.get(b"x-api-key", b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        api_key = authorization[7:].strip()
+    if api_key and api_key in (clients or {}):
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16], api_key
+
+    address = (scope.get("client") or ("unknown", 0))[0]
+    forwarded = headers.get(b"x-forwarded-for")
+    if exempt_local and not forwarded and not _is_public(address):
+        return None
+    if trust_forwarded and forwarded and not _is_public(address):
+        hops = [hop.strip() for hop in forwarded.decode("latin-1").split(",") if hop.strip()]
+        # The last public hop was added by our proxy's peer; anything to its left can be forged
+        address = next((hop for hop in reversed(hops) if _is_public(hop)), hops[0] if hops else address)
+    return "ip:" + address, address
+
+
+class TokenBuckets:
+    """Token bucket per client, created full on first request"""
+
+    def __init__(self, rate, burst, clients=None, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.clients = clients or {}
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+
+    def limits(self, name):
+        override = self.clients.get(name) or {}
+        return override.get("rate", self.rate), override.get("burst", self.burst)
+
+    def take(self, key, name, cost, now=None):
+        """0 when the request may proceed, else seconds until it could, at most MAX_RETRY_AFTER"""
+        rate, burst = self.limits(name)
+        if rate is None or cost == 0:
+            return 0
+        now = time.monotonic() if now is None else now
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * max(rate, 0))
+        # A request costing more than burst is admitted from a full bucket and leaves it in debt
+        needed = min(cost, burst)
+        wait = 0
+        if tokens >= needed:
+            tokens -= cost
+        else:
+            wait = min((needed - tokens) / rate, MAX_RETRY_AFTER) if rate > 0 else MAX_RETRY_AFTER
+        self.buckets[key] = (tokens, now)
+        while len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class FairQueue:
+    """
+    Admits at most max_active requests at a time; waiting requests are
+    admitted one client at a time in round-robin order
+    """
+
+    def __init__(self, max_active, max_queued_per_client):
+        self.max_active = max_active
+        self.max_queued_per_client = max_queued_per_client
+        self.active = 0
+        self.waiting = OrderedDict()  # client -> deque of futures, in turn order
+
+    @property
+    def queued(self):
+        return sum(len(waiters) for waiters in self.waiting.values())
+
+    async def acquire(self, client):
+        """False when the client already has too many requests waiting"""
+        if self.active < self.max_active and not self.waiting:
+            self.active += 1
+            return True
+        waiters = self.waiting.setdefault(client, deque())
+        if len(waiters) >= self.max_queued_per_client:
+            if not waiters:
+                del self.waiting[client]
+            return False
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # Admitted just as the request went away
+            elif future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    self.waiting.pop(client, None)
+            raise
+        return True
+
+    def release(self):
+        self.active -= 1
+        while self.waiting and self.active < self.max_active:
+            client, waiters = next(iter(self.waiting.items()))
+            future = waiters.popleft()
+            # The client's turn is over: it goes to the back of the line
+            del self.waiting[client]
+            if waiters:
+                self.waiting[client] = waiters
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+
+class RateLimiter:
+    """Token buckets, the fair-share queue and counters for one Datasette instance"""
+
+    def __init__(self, rate, burst, costs, max_active, max_queued_per_client, trust_forwarded, exempt_local,
+                 clients):
+        self.costs = dict(DEFAULTS["costs"], **(costs or {}))
+        self.buckets = TokenBuckets(rate, burst, clients)
+        self.queue = FairQueue(max_active, max_queued_per_client) if max_active else None
+        self.trust_forwarded = trust_forwarded
+        self.exempt_local = exempt_local
+        self.limited = 0
+        self.rejected = 0
+        self.queued = 0
+
+    def stats(self):
+        return {
+            "clients": len(self.buckets.buckets),
+            "limited": self.limited,
+            "rejected": self.rejected,
+            "queued": self.queued,
+            "active": self.queue.active if self.queue else None,
+            "waiting": self.queue.queued if self.queue else None,
+        }
+
+
+def get_limiter(datasette):
+    """The RateLimiter for this Datasette instance, created on first use"""
+    limiter = getattr(datasette, "_zeeker_rate_limit", None)
+    if limiter is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        limiter = datasette._zeeker_rate_limit = RateLimiter(**{key: config[key] for key in DEFAULTS})
+    return limiter
+
+
+async def too_many_requests(scope, send, message, retry_after):
+    if scope["path"].endswith(".json"):
+        content_type = b"application/json; charset=utf-8"
+        body = json.dumps({"ok": False, "error": message, "status": 429, "title": "Too many requests"})
+    else:
+        content_type = b"text/plain; charset=utf-8"
+        body = message
+    await send({"type": "http.response.start", "status": 429, "headers": [
+        (b"content-type", content_type),
+        (b"retry-after", str(max(math.ceil(retry_after), 1)).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body.encode()})
+
+
+@hookimpl
+def startup(datasette):
+    get_limiter(datasette)
+
+
+# trylast makes this the outermost wrapper, so limited requests do no other work
+@hookimpl(trylast=True)
+def asgi_wrapper(datasette):
+    def wrap_with_limits(app):
+        async def limited_app(scope, receive, send):
+            if scope["type"] != "http":
+                return await app(scope, receive, send)
+            limiter = get_limiter(datasette)
+            if route_cost(scope, limiter.costs) == 0:
+                return await app(scope, receive, send)
+
+            client = client_id(scope, limiter.trust_forwarded, limiter.exempt_local, limiter.buckets.clients)
+            if client is None:
+                return await app(scope, receive, send)
+            key, name = client
+            wait = limiter.buckets.take(key, name, route_cost(scope, limiter.costs))
+            if wait:
+                limiter.limited += 1
+                logger.info(f"Rate limited {key} on {scope['path']}")
+                return await too_many_requests(
+                    scope, send, f"Rate limit exceeded. Retry in {math.ceil(wait)}s, or slow down.", wait,
+                )
+
+            queue = limiter.queue
+            if queue is None:
+                return await app(scope, receive, send)
+            if queue.active >= queue.max_active or queue.waiting:
+                limiter.queued += 1
+            if not await queue.acquire(key):
+                limiter.rejected += 1
+                return await too_many_requests(
+                    scope, send, "Too many requests from this client are already waiting.", 1,
+                )
+            released = False
+
+            def release():
+                nonlocal released
+                if not released:
+                    released = True
+                    queue.release()
+
+            async def send_and_release(message):
+                # The work is done once the response starts; streamed bodies do not hold a slot
+                if message["type"] == "http.response.start":
+                    release()
+                await send(message)
+
+            try:
+                await app(scope, receive, send_and_release)
+            finally:
+                release()
+
+        return limited_app
+
+    return wrap_with_limits
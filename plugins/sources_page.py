@@ -1,15 +1,245 @@
+# plugins/sources_page.py
+"""
+The /sources page, and the pre-built bulk exports it links to.
+
+scripts/export_artifacts.py writes compressed Parquet, NDJSON and CSV files
+of every table to data/exports during refresh, with a manifest of their
+rows, sizes and sha256 hashes. The page lists them per database, and
+/-/downloads/<path> serves the files named in the manifest from disk with
+Range support (resumable and parallel downloads) and the sha256 as ETag.
+Each file needs the same view-table, view-database and view-instance
+permissions as its table, and the page lists only the files the actor
+may download.
+With base_url set the links point there instead, for example the exports/
+prefix of a public bucket. Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-downloads": {
+            "directory": "data/exports",   # default: exports/ beside the databases
+            "base_url": null
+        }
+    }
+"""
+import json
+import re
+import sys
+from pathlib import Path
+
+import aiofiles
+import aiofiles.os
 from datasette import hookimpl
-from datasette.utils.asgi import Response
+from datasette.utils.asgi import NotFound, Response
+
+try:
+    from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME
+except ImportError:
+    # Loaded by Datasette from plugins_dir: the scripts package is beside it
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME
+
+PLUGIN_NAME = "zeeker-downloads"
+
+DEFAULTS = {
+    "directory": None,
+    "base_url": None,
+}
+
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    ".parquet": "application/vnd.apache.parquet",
+    ".gz": "application/gzip",
+    ".json": "application/json",
+}
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
 
 
 @hookimpl
 def register_routes():
     return [
         (r"^/sources$", sources_page),
+        (r"^/-/downloads/(?P<path>.+)$", download_file),
     ]
 
 
+class Downloads:
+    """The exports directory and its manifest, re-read when the file changes"""
+
+    def __init__(self, directory, base_url=None):
+        self.directory = Path(directory) if directory else None
+        self.base_url = base_url.rstrip("/") if base_url else "/-/downloads"
+        self._manifest = {}
+        self._files = {}
+        self._stamp = None
+
+    def manifest(self):
+        if self.directory is None:
+            return {}
+        try:
+            stat = (self.directory / MANIFEST_FILENAME).stat()
+        except OSError:
+            self._manifest, self._files, self._stamp = {}, {}, None
+            return {}
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            try:
+                manifest = json.loads((self.directory / MANIFEST_FILENAME).read_text())
+            except (OSError, ValueError):
+                return self._manifest
+            self._manifest, self._stamp = manifest, stamp
+            self._files = {
+                entry["path"]: dict(entry, database=database, table=table)
+                for database, recorded in manifest.get("databases", {}).items()
+                for table, info in recorded["tables"].items()
+                for entry in info["files"].values()
+            }
+        return self._manifest
+
+    def file(self, path):
+        """
+        Manifest entry for path, with its database and table; only files
+        named in the manifest are served
+        """
+        self.manifest()
+        if path == MANIFEST_FILENAME and self._stamp:
+            return {"path": path}
+        return self._files.get(path)
+
+    def table_names(self):
+        """(database, table) for every table in the manifest"""
+        return {(entry["database"], entry["table"]) for entry in self._files.values()}
+
+    def tables(self, database):
+        """{table: [{"format", "url", "bytes"}]} for the page"""
+        recorded = self.manifest().get("databases", {}).get(database)
+        if not recorded:
+            return {}
+        return {
+            table: [
+                {"format": format, "url": f"{self.base_url}/{entry['path']}", "bytes": entry["bytes"]}
+                for format, entry in info["files"].items()
+            ]
+            for table, info in recorded["tables"].items()
+        }
+
+
+def get_downloads(datasette):
+    downloads = getattr(datasette, "_zeeker_downloads", None)
+    if downloads is None:
+        config = dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+        directory = config["directory"]
+        if not directory:
+            paths = [db.path for name, db in datasette.databases.items() if db.path and name != "_internal"]
+            directory = Path(paths[0]).parent / EXPORTS_DIRNAME if paths else None
+        downloads = Downloads(directory, config["base_url"])
+        datasette._zeeker_downloads = downloads
+    return downloads
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the
+    whole file (no, malformed or multiple ranges) or False if unsatisfiable
+    """
+    match = RANGE_RE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+class FileResponse:
+    """A file, or one byte range of it, read in chunks"""
+
+    def __init__(self, path, status, headers, start=0, length=0, body=True):
+        self.path = path
+        self.status = status
+        self.headers = headers
+        self.start = start
+        self.length = length
+        self.body = body
+
+    async def asgi_send(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": [[key.encode("latin-1"), value.encode("latin-1")] for key, value in self.headers.items()],
+        })
+        if not self.body or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        remaining = self.length
+        async with aiofiles.open(str(self.path), mode="rb") as fp:
+            await fp.seek(self.start)
+            while remaining:
+                chunk = await fp.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise OSError(f"{self.path} is shorter than expected")
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+
+async def download_file(request, datasette):
+    downloads = get_downloads(datasette)
+    relative = request.url_vars["path"]
+    entry = downloads.file(relative)
+    if entry is None:
+        raise NotFound("Download not found")
+    # The manifest lists every table, so it needs permission to view them all
+    tables = [(entry["database"], entry["table"])] if "table" in entry else sorted(downloads.table_names())
+    for database, table in tables:
+        await datasette.ensure_permissions(
+            request.actor, [("view-table", (database, table)), ("view-database", database), "view-instance"]
+        )
+    await datasette.ensure_permissions(request.actor, ["view-instance"])
+    path = downloads.directory / relative
+    try:
+        size = (await aiofiles.os.stat(str(path))).st_size
+    except OSError:
+        raise NotFound("Download not found")
+
+    etag = f'"{entry["sha256"]}"' if "sha256" in entry else None
+    headers = {
+        "content-type": CONTENT_TYPES.get(path.suffix, "application/octet-stream"),
+        "accept-ranges": "bytes",
+        "content-disposition": f'attachment; filename="{relative.replace("/", "-")}"',
+    }
+    if etag:
+        headers["etag"] = etag
+        headers["cache-control"] = "public, max-age=3600"
+        if request.headers.get("if-none-match") == etag:
+            return FileResponse(path, 304, headers, body=False)
+
+    byte_range = None
+    if "range" in request.headers and request.headers.get("if-range", etag) == etag:
+        byte_range = parse_range(request.headers["range"], size)
+    if byte_range is False:
+        headers["content-range"] = f"bytes */{size}"
+        return FileResponse(path, 416, headers, body=False)
+    body = request.method != "HEAD"
+    if byte_range:
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        headers["content-length"] = str(end - start + 1)
+        return FileResponse(path, 206, headers, start, end - start + 1, body)
+    headers["content-length"] = str(size)
+    return FileResponse(path, 200, headers, 0, size, body)
+
+
 async def sources_page(request, datasette):
+    downloads = get_downloads(datasette)
+
     # Get all databases
     databases = []
     for db_name in datasette.databases.keys():
@@ -43,6 +273,16 @@ async def sources_page(request, datasette):
         except:
             size = None
 
+        # Only the exports of tables the actor may view
+        table_downloads = {}
+        for table, files in downloads.tables(db_name).items():
+            visible, _ = await datasette.check_visibility(
+                request.actor,
+                permissions=[("view-table", (db_name, table)), ("view-database", db_name), "view-instance"],
+            )
+            if visible:
+                table_downloads[table] = files
+
         database_info = {
             "name": db_name,
             "description": metadata.get("description", ""),
@@ -51,7 +291,8 @@ async def sources_page(request, datasette):
             "license_url": metadata.get("license_url", ""),
             "tables": tables,
             "table_count": len(tables),
-            "size": size
+            "size": size,
+            "downloads": table_downloads
         }
         databases.append(database_info)
 
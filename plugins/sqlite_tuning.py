@@ -0,0 +1,126 @@
+# plugins/sqlite_tuning.py
+"""
+SQLite pragmas applied to every connection Datasette opens
+
+The served databases are immutable files, so reads can go through a memory map
+instead of read() syscalls, and a larger page cache keeps hot pages of big
+tables and FTS indexes resident. Sorts and GROUP BY temp b-trees stay in memory.
+
+Configure in metadata.json, globally and optionally per database:
+
+    "plugins": {
+        "zeeker-sqlite": {
+            "mmap_size": 268435456,   # bytes memory-mapped per connection, 0 disables
+            "cache_size": -65536,     # pages, or KiB when negative (64 MiB)
+            "temp_store": "MEMORY",   # DEFAULT, FILE or MEMORY
+            "threads": 0,             # auxiliary sort threads
+            "cache_spill": true
+        }
+    },
+    "databases": {
+        "judgments": {"plugins": {"zeeker-sqlite": {"mmap_size": 1073741824}}}
+    }
+
+Database settings override the global ones key by key; a null value leaves
+SQLite's default in place. Settings are validated once per database, at
+startup: invalid values are logged and skipped, and each new connection
+runs only the validated pragmas. Datasette's internal database is left
+untouched.
+"""
+import logging
+
+from datasette import hookimpl
+
+PLUGIN_NAME = "zeeker-sqlite"
+
+DEFAULTS = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+    "threads": None,
+    "cache_spill": None,
+}
+
+TEMP_STORE_VALUES = {"DEFAULT", "FILE", "MEMORY"}
+
+SKIP_DATABASES = {"_internal"}
+
+logger = logging.getLogger("zeeker-sqlite")
+
+
+def _integer(value):
+    if isinstance(value, bool):
+        raise ValueError("expected an integer")
+    return int(value)
+
+
+def _temp_store(value):
+    value = str(value).upper()
+    if value not in TEMP_STORE_VALUES:
+        raise ValueError(f"expected one of {', '.join(sorted(TEMP_STORE_VALUES))}")
+    return value
+
+
+def _boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError("expected true or false")
+    return "ON" if value else "OFF"
+
+
+# Pragma name -> converter producing the literal used in the PRAGMA statement
+PRAGMAS = {
+    "mmap_size": _integer,
+    "cache_size": _integer,
+    "temp_store": _temp_store,
+    "threads": _integer,
+    "cache_spill": _boolean,
+}
+
+
+def resolve_config(datasette, database):
+    """Defaults, then the global plugin config, then the database's own config"""
+    config = dict(DEFAULTS)
+    config.update(datasette.plugin_config(PLUGIN_NAME) or {})
+    config.update(datasette.plugin_config(PLUGIN_NAME, database=database, fallback=False) or {})
+    return config
+
+
+def pragma_statements(config, database=None):
+    """PRAGMA statements for the known, non-null settings in config"""
+    statements = []
+    for name, convert in PRAGMAS.items():
+        value = config.get(name)
+        if value is None:
+            continue
+        try:
+            statements.append(f"PRAGMA {name}={convert(value)}")
+        except (TypeError, ValueError) as e:
+            logger.warning("Ignoring %s=%r for database %s: %s", name, value, database, e)
+    for name in config.keys() - PRAGMAS.keys():
+        logger.warning("Ignoring unknown setting %s for database %s", name, database)
+    return statements
+
+
+def database_statements(datasette, database):
+    """Validated PRAGMA statements for database, worked out (and warned about) once"""
+    statements = getattr(datasette, "_zeeker_sqlite_pragmas", None)
+    if statements is None:
+        statements = datasette._zeeker_sqlite_pragmas = {}
+    if database not in statements:
+        statements[database] = pragma_statements(resolve_config(datasette, database), database)
+    return statements[database]
+
+
+@hookimpl
+def startup(datasette):
+    for database in datasette.databases:
+        if database not in SKIP_DATABASES:
+            database_statements(datasette, database)
+
+
+@hookimpl
+def prepare_connection(conn, database, datasette):
+    if database in SKIP_DATABASES:
+        return
+    for statement in database_statements(datasette, database):
+        conn.execute(statement)
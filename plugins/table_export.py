@@ -0,0 +1,336 @@
+# plugins/table_export.py
+"""
+Streaming full-table exports: /-/export/<database>/<table>.<csv|ndjson|parquet>
+
+Downloading a whole table through /db/table.json means following _next
+links page by page, a request (and a COUNT, facets and template work) per
+page. This route reads the table in keyset order, chunk_size rows per query
+on Datasette's read connections (WHERE (pk) > (last pk) ORDER BY pk, so
+every chunk is an index range scan however deep into the table), and writes
+each chunk to the response as it is encoded. Memory stays bounded by one
+chunk, or one Parquet row group, regardless of table size, and no executor
+thread is held between chunks.
+
+- csv: header row, then one row per record; BLOBs are base64
+- ndjson: one JSON object per line; BLOBs as {"$base64": true, "encoded": ...}
+  as in Datasette's JSON
+- parquet: requires pyarrow (the columnar extra: uv sync --extra columnar).
+  INTEGER and REAL columns keep their types, everything else is a string
+  (BLOB columns are binary); values that do not fit their column's declared
+  type are written as null. Table pages only link to it when pyarrow is
+  installed.
+
+Exports need the view-table permission and are disabled along with
+Datasette's allow_csv_stream setting. Configure in metadata.json:
+
+    "plugins": {
+        "zeeker-export": {
+            "chunk_size": 1000,         # rows per query
+            "row_group_rows": 65536     # rows per Parquet row group
+        }
+    }
+"""
+import base64
+import csv
+import importlib.util
+import io
+import json
+import logging
+import re
+from urllib.parse import quote
+
+from datasette import hookimpl
+from datasette.utils import escape_sqlite, tilde_decode, tilde_encode
+from datasette.utils.asgi import Forbidden, NotFound, Response
+
+PLUGIN_NAME = "zeeker-export"
+
+logger = logging.getLogger(PLUGIN_NAME)
+
+DEFAULTS = {
+    "chunk_size": 1000,
+    "row_group_rows": 65536,
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_path(database, table, format):
+    """Path of a table export, for templates and other plugins"""
+    return f"/-/export/{tilde_encode(database)}/{tilde_encode(table)}.{format}"
+
+
+def content_disposition(filename):
+    """
+    attachment header for filename: an ASCII filename= with anything that
+    could break the quoted string replaced, and the exact name as RFC 5987
+    filename*= for clients that read it
+    """
+    fallback = re.sub(r"[^\w.\- ]", "_", filename, flags=re.ASCII)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+async def keyset_columns(db, table):
+    """Columns giving a unique, indexed order: the primary key, else rowid"""
+    return await db.primary_keys(table) or ["rowid"]
+
+
+async def table_chunks(db, table, columns, keys, chunk_size):
+    """Yield lists of row tuples (columns only) in key order, one query per chunk"""
+    select = ", ".join(escape_sqlite(column) for column in columns + keys)
+    order = ", ".join(escape_sqlite(key) for key in keys)
+    placeholders = ", ".join("?" for _ in keys)
+    after = None
+    while True:
+        where = f"WHERE ({order}) > ({placeholders}) " if after is not None else ""
+        rows = (await db.execute(
+            f"SELECT {select} FROM {escape_sqlite(table)} {where}ORDER BY {order} LIMIT {int(chunk_size)}",
+            after or [],
+        )).rows
+        if not rows:
+            return
+        yield [tuple(row)[:len(columns)] for row in rows]
+        if len(rows) < chunk_size:
+            return
+        after = list(rows[-1])[len(columns):]
+
+
+def text_value(value):
+    """A value for CSV or a Parquet string column: BLOBs as base64"""
+    return base64.b64encode(value).decode("latin-1") if isinstance(value, bytes) else value
+
+
+def json_default(value):
+    """json.dumps default for BLOBs, in the form Datasette's JSON uses"""
+    if isinstance(value, bytes):
+        return {"$base64": True, "encoded": base64.b64encode(value).decode("latin-1")}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class CsvEncoder:
+    def __init__(self, columns, types=None):
+        self.columns = columns
+
+    def _write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    def header(self):
+        return self._write([self.columns])
+
+    def encode(self, rows):
+        return self._write([text_value(value) for value in row] for row in rows)
+
+    def finish(self):
+        return b""
+
+
+class NdjsonEncoder:
+    def __init__(self, columns, types=None):
+        self.columns = columns
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        return "".join(
+            json.dumps(dict(zip(self.columns, row)), default=json_default) + "\n" for row in rows
+        ).encode("utf-8")
+
+    def finish(self):
+        return b""
+
+
+class _Sink:
+    """Write-only file object for pyarrow, drained after every row group"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_type(declared):
+    """Arrow type for a column from its declared SQLite type (by affinity)"""
+    import pyarrow as pa
+
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return pa.int64()
+    if any(name in declared for name in ("CHAR", "CLOB", "TEXT")):
+        return pa.string()
+    if "BLOB" in declared:
+        return pa.binary()
+    if any(name in declared for name in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    return pa.string()
+
+
+def arrow_array(values, field):
+    """
+    (Arrow array, values written as null) for one column of a schema from
+    parquet_type; values that do not fit the column's type become null
+    """
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=field.type), 0
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+        pass
+    if pa.types.is_string(field.type):
+        return pa.array([None if value is None else str(text_value(value)) for value in values], type=field.type), 0
+    expected = int if pa.types.is_integer(field.type) else (int, float) if pa.types.is_floating(field.type) \
+        else bytes
+    converted = [value if isinstance(value, expected) and not isinstance(value, bool) else None
+                 for value in values]
+    mismatched = sum(1 for value, kept in zip(values, converted) if value is not None and kept is None)
+    return pa.array(converted, type=field.type), mismatched
+
+
+class ParquetEncoder:
+    def __init__(self, columns, types, row_group_rows=DEFAULTS["row_group_rows"]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([(column, parquet_type(declared)) for column, declared in zip(columns, types)])
+        self.row_group_rows = row_group_rows
+        self.pending = []
+        self.sink = _Sink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema)
+        self.mismatched = 0
+
+    def _array(self, values, field):
+        array, mismatched = arrow_array(values, field)
+        self.mismatched += mismatched
+        return array
+
+    def _flush(self):
+        if not self.pending:
+            return b""
+        columns = list(zip(*self.pending))
+        self.pending = []
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self._array(list(values), field) for values, field in zip(columns, self.schema)], schema=self.schema,
+        ))
+        return self.sink.drain()
+
+    def header(self):
+        return b""
+
+    def encode(self, rows):
+        self.pending.extend(rows)
+        return self._flush() if len(self.pending) >= self.row_group_rows else b""
+
+    def finish(self):
+        data = self._flush()
+        self.writer.close()
+        if self.mismatched:
+            logger.warning(f"{self.mismatched} values did not match their column type and were written as null")
+        return data + self.sink.drain()
+
+
+ENCODERS = {"csv": CsvEncoder, "ndjson": NdjsonEncoder, "parquet": ParquetEncoder}
+
+
+class ExportResponse:
+    """Streams encoded chunks as they are read"""
+
+    def __init__(self, chunks, encoder, format, filename):
+        self.chunks = chunks
+        self.encoder = encoder
+        self.headers = [
+            (b"content-type", CONTENT_TYPES[format].encode()),
+            (b"content-disposition", content_disposition(filename).encode("ascii")),
+        ]
+
+    async def asgi_send(self, send):
+        await send({"type": "http.response.start", "status": 200, "headers": self.headers})
+        body = self.encoder.header()
+        try:
+            async for rows in self.chunks:
+                body += self.encoder.encode(rows)
+                if body:
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                    body = b""
+            body += self.encoder.finish()
+        except Exception as e:
+            # Headers are sent: fail the transfer rather than end a truncated file cleanly
+            logger.error(f"Export failed part way: {e}")
+            raise
+        await send({"type": "http.response.body", "body": body})
+
+
+def get_config(datasette):
+    return dict(DEFAULTS, **(datasette.plugin_config(PLUGIN_NAME) or {}))
+
+
+async def export_table(datasette, request):
+    database = tilde_decode(request.url_vars["database"])
+    table = tilde_decode(request.url_vars["table"])
+    format = request.url_vars["format"]
+    db = datasette.databases.get(database)
+    if db is None or not await db.table_exists(table):
+        raise NotFound(f"Table not found: {table}")
+    await datasette.ensure_permissions(request.actor, [
+        ("view-table", (database, table)), ("view-database", database), "view-instance",
+    ])
+    if not datasette.setting("allow_csv_stream"):
+        raise Forbidden("Streaming exports are disabled")
+
+    config = get_config(datasette)
+    details = [column for column in await db.table_column_details(table) if column.hidden != 1]
+    columns = [column.name for column in details]
+    if format == "parquet":
+        try:
+            encoder = ParquetEncoder(columns, [column.type for column in details], int(config["row_group_rows"]))
+        except ImportError:
+            return Response.text("Parquet export requires pyarrow to be installed", status=501)
+    else:
+        encoder = ENCODERS[format](columns)
+    keys = await keyset_columns(db, table)
+    chunks = table_chunks(db, table, columns, keys, int(config["chunk_size"]))
+    return ExportResponse(chunks, encoder, format, f"{table}.{format}")
+
+
+def parquet_available():
+    """Whether pyarrow is installed, so Parquet exports can be offered"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+@hookimpl
+def extra_template_vars():
+    return {"parquet_export": parquet_available()}
+
+
+@hookimpl
+def register_routes():
+    return [
+        (r"^/-/export/(?P<database>[^/]+)/(?P<table>[^/]+?)\.(?P<format>csv|ndjson|parquet)$", export_table),
+    ]
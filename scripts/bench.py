@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""
+HTTP load test for the Zeeker Datasette deployment.
+
+Starts Datasette in-process with the repo's metadata, templates, static files
+and plugins, then drives a concurrent request mix through its ASGI app and
+reports latency percentiles and throughput per route. Requests never leave
+the process, so results measure Datasette and plugin cost, not the network.
+
+Used by `manage.py bench`; reports can be saved as JSON and compared with a
+previous run to spot regressions between releases.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+# Percentiles reported for every route
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class RouteStats:
+    """Latency samples for one route label"""
+
+    latencies: List[float] = field(default_factory=list)
+    requests: int = 0
+    errors: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 when empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def build_datasette(database_files: Iterable[Path], project_dir: Path = PROJECT_DIR):
+    """Datasette configured like entrypoint.sh: immutable databases plus repo assets"""
+    from datasette.app import Datasette
+
+    metadata_file = project_dir / "metadata.json"
+    metadata = json.loads(metadata_file.read_text()) if metadata_file.exists() else {}
+    static_dir = project_dir / "static"
+
+    return Datasette(
+        immutables=[str(path) for path in database_files],
+        metadata=metadata,
+        template_dir=str(project_dir / "templates"),
+        plugins_dir=str(project_dir / "plugins"),
+        static_mounts=[("static", str(static_dir))] if static_dir.exists() else None,
+    )
+
+
+async def default_routes(datasette, search_term: str = "appeal") -> Dict[str, str]:
+    """
+    Route mix covering the custom pages, search and table JSON endpoints.
+
+    Returns {label: path}. Labels group per-database paths so reports stay
+    comparable when the number of databases changes.
+    """
+    routes = {
+        "index": "/",
+        "sources": "/sources",
+        "status": "/status",
+        "search_all": f"/-/search?q={search_term}",
+    }
+
+    for db_name, db in datasette.databases.items():
+        if db_name == "_internal":
+            continue
+        hidden = set(await db.hidden_table_names())
+        tables = [table for table in await db.table_names() if table not in hidden]
+        if not tables:
+            continue
+        # Prefer a full-text searchable table so _search is exercised
+        fts_tables = [table for table in tables if await db.fts_table(table)]
+        table = (fts_tables or tables)[0]
+        routes.setdefault("database_json", f"/{db_name}.json")
+        routes.setdefault("table_json", f"/{db_name}/{table}.json?_size=50")
+        sort_column = (await db.table_columns(table))[0]
+        routes.setdefault("table_json_sorted", f"/{db_name}/{table}.json?_sort_desc={sort_column}&_size=50")
+        if fts_tables:
+            routes.setdefault("table_search_json", f"/{db_name}/{table}.json?_search={search_term}")
+
+    return routes
+
+
+async def run_load(datasette, routes: Dict[str, str], concurrency: int = 10,
+                   requests: int = 500, warmup: int = 1) -> Dict:
+    """
+    Issue `requests` requests spread round-robin over routes using
+    `concurrency` workers, after `warmup` untimed passes over every route.
+
+    Returns a report dict (see summarize).
+    """
+    # httpx logs every in-process request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    await datasette.invoke_startup()
+    client = datasette.client
+    for _ in range(warmup):
+        for path in routes.values():
+            await client.get(path)
+
+    stats = {label: RouteStats() for label in routes}
+    schedule = list(routes.items())
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            label, path = schedule[i % len(schedule)]
+            route = stats[label]
+            route.requests += 1
+            start = time.perf_counter()
+            try:
+                response = await client.get(path)
+            except Exception:
+                route.errors += 1
+                continue
+            route.latencies.append(time.perf_counter() - start)
+            route.statuses[response.status_code] = route.statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                route.errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return summarize(stats, routes, elapsed, concurrency)
+
+
+def summarize(stats: Dict[str, RouteStats], routes: Dict[str, str], elapsed: float,
+              concurrency: int) -> Dict:
+    """Per-route and overall latency percentiles (ms) and throughput (req/s)"""
+
+    def describe(latencies, requests, errors):
+        entry = {
+            "requests": requests,
+            "errors": errors,
+            "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        }
+        for pct in PERCENTILES:
+            entry[f"p{pct}_ms"] = percentile(latencies, pct) * 1000
+        entry["rps"] = len(latencies) / elapsed if elapsed else 0.0
+        return entry
+
+    all_latencies = [value for route in stats.values() for value in route.latencies]
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "routes": {
+            label: dict(describe(route.latencies, route.requests, route.errors), path=routes[label], statuses=route.statuses)
+            for label, route in stats.items()
+        },
+        "total": describe(
+            all_latencies,
+            sum(route.requests for route in stats.values()),
+            sum(route.errors for route in stats.values()),
+        ),
+    }
+
+
+def format_report(report: Dict, baseline: Optional[Dict] = None) -> str:
+    """Plain-text table; with a baseline report, adds the p95 change per route"""
+    header = f"{'route':<20} {'reqs':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}"
+    if baseline:
+        header += f" {'Δp95':>8}"
+    lines = [header, "-" * len(header)]
+
+    rows = list(report["routes"].items()) + [("TOTAL", report["total"])]
+    previous = dict((baseline or {}).get("routes", {}), TOTAL=(baseline or {}).get("total"))
+    for label, entry in rows:
+        line = (
+            f"{label:<20} {entry['requests']:>6} {entry['errors']:>4} "
+            f"{entry['p50_ms']:>8.1f} {entry['p95_ms']:>8.1f} {entry['p99_ms']:>8.1f} {entry['rps']:>8.1f}"
+        )
+        if baseline:
+            before = previous.get(label)
+            if before and before.get("p95_ms"):
+                change = (entry["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+                line += f" {change:>+7.0f}%"
+            else:
+                line += f" {'n/a':>8}"
+        lines.append(line)
+
+    lines.append(f"\n{report['total']['requests']} requests in {report['elapsed_s']:.2f}s "
+                 f"at concurrency {report['concurrency']}")
+    return "\n".join(lines)
+
+
+def run_benchmark(database_files: Iterable[Path], concurrency: int = 10, requests: int = 500,
+                  routes: Optional[Dict[str, str]] = None, project_dir: Path = PROJECT_DIR) -> Dict:
+    """Build Datasette and run the load test synchronously; returns the report"""
+    datasette = build_datasette(database_files, project_dir)
+
+    async def main():
+        selected = routes or await default_routes(datasette)
+        return await run_load(datasette, selected, concurrency=concurrency, requests=requests)
+
+    return asyncio.run(main())
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""
+Helpers shared by the download pipeline scripts.
+
+Kept free of imports from the other scripts, so any of them can use it
+without an import cycle.
+"""
+import hashlib
+from pathlib import Path
+
+
+def file_sha256(path: Path) -> str:
+    """Return the SHA-256 hex digest of a local file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table, column or index name for use in SQLite SQL."""
+    return '"{}"'.format(name.replace('"', '""'))
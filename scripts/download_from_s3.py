@@ -3,17 +3,49 @@
 Download SQLite databases and assets from S3 with three-pass merge system.
 Enhanced version of the original script with asset management capabilities.
 """
+import contextvars
 import json
 import logging
 import os
+import shutil
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Set
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
 
+try:
+    from scripts.common import file_sha256
+    from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME as EXPORTS_MANIFEST_FILENAME, \
+        build_exports, format_report as format_exports_report
+    from scripts.fts_builder import ensure_fts, format_report as format_fts_report, fts_config
+    from scripts.index_advisor import IndexAdvisor, load_query_log
+    from scripts.metadata_merge import merge_metadata, merge_overlays
+    from scripts.search_index import SEARCH_INDEX_FILENAME, build_search_index, format_report as format_search_report
+    from scripts.sort_indexes import ensure_sort_indexes, format_report as format_sort_report, sort_config
+    from scripts.sqlite_optimize import optimize_database
+    from scripts.tracing import SpanTracer
+except ImportError:
+    from common import file_sha256
+    from export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME as EXPORTS_MANIFEST_FILENAME, \
+        build_exports, format_report as format_exports_report
+    from fts_builder import ensure_fts, format_report as format_fts_report, fts_config
+    from index_advisor import IndexAdvisor, load_query_log
+    from metadata_merge import merge_metadata, merge_overlays
+    from search_index import SEARCH_INDEX_FILENAME, build_search_index, format_report as format_search_report
+    from sort_indexes import ensure_sort_indexes, format_report as format_sort_report, sort_config
+    from sqlite_optimize import optimize_database
+    from tracing import SpanTracer
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,6 +54,536 @@ logging.basicConfig(
 )
 logger = logging.getLogger("s3-downloader")
 
+# Number of concurrent S3 transfers (and pooled HTTP connections)
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Asset sync manifest, stored next to the static directory
+ASSET_MANIFEST_FILENAME = ".asset-manifest.json"
+
+# Run metrics read by the /-/metrics plugin, stored next to the databases
+METRICS_SNAPSHOT_FILENAME = ".zeeker-metrics.json"
+
+# Timing spans of the last download run (JSON lines), next to the databases
+TRACE_FILENAME = ".zeeker-trace.jsonl"
+
+# Record of optimized databases (source and result hashes), next to the databases
+OPTIMIZE_MANIFEST_FILENAME = ".zeeker-optimize.json"
+
+
+def write_json_atomic(path: Path, data, **dump_kwargs) -> None:
+    """Write JSON to path via a temp file and rename, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+def record_metrics_run(path: Path, job: str, success: bool, duration: float,
+                       bytes_downloaded: int = 0, **values) -> None:
+    """
+    Record one run of job (e.g. "download", "refresh") in the metrics snapshot.
+
+    Keeps per-job last-run gauges, run counters by status and a cumulative
+    byte counter. Extra keyword values are stored as last-run gauges. Failing
+    to write metrics is logged and never fails the run itself.
+    """
+    path = Path(path)
+    try:
+        snapshot = json.loads(path.read_text())
+    except (OSError, ValueError):
+        snapshot = {}
+
+    now = time.time()
+    jobs = snapshot.setdefault("jobs", {})
+    entry = jobs.setdefault(job, {})
+    status = "success" if success else "failure"
+    runs = entry.setdefault("runs_total", {})
+    runs[status] = runs.get(status, 0) + 1
+    entry["bytes_downloaded_total"] = entry.get("bytes_downloaded_total", 0) + bytes_downloaded
+    entry["last_run_timestamp"] = now
+    entry["last_status"] = status
+    entry["last"] = dict(values, duration_seconds=duration, bytes_downloaded=bytes_downloaded)
+    if success:
+        entry["last_success_timestamp"] = now
+        entry["last_success_duration_seconds"] = duration
+    snapshot["version"] = 1
+
+    try:
+        write_json_atomic(path, snapshot, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not write metrics snapshot {path}: {e}")
+
+
+class AssetManifest:
+    """
+    Record of downloaded assets: S3 key → ETag, size, local path and local hash.
+
+    An object is skipped when S3 still reports the same ETag and size and the
+    local file still has the hash it had when it was downloaded.
+    """
+
+    def __init__(self, path: Path, load: bool = True):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen: Set[str] = set()
+        self.entries: Dict[str, Dict] = {}
+
+        if load and path.exists():
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f).get("objects", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable asset manifest {path}: {e}")
+
+    def is_current(self, key: str, obj: Dict, local_path: Path) -> bool:
+        """Check whether local_path already holds this version of the object."""
+        with self._lock:
+            entry = self.entries.get(key)
+        if (
+            not entry
+            or entry.get("etag") != obj.get("ETag")
+            or entry.get("size") != obj.get("Size")
+            or entry.get("path") != str(local_path)
+            or not local_path.is_file()
+        ):
+            return False
+
+        if file_sha256(local_path) != entry.get("sha256"):
+            return False
+
+        with self._lock:
+            self._seen.add(key)
+        return True
+
+    def record(self, key: str, obj: Dict, local_path: Path) -> None:
+        """Remember a freshly downloaded object."""
+        if not local_path.is_file():
+            return
+
+        entry = {
+            "etag": obj.get("ETag"),
+            "size": obj.get("Size"),
+            "path": str(local_path),
+            "sha256": file_sha256(local_path),
+        }
+        with self._lock:
+            self.entries[key] = entry
+            self._seen.add(key)
+
+    def save(self) -> None:
+        """Persist entries seen during this run, dropping objects that disappeared."""
+        with self._lock:
+            entries = {key: self.entries[key] for key in sorted(self._seen) if key in self.entries}
+        write_json_atomic(self.path, {"version": 1, "objects": entries}, indent=2)
+
+
+class DatabaseOptimizer:
+    """
+    Optional ANALYZE/VACUUM/PRAGMA optimize stage for fresh database files.
+
+    The manifest records, per database file, the hash of the downloaded source,
+    the optimization settings and the hash of the optimized result. A download
+    whose source hash and settings match, while the live file still has the
+    optimized hash, is not optimized again. Optimization is best effort: a
+    file that fails is installed as downloaded.
+
+    Before ANALYZE, FTS indexes are verified, built for the searchable
+    columns configured in metadata and optimized (see fts_builder). With an
+    index_advisor, indexes for faceted, sorted and filtered columns that reach
+    its minimum measured speedup are built as well, and with sort_indexes,
+    descending indexes on the sortable columns of large tables (see
+    sort_indexes) so deep sorted pages read one page of rows.
+    """
+
+    def __init__(self, manifest_path: Path, vacuum: bool = False, page_size: Optional[int] = None,
+                 index_advisor: Optional[IndexAdvisor] = None, metadata: Optional[Dict] = None,
+                 sort_indexes: bool = False):
+        self.manifest_path = manifest_path
+        self.settings = {"vacuum": vacuum, "page_size": page_size}
+        self.index_advisor = index_advisor
+        self.sort_indexes = sort_indexes
+        self.metadata: Dict = {}
+        if metadata is not None:
+            self.set_metadata(metadata)
+        self.stats = {"databases_optimized": 0, "databases_unchanged": 0, "optimize_failures": 0,
+                      "optimize_seconds": 0.0, "indexes_built": 0, "fts_built": 0, "sort_indexes_built": 0}
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+
+        if manifest_path.exists():
+            try:
+                with open(manifest_path, "r") as f:
+                    self.entries = json.load(f).get("databases", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable optimization manifest {manifest_path}: {e}")
+
+    @classmethod
+    def from_env(cls, manifest_path: Path, metadata_file: Optional[Path] = None) -> Optional["DatabaseOptimizer"]:
+        """
+        Build from ZEEKER_OPTIMIZE_* settings, or None when the stage is disabled.
+
+        Table settings are read from metadata_file. ZEEKER_BUILD_INDEXES adds
+        the index advisor, with query logs from ZEEKER_QUERY_LOG, and
+        ZEEKER_SORT_INDEXES the sort indexes.
+        """
+        if not _env_flag("ZEEKER_OPTIMIZE_DATABASES"):
+            return None
+        page_size = os.getenv("ZEEKER_OPTIMIZE_PAGE_SIZE")
+        metadata = read_metadata(metadata_file)
+        return cls(manifest_path, vacuum=_env_flag("ZEEKER_OPTIMIZE_VACUUM"),
+                   page_size=int(page_size) if page_size else None,
+                   index_advisor=index_advisor_from_env(metadata), metadata=metadata,
+                   sort_indexes=_env_flag("ZEEKER_SORT_INDEXES"))
+
+    def set_metadata(self, metadata: Dict) -> None:
+        """Table settings (searchable columns, facets, sorts) used by the FTS and index steps."""
+        self.metadata = metadata
+        if self.index_advisor:
+            self.index_advisor.metadata = metadata
+
+    def install(self, downloaded: Path, live: Path) -> str:
+        """
+        Optimize a downloaded file and move it over live, or discard it when
+        live is already the optimized version of the same source.
+        """
+        status = self._process(downloaded, live)
+        if status == "unchanged":
+            downloaded.unlink()
+        else:
+            os.replace(downloaded, live)
+        return status
+
+    def prepare(self, staged: Path, live: Path) -> str:
+        """
+        Optimize a staged file in place before it is swapped in; when unchanged,
+        copy the live (already optimized) file over it instead.
+        """
+        status = self._process(staged, live)
+        if status == "unchanged":
+            shutil.copyfile(live, staged)
+        return status
+
+    def _process(self, path: Path, live: Path) -> str:
+        """Return "unchanged", or optimize path and return "optimized" or "failed"."""
+        source_hash = file_sha256(path)
+        searchable = fts_config(self.metadata, live.stem)
+        settings = dict(self.settings, fts=searchable)
+        if self.index_advisor:
+            settings["indexes"] = self.index_advisor.fingerprint(live.stem)
+        if self.sort_indexes:
+            settings["sort_indexes"] = sort_config(self.metadata, live.stem)
+        with self._lock:
+            entry = self.entries.get(live.name)
+        if (
+            entry
+            and entry.get("source_sha256") == source_hash
+            and entry.get("settings") == settings
+            and live.is_file()
+            and file_sha256(live) == entry.get("sha256")
+        ):
+            logger.info(f"Database unchanged, skipping optimization: {live.name}")
+            self._count(databases_unchanged=1)
+            return "unchanged"
+
+        start = time.perf_counter()
+        indexes = []
+        sort_indexes = []
+        try:
+            steps = {}
+            steps["fts"], fts_built = self._ensure_fts(path, searchable)
+            if self.index_advisor:
+                steps["indexes"], indexes = self._build_indexes(path, live.stem)
+            if self.sort_indexes:
+                steps["sort_indexes"], sort_indexes = self._build_sort_indexes(path, live.stem)
+            steps.update(optimize_database(path, **self.settings))
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Could not optimize {live.name}, installing it as downloaded: {e}")
+            self._count(optimize_failures=1)
+            with self._lock:
+                self.entries.pop(live.name, None)
+            return "failed"
+
+        seconds = time.perf_counter() - start
+        logger.info(f"Optimized {live.name} in {seconds:.2f}s "
+                    f"({', '.join(f'{step} {value:.2f}s' for step, value in steps.items())})")
+        self._count(databases_optimized=1, optimize_seconds=seconds, indexes_built=len(indexes),
+                    fts_built=fts_built, sort_indexes_built=len(sort_indexes))
+        with self._lock:
+            self.entries[live.name] = {
+                "source_sha256": source_hash,
+                "sha256": file_sha256(path),
+                "settings": settings,
+                "seconds": seconds,
+                "steps": steps,
+                "indexes": indexes + sort_indexes,
+            }
+        return "optimized"
+
+    def _ensure_fts(self, path: Path, searchable: Dict):
+        """Verify, build and optimize FTS indexes; return (seconds, indexes built or rebuilt)."""
+        start = time.perf_counter()
+        reports = ensure_fts(path, searchable)
+        for report in reports:
+            logger.info(f"{path.name}: {format_fts_report(report)}")
+        built = sum(report["action"] in ("built", "rebuilt") for report in reports)
+        return time.perf_counter() - start, built
+
+    def _build_indexes(self, path: Path, database: str):
+        """Run the index advisor in build mode; return (seconds, built index names)."""
+        start = time.perf_counter()
+        built = []
+        for report in self.index_advisor.advise(path, database, build=True):
+            if "measured_speedup" in report:
+                logger.info(
+                    f"Index {report['index']} on {report['table']}({', '.join(report['columns'])}): "
+                    f"{report['status']}, estimated {report['estimated_speedup']:.1f}x, "
+                    f"measured {report['measured_speedup']:.1f}x "
+                    f"({report['before_ms']:.1f}ms → {report['after_ms']:.1f}ms)"
+                )
+            if report["status"] == "failed":
+                logger.warning(f"Index {report['index']} on {report['table']}({', '.join(report['columns'])}) "
+                               f"failed: {report['reason']}")
+            if report["status"] == "built":
+                built.append(report["index"])
+        return time.perf_counter() - start, built
+
+    def _build_sort_indexes(self, path: Path, database: str):
+        """Build missing sort indexes; return (seconds, built index names)."""
+        start = time.perf_counter()
+        reports = ensure_sort_indexes(path, self.metadata, database)
+        for report in reports:
+            if report["action"] != "exists":
+                logger.info(f"{path.name}: {format_sort_report(report)}")
+        return time.perf_counter() - start, [report["index"] for report in reports if report["action"] == "built"]
+
+    def _count(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def save(self, databases: Set[str]) -> None:
+        """Persist entries for the given database file names, dropping the rest."""
+        with self._lock:
+            entries = {name: self.entries[name] for name in sorted(databases) if name in self.entries}
+        write_json_atomic(self.manifest_path, {"version": 1, "databases": entries}, indent=2)
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def read_metadata(path: Optional[Path]) -> Dict:
+    """Parsed metadata.json, or {} when it is missing or unreadable."""
+    if not path or not Path(path).exists():
+        return {}
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable metadata {path}: {e}")
+        return {}
+
+
+def index_advisor_from_env(metadata: Optional[Dict] = None) -> Optional[IndexAdvisor]:
+    """IndexAdvisor when ZEEKER_BUILD_INDEXES is set, using ZEEKER_QUERY_LOG and ZEEKER_INDEX_MIN_SPEEDUP."""
+    if not _env_flag("ZEEKER_BUILD_INDEXES"):
+        return None
+    query_logs = [Path(path) for path in os.getenv("ZEEKER_QUERY_LOG", "").split(os.pathsep) if path]
+    try:
+        return IndexAdvisor(
+            metadata, load_query_log(path for path in query_logs if path.exists()),
+            min_speedup=float(os.getenv("ZEEKER_INDEX_MIN_SPEEDUP", "2.0")),
+        )
+    except (OSError, ValueError) as e:
+        logger.warning(f"Index advisor disabled, could not read its inputs: {e}")
+        return None
+
+
+def update_search_index(data_dir: Path, metadata: Dict) -> Dict:
+    """
+    Bring the unified search index (see search_index) up to date with the
+    *.db files in data_dir and return run stats. Only databases whose hash
+    or searchable tables changed are re-indexed. Best effort: a failure is
+    logged and leaves the previous index in place.
+    """
+    start = time.perf_counter()
+    databases = {path.stem: path for path in sorted(Path(data_dir).glob("*.db"))}
+    try:
+        report = build_search_index(Path(data_dir) / SEARCH_INDEX_FILENAME, databases, metadata)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not update the search index: {e}")
+        return {"search_index_failures": 1}
+    for database, entry in report.items():
+        logger.info(format_search_report(database, entry))
+    indexed = [entry for entry in report.values() if entry["action"] == "indexed"]
+    return {
+        "search_indexed": len(indexed),
+        "search_index_rows": sum(entry["rows"] for entry in indexed),
+        "search_index_seconds": time.perf_counter() - start,
+    }
+
+
+def update_exports(data_dir: Path, upload: Optional[Callable[[Path, str], None]] = None) -> Dict:
+    """
+    Bring the bulk export files (see export_artifacts) in data_dir/exports up
+    to date with the *.db files in data_dir and return run stats. Only
+    databases whose hash changed are exported again. With upload, each file
+    written and then the manifest are passed to upload(path, key), the key
+    being the path relative to the exports directory. Best effort: a failure
+    is logged and leaves the previous exports in place.
+    """
+    start = time.perf_counter()
+    exports_dir = Path(data_dir) / EXPORTS_DIRNAME
+    databases = {path.stem: path for path in sorted(Path(data_dir).glob("*.db"))}
+    try:
+        report = build_exports(exports_dir, databases)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not update the bulk exports: {e}")
+        return {"export_failures": 1}
+    for database, entry in report.items():
+        logger.info(format_exports_report(database, entry))
+    exported = [entry for entry in report.values() if entry["action"] == "exported"]
+    stats = {
+        "exports_built": len(exported),
+        "export_files": sum(entry["files"] for entry in exported),
+        "export_bytes": sum(entry["bytes"] for entry in exported),
+    }
+    if upload and any(entry["action"] != "unchanged" for entry in report.values()):
+        keys = [key for entry in exported for key in entry["written"]] + [EXPORTS_MANIFEST_FILENAME]
+        try:
+            for key in keys:
+                upload(exports_dir / key, key)
+            stats["export_files_uploaded"] = len(keys)
+        except Exception as e:
+            logger.warning(f"Could not upload the bulk exports: {e}")
+            stats["export_failures"] = 1
+    stats["export_seconds"] = time.perf_counter() - start
+    return stats
+
+
+class S3ObjectIndex:
+    """
+    In-memory listing of every object under a root prefix (key → listing entry).
+
+    Built from a single paginated listing so existence checks and directory
+    walks below the root need no further S3 requests.
+    """
+
+    def __init__(self, root: str, objects: Dict[str, Dict]):
+        self.root = root
+        self.objects = objects
+        self._sorted_keys = sorted(objects)
+
+    @classmethod
+    def from_listing(cls, s3_client, bucket: str, root: str) -> "S3ObjectIndex":
+        """List everything under root, one request per page."""
+        objects = {}
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=root):
+            for obj in page.get("Contents", []):
+                if obj["Key"].startswith(root):
+                    objects[obj["Key"]] = obj
+        return cls(root, objects)
+
+    def covers(self, prefix: str) -> bool:
+        """Whether lookups under prefix can be answered by this index."""
+        return prefix.startswith(self.root)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.objects
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+    def iter_prefix(self, prefix: str) -> Iterator[Dict]:
+        """Yield listing entries whose key starts with prefix, in key order."""
+        for i in range(bisect_left(self._sorted_keys, prefix), len(self._sorted_keys)):
+            key = self._sorted_keys[i]
+            if not key.startswith(prefix):
+                break
+            yield self.objects[key]
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Whether any object key starts with prefix (S3 prefix semantics)."""
+        i = bisect_left(self._sorted_keys, prefix)
+        return i < len(self._sorted_keys) and self._sorted_keys[i].startswith(prefix)
+
+
+class S3TransferQueue:
+    """
+    Thread pool for S3 downloads shared by every pass of the download process.
+
+    Transfers that target the same local path run in submission order, so a
+    database-specific overlay always lands on top of the base asset it replaces.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="s3-transfer"
+        )
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Future] = {}
+        self._futures: List[Tuple[Future, Path, bool]] = []
+        self.failures: List[Tuple[Path, Exception]] = []
+
+    def submit(self, destination: Path, fn: Callable, *args, required: bool = True) -> Future:
+        """
+        Queue a transfer writing to destination. A failed transfer that is
+        not required is logged by join() instead of failing the whole run.
+        """
+        with self._lock:
+            previous = self._latest.get(str(destination))
+            # Run in a copy of the caller's context so timing spans keep their parent
+            context = contextvars.copy_context()
+            future = self._executor.submit(context.run, self._run_after, previous, fn, *args)
+            self._latest[str(destination)] = future
+            self._futures.append((future, destination, required))
+        return future
+
+    @staticmethod
+    def _run_after(previous: Optional[Future], fn: Callable, *args):
+        # The executor queue is FIFO, so an earlier transfer to the same path
+        # is already running (or finished) by the time we wait on it.
+        if previous is not None:
+            try:
+                previous.result()
+            except Exception:
+                pass  # Reported by join()
+        return fn(*args)
+
+    def join(self) -> int:
+        """
+        Wait for all queued transfers and return how many there were. Failed
+        transfers are logged and kept in failures; the first failure of a
+        required transfer is raised.
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+            self._latest.clear()
+
+        first_error = None
+        for future, destination, required in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Transfer to {destination} failed: {e}")
+                self.failures.append((destination, e))
+                if required and first_error is None:
+                    first_error = e
+
+        if first_error is not None:
+            raise first_error
+        return len(futures)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads, dropping transfers that have not started."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
 
 class ZeekerS3Downloader:
     """Enhanced S3 downloader with three-pass merge system for Zeeker assets."""
@@ -35,19 +597,48 @@ class ZeekerS3Downloader:
         self.static_dir = Path(os.getenv("DATASETTE_STATIC_DIR", "static"))
         self.plugins_dir = Path(os.getenv("DATASETTE_PLUGINS_DIR", "plugins"))
         self.metadata_file = Path(os.getenv("DATASETTE_METADATA_FILE", "metadata.json"))
+        self.asset_manifest_file = self.static_dir.parent / ASSET_MANIFEST_FILENAME
 
         # S3 paths (simplified structure)
         self.s3_databases_path = "latest"
+        self.s3_exports_path = EXPORTS_DIRNAME
         self.s3_assets_default_path = "assets/default"
         self.s3_assets_databases_path = "assets/databases"
+        self.s3_assets_root = "assets/"
 
         if not self.s3_bucket:
             logger.error("S3_BUCKET environment variable is required")
             sys.exit(1)
 
+        # Concurrent transfers; active only inside _transfer_session()
+        self.max_concurrency = int(os.environ.get("S3_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self._transfers: Optional[S3TransferQueue] = None
+        self.transfer_stats: Dict[str, int] = {}
+        self.search_index_stats: Dict = {}
+        self.export_stats: Dict = {}
+        self._stats_lock = threading.Lock()
+        self._tracer = SpanTracer()
+        self._asset_manifest: Optional[AssetManifest] = None
+        self._optimizer: Optional[DatabaseOptimizer] = None
+        self._pending_databases: List = []  # (downloaded, live) paths awaiting optimization
+
+        # Listing of assets/, fetched at most once per run
+        self._asset_index: Optional[S3ObjectIndex] = None
+        self._asset_index_loaded = False
+
         # Initialize S3 client
         self.s3_client = self._setup_s3_client()
 
+    @property
+    def metrics_file(self) -> Path:
+        """Metrics snapshot path, next to the databases unless ZEEKER_METRICS_FILE is set."""
+        return Path(os.getenv("ZEEKER_METRICS_FILE") or self.data_dir / METRICS_SNAPSHOT_FILENAME)
+
+    @property
+    def trace_file(self) -> Path:
+        """Span log path, next to the databases unless ZEEKER_TRACE_FILE is set."""
+        return Path(os.getenv("ZEEKER_TRACE_FILE") or self.data_dir / TRACE_FILENAME)
+
     def _setup_s3_client(self):
         """Initialize S3 client with configuration."""
         s3_endpoint_url = os.environ.get("S3_ENDPOINT_URL")
@@ -63,40 +654,137 @@ class ZeekerS3Downloader:
                 },
                 response_checksum_validation="when_required",
                 request_checksum_calculation="when_required",
+                # One pooled connection per transfer worker so they are reused
+                max_pool_connections=self.max_concurrency,
             )
         )
 
-    def download_complete_setup(self) -> bool:
+    @contextmanager
+    def _transfer_session(self):
+        """Share one transfer queue across all passes, draining it on exit."""
+        transfers = S3TransferQueue(self.max_concurrency)
+        self._transfers = transfers
+        try:
+            yield transfers
+            transfers.join()
+        finally:
+            self._transfers = None
+            transfers.shutdown()
+
+    def download_complete_setup(self, force: bool = False) -> bool:
         """
         Three-pass download and merge process:
         1. Download database files
         2. Download and merge base assets
         3. Download and merge database-specific assets
+
+        Assets unchanged since the last run are skipped unless force is set.
+        With ZEEKER_OPTIMIZE_DATABASES set, each database is downloaded beside
+        the live file, optimized (see DatabaseOptimizer) and then swapped in.
+        With ZEEKER_SEARCH_INDEX set, the unified search index is then updated
+        for databases that changed, and with ZEEKER_EXPORTS the bulk export
+        files (uploaded under exports/ beside latest/ with ZEEKER_EXPORTS_UPLOAD).
+        Duration and transfer counts are recorded in the metrics snapshot, and
+        timing spans for each pass, S3 call and file in the trace file.
         """
+        start = time.perf_counter()
+        self.transfer_stats = {"bytes_downloaded": 0, "files_downloaded": 0, "files_skipped": 0, "files_failed": 0}
+        self.search_index_stats = {}
+        self.export_stats = {}
+        try:
+            self._tracer = SpanTracer(self.trace_file).start()
+        except OSError as e:
+            # Tracing is diagnostic only: keep spans in memory and carry on
+            logger.warning(f"Could not open trace file {self.trace_file}, not writing spans: {e}")
+            self._tracer = SpanTracer()
+        try:
+            with self._tracer.span("download_complete_setup", force=force) as span:
+                success = self._run_complete_setup(force)
+                span.set(success=success, bytes=self.transfer_stats["bytes_downloaded"])
+        finally:
+            self._tracer.close()
+        stats = dict(self.transfer_stats)
+        if self._optimizer:
+            stats.update(self._optimizer.stats)
+        stats.update(self.search_index_stats)
+        stats.update(self.export_stats)
+        record_metrics_run(self.metrics_file, "download", success, time.perf_counter() - start,
+                           bytes_downloaded=stats.pop("bytes_downloaded"), **stats)
+        return success
+
+    def _run_complete_setup(self, force: bool) -> bool:
         try:
             logger.info("Starting three-pass asset download and merge process")
 
-            # Pass 1: Download database files
-            logger.info("Pass 1: Downloading database files")
-            databases = self._download_database_files()
-
-            if not databases:
-                logger.warning("No database files found")
-                return False
-
-            # Pass 2: Download base assets (or upload if missing)
-            logger.info("Pass 2: Setting up base assets")
-            if not self._setup_base_assets():
-                logger.error("Failed to setup base assets")
-                return False
-
-            # Pass 3: Download and merge database-specific assets
-            logger.info("Pass 3: Applying database-specific customizations")
-            for db_name in databases:
-                self._apply_database_customizations(db_name)
-
+            # A forced run starts from an empty manifest, so every asset is fetched
+            self._asset_manifest = AssetManifest(self.asset_manifest_file, load=not force)
+            self._optimizer = DatabaseOptimizer.from_env(self.data_dir / OPTIMIZE_MANIFEST_FILENAME,
+                                                         self.metadata_file)
+            self._invalidate_asset_index()
+
+            # All passes queue their downloads on one shared transfer queue.
+            # Pass spans cover listing and queueing; the files themselves are
+            # timed by their own spans and the wait for them by transfers.drain.
+            span = self._tracer.span
+            with self._transfer_session() as transfers:
+                # Pass 1: Download database files
+                logger.info("Pass 1: Downloading database files")
+                with span("pass1.database_files") as pass_span:
+                    databases = self._download_database_files()
+                    pass_span.set(databases=len(databases))
+
+                if not databases:
+                    logger.warning("No database files found")
+                    return False
+
+                # Pass 2: Download base assets (or upload if missing)
+                logger.info("Pass 2: Setting up base assets")
+                with span("pass2.base_assets"):
+                    base_ready = self._setup_base_assets()
+                if not base_ready:
+                    logger.error("Failed to setup base assets")
+                    return False
+
+                # Pass 3: Download and merge database-specific assets
+                logger.info("Pass 3: Applying database-specific customizations")
+                with span("pass3.customizations"):
+                    for db_name in databases:
+                        with span("customize_database", database=db_name):
+                            self._apply_database_customizations(db_name)
+
+                # Metadata merging needs every file on disk
+                # Failed asset transfers are logged and counted; a failed
+                # database download raises and fails the run
+                with span("transfers.drain") as drain_span:
+                    completed = transfers.join()
+                    drain_span.set(transfers=completed, failed=len(transfers.failures))
+                if transfers.failures:
+                    self._count_transfer(files_failed=len(transfers.failures))
+                    logger.warning(f"{len(transfers.failures)} of {completed} asset transfers failed")
+                logger.info(f"Completed {completed} S3 transfers")
+
+            with span("asset_manifest.save"):
+                self._asset_manifest.save()
             # Merge all metadata
-            self._merge_all_metadata(databases)
+            with span("metadata.merge", databases=len(databases)):
+                self._merge_all_metadata(databases)
+
+            if self._optimizer:
+                with span("databases.optimize", databases=len(databases)):
+                    self._install_databases()
+                self._optimizer.save({f"{db_name}.db" for db_name in databases})
+                logger.info(f"Database optimization took {self._optimizer.stats['optimize_seconds']:.2f}s")
+
+            if _env_flag("ZEEKER_SEARCH_INDEX"):
+                with span("search_index.update") as index_span:
+                    self.search_index_stats = update_search_index(self.data_dir, read_metadata(self.metadata_file))
+                    index_span.set(**self.search_index_stats)
+
+            if _env_flag("ZEEKER_EXPORTS"):
+                with span("exports.update") as exports_span:
+                    upload = self._upload_export if _env_flag("ZEEKER_EXPORTS_UPLOAD") else None
+                    self.export_stats = update_exports(self.data_dir, upload)
+                    exports_span.set(**self.export_stats)
 
             logger.info("Asset download and merge process completed successfully")
             return True
@@ -105,6 +793,12 @@ class ZeekerS3Downloader:
             logger.error(f"Error in download process: {e}")
             return False
 
+        finally:
+            # Downloads never swapped in (early return or error)
+            for downloaded, _ in self._pending_databases:
+                downloaded.unlink(missing_ok=True)
+            self._pending_databases = []
+
     def _download_database_files(self) -> Set[str]:
         """Download .db files and return set of database names."""
         self.data_dir.mkdir(exist_ok=True)
@@ -131,10 +825,11 @@ class ZeekerS3Downloader:
                     local_path = self.data_dir / filename
 
                     logger.info(f"Downloading database: {key} → {local_path}")
-                    self.s3_client.download_file(self.s3_bucket, key, str(local_path))
+                    fetch = self._fetch_database if self._optimizer else self._fetch_file
+                    self._submit(local_path, fetch, key, local_path)
                     databases.add(db_name)
 
-            logger.info(f"Downloaded {len(databases)} database files: {databases}")
+            logger.info(f"Found {len(databases)} database files: {databases}")
             return databases
 
         except Exception as e:
@@ -156,6 +851,33 @@ class ZeekerS3Downloader:
             logger.error(f"Error setting up base assets: {e}")
             return False
 
+    def _get_asset_index(self) -> Optional[S3ObjectIndex]:
+        """
+        Return the listing of assets/, fetching it on first use.
+
+        Returns None if the listing failed; callers then fall back to
+        per-object S3 requests.
+        """
+        if not self._asset_index_loaded:
+            self._asset_index_loaded = True
+            try:
+                with self._tracer.span("s3.list", prefix=self.s3_assets_root) as span:
+                    self._asset_index = S3ObjectIndex.from_listing(
+                        self.s3_client, self.s3_bucket, self.s3_assets_root
+                    )
+                    span.set(objects=len(self._asset_index))
+                logger.info(f"Indexed {len(self._asset_index)} asset objects in S3")
+            except Exception as e:
+                logger.warning(f"Could not index S3 assets, checking objects individually: {e}")
+                self._asset_index = None
+
+        return self._asset_index
+
+    def _invalidate_asset_index(self) -> None:
+        """Forget the asset listing, e.g. after uploading assets."""
+        self._asset_index = None
+        self._asset_index_loaded = False
+
     def _check_base_assets_exist(self) -> bool:
         """Check if base assets exist in S3."""
         required_files = [
@@ -164,9 +886,17 @@ class ZeekerS3Downloader:
             f"{self.s3_assets_default_path}/static/css/zeeker-theme.css"
         ]
 
+        index = self._get_asset_index()
+        if index is not None:
+            missing = [file_key for file_key in required_files if file_key not in index]
+            for file_key in missing:
+                logger.info(f"Base asset not found: {file_key}")
+            return not missing
+
         for file_key in required_files:
             try:
-                self.s3_client.head_object(Bucket=self.s3_bucket, Key=file_key)
+                with self._tracer.span("s3.head_object", key=file_key):
+                    self.s3_client.head_object(Bucket=self.s3_bucket, Key=file_key)
             except ClientError:
                 logger.info(f"Base asset not found: {file_key}")
                 return False
@@ -195,13 +925,12 @@ class ZeekerS3Downloader:
             )
 
             # Download base metadata
-            self.s3_client.download_file(
-                self.s3_bucket,
+            self._download_file(
                 f"{self.s3_assets_default_path}/metadata.json",
-                str(self.metadata_file)
+                self.metadata_file
             )
 
-            logger.info("Successfully downloaded base assets from S3")
+            logger.info("Successfully queued base assets from S3")
             return True
 
         except Exception as e:
@@ -240,6 +969,9 @@ class ZeekerS3Downloader:
                     f"{self.s3_assets_default_path}/metadata.json"
                 )
 
+            # The cached listing no longer reflects the bucket
+            self._invalidate_asset_index()
+
             logger.info("Successfully uploaded base assets to S3")
             return True
 
@@ -247,6 +979,11 @@ class ZeekerS3Downloader:
             logger.error(f"Error uploading base assets: {e}")
             return False
 
+    def _upload_export(self, path: Path, key: str) -> None:
+        """Upload one bulk export file to exports/, next to latest/"""
+        with self._tracer.span("s3.upload_file", key=key):
+            self.s3_client.upload_file(str(path), self.s3_bucket, f"{self.s3_exports_path}/{key}")
+
     def _apply_database_customizations(self, db_name: str) -> bool:
         """Download and apply database-specific customizations."""
         try:
@@ -289,74 +1026,94 @@ class ZeekerS3Downloader:
                 with open(self.metadata_file, 'r') as f:
                     base_metadata = json.load(f)
 
-            # Initialize merged metadata with base
-            merged_metadata = base_metadata.copy()
+            # Merge database-specific metadata in database name order
+            overlays = self._fetch_database_metadata(databases)
+            merged_metadata = merge_overlays(base_metadata, overlays)
+            for db_name in sorted(overlays):
+                logger.info(f"Merged metadata for database: {db_name}")
 
-            # Merge database-specific metadata
-            for db_name in databases:
-                db_metadata_key = f"{self.s3_assets_databases_path}/{db_name}/metadata.json"
+            # Write merged metadata in one step so Datasette never reads a partial file
+            write_json_atomic(self.metadata_file, merged_metadata, indent=2)
 
-                try:
-                    # Download database metadata to temp file
-                    temp_metadata = Path(f"/tmp/{db_name}_metadata.json")
-                    self.s3_client.download_file(
-                        self.s3_bucket,
-                        db_metadata_key,
-                        str(temp_metadata)
-                    )
+            logger.info("Successfully merged all metadata files")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error merging metadata: {e}")
+            return False
 
-                    # Load and merge
-                    with open(temp_metadata, 'r') as f:
-                        db_metadata = json.load(f)
+    def _fetch_database_metadata(self, databases: Set[str]) -> Dict[str, Dict]:
+        """Fetch and parse every database's metadata.json concurrently, in memory."""
+        keys = {}
+        index = self._asset_index
+        for db_name in databases:
+            db_metadata_key = f"{self.s3_assets_databases_path}/{db_name}/metadata.json"
+
+            # The asset listing already tells us which databases have metadata
+            if index is not None and index.covers(db_metadata_key) and db_metadata_key not in index:
+                logger.info(f"No custom metadata found for database: {db_name}")
+                continue
+            keys[db_name] = db_metadata_key
 
-                    merged_metadata = self._deep_merge_metadata(merged_metadata, db_metadata)
-                    logger.info(f"Merged metadata for database: {db_name}")
+        if not keys:
+            return {}
 
-                    # Clean up temp file
-                    temp_metadata.unlink()
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(keys))) as pool:
+            futures = {
+                db_name: pool.submit(contextvars.copy_context().run, self._get_json_object, key)
+                for db_name, key in keys.items()
+            }
 
+            results = {}
+            for db_name, future in futures.items():
+                try:
+                    results[db_name] = future.result()
                 except ClientError:
                     logger.info(f"No custom metadata found for database: {db_name}")
-                    continue
-
-            # Write merged metadata
-            with open(self.metadata_file, 'w') as f:
-                json.dump(merged_metadata, f, indent=2)
 
-            logger.info("Successfully merged all metadata files")
-            return True
+        return results
 
-        except Exception as e:
-            logger.error(f"Error merging metadata: {e}")
-            return False
+    def _get_json_object(self, key: str):
+        """GET an object and parse it as JSON straight from the response stream."""
+        with self._tracer.span("s3.get_object", key=key):
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)
+            with response["Body"] as body:
+                return json.load(body)
 
     def _deep_merge_metadata(self, base: Dict, overlay: Dict) -> Dict:
         """Deep merge two metadata dictionaries with conflict resolution."""
-        result = base.copy()
-
-        for key, value in overlay.items():
-            if key in ["extra_css_urls", "extra_js_urls"]:
-                # Always append, never replace
-                result[key] = result.get(key, []) + value
-            elif key == "databases":
-                # Merge database configs without overriding base "*" settings
-                result[key] = result.get(key, {})
-                for db_name, db_config in value.items():
-                    if db_name != "*":  # Never override global defaults
-                        result[key][db_name] = db_config
-            elif key in result and isinstance(result[key], dict) and isinstance(value, dict):
-                # Deep merge nested dictionaries
-                result[key] = self._deep_merge_metadata(result[key], value)
-            else:
-                # For other keys, database-specific takes precedence
-                result[key] = value
-
-        return result
+        return merge_metadata(base, overlay)
 
     def _download_s3_directory(self, s3_prefix: str, local_dir: Path) -> None:
         """Download entire S3 directory to local path."""
         local_dir.mkdir(parents=True, exist_ok=True)
 
+        for obj in self._iter_s3_objects(s3_prefix):
+            key = obj["Key"]
+
+            # Skip files that don't match the prefix (defensive programming)
+            if not key.startswith(s3_prefix):
+                continue
+
+            # Skip directories
+            if key.endswith("/"):
+                continue
+
+            # Calculate relative path
+            relative_path = key[len(s3_prefix):].lstrip("/")
+            if not relative_path:
+                continue
+
+            # Queued while the paginator fetches the next page
+            self._download_file(key, local_dir / relative_path, obj)
+
+    def _iter_s3_objects(self, s3_prefix: str) -> Iterator[Dict]:
+        """Yield listing entries under s3_prefix, from the asset index when it covers them."""
+        index = self._asset_index
+        if index is not None and index.covers(s3_prefix):
+            yield from index.iter_prefix(s3_prefix)
+            return
+
         paginator = self.s3_client.get_paginator("list_objects_v2")
         page_iterator = paginator.paginate(
             Bucket=self.s3_bucket,
@@ -364,30 +1121,85 @@ class ZeekerS3Downloader:
         )
 
         for page in page_iterator:
-            if "Contents" not in page:
-                continue
-
-            for obj in page["Contents"]:
-                key = obj["Key"]
-
-                # Skip files that don't match the prefix (defensive programming)
-                if not key.startswith(s3_prefix):
-                    continue
-
-                # Skip directories
-                if key.endswith("/"):
-                    continue
+            yield from page.get("Contents", [])
+
+    def _download_file(self, key: str, local_path: Path, obj: Optional[Dict] = None) -> None:
+        """Download one asset, via the transfer queue when a session is active."""
+        # An asset that fails to download is logged; the other files still install
+        self._submit(local_path, self._fetch_file, key, local_path, obj, required=False)
+
+    def _submit(self, destination: Path, fn: Callable, *args, required: bool = True) -> None:
+        """Run fn on the transfer queue when a session is active, else inline."""
+        if self._transfers is None:
+            fn(*args)
+        else:
+            self._transfers.submit(destination, fn, *args, required=required)
+
+    def _fetch_database(self, key: str, local_path: Path) -> None:
+        """Download a database beside local_path; _install_databases swaps it in."""
+        downloaded = local_path.with_name(f".{local_path.name}.download")
+        self._fetch_file(key, downloaded)
+        with self._stats_lock:
+            self._pending_databases.append((downloaded, local_path))
+
+    def _install_databases(self) -> None:
+        """
+        Optimize downloaded databases in parallel and swap them in. Runs after
+        the metadata merge so searchable columns and facets are current.
+        """
+        pending, self._pending_databases = self._pending_databases, []
+        if not pending:
+            return
+        self._optimizer.set_metadata(read_metadata(self.metadata_file))
 
-                # Calculate relative path
-                relative_path = key[len(s3_prefix):].lstrip("/")
-                if not relative_path:
-                    continue
+        def install(downloaded: Path, live: Path) -> None:
+            with self._tracer.span("db.optimize", database=live.name) as span:
+                span.set(status=self._optimizer.install(downloaded, live))
 
-                local_file = local_dir / relative_path
-                local_file.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1),
+                                    thread_name_prefix="db-optimize") as pool:
+                futures = [pool.submit(contextvars.copy_context().run, install, *paths) for paths in pending]
+                for future in futures:
+                    future.result()
+        finally:
+            for downloaded, _ in pending:
+                downloaded.unlink(missing_ok=True)
+
+    def _fetch_file(self, key: str, local_path: Path, obj: Optional[Dict] = None) -> None:
+        """
+        Download one object to local_path.
 
-                self.s3_client.download_file(self.s3_bucket, key, str(local_file))
-                logger.debug(f"Downloaded: {key} → {local_file}")
+        When the listing entry (obj) is known and the asset manifest shows the
+        local copy is current, the download is skipped. This runs on the transfer
+        worker so it sees the result of any earlier transfer to the same path.
+        """
+        manifest = self._asset_manifest if obj and "ETag" in obj else None
+        if manifest:
+            with self._tracer.span("file.check", key=key) as span:
+                current = manifest.is_current(key, obj, local_path)
+                span.set(unchanged=current)
+            if current:
+                logger.debug(f"Unchanged: {key}")
+                self._count_transfer(files_skipped=1)
+                return
+
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._tracer.span("s3.download_file", key=key) as span:
+            self.s3_client.download_file(self.s3_bucket, key, str(local_path))
+            size = local_path.stat().st_size if local_path.is_file() else 0
+            span.set(bytes=size)
+        logger.debug(f"Downloaded: {key} → {local_path}")
+        self._count_transfer(files_downloaded=1, bytes_downloaded=size)
+
+        if manifest:
+            manifest.record(key, obj, local_path)
+
+    def _count_transfer(self, **counts: int) -> None:
+        """Add to the per-run transfer counters (called from transfer workers)."""
+        with self._stats_lock:
+            for name, value in counts.items():
+                self.transfer_stats[name] = self.transfer_stats.get(name, 0) + value
 
     def _upload_directory_to_s3(self, local_dir: Path, s3_prefix: str) -> None:
         """Upload entire local directory to S3."""
@@ -396,21 +1208,27 @@ class ZeekerS3Downloader:
                 relative_path = file_path.relative_to(local_dir)
                 s3_key = f"{s3_prefix}{relative_path}".replace("\\", "/")
 
-                self.s3_client.upload_file(
-                    str(file_path),
-                    self.s3_bucket,
-                    s3_key
-                )
+                with self._tracer.span("s3.upload_file", key=s3_key, bytes=file_path.stat().st_size):
+                    self.s3_client.upload_file(
+                        str(file_path),
+                        self.s3_bucket,
+                        s3_key
+                    )
                 logger.debug(f"Uploaded: {file_path} → {s3_key}")
 
     def _check_s3_path_exists(self, s3_prefix: str) -> bool:
         """Check if S3 path exists (has any objects)."""
+        index = self._asset_index
+        if index is not None and index.covers(s3_prefix):
+            return index.has_prefix(s3_prefix)
+
         try:
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.s3_bucket,
-                Prefix=s3_prefix,
-                MaxKeys=1
-            )
+            with self._tracer.span("s3.list", prefix=s3_prefix):
+                response = self.s3_client.list_objects_v2(
+                    Bucket=self.s3_bucket,
+                    Prefix=s3_prefix,
+                    MaxKeys=1
+                )
             return "Contents" in response and len(response["Contents"]) > 0
         except ClientError:
             return False
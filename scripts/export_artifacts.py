@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Pre-built bulk exports of every table, generated when a database changes.
+
+Whole-dataset downloads are the most common request from people training
+models on the data, and the data changes nightly at most, so streaming the
+same tables on demand (plugins/table_export.py) repeats identical work.
+This builds, per database and table, next to the databases:
+
+    exports/<database>/<table>.parquet     (zstd, requires pyarrow)
+    exports/<database>/<table>.ndjson.gz
+    exports/<database>/<table>.csv.gz
+    exports/exports.json                   (manifest)
+
+The manifest records each database's file hash and, for every file, its
+rows, size and sha256. Only databases whose hash (or the requested formats)
+changed are exported again; files of removed databases and tables are
+deleted. Rows are written in primary-key order and gzip headers carry no
+timestamp or name, so an unchanged table always produces identical bytes. Each
+file is written under a unique temporary name and renamed into place.
+Database and table names are tilde-encoded as in Datasette URLs, so a name
+containing / or .. stays inside its directory.
+
+The sources page (plugins/sources_page.py) links the files from the
+manifest and serves them with Range support at /-/downloads/:
+
+    uv run scripts/export_artifacts.py data/*.db
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from datasette.utils import tilde_encode
+
+try:
+    from scripts.common import file_sha256, quote_identifier
+except ImportError:
+    from common import file_sha256, quote_identifier
+try:
+    from plugins.table_export import arrow_array, json_default, parquet_type, text_value
+except ImportError:
+    # Run as a script from scripts/: the plugins package is beside it
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from plugins.table_export import arrow_array, json_default, parquet_type, text_value
+
+EXPORTS_DIRNAME = "exports"
+MANIFEST_FILENAME = "exports.json"
+
+FORMATS = ("parquet", "ndjson", "csv")
+EXTENSIONS = {"parquet": ".parquet", "ndjson": ".ndjson.gz", "csv": ".csv.gz"}
+
+# Bumped when file contents change for the same database, forcing a rebuild
+MANIFEST_VERSION = 1
+
+# Rows read per fetch, and per Parquet row group
+BATCH_ROWS = 1000
+ROW_GROUP_ROWS = 65536
+
+
+def available_formats(formats: Iterable[str] = FORMATS) -> List[str]:
+    """The requested formats that can be written here (Parquet needs pyarrow)."""
+    formats = [name for name in FORMATS if name in formats]
+    if "parquet" in formats:
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            formats.remove("parquet")
+    return formats
+
+
+def exportable_tables(conn) -> List[str]:
+    """Ordinary tables: not virtual (FTS), shadow or sqlite_ internal tables."""
+    return [
+        name for name, kind in conn.execute("SELECT name, type FROM pragma_table_list WHERE schema = 'main'")
+        if kind == "table" and not name.startswith("sqlite_")
+    ]
+
+
+def _table_rows(conn, table: str):
+    """(columns, declared types, row iterator) in primary-key (else rowid) order."""
+    info = list(conn.execute(f"PRAGMA table_info({quote_identifier(table)})"))
+    columns = [row[1] for row in info]
+    pks = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5]]
+    order = ", ".join(quote_identifier(pk) for pk in pks) or "rowid"
+    select = ", ".join(quote_identifier(column) for column in columns)
+    cursor = conn.execute(f"SELECT {select} FROM {quote_identifier(table)} ORDER BY {order}")
+
+    def batches():
+        while True:
+            batch = cursor.fetchmany(BATCH_ROWS)
+            if not batch:
+                return
+            yield batch
+
+    return columns, [row[2] for row in info], batches()
+
+
+def _write_gzip(path: Path, columns: List[str], batches, format: str) -> int:
+    rows = 0
+    with open(path, "wb") as raw, gzip.GzipFile(filename="", fileobj=raw, mode="wb", mtime=0) as compressed:
+        text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        if format == "csv":
+            writer = csv.writer(text)
+            writer.writerow(columns)
+        for batch in batches:
+            if format == "csv":
+                writer.writerows([text_value(value) for value in row] for row in batch)
+            else:
+                text.writelines(json.dumps(dict(zip(columns, row)), default=json_default) + "\n" for row in batch)
+            rows += len(batch)
+        text.flush()
+        text.detach()
+    return rows
+
+
+def _write_parquet(path: Path, columns: List[str], types: List[str], batches) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, parquet_type(declared)) for column, declared in zip(columns, types)])
+    rows = 0
+    pending = []
+
+    def flush(writer):
+        if pending:
+            values = list(zip(*pending))
+            writer.write_table(pa.Table.from_arrays(
+                [arrow_array(list(column), field)[0] for column, field in zip(values, schema)], schema=schema,
+            ))
+            pending.clear()
+
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            pending.extend(batch)
+            rows += len(batch)
+            if len(pending) >= ROW_GROUP_ROWS:
+                flush(writer)
+        flush(writer)
+    return rows
+
+
+def export_table(conn, table: str, directory: Path, format: str) -> Dict:
+    """Write one table in one format; return its manifest entry."""
+    path = directory / f"{tilde_encode(table)}{EXTENSIONS[format]}"
+    fd, temp_name = tempfile.mkstemp(dir=directory, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    temp_path = Path(temp_name)
+    try:
+        columns, types, batches = _table_rows(conn, table)
+        if format == "parquet":
+            rows = _write_parquet(temp_path, columns, types, batches)
+        else:
+            rows = _write_gzip(temp_path, columns, batches, format)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return {
+        "path": f"{directory.name}/{path.name}",
+        "rows": rows,
+        "bytes": path.stat().st_size,
+        "sha256": file_sha256(path),
+    }
+
+
+def read_manifest(exports_dir: Path) -> Dict:
+    try:
+        manifest = json.loads((Path(exports_dir) / MANIFEST_FILENAME).read_text())
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "databases": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "databases": {}}
+    return manifest
+
+
+def build_exports(exports_dir: Path, databases: Dict[str, Path], formats: Iterable[str] = FORMATS) -> Dict:
+    """
+    Bring exports_dir up to date with databases (name → file).
+
+    Returns {database: {"action", "tables", "files", "bytes", "seconds", "written"}}
+    where action is "exported", "unchanged" or "removed" and written lists the
+    paths (relative to exports_dir) of files written this run.
+    """
+    exports_dir = Path(exports_dir)
+    exports_dir.mkdir(parents=True, exist_ok=True)
+    formats = available_formats(formats)
+    manifest = read_manifest(exports_dir)
+    recorded = manifest["databases"]
+    report = {}
+
+    for database in sorted(set(recorded) - set(databases)):
+        for table in recorded.pop(database)["tables"].values():
+            for entry in table["files"].values():
+                (exports_dir / entry["path"]).unlink(missing_ok=True)
+        _remove_empty(exports_dir / tilde_encode(database))
+        report[database] = {"action": "removed"}
+
+    for database, path in sorted(databases.items()):
+        start = time.perf_counter()
+        sha256 = file_sha256(path)
+        previous = recorded.get(database)
+        if previous and previous["sha256"] == sha256 and previous["formats"] == formats and all(
+            (exports_dir / entry["path"]).exists()
+            for table in previous["tables"].values() for entry in table["files"].values()
+        ):
+            report[database] = {"action": "unchanged", "tables": len(previous["tables"])}
+            continue
+
+        directory = exports_dir / tilde_encode(database)
+        directory.mkdir(exist_ok=True)
+        tables = {}
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            for table in exportable_tables(conn):
+                files = {format: export_table(conn, table, directory, format) for format in formats}
+                tables[table] = {"rows": next(iter(files.values()))["rows"] if files else None, "files": files}
+        finally:
+            conn.close()
+
+        written = {entry["path"] for table in tables.values() for entry in table["files"].values()}
+        for stale in directory.iterdir():
+            if f"{directory.name}/{stale.name}" not in written:
+                stale.unlink()
+        recorded[database] = {
+            "sha256": sha256,
+            "formats": formats,
+            "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "tables": tables,
+        }
+        report[database] = {
+            "action": "exported",
+            "tables": len(tables),
+            "files": len(written),
+            "bytes": sum(entry["bytes"] for table in tables.values() for entry in table["files"].values()),
+            "seconds": time.perf_counter() - start,
+            "written": sorted(written),
+        }
+        _save_manifest(exports_dir, manifest)
+
+    _save_manifest(exports_dir, manifest)
+    return report
+
+
+def _remove_empty(directory: Path) -> None:
+    try:
+        directory.rmdir()
+    except OSError:
+        pass
+
+
+def _save_manifest(exports_dir: Path, manifest: Dict) -> None:
+    path = exports_dir / MANIFEST_FILENAME
+    fd, temp_name = tempfile.mkstemp(dir=exports_dir, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(manifest, indent=2, sort_keys=True))
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, path)
+    finally:
+        Path(temp_name).unlink(missing_ok=True)
+
+
+def format_report(database: str, entry: Dict) -> str:
+    """One log line for a build_exports report entry."""
+    line = f"Exports {database}: {entry['action']}"
+    if entry["action"] == "exported":
+        line += f", {entry['files']} file(s), {entry['bytes']:,} bytes from {entry['tables']} table(s) " \
+                f"in {entry['seconds']:.2f}s"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build compressed bulk exports of every table")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files")
+    parser.add_argument("--output", type=Path, help=f"Exports directory (default: {EXPORTS_DIRNAME}/ beside the databases)")
+    parser.add_argument("--format", action="append", choices=FORMATS, help="Formats to build (default: all)")
+    args = parser.parse_args()
+
+    output = args.output or args.paths[0].parent / EXPORTS_DIRNAME
+    report = build_exports(output, {path.stem: path for path in args.paths}, args.format or FORMATS)
+    for database, entry in report.items():
+        print(format_report(database, entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Verify and build full-text search indexes for searchable tables.
+
+datasette-search-all and the table ?_search= links only work when a table has
+an FTS index, and the ETL does not always create one. Searchable columns are
+configured per table in metadata.json:
+
+    "databases": {
+        "judgments": {
+            "tables": {
+                "documents": {
+                    "plugins": {
+                        "zeeker-fts": {
+                            "columns": ["title", "parties", "summary"],
+                            "tokenize": "porter unicode61 remove_diacritics 2"
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+For each configured table a missing index is built as an external-content
+FTS5 table named <table>_fts (or the table's "fts_table"), which Datasette
+detects automatically. An index missing configured columns is rebuilt when
+it is external content. Every FTS index in the file, configured or not, is
+integrity-checked (rebuilt from its content table if that fails) and then
+merged with 'optimize'. Run this on a staged copy, not a file being served:
+
+    uv run scripts/fts_builder.py data/judgments.db --metadata metadata.json
+"""
+import argparse
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from scripts.common import quote_identifier
+except ImportError:
+    from common import quote_identifier
+
+PLUGIN_NAME = "zeeker-fts"
+
+# Porter stemming over Unicode word boundaries suits English legal text
+DEFAULT_TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+_USING = re.compile(r"\bUSING\s+(fts[345])\s*\(", re.I)
+_CONTENT = re.compile(r"\bcontent\s*=\s*(?:\[([^\]]+)\]|\"([^\"]+)\"|'([^']+)'|(\w+))", re.I)
+
+
+def fts_config(metadata: Dict, database: str) -> Dict[str, Dict]:
+    """Table → {"columns", "tokenize", "fts_table"} for tables with searchable columns."""
+    tables = ((metadata.get("databases") or {}).get(database) or {}).get("tables") or {}
+    config = {}
+    for table, table_config in tables.items():
+        plugin = (table_config.get("plugins") or {}).get(PLUGIN_NAME) or {}
+        if plugin.get("columns"):
+            config[table] = {
+                "columns": list(plugin["columns"]),
+                "tokenize": plugin.get("tokenize", DEFAULT_TOKENIZE),
+                "fts_table": table_config.get("fts_table"),
+            }
+    return config
+
+
+def fts_tables(conn) -> Dict[str, Dict]:
+    """FTS virtual tables in the database: name → {"module", "content"}."""
+    found = {}
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND rootpage = 0"):
+        using = _USING.search(sql or "")
+        if not using:
+            continue
+        content = _CONTENT.search(sql)
+        found[name] = {
+            "module": using.group(1).lower(),
+            "content": next((group for group in content.groups() if group), None) if content else None,
+        }
+    return found
+
+
+def index_size(conn, fts_table: str) -> Optional[int]:
+    """Bytes used by the FTS index's shadow tables, or None without dbstat."""
+    try:
+        return conn.execute(
+            "SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name GLOB ?", [f"{fts_table}_*"]
+        ).fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def _columns(conn, table: str) -> List[Dict]:
+    return [
+        {"name": row[1], "type": (row[2] or "").upper(), "pk": row[5]}
+        for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")
+    ]
+
+
+def _content_rowid(columns: List[Dict]) -> str:
+    """The INTEGER PRIMARY KEY column (a rowid alias), else rowid."""
+    keys = [column for column in columns if column["pk"]]
+    if len(keys) == 1 and keys[0]["type"] == "INTEGER":
+        return keys[0]["name"]
+    return "rowid"
+
+
+def build_fts(conn, table: str, columns: List[str], fts_table: str, tokenize: str = DEFAULT_TOKENIZE) -> None:
+    """Create an external-content FTS5 index over columns of table and populate it."""
+    content_rowid = _content_rowid(_columns(conn, table))
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(fts_table)}")
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {quote_identifier(fts_table)} USING fts5("
+        f"{', '.join(quote_identifier(column) for column in columns)}, "
+        f"content={quote_identifier(table)}, content_rowid={quote_identifier(content_rowid)}, "
+        f"tokenize='{tokenize.replace(chr(39), chr(39) * 2)}')"
+    )
+    conn.execute(f"INSERT INTO {quote_identifier(fts_table)} ({quote_identifier(fts_table)}) VALUES ('rebuild')")
+
+
+def _command(conn, fts_table: str, command: str, module: str) -> None:
+    name = quote_identifier(fts_table)
+    if command == "integrity-check" and module == "fts5":
+        # rank=1 also compares an external-content index with its content table
+        conn.execute(f"INSERT INTO {name} ({name}, rank) VALUES ('integrity-check', 1)")
+    else:
+        conn.execute(f"INSERT INTO {name} ({name}) VALUES (?)", [command])
+
+
+def ensure_fts(path: Path, config: Dict[str, Dict]) -> List[Dict]:
+    """
+    Build missing indexes for config (see fts_config), then verify and optimize
+    every FTS index in the database at path. Returns one report per index.
+    """
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    try:
+        reports = {}
+        existing = fts_tables(conn)
+
+        for table, table_config in config.items():
+            report = {"table": table, "fts_table": None, "columns": table_config["columns"]}
+            columns = {column["name"] for column in _columns(conn, table)}
+            missing = [column for column in table_config["columns"] if column not in columns]
+            if not columns or missing:
+                reports[table] = dict(report, action="skipped", reason=f"unknown table or columns {missing}")
+                continue
+
+            fts_table = table_config.get("fts_table") or next(
+                (name for name, info in existing.items() if info["content"] == table), f"{table}_fts"
+            )
+            report["fts_table"] = fts_table
+            info = existing.get(fts_table)
+            if info:
+                indexed = {column["name"] for column in _columns(conn, fts_table)}
+                if set(table_config["columns"]) <= indexed:
+                    continue  # Verified and optimized below
+                if not info["content"]:
+                    reports[fts_table] = dict(report, action="mismatch",
+                                              reason="index stores its own content; not rebuilt")
+                    continue
+
+            start = time.perf_counter()
+            build_fts(conn, table, table_config["columns"], fts_table, table_config["tokenize"])
+            reports[fts_table] = dict(report, action="rebuilt" if info else "built",
+                                      seconds=time.perf_counter() - start)
+            existing[fts_table] = {"module": "fts5", "content": table}
+
+        for fts_table, info in existing.items():
+            report = reports.setdefault(
+                fts_table, {"table": info["content"], "fts_table": fts_table, "action": "optimized"}
+            )
+            start = time.perf_counter()
+            try:
+                _command(conn, fts_table, "integrity-check", info["module"])
+            except sqlite3.OperationalError:
+                pass  # Module without integrity-check (FTS3)
+            except sqlite3.DatabaseError as e:
+                if not info["content"]:
+                    report.update(action="corrupt", reason=str(e))
+                    continue
+                _command(conn, fts_table, "rebuild", info["module"])
+                report.update(action="rebuilt", reason=f"integrity check failed: {e}")
+            _command(conn, fts_table, "optimize", info["module"])
+            report["seconds"] = report.get("seconds", 0.0) + time.perf_counter() - start
+
+        for report in reports.values():
+            if report.get("fts_table") in existing:
+                report["bytes"] = index_size(conn, report["fts_table"])
+        return list(reports.values())
+    finally:
+        conn.close()
+
+
+def format_report(report: Dict) -> str:
+    """One log line for an ensure_fts report."""
+    line = f"FTS {report.get('fts_table') or '-'} on {report.get('table') or '-'}: {report['action']}"
+    if report.get("seconds") is not None:
+        line += f" in {report['seconds']:.2f}s"
+    if report.get("bytes") is not None:
+        line += f", {report['bytes'] / (1024 * 1024):.1f} MB"
+    if report.get("reason"):
+        line += f" ({report['reason']})"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify, build and optimize FTS indexes")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files (not in use)")
+    parser.add_argument("--metadata", type=Path, help="metadata.json with zeeker-fts table settings")
+    args = parser.parse_args()
+
+    metadata = json.loads(args.metadata.read_text()) if args.metadata else {}
+    for path in args.paths:
+        for report in ensure_fts(path, fts_config(metadata, path.stem)):
+            print(f"{path.name}: {format_report(report)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+"""
+Index advisor for faceted, sorted and filtered columns.
+
+metadata.json allows faceting on every database, and the columns people facet
+and sort on (dates, court names) often have no index, so each facet request
+scans the whole table. The advisor collects candidate indexes from:
+
+- table metadata: "facets", "sort" and "sort_desc"
+- query logs: /-/perf.json snapshots saved from the perf_monitor plugin
+  (GROUP BY, ORDER BY and WHERE column = :param in the recorded statements)
+
+For each candidate it compares the EXPLAIN QUERY PLAN and timing of a
+representative query before and after creating the index inside a
+transaction. The estimated speedup is the ratio of table bytes to estimated
+index bytes (what a covering index saves a scan). Indexes are kept only when
+building and the measured speedup reaches min_speedup; otherwise the
+transaction is rolled back, so proposing never changes the file. A
+candidate that fails (say, a locked table) is reported as "failed" and the
+rest are still evaluated.
+
+The file must not be in use (run it on a staged copy):
+
+    uv run scripts/index_advisor.py data/courts.db --metadata metadata.json --query-log perf.json
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from scripts.common import quote_identifier
+except ImportError:
+    from common import quote_identifier
+
+# Prefix of every index created by the advisor
+INDEX_PREFIX = "idx_zeeker_"
+
+# Row limits Datasette uses for facet values and table pages
+FACET_LIMIT = 31
+PAGE_LIMIT = 101
+
+# ORDER BY targets that are not table columns
+_IGNORED_SORTS = {"count", "value", "rank", "rowid"}
+
+_IDENT = r'(?:\[([^\]]+)\]|"([^"]+)"|`([^`]+)`|([A-Za-z_]\w*))'
+_FROM = re.compile(r"\bfrom\s+" + _IDENT, re.I)
+_GROUP_BY = re.compile(r"\bgroup\s+by\s+" + _IDENT, re.I)
+_ORDER_BY = re.compile(r"\border\s+by\s+" + _IDENT, re.I)
+_WHERE = re.compile(r"\bwhere\b(.*?)(?=\bgroup\s+by\b|\border\s+by\b|\blimit\b|\)|$)", re.I | re.S)
+_FILTER = re.compile(_IDENT + r"\s*(?:=|>=|<=|>|<)\s*[:?]", re.I)
+
+
+def _identifier(match) -> str:
+    """The column or table name from the first _IDENT in match, unquoted."""
+    return next(group for group in match.groups()[:4] if group)
+
+
+@dataclass
+class Candidate:
+    """A proposed index: table, columns and the access pattern it serves."""
+
+    table: str
+    columns: Tuple[str, ...]
+    kind: str  # "facet", "sort" or "filter"
+    hits: int = 0
+    sources: set = field(default_factory=set)
+
+    @property
+    def key(self):
+        return (self.table, self.columns, self.kind)
+
+    @property
+    def index_name(self) -> str:
+        parts = (self.table,) + self.columns
+        return INDEX_PREFIX + "_".join(re.sub(r"\W+", "_", part).strip("_").lower() for part in parts)
+
+
+def candidates_from_metadata(metadata: Dict, database: str) -> List[Candidate]:
+    """Facet and sort columns configured for the database's tables."""
+    tables = ((metadata.get("databases") or {}).get(database) or {}).get("tables") or {}
+    candidates = []
+    for table, config in tables.items():
+        for facet in config.get("facets") or []:
+            # Plain columns, or {"date": column} / {"array": column} facets
+            column = facet if isinstance(facet, str) else next(iter(facet.values()), None)
+            if isinstance(column, str):
+                candidates.append(Candidate(table, (column,), "facet", 1, {"metadata"}))
+        for key in ("sort", "sort_desc"):
+            if config.get(key):
+                candidates.append(Candidate(table, (config[key],), "sort", 1, {"metadata"}))
+    return candidates
+
+
+def candidates_from_sql(sql: str, count: int = 1) -> List[Candidate]:
+    """Candidates suggested by one statement, weighted by how often it ran."""
+    table_match = _FROM.search(sql)
+    if not table_match:
+        return []
+    table = _identifier(table_match)
+
+    filters = []
+    for where in _WHERE.finditer(sql):
+        filters += [_identifier(match) for match in _FILTER.finditer(where.group(1))]
+
+    group = _GROUP_BY.search(sql)
+    if group:
+        column = _identifier(group)
+        columns = (filters[0], column) if filters and filters[0] != column else (column,)
+        return [Candidate(table, columns, "facet", count, {"query log"})]
+
+    candidates = [Candidate(table, (column,), "filter", count, {"query log"}) for column in dict.fromkeys(filters)]
+    order = _ORDER_BY.search(sql)
+    if order and _identifier(order).lower() not in _IGNORED_SORTS:
+        candidates.append(Candidate(table, (_identifier(order),), "sort", count, {"query log"}))
+    return candidates
+
+
+def load_query_log(paths: Iterable[Path]) -> List[Dict]:
+    """Statements from saved /-/perf.json snapshots: [{"database", "sql", "count"}]."""
+    queries = []
+    for path in paths:
+        snapshot = json.loads(Path(path).read_text())
+        sql = snapshot.get("sql") or {}
+        queries += [
+            {"database": entry["database"], "sql": entry["sql"], "count": entry.get("count", 1)}
+            for entry in sql.get("top") or []
+        ]
+        queries += [
+            {"database": entry["database"], "sql": entry["sql"], "count": 1}
+            for entry in sql.get("slow") or []
+        ]
+    return queries
+
+
+def merge_candidates(candidates: Iterable[Candidate]) -> List[Candidate]:
+    """Combine duplicates, summing hits; most requested first."""
+    merged: Dict[Tuple, Candidate] = {}
+    for candidate in candidates:
+        existing = merged.get(candidate.key)
+        if existing is None:
+            merged[candidate.key] = Candidate(candidate.table, candidate.columns, candidate.kind,
+                                              candidate.hits, set(candidate.sources))
+        else:
+            existing.hits += candidate.hits
+            existing.sources |= candidate.sources
+    return sorted(merged.values(), key=lambda candidate: candidate.hits, reverse=True)
+
+
+class IndexAdvisor:
+    """Evaluates, and optionally builds, candidate indexes for database files."""
+
+    def __init__(self, metadata: Optional[Dict] = None, queries: Iterable[Dict] = (),
+                 min_speedup: float = 2.0, repeat: int = 3):
+        self.metadata = metadata or {}
+        self.queries = list(queries)
+        self.min_speedup = min_speedup
+        self.repeat = repeat
+
+    @classmethod
+    def from_files(cls, metadata_file: Optional[Path] = None, query_logs: Iterable[Path] = (),
+                   **kwargs) -> "IndexAdvisor":
+        metadata = {}
+        if metadata_file and Path(metadata_file).exists():
+            metadata = json.loads(Path(metadata_file).read_text())
+        return cls(metadata, load_query_log(query_logs), **kwargs)
+
+    def candidates(self, database: str) -> List[Candidate]:
+        found = candidates_from_metadata(self.metadata, database)
+        for query in self.queries:
+            if query["database"] == database:
+                found += candidates_from_sql(query["sql"], query["count"])
+        return merge_candidates(found)
+
+    def fingerprint(self, database: str) -> str:
+        """Changes whenever the candidates or threshold for database change."""
+        keys = sorted(repr(candidate.key) for candidate in self.candidates(database))
+        return hashlib.sha256(json.dumps([keys, self.min_speedup]).encode()).hexdigest()[:16]
+
+    def advise(self, path: Path, database: Optional[str] = None, build: bool = False) -> List[Dict]:
+        """
+        Evaluate each candidate for the database file at path and return one
+        report per candidate. With build set, indexes reaching min_speedup are
+        kept; everything else is rolled back.
+        """
+        database = database or Path(path).stem
+        conn = sqlite3.connect(str(path), isolation_level=None)
+        try:
+            reports = []
+            for candidate in self.candidates(database):
+                try:
+                    reports.append(self._evaluate(conn, database, candidate, build))
+                except sqlite3.Error as e:
+                    reports.append(dict(self._report(database, candidate), status="failed", reason=str(e)))
+            return reports
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _report(database: str, candidate: Candidate) -> Dict:
+        return {
+            "database": database,
+            "table": candidate.table,
+            "columns": list(candidate.columns),
+            "kind": candidate.kind,
+            "hits": candidate.hits,
+            "sources": sorted(candidate.sources),
+            "index": candidate.index_name,
+        }
+
+    def _evaluate(self, conn, database: str, candidate: Candidate, build: bool) -> Dict:
+        report = self._report(database, candidate)
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(candidate.table)})")}
+        if not columns or not set(candidate.columns) <= columns:
+            return dict(report, status="skipped", reason="unknown table or column")
+        existing = self._existing_index(conn, candidate)
+        if existing:
+            return dict(report, status="exists", index=existing)
+        report["index"] = name = self._unused_name(conn, candidate)
+
+        sql, params = self._probe(conn, candidate)
+        report["plan_before"] = self._plan(conn, sql, params)
+        report["estimated_speedup"] = self._estimate(conn, candidate)
+        report["before_ms"] = self._time(conn, sql, params)
+
+        start = time.perf_counter()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                f"CREATE INDEX {quote_identifier(name)} ON {quote_identifier(candidate.table)} "
+                f"({', '.join(quote_identifier(column) for column in candidate.columns)})"
+            )
+            report["build_ms"] = (time.perf_counter() - start) * 1000
+            report["plan_after"] = self._plan(conn, sql, params)
+            report["after_ms"] = self._time(conn, sql, params)
+            report["measured_speedup"] = report["before_ms"] / max(report["after_ms"], 1e-6)
+            keep = build and report["measured_speedup"] >= self.min_speedup
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT" if keep else "ROLLBACK")
+
+        if keep:
+            report["status"] = "built"
+        elif report["measured_speedup"] >= self.min_speedup:
+            report["status"] = "proposed"
+        else:
+            report["status"] = "rejected"
+        return report
+
+    @staticmethod
+    def _existing_index(conn, candidate: Candidate) -> Optional[str]:
+        """Name of an index whose leading columns already match the candidate."""
+        for row in conn.execute(f"PRAGMA index_list({quote_identifier(candidate.table)})"):
+            indexed = [info[2] for info in conn.execute(f"PRAGMA index_info({quote_identifier(row[1])})")]
+            if tuple(indexed[:len(candidate.columns)]) == candidate.columns:
+                return row[1]
+        return None
+
+    @staticmethod
+    def _unused_name(conn, candidate: Candidate) -> str:
+        """
+        candidate.index_name, or with a short hash of the table and columns
+        when another index or table has it (names are sanitised, so "a b" and
+        "a_b" map to the same one).
+        """
+        name = candidate.index_name
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ? COLLATE NOCASE", [name]).fetchone():
+            digest = hashlib.sha256(json.dumps([candidate.table, *candidate.columns]).encode()).hexdigest()[:8]
+            name = f"{name}_{digest}"
+        return name
+
+    @staticmethod
+    def _probe(conn, candidate: Candidate) -> Tuple[str, List]:
+        """Representative query for the candidate, shaped like Datasette's own."""
+        table = quote_identifier(candidate.table)
+        column = quote_identifier(candidate.columns[-1])
+        if candidate.kind == "sort":
+            return f"SELECT * FROM {table} ORDER BY {column} DESC LIMIT {PAGE_LIMIT}", []
+
+        params = []
+        filters = []
+        filter_columns = candidate.columns if candidate.kind == "filter" else candidate.columns[:-1]
+        for name in filter_columns:
+            value = conn.execute(
+                f"SELECT {quote_identifier(name)} FROM {table} WHERE {quote_identifier(name)} IS NOT NULL LIMIT 1"
+            ).fetchone()
+            filters.append(f"{quote_identifier(name)} = ?")
+            params.append(value[0] if value else None)
+
+        if candidate.kind == "filter":
+            return f"SELECT * FROM {table} WHERE {' AND '.join(filters)} LIMIT {PAGE_LIMIT}", params
+        where = " AND ".join(filters + [f"{column} IS NOT NULL"])
+        return (
+            f"SELECT {column} AS value, count(*) AS count FROM {table} WHERE {where} "
+            f"GROUP BY {column} ORDER BY count DESC, value LIMIT {FACET_LIMIT}",
+            params,
+        )
+
+    @staticmethod
+    def _plan(conn, sql: str, params: List) -> str:
+        return "; ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+    def _time(self, conn, sql: str, params: List) -> float:
+        """Best of repeat runs, in milliseconds."""
+        best = float("inf")
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - start)
+        return best * 1000
+
+    @staticmethod
+    def _estimate(conn, candidate: Candidate) -> float:
+        """Table bytes over estimated index bytes: what a covering index saves a scan."""
+        table = quote_identifier(candidate.table)
+        try:
+            table_bytes = conn.execute(
+                "SELECT sum(pgsize) FROM dbstat WHERE name = ?", [candidate.table]
+            ).fetchone()[0] or 0
+        except sqlite3.Error:  # SQLite built without dbstat
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            table_bytes = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+        rows = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        lengths = " + ".join(
+            f"coalesce(length(CAST({quote_identifier(column)} AS BLOB)), 0)" for column in candidate.columns
+        )
+        key_bytes = conn.execute(f"SELECT avg({lengths}) FROM (SELECT * FROM {table} LIMIT 1000)").fetchone()[0]
+        index_bytes = rows * ((key_bytes or 0) + 8)  # Key plus rowid and cell overhead
+        return max(table_bytes / index_bytes, 1.0) if index_bytes else 1.0
+
+
+def format_report(reports: List[Dict]) -> str:
+    """Plain-text table of advisor reports."""
+    def number(report, key, suffix, width):
+        value = report.get(key)
+        return f"{value:.1f}{suffix}".rjust(width) if value is not None else "-".rjust(width)
+
+    header = (f"{'database':<14} {'table':<20} {'columns':<28} {'kind':<6} {'hits':>6} "
+              f"{'est.':>7} {'before':>9} {'after':>9} {'measured':>8}  status")
+    lines = [header, "-" * len(header)]
+    for report in reports:
+        lines.append(
+            f"{report['database']:<14} {report['table']:<20} {', '.join(report['columns']):<28} "
+            f"{report['kind']:<6} {report['hits']:>6} {number(report, 'estimated_speedup', 'x', 7)} "
+            f"{number(report, 'before_ms', 'ms', 9)} {number(report, 'after_ms', 'ms', 9)} "
+            f"{number(report, 'measured_speedup', 'x', 8)}  {report['status']}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose or build indexes for faceted and sorted columns")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files (not in use)")
+    parser.add_argument("--metadata", type=Path, help="metadata.json with facet/sort configuration")
+    parser.add_argument("--query-log", type=Path, action="append", default=[], help="Saved /-/perf.json")
+    parser.add_argument("--min-speedup", type=float, default=2.0, help="Measured speedup needed to build")
+    parser.add_argument("--build", action="store_true", help="Keep indexes that reach --min-speedup")
+    args = parser.parse_args()
+
+    advisor = IndexAdvisor.from_files(args.metadata, args.query_log, min_speedup=args.min_speedup)
+    reports = []
+    for path in args.paths:
+        reports += advisor.advise(path, build=args.build)
+    print(format_report(reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,8 @@ import os
 import shutil
 import subprocess
 import sys
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -38,9 +40,21 @@ setup_imports()
 
 # Replace the dynamic import section
 try:
-    from scripts.download_from_s3 import ZeekerS3Downloader
+    from scripts.download_from_s3 import (
+        EXPORTS_DIRNAME, METRICS_SNAPSHOT_FILENAME, OPTIMIZE_MANIFEST_FILENAME, TRACE_FILENAME, DatabaseOptimizer,
+        ZeekerS3Downloader, index_advisor_from_env, read_metadata, record_metrics_run,
+        update_exports, update_search_index,
+    )
+    from scripts.index_advisor import IndexAdvisor, format_report
+    from scripts.tracing import format_summary, load_spans, summarize_spans
 except ImportError:
-    from download_from_s3 import ZeekerS3Downloader
+    from download_from_s3 import (
+        EXPORTS_DIRNAME, METRICS_SNAPSHOT_FILENAME, OPTIMIZE_MANIFEST_FILENAME, TRACE_FILENAME, DatabaseOptimizer,
+        ZeekerS3Downloader, index_advisor_from_env, read_metadata, record_metrics_run,
+        update_exports, update_search_index,
+    )
+    from index_advisor import IndexAdvisor, format_report
+    from tracing import format_summary, load_spans, summarize_spans
 
 
 def setup_logging(verbose=False):
@@ -134,7 +148,19 @@ def cli():
 @click.option("--no-restart", is_flag=True, help="Download data but don't restart container")
 @click.option("--verbose", "-v", is_flag=True, help="Verbose logging")
 @click.option("--staging-dir", default="/tmp/datasette-staging", help="Staging directory")
-def refresh(force, no_restart, verbose, staging_dir):
+@click.option("--optimize/--no-optimize", default=None,
+              help="ANALYZE and PRAGMA optimize new databases before swapping them in "
+                   "(default: ZEEKER_OPTIMIZE_DATABASES)")
+@click.option("--vacuum", is_flag=True, help="With --optimize, also VACUUM each database")
+@click.option("--page-size", type=int, help="With --optimize, rebuild databases with this page size")
+@click.option("--sort-indexes/--no-sort-indexes", envvar="ZEEKER_SORT_INDEXES", default=False,
+              help="With --optimize, index the sortable columns of large tables (default: ZEEKER_SORT_INDEXES)")
+@click.option("--search-index/--no-search-index", envvar="ZEEKER_SEARCH_INDEX", default=False,
+              help="Update the unified cross-database search index (default: ZEEKER_SEARCH_INDEX)")
+@click.option("--exports/--no-exports", envvar="ZEEKER_EXPORTS", default=False,
+              help="Build compressed per-table bulk export files (default: ZEEKER_EXPORTS)")
+def refresh(force, no_restart, verbose, staging_dir, optimize, vacuum, page_size, sort_indexes, search_index,
+            exports):
     """Refresh Datasette data from S3"""
     logger = setup_logging(verbose)
 
@@ -143,6 +169,10 @@ def refresh(force, no_restart, verbose, staging_dir):
     if env_file.exists():
         load_dotenv(env_file)
 
+    # Run metrics for the /-/metrics endpoint
+    start_time = time.perf_counter()
+    run = {"success": False, "bytes_downloaded": 0, "changed": 0}
+
     try:
         # Get project directory
         project_dir = Path(__file__).parent.parent
@@ -156,6 +186,33 @@ def refresh(force, no_restart, verbose, staging_dir):
         data_dir.mkdir(exist_ok=True)
         staging_path.mkdir(exist_ok=True, parents=True)
 
+        manifest_file = data_dir / OPTIMIZE_MANIFEST_FILENAME
+        metadata_file = project_dir / "metadata.json"
+        if optimize is None:
+            optimizer = DatabaseOptimizer.from_env(manifest_file, metadata_file)
+        elif optimize:
+            metadata = read_metadata(metadata_file)
+            optimizer = DatabaseOptimizer(manifest_file, vacuum=vacuum, page_size=page_size,
+                                          index_advisor=index_advisor_from_env(metadata), metadata=metadata,
+                                          sort_indexes=sort_indexes)
+        else:
+            optimizer = None
+
+        def refresh_search_index():
+            # Re-indexes only databases whose hash changed; builds a missing index
+            if search_index:
+                stats = update_search_index(data_dir, read_metadata(metadata_file))
+                run.update(stats)
+                click.echo(f"Search index: {stats.get('search_indexed', 0)} database(s) re-indexed")
+
+        def refresh_exports():
+            # Exports only databases whose hash changed; builds missing files
+            if exports:
+                stats = update_exports(data_dir)
+                run.update(stats)
+                click.echo(f"Bulk exports: {stats.get('exports_built', 0)} database(s) exported, "
+                           f"{stats.get('export_bytes', 0):,} bytes")
+
         # Get current data hash
         current_hash = calculate_directory_hash(data_dir)
         logger.debug(f"Current data hash: {current_hash}")
@@ -169,6 +226,21 @@ def refresh(force, no_restart, verbose, staging_dir):
             click.echo(f"❌ {error_msg}")
             raise click.Abort()
 
+        run["bytes_downloaded"] = sum(f.stat().st_size for f in staging_path.glob("*.db"))
+
+        # Optimize new databases; unchanged ones are replaced by their live,
+        # already optimized copy so the hash comparison below still holds
+        if optimizer:
+            click.echo("Optimizing databases...")
+            for db_file in sorted(staging_path.glob("*.db")):
+                optimizer.prepare(db_file, data_dir / db_file.name)
+            run.update(optimizer.stats)
+            click.echo(
+                f"Optimized {optimizer.stats['databases_optimized']} database(s), "
+                f"{optimizer.stats['databases_unchanged']} unchanged, "
+                f"in {optimizer.stats['optimize_seconds']:.1f}s"
+            )
+
         # Calculate new hash
         new_hash = calculate_directory_hash(staging_path)
         logger.debug(f"New data hash: {new_hash}")
@@ -177,6 +249,9 @@ def refresh(force, no_restart, verbose, staging_dir):
             click.echo("No data changes detected, skipping update")
             logger.info("No data changes detected, skipping update")
             shutil.rmtree(staging_path)
+            refresh_search_index()
+            refresh_exports()
+            run["success"] = True
             return
 
         click.echo("Data changes detected, updating...")
@@ -185,7 +260,8 @@ def refresh(force, no_restart, verbose, staging_dir):
         # Backup current data
         backup_dir = project_dir / f"data.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         if data_dir.exists() and any(data_dir.glob("*.db")):
-            shutil.copytree(data_dir, backup_dir)
+            # Exports are rebuilt from the databases, so are not backed up
+            shutil.copytree(data_dir, backup_dir, ignore=shutil.ignore_patterns(EXPORTS_DIRNAME))
             logger.info(f"Backed up current data to {backup_dir}")
 
         # Clear current data and move new data
@@ -198,6 +274,11 @@ def refresh(force, no_restart, verbose, staging_dir):
 
         shutil.rmtree(staging_path)
 
+        if optimizer:
+            optimizer.save({db_file.name for db_file in data_dir.glob("*.db")})
+        refresh_search_index()
+        refresh_exports()
+
         # Restart container unless disabled
         if not no_restart:
             click.echo("Restarting Docker container...")
@@ -219,11 +300,19 @@ def refresh(force, no_restart, verbose, staging_dir):
 
         click.echo("Datasette refresh completed successfully")
         logger.info("Datasette refresh completed successfully")
+        run.update(success=True, changed=1)
 
     except Exception as e:
         logger.error(f"Error during refresh: {e}", exc_info=True)
         raise click.Abort()
 
+    finally:
+        metrics_file = os.getenv("ZEEKER_METRICS_FILE") or (
+            Path(__file__).parent.parent / "data" / METRICS_SNAPSHOT_FILENAME
+        )
+        record_metrics_run(metrics_file, "refresh", run.pop("success"),
+                           time.perf_counter() - start_time, **run)
+
 
 @cli.command()
 def status():
@@ -358,7 +447,7 @@ def sync_assets(upload_base, force, verbose):
             from download_from_s3 import ZeekerS3Downloader
 
             downloader = ZeekerS3Downloader()
-            success = downloader.download_complete_setup()
+            success = downloader.download_complete_setup(force=force)
 
             if success:
                 logger.info("✅ Successfully synced all assets")
@@ -652,6 +741,80 @@ def test_s3_connection(verbose):
         logger.error(f"S3 connection test failed: {e}")
 
 
+@cli.command()
+@click.argument("trace_file", required=False, type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--top", default=10, help="Number of slowest spans to list")
+@click.option("--json", "as_json", is_flag=True, help="Print the per-span aggregates as JSON")
+def trace_summary(trace_file, top, as_json):
+    """Show where the time went in the last download run"""
+    if trace_file is None:
+        trace_file = Path(
+            os.getenv("ZEEKER_TRACE_FILE") or Path(__file__).parent.parent / "data" / TRACE_FILENAME
+        )
+
+    if not trace_file.exists():
+        click.echo(f"❌ No trace file found at {trace_file}")
+        raise click.Abort()
+
+    records = load_spans(trace_file)
+    if not records:
+        click.echo(f"❌ No spans recorded in {trace_file}")
+        raise click.Abort()
+
+    if as_json:
+        click.echo(json.dumps(summarize_spans(records), indent=2))
+        return
+
+    click.echo(f"⏱️  Timing summary for {trace_file} ({len(records)} spans)")
+    click.echo()
+    click.echo(format_summary(records, top=top))
+
+
+@cli.command()
+@click.option("--data-dir", type=click.Path(exists=True, file_okay=False, path_type=Path),
+              help="Directory of .db files (default: project data/)")
+@click.option("--metadata", "metadata_file", type=click.Path(dir_okay=False, path_type=Path),
+              help="metadata.json with facet/sort settings (default: project metadata.json)")
+@click.option("--query-log", "query_logs", multiple=True,
+              type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="Saved /-/perf.json snapshot (repeatable)")
+@click.option("--min-speedup", default=2.0, help="Measured speedup needed to recommend an index")
+@click.option("--json", "as_json", is_flag=True, help="Print the reports as JSON")
+def advise_indexes(data_dir, metadata_file, query_logs, min_speedup, as_json):
+    """Propose indexes for faceted, sorted and filtered columns"""
+    project_dir = Path(__file__).parent.parent
+    data_dir = data_dir or project_dir / "data"
+    metadata_file = metadata_file or project_dir / "metadata.json"
+    advisor = IndexAdvisor.from_files(metadata_file, query_logs, min_speedup=min_speedup)
+
+    db_files = sorted(data_dir.glob("*.db"))
+    if not db_files:
+        click.echo(f"❌ No .db files found in {data_dir}")
+        raise click.Abort()
+
+    # The served files are opened immutable, so indexes are trialled on copies
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="zeeker-advisor-") as scratch:
+        for db_file in db_files:
+            copy = Path(scratch) / db_file.name
+            shutil.copyfile(db_file, copy)
+            reports += advisor.advise(copy, db_file.stem)
+            copy.unlink()
+
+    if as_json:
+        click.echo(json.dumps(reports, indent=2))
+        return
+
+    if not reports:
+        click.echo("No facet, sort or filter columns found in metadata or query logs")
+        return
+    click.echo(format_report(reports))
+    proposed = [report for report in reports if report["status"] == "proposed"]
+    click.echo()
+    click.echo(f"{len(proposed)} index(es) reach {min_speedup:.1f}x; set ZEEKER_BUILD_INDEXES=1 "
+               "to build them when databases are next optimized")
+
+
 @cli.command()
 @click.option("--clean-backups", is_flag=True, help="Remove old backup directories")
 @click.option("--keep-days", default=7, help="Number of days of backups to keep")
@@ -702,5 +865,69 @@ def cleanup(clean_backups, keep_days, verbose):
         logger.error(f"Error during cleanup: {e}", exc_info=True)
 
 
+@cli.command()
+@click.option("--data-dir", type=click.Path(file_okay=False, path_type=Path),
+              help="Benchmark the .db files in this directory instead of synthetic ones")
+@click.option("--databases", default=3, help="Number of synthetic databases")
+@click.option("--size-mb", default=8.0, help="Approximate size of each synthetic database")
+@click.option("--concurrency", "-c", default=10, help="Concurrent in-flight requests")
+@click.option("--requests", "-n", "total_requests", default=500, help="Total requests to issue")
+@click.option("--route", "extra_routes", multiple=True, metavar="LABEL=PATH",
+              help="Route to benchmark (repeatable); replaces the default mix")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, path_type=Path),
+              help="Write the JSON report to this file")
+@click.option("--compare", type=click.Path(exists=True, dir_okay=False, path_type=Path),
+              help="Previous JSON report to compare p95 latency against")
+@click.option("--verbose", "-v", is_flag=True, help="Verbose logging")
+def bench(data_dir, databases, size_mb, concurrency, total_requests, extra_routes, output, compare, verbose):
+    """Load-test Datasette in-process and report p50/p95/p99 latency per route"""
+    logger = setup_logging(verbose)
+
+    try:
+        from scripts.bench import format_report, run_benchmark
+        from scripts.synthetic_data import create_databases
+    except ImportError:
+        from bench import format_report, run_benchmark
+        from synthetic_data import create_databases
+
+    routes = None
+    if extra_routes:
+        routes = {}
+        for entry in extra_routes:
+            label, sep, path = entry.partition("=")
+            if not sep or not path.startswith("/"):
+                raise click.BadParameter(f"expected LABEL=/path, got {entry!r}", param_hint="--route")
+            routes[label] = path
+
+    with tempfile.TemporaryDirectory(prefix="zeeker-bench-") as temp_dir:
+        if data_dir:
+            db_files = sorted(data_dir.glob("*.db"))
+            if not db_files:
+                click.echo(f"❌ No .db files found in {data_dir}")
+                raise click.Abort()
+        else:
+            click.echo(f"Generating {databases} synthetic database(s) of ~{size_mb:g}MB...")
+            names = [f"bench_{i}" for i in range(databases)]
+            db_files = create_databases(temp_dir, names, size_mb=size_mb)
+
+        click.echo(f"Running {total_requests} requests at concurrency {concurrency} "
+                   f"against {len(db_files)} database(s)...")
+        logger.debug(f"Databases: {[str(f) for f in db_files]}")
+        report = run_benchmark(db_files, concurrency=concurrency, requests=total_requests, routes=routes)
+
+    report["databases"] = [f.name for f in db_files]
+    baseline = json.loads(compare.read_text()) if compare else None
+    click.echo()
+    click.echo(format_report(report, baseline))
+
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        click.echo(f"\n✅ Report written to {output}")
+
+    if report["total"]["errors"]:
+        click.echo(f"⚠️  {report['total']['errors']} request(s) failed")
+
+
 if __name__ == "__main__":
     cli()
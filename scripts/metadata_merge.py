@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Metadata merge engine for layering database-specific overlays on base metadata.
+
+Merging rules (unchanged from the original downloader):
+- extra_css_urls / extra_js_urls are appended, never replaced
+- databases entries from an overlay replace the base entry, except "*"
+- other nested dictionaries are deep merged
+- any other key from the overlay takes precedence
+
+The engine never mutates its inputs. Containers are copied on first write
+only, so subtrees that no overlay touches are shared with the base instead
+of being copied, and merging N overlays costs O(size of overlays) rather
+than O(N × size of base).
+"""
+from typing import Dict, List, Mapping, Optional
+
+# List keys whose overlay values are appended to the base list
+APPEND_KEYS = ("extra_css_urls", "extra_js_urls")
+
+# Database entry holding global defaults, which overlays may not override
+GLOBAL_DATABASE_KEY = "*"
+
+
+class MetadataMerger:
+    """
+    Copy-on-write merge of overlays onto a base metadata dictionary.
+
+    Usage:
+        merger = MetadataMerger(base)
+        merger.apply(overlay)
+        merged = merger.result
+    """
+
+    def __init__(self, base: Dict):
+        self.result = base
+        # Containers created by this merger, safe to mutate in place. Holding
+        # the objects (not just their ids) keeps the ids from being reused.
+        self._owned: Dict[int, object] = {}
+        # Members of owned append-lists, for O(1) duplicate checks
+        self._members: Dict[int, set] = {}
+
+    def apply(self, overlay: Mapping) -> Dict:
+        """Merge one overlay into the result and return it."""
+        if overlay:
+            self.result = self._merge_dict(self.result, overlay)
+        return self.result
+
+    def _own_dict(self, value: Optional[Mapping]) -> Dict:
+        if value is not None and id(value) in self._owned:
+            return value
+        copy = dict(value or {})
+        self._owned[id(copy)] = copy
+        return copy
+
+    def _own_list(self, value: Optional[List]) -> List:
+        if value is not None and id(value) in self._owned:
+            return value
+        copy = list(value or [])
+        self._owned[id(copy)] = copy
+        members = self._members[id(copy)] = set()
+        for item in copy:
+            try:
+                members.add(item)
+            except TypeError:  # Unhashable entries are checked by scanning the list
+                pass
+        return copy
+
+    def _merge_dict(self, base: Mapping, overlay: Mapping) -> Dict:
+        result = self._own_dict(base)
+
+        for key, value in overlay.items():
+            current = result.get(key)
+            if key in APPEND_KEYS and isinstance(value, list):
+                result[key] = self._append_unique(current if isinstance(current, list) else None, value)
+            elif key == "databases" and isinstance(value, Mapping):
+                result[key] = self._merge_databases(current if isinstance(current, Mapping) else None, value)
+            elif isinstance(current, Mapping) and isinstance(value, Mapping):
+                result[key] = self._merge_dict(current, value)
+            else:
+                result[key] = value
+
+        return result
+
+    def _merge_databases(self, base: Optional[Mapping], overlay: Mapping) -> Dict:
+        result = self._own_dict(base)
+        for db_name, db_config in overlay.items():
+            if db_name != GLOBAL_DATABASE_KEY:  # Never override global defaults
+                result[db_name] = db_config
+        return result
+
+    def _append_unique(self, base: Optional[List], items: List) -> List:
+        result = self._own_list(base)
+        members = self._members[id(result)]
+        for item in items:
+            try:
+                if item in members:
+                    continue
+                members.add(item)
+            except TypeError:
+                if item in result:
+                    continue
+            result.append(item)
+        return result
+
+
+def merge_metadata(base: Dict, overlay: Mapping) -> Dict:
+    """Return base with one overlay applied. Neither argument is modified."""
+    return MetadataMerger(base).apply(overlay)
+
+
+def merge_overlays(base: Dict, overlays: Mapping[str, Mapping]) -> Dict:
+    """
+    Apply overlays keyed by database name onto base.
+
+    Overlays are applied in sorted name order, so the result does not depend
+    on the order in which databases were discovered.
+    """
+    merger = MetadataMerger(base)
+    for name in sorted(overlays):
+        merger.apply(overlays[name])
+    return merger.result
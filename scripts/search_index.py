@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Build one FTS5 search index over every searchable table in every database.
+
+Cross-database search otherwise runs one FTS query per table and can only
+merge per-table rankings. The unified index holds, for each row of each
+searchable table, its database, table, row key, title and searchable text,
+so /-/search.json (plugins/cross_search.py) answers with a single query
+ranked over the whole corpus. A second, prefix-indexed FTS5 table holds
+short suggestion texts (distinct values of any "suggest" columns such as
+party names, most frequent first, then titles) for /-/suggest.json
+search-as-you-type.
+
+A table is searchable when it has an FTS index over a content table, or
+searchable columns configured under the zeeker-fts plugin settings (see
+fts_builder). The title is the table's label_column from metadata, else a
+"title" or "name" column, else the first searchable column. Suggestion
+columns are set with "suggest" in the same zeeker-fts settings:
+
+    "zeeker-fts": {"columns": ["title", "parties", "summary"], "suggest": ["parties"]}
+
+The index lives next to the databases as SEARCH_INDEX_FILENAME (not *.db, so
+it is neither served nor part of the refresh data hash). Each database's
+file hash, size, mtime and table settings are recorded in the index; only
+databases whose hash or settings changed are re-indexed, a file whose size
+and mtime are unchanged is not hashed again, and the index is left alone when
+nothing changed. Updates are made on a copy that is renamed over the index,
+so readers never see a partial build:
+
+    uv run scripts/search_index.py data/*.db --metadata metadata.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from scripts.common import file_sha256, quote_identifier
+    from scripts.fts_builder import DEFAULT_TOKENIZE, PLUGIN_NAME, fts_config, fts_tables
+except ImportError:
+    from common import file_sha256, quote_identifier
+    from fts_builder import DEFAULT_TOKENIZE, PLUGIN_NAME, fts_config, fts_tables
+
+SEARCH_INDEX_FILENAME = "zeeker-search.sqlite"
+
+# Bumped when the index schema changes, forcing a full rebuild
+SCHEMA_VERSION = 3
+
+# Indexed prefix lengths of the suggestion table, in characters
+SUGGEST_PREFIXES = "2 3 4"
+
+_TITLE_COLUMNS = ("title", "name")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sources (
+    database TEXT PRIMARY KEY,
+    sha256 TEXT,
+    settings TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    tables INTEGER,
+    rows INTEGER,
+    seconds REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    title, body,
+    database UNINDEXED, tbl UNINDEXED, row_key UNINDEXED,
+    tokenize='{DEFAULT_TOKENIZE}'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS suggest USING fts5(
+    text,
+    database UNINDEXED, tbl UNINDEXED, row_key UNINDEXED, kind UNINDEXED,
+    prefix='{SUGGEST_PREFIXES}', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def searchable_tables(conn, metadata: Dict, database: str) -> List[Dict]:
+    """[{"table", "columns", "title", "suggest", "pks"}] for the tables to index in one database."""
+    configured = fts_config(metadata, database)
+    columns = {table: config["columns"] for table, config in configured.items()}
+    for fts_table, info in fts_tables(conn).items():
+        if info["content"] and info["content"] not in columns:
+            indexed = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(fts_table)})")]
+            columns[info["content"]] = indexed
+
+    tables_metadata = ((metadata.get("databases") or {}).get(database) or {}).get("tables") or {}
+    tables = []
+    for table, searchable in sorted(columns.items()):
+        table_info = list(conn.execute(f"PRAGMA table_info({quote_identifier(table)})"))
+        names = [row[1] for row in table_info]
+        searchable = [column for column in searchable if column in names]
+        if not searchable:
+            continue
+        title = (tables_metadata.get(table) or {}).get("label_column")
+        if title not in names:
+            title = next((name for name in names if name.lower() in _TITLE_COLUMNS), searchable[0])
+        plugin = ((tables_metadata.get(table) or {}).get("plugins") or {}).get(PLUGIN_NAME) or {}
+        suggest = [column for column in plugin.get("suggest") or [] if column in names and column != title]
+        pks = [row[1] for row in sorted(table_info, key=lambda row: row[5]) if row[5]]
+        tables.append({"table": table, "columns": searchable, "title": title, "suggest": suggest, "pks": pks})
+    return tables
+
+
+def _index_database(index, path: Path, database: str, tables: List[Dict]) -> int:
+    """Replace the database's rows and suggestions in the index; return rows indexed."""
+    index.execute("DELETE FROM search WHERE database = ?", [database])
+    index.execute("DELETE FROM suggest WHERE database = ?", [database])
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = 0
+        for spec in tables:
+            body = " || char(10) || ".join(
+                f"coalesce({quote_identifier(column)}, '')" for column in spec["columns"] if column != spec["title"]
+            ) or "NULL"
+            key = ", ".join(quote_identifier(pk) for pk in spec["pks"]) or "rowid"
+            # Suggestions are served in rowid order, so the most frequent values
+            # of suggestion columns (e.g. party names) go in first, then titles.
+            # Such values repeat across rows; they lead to a search, not a row.
+            for column in spec["suggest"]:
+                values = source.execute(
+                    f"SELECT {quote_identifier(column)} FROM {quote_identifier(spec['table'])} "
+                    f"WHERE {quote_identifier(column)} IS NOT NULL AND {quote_identifier(column)} != '' "
+                    f"GROUP BY {quote_identifier(column)} ORDER BY count(*) DESC"
+                )
+                index.executemany(
+                    "INSERT INTO suggest (text, database, tbl, row_key, kind) VALUES (?, ?, ?, NULL, ?)",
+                    ((value, database, spec["table"], column) for (value,) in values),
+                )
+            cursor = source.execute(
+                f"SELECT {quote_identifier(spec['title'])}, {body}, {key} FROM {quote_identifier(spec['table'])}"
+            )
+            while True:
+                batch = cursor.fetchmany(1000)
+                if not batch:
+                    break
+                keys = [json.dumps(list(row[2:])) for row in batch]
+                index.executemany(
+                    "INSERT INTO search (title, body, database, tbl, row_key) VALUES (?, ?, ?, ?, ?)",
+                    [(row[0], row[1], database, spec["table"], key) for row, key in zip(batch, keys)],
+                )
+                index.executemany(
+                    "INSERT INTO suggest (text, database, tbl, row_key, kind) VALUES (?, ?, ?, ?, 'title')",
+                    [(row[0], database, spec["table"], key) for row, key in zip(batch, keys) if row[0]],
+                )
+                rows += len(batch)
+        return rows
+    finally:
+        source.close()
+
+
+def _recorded_sources(index_path: Path) -> Dict[str, Dict]:
+    """{database: {"sha256", "settings", "size", "mtime_ns"}} recorded in the index, {} to rebuild it"""
+    if not index_path.exists():
+        return {}
+    index = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        if index.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            return {}
+        return {
+            row[0]: {"sha256": row[1], "settings": row[2], "size": row[3], "mtime_ns": row[4]}
+            for row in index.execute("SELECT database, sha256, settings, size, mtime_ns FROM sources")
+        }
+    except sqlite3.DatabaseError:
+        return {}
+    finally:
+        index.close()
+
+
+def build_search_index(index_path: Path, databases: Dict[str, Path], metadata: Optional[Dict] = None) -> Dict:
+    """
+    Bring the index at index_path up to date with databases (name → file).
+
+    Returns {database: {"action", "tables", "rows", "seconds"}} where action is
+    "indexed", "unchanged", "removed" or "skipped" (no searchable tables).
+    A database is unchanged when its settings match the recorded ones and
+    either its size and mtime or, failing that, its hash do. When every
+    database is unchanged the index file is not touched at all.
+    """
+    metadata = metadata or {}
+    recorded = _recorded_sources(index_path)
+    report = {database: {"action": "removed"} for database in sorted(set(recorded) - set(databases))}
+    pending, restat = {}, {}
+    for database, path in sorted(databases.items()):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            tables = searchable_tables(conn, metadata, database)
+        finally:
+            conn.close()
+        settings, stat = json.dumps(tables, sort_keys=True), path.stat()
+        entry = recorded.get(database)
+        sha256 = None
+        if entry and entry["settings"] == settings:
+            if (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                sha256 = entry["sha256"]
+            else:
+                sha256 = file_sha256(path)
+                restat[database] = stat
+            if sha256 == entry["sha256"]:
+                report[database] = {"action": "unchanged", "tables": len(tables)}
+                continue
+            restat.pop(database, None)
+        pending[database] = (path, tables, settings, sha256, stat)
+    if not pending and not any(entry["action"] == "removed" for entry in report.values()):
+        return report
+
+    fd, temp_name = tempfile.mkstemp(dir=index_path.parent, prefix=f".{index_path.name}.", suffix=".tmp")
+    os.close(fd)
+    temp_path = Path(temp_name)
+    try:
+        if recorded:
+            shutil.copyfile(index_path, temp_path)
+        index = sqlite3.connect(temp_path)
+        try:
+            if not recorded:
+                index.executescript(
+                    "DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS search; DROP TABLE IF EXISTS suggest;"
+                )
+            index.executescript(_SCHEMA)
+            index.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+            for database in [database for database, entry in report.items() if entry["action"] == "removed"]:
+                index.execute("DELETE FROM search WHERE database = ?", [database])
+                index.execute("DELETE FROM suggest WHERE database = ?", [database])
+                index.execute("DELETE FROM sources WHERE database = ?", [database])
+
+            for database, (path, tables, settings, sha256, stat) in pending.items():
+                start = time.perf_counter()
+                rows = _index_database(index, path, database, tables)
+                seconds = time.perf_counter() - start
+                index.execute(
+                    "INSERT OR REPLACE INTO sources "
+                    "(database, sha256, settings, size, mtime_ns, tables, rows, seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [database, sha256 or file_sha256(path), settings, stat.st_size, stat.st_mtime_ns, len(tables),
+                     rows, seconds],
+                )
+                report[database] = {"action": "indexed" if tables else "skipped", "tables": len(tables),
+                                    "rows": rows, "seconds": seconds}
+                index.commit()
+
+            # Same content under a new mtime: record it so the next refresh need not hash the file
+            for database, stat in restat.items():
+                index.execute("UPDATE sources SET size = ?, mtime_ns = ? WHERE database = ?",
+                              [stat.st_size, stat.st_mtime_ns, database])
+            index.execute("INSERT INTO search (search) VALUES ('optimize')")
+            index.execute("INSERT INTO suggest (suggest) VALUES ('optimize')")
+            index.commit()
+        finally:
+            index.close()
+
+        if index_path.exists():
+            os.chmod(temp_path, index_path.stat().st_mode & 0o777)
+        os.replace(temp_path, index_path)
+        return dict(sorted(report.items()))
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def format_report(database: str, entry: Dict) -> str:
+    """One log line for a build_search_index report entry."""
+    line = f"Search index {database}: {entry['action']}"
+    if entry["action"] == "indexed":
+        line += f", {entry['rows']:,} rows from {entry['tables']} table(s) in {entry['seconds']:.2f}s"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the unified cross-database search index")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files")
+    parser.add_argument("--metadata", type=Path, help="metadata.json with zeeker-fts and label_column settings")
+    parser.add_argument("--output", type=Path, help=f"Index file (default: {SEARCH_INDEX_FILENAME} beside the databases)")
+    args = parser.parse_args()
+
+    metadata = json.loads(args.metadata.read_text()) if args.metadata else {}
+    output = args.output or args.paths[0].parent / SEARCH_INDEX_FILENAME
+    report = build_search_index(output, {path.stem: path for path in args.paths}, metadata)
+    for database, entry in report.items():
+        print(format_report(database, entry))
+
+
+if __name__ == "__main__":
+    main()
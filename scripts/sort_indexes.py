@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+Sort indexes that keep deep table pages as fast as the first one.
+
+Datasette pages a sorted table with keyset _next tokens (the last row's
+sort value and primary key), so page N asks for
+
+    WHERE (col > :v OR (col = :v AND pk > :p)) ORDER BY col, pk LIMIT 101
+
+and, without an index on col, every page sorts the whole table again. An
+index on col turns each page into an index range read of one page of rows.
+New indexes are created descending, but SQLite can walk an index either
+way, so any existing index led by the column (such as the ascending
+idx_zeeker_<table>_<column> indexes scripts/index_advisor.py creates)
+already serves both sort directions and no second index is built.
+
+Candidate columns are the table's sortable columns: its "sortable_columns"
+in metadata.json if set, else every column, plus its "sort"/"sort_desc".
+Tables under min_rows rows sort quickly anyway and are skipped, as are the
+rowid primary key (already in order) and columns whose values average more
+than max_key_bytes (body text, BLOBs), which would roughly double the file.
+When the primary key is not the rowid, its columns follow the sort column,
+matching Datasette's tie-break. Indexes are named
+idx_zeeker_sort_<table>_<column>, and plugins/keyset_pages.py offers sorting
+only on indexed columns of tables that have them. Run this on a staged copy,
+not a file being served:
+
+    uv run scripts/sort_indexes.py data/courts.db --metadata metadata.json
+"""
+import argparse
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from scripts.common import quote_identifier
+except ImportError:
+    from common import quote_identifier
+
+# Prefix of every index created here
+INDEX_PREFIX = "idx_zeeker_sort_"
+
+DEFAULT_MIN_ROWS = 10_000
+DEFAULT_MAX_KEY_BYTES = 100
+
+# Rows sampled to estimate a column's average value size
+SAMPLE_ROWS = 1000
+
+
+def index_name(table: str, column: str) -> str:
+    return INDEX_PREFIX + "_".join(re.sub(r"\W+", "_", part).strip("_").lower() for part in (table, column))
+
+
+def table_config(metadata: Dict, database: str, table: str) -> Dict:
+    tables = ((metadata.get("databases") or {}).get(database) or {}).get("tables") or {}
+    return tables.get(table) or {}
+
+
+def sort_config(metadata: Dict, database: str) -> Dict[str, Dict]:
+    """Table → its sortable_columns, sort and sort_desc settings, for tables that have any."""
+    tables = ((metadata.get("databases") or {}).get(database) or {}).get("tables") or {}
+    config = {}
+    for table, settings in tables.items():
+        settings = {key: settings[key] for key in ("sortable_columns", "sort", "sort_desc") if settings.get(key)}
+        if settings:
+            config[table] = settings
+    return config
+
+
+def _tables(conn) -> List[str]:
+    return [
+        name for name, kind in conn.execute("SELECT name, type FROM pragma_table_list WHERE schema = 'main'")
+        if kind == "table" and not name.startswith("sqlite_")
+    ]
+
+
+def _primary_keys(conn, table: str) -> Tuple[List[str], bool]:
+    """(primary key columns, whether the key is the table's own order: the rowid)"""
+    info = list(conn.execute(f"PRAGMA table_info({quote_identifier(table)})"))
+    pks = [row for row in sorted(info, key=lambda row: row[5]) if row[5]]
+    return [row[1] for row in pks], len(pks) == 1 and (pks[0][2] or "").upper() == "INTEGER"
+
+
+def sorted_index(conn, table: str, column: str) -> Optional[str]:
+    """Name of an index led by column, in either direction"""
+    for row in conn.execute(f"PRAGMA index_list({quote_identifier(table)})"):
+        keys = [info for info in conn.execute(f"PRAGMA index_xinfo({quote_identifier(row[1])})") if info[5]]
+        if keys and keys[0][2] == column:
+            return row[1]
+    return None
+
+
+def candidate_columns(conn, table: str, config: Dict, max_key_bytes: int) -> Dict[str, Optional[str]]:
+    """Sortable column → None to index it, or the reason it is not indexed"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+    sortable = list(config.get("sortable_columns") or columns)
+    required = [config[key] for key in ("sort", "sort_desc") if config.get(key)]
+    pks, rowid = _primary_keys(conn, table)
+    sizes = conn.execute(
+        "SELECT {} FROM (SELECT * FROM {} LIMIT {})".format(
+            ", ".join(f"avg(length(CAST({quote_identifier(column)} AS BLOB)))" for column in columns),
+            quote_identifier(table), SAMPLE_ROWS,
+        )
+    ).fetchone() if columns else ()
+    size = dict(zip(columns, sizes))
+
+    candidates = {}
+    for column in dict.fromkeys(sortable + required):
+        if column not in size:
+            candidates[column] = "unknown column"
+        elif rowid and column == pks[0]:
+            candidates[column] = "rowid order"
+        elif column not in required and (size[column] or 0) > max_key_bytes:
+            candidates[column] = f"values average {size[column]:.0f} bytes"
+        else:
+            candidates[column] = None
+    return candidates
+
+
+def ensure_sort_indexes(path: Path, metadata: Dict, database: str, min_rows: int = DEFAULT_MIN_ROWS,
+                        max_key_bytes: int = DEFAULT_MAX_KEY_BYTES) -> List[Dict]:
+    """
+    Create the missing sort indexes of every large table in the database at
+    path. Returns one report per candidate column: {"table", "column",
+    "index", "action"} with action "built", "exists" or "skipped" (and a
+    "reason"), plus "seconds" for built indexes.
+    """
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    try:
+        reports = []
+        for table in _tables(conn):
+            rows = conn.execute(f"SELECT count(*) FROM {quote_identifier(table)}").fetchone()[0]
+            if rows < min_rows:
+                continue
+            pks, rowid = _primary_keys(conn, table)
+            for column, reason in candidate_columns(
+                conn, table, table_config(metadata, database, table), max_key_bytes,
+            ).items():
+                report = {"table": table, "column": column, "index": None}
+                if reason:
+                    reports.append(dict(report, action="skipped", reason=reason))
+                    continue
+                existing = sorted_index(conn, table, column)
+                if existing:
+                    reports.append(dict(report, index=existing, action="exists"))
+                    continue
+                name = index_name(table, column)
+                start = time.perf_counter()
+                keys = [f"{quote_identifier(column)} DESC"]
+                if not rowid:
+                    keys += [quote_identifier(key) for key in pks if key != column]
+                conn.execute(f"CREATE INDEX {quote_identifier(name)} ON {quote_identifier(table)} ({', '.join(keys)})")
+                reports.append(dict(report, index=name, action="built", seconds=time.perf_counter() - start))
+        return reports
+    finally:
+        conn.close()
+
+
+def format_report(report: Dict) -> str:
+    """One log line for an ensure_sort_indexes report."""
+    line = f"Sort index on {report['table']}({report['column']}): {report['action']}"
+    if report.get("index"):
+        line += f" {report['index']}"
+    if report.get("seconds") is not None:
+        line += f" in {report['seconds']:.2f}s"
+    if report.get("reason"):
+        line += f" ({report['reason']})"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build indexes for sorted table pages")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files (not in use)")
+    parser.add_argument("--metadata", type=Path, help="metadata.json with sortable_columns table settings")
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS, help="Skip smaller tables")
+    parser.add_argument("--max-key-bytes", type=int, default=DEFAULT_MAX_KEY_BYTES,
+                        help="Skip columns whose values average more bytes")
+    args = parser.parse_args()
+
+    metadata = json.loads(args.metadata.read_text()) if args.metadata else {}
+    for path in args.paths:
+        for report in ensure_sort_indexes(path, metadata, path.stem, args.min_rows, args.max_key_bytes):
+            print(f"{path.name}: {format_report(report)}")
+
+
+if __name__ == "__main__":
+    main()
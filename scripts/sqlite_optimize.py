@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Post-download optimization of SQLite database files.
+
+Databases arrive from the ETL as-is and often lack sqlite_stat1, so the query
+planner guesses at index selectivity for facet and filter queries. Before a
+fresh file is installed in data/ it can be:
+
+- ANALYZEd, giving the planner statistics
+- rebuilt with VACUUM, optionally at a different page size
+- finished with PRAGMA optimize
+
+The file is modified in place, so run this on a staged copy only.
+
+    uv run scripts/sqlite_optimize.py data/courts.db --vacuum --page-size 8192
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+VALID_PAGE_SIZES = {512, 1024, 2048, 4096, 8192, 16384, 32768, 65536}
+
+
+def optimize_database(path, vacuum: bool = False, page_size: Optional[int] = None) -> Dict[str, float]:
+    """
+    Optimize the database at path in place and return seconds spent per step.
+
+    A page_size different from the file's current one implies VACUUM, which
+    needs a rollback journal, so WAL databases are switched to DELETE mode.
+    """
+    if page_size is not None and page_size not in VALID_PAGE_SIZES:
+        raise ValueError(f"Invalid page size {page_size}: must be a power of two from 512 to 65536")
+
+    timings = {}
+    conn = sqlite3.connect(str(path), isolation_level=None)
+    try:
+        start = time.perf_counter()
+        conn.execute("ANALYZE")
+        timings["analyze"] = time.perf_counter() - start
+
+        if page_size and conn.execute("PRAGMA page_size").fetchone()[0] != page_size:
+            vacuum = True
+        if vacuum:
+            start = time.perf_counter()
+            conn.execute("PRAGMA journal_mode=DELETE")
+            if page_size:
+                conn.execute(f"PRAGMA page_size={page_size}")
+            conn.execute("VACUUM")
+            timings["vacuum"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        conn.execute("PRAGMA optimize")
+        timings["optimize"] = time.perf_counter() - start
+    finally:
+        conn.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANALYZE, VACUUM and PRAGMA optimize SQLite databases in place")
+    parser.add_argument("paths", nargs="+", type=Path, help="Database files")
+    parser.add_argument("--vacuum", action="store_true", help="Rebuild the file with VACUUM")
+    parser.add_argument("--page-size", type=int, help="Rebuild with this page size")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        timings = optimize_database(path, vacuum=args.vacuum, page_size=args.page_size)
+        steps = ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items())
+        print(f"{path}: {steps}")
+
+
+if __name__ == "__main__":
+    main()
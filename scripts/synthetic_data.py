@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Generate synthetic SQLite databases shaped like the Zeeker legal datasets.
+
+Used by the benchmark harnesses to seed a local S3 stand-in and to start
+Datasette offline. Output is deterministic for a given name, size and seed,
+so runs are reproducible.
+
+    uv run scripts/synthetic_data.py data/courts.db --size-mb 2048
+"""
+import argparse
+import random
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+WORDS = (
+    "appeal appellant respondent court judgment tribunal statute section act "
+    "contract tort negligence damages injunction arbitration award claim "
+    "defendant plaintiff evidence witness hearing registrar judge justice "
+    "singapore high supreme district magistrate criminal civil procedure "
+    "liability breach duty care remedy costs order application dismissed "
+    "allowed held reasons ground decision precedent legislation amendment "
+    "parliament minister regulation licence property trust company insolvency "
+    "employment family divorce custody maintenance sentence conviction bail"
+).split()
+
+COURTS = [
+    "Court of Appeal", "High Court", "District Court",
+    "Magistrate's Court", "Family Justice Courts", "State Courts",
+]
+
+CATEGORIES = ["Judgment", "News", "Legislation", "Practice Direction", "Commentary"]
+
+# Rows inserted per transaction while growing the file
+BATCH_SIZE = 2000
+
+# Distinct generated texts per column; rows draw from these pools so that
+# multi-GB files can be produced at disk speed
+POOL_SIZE = 512
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _row(rng: random.Random, row_id: int, pools):
+    titles, summaries, bodies = pools
+    published = date(2000, 1, 1) + timedelta(days=rng.randrange(9000))
+    return (
+        row_id,
+        f"{rng.choice(titles)} ({row_id})",
+        rng.choice(COURTS),
+        rng.choice(CATEGORIES),
+        published.isoformat(),
+        f"{rng.choice(WORDS).title()} v {rng.choice(WORDS).title()}",
+        rng.choice(summaries),
+        rng.choice(bodies),
+        f"https://example.zeeker.sg/{row_id}",
+    )
+
+
+def create_database(path, size_mb: float = 8, seed: int = 0, fts: bool = True,
+                    body_words: int = 400) -> Path:
+    """
+    Create (or replace) a synthetic database at path of roughly size_mb.
+
+    The database holds one `documents` table with title, court, category,
+    date, parties, summary, body and url columns, plus an FTS5 index over
+    title, parties and summary when fts is set. Returns the path.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    rng = random.Random(f"{path.stem}:{seed}")
+    target_bytes = int(size_mb * 1024 * 1024)
+    pools = (
+        [_sentence(rng, rng.randint(5, 12)).capitalize() for _ in range(POOL_SIZE)],
+        [_sentence(rng, 40) for _ in range(POOL_SIZE)],
+        [_sentence(rng, body_words) for _ in range(POOL_SIZE)],
+    )
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE documents (
+                id INTEGER PRIMARY KEY,
+                title TEXT,
+                court TEXT,
+                category TEXT,
+                date TEXT,
+                parties TEXT,
+                summary TEXT,
+                body TEXT,
+                url TEXT
+            );
+        """)
+
+        row_id = 0
+        while True:
+            rows = [_row(rng, row_id + i + 1, pools) for i in range(BATCH_SIZE)]
+            row_id += BATCH_SIZE
+            conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            if page_count * page_size >= target_bytes:
+                break
+
+        if fts:
+            conn.executescript("""
+                CREATE VIRTUAL TABLE documents_fts USING fts5(
+                    title, parties, summary, content="documents", content_rowid="id"
+                );
+                INSERT INTO documents_fts (documents_fts) VALUES ('rebuild');
+            """)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return path
+
+
+def create_databases(directory, names, size_mb: float = 8, seed: int = 0, fts: bool = True):
+    """Create one synthetic database per name in directory; returns the paths."""
+    return [
+        create_database(Path(directory) / f"{name}.db", size_mb=size_mb, seed=seed, fts=fts)
+        for name in names
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="Database file to create")
+    parser.add_argument("--size-mb", type=float, default=8, help="Approximate size in MB")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--no-fts", action="store_true", help="Skip the FTS5 index")
+    args = parser.parse_args()
+
+    created = create_database(args.path, size_mb=args.size_mb, seed=args.seed, fts=not args.no_fts)
+    print(f"Created {created} ({created.stat().st_size / (1024 * 1024):.1f}MB)")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Lightweight timing spans written as JSON lines.
+
+Each span records its name, parent, thread, start time, duration, status and
+free-form attributes (S3 key, bytes, ...). Spans nest through a context
+variable, so work submitted to thread pools under contextvars.copy_context()
+keeps its parent. The resulting file can be summarized with
+`manage.py trace-summary` or shipped to any JSON log pipeline.
+
+    tracer = SpanTracer(Path("data/.zeeker-trace.jsonl"))
+    with tracer.span("pass1", prefix="latest") as span:
+        ...
+        span.set(bytes=1024)
+"""
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Span currently open in this context (thread or task)
+_current_span = contextvars.ContextVar("zeeker_current_span", default=None)
+
+
+class Span:
+    """One timed operation; attributes can be added while it is open."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "_perf_start")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, status: str, error: Optional[str] = None) -> Dict:
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": (time.perf_counter() - self._perf_start) * 1000,
+            "status": status,
+            "thread": threading.current_thread().name,
+            "attributes": self.attributes,
+        }
+        if error:
+            record["error"] = error
+        return record
+
+
+class SpanTracer:
+    """
+    Collects finished spans in memory and, when path is set, appends them to
+    a JSON-lines file. Calling start() truncates the file for a new trace.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else None
+        self.trace_id = uuid.uuid4().hex
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+        self._file = None
+
+    def start(self) -> "SpanTracer":
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "w", buffering=1)
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(self.trace_id, parent.span_id if parent else None, name, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self._emit(span.finish("error", f"{type(e).__name__}: {e}"))
+            raise
+        else:
+            self._emit(span.finish("ok"))
+        finally:
+            _current_span.reset(token)
+
+    def _emit(self, record: Dict) -> None:
+        with self._lock:
+            self.records.append(record)
+            if self._file:
+                self._file.write(json.dumps(record, default=str) + "\n")
+
+
+def load_spans(path: Path) -> List[Dict]:
+    """Read span records from a JSON-lines trace file, skipping malformed lines."""
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def summarize_spans(records: Iterable[Dict]) -> List[Dict]:
+    """
+    Aggregate spans by name: count, errors, total/mean/max milliseconds and
+    bytes. Sorted by total time, largest first.
+    """
+    groups: Dict[str, Dict] = {}
+    for record in records:
+        group = groups.setdefault(record["name"], {
+            "name": record["name"], "count": 0, "errors": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "bytes": 0,
+        })
+        group["count"] += 1
+        group["errors"] += record.get("status") == "error"
+        group["total_ms"] += record["duration_ms"]
+        group["max_ms"] = max(group["max_ms"], record["duration_ms"])
+        group["bytes"] += record.get("attributes", {}).get("bytes") or 0
+
+    for group in groups.values():
+        group["mean_ms"] = group["total_ms"] / group["count"]
+    return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+
+
+def format_summary(records: List[Dict], top: int = 10) -> str:
+    """Plain-text table of time per span name plus the slowest individual spans."""
+    roots = [record for record in records if not record.get("parent_id")]
+    wall_ms = sum(record["duration_ms"] for record in roots)
+
+    header = f"{'span':<28} {'count':>6} {'err':>4} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'MB':>8} {'% wall':>7}"
+    lines = [header, "-" * len(header)]
+    for group in summarize_spans(records):
+        share = group["total_ms"] / wall_ms * 100 if wall_ms else 0.0
+        lines.append(
+            f"{group['name']:<28} {group['count']:>6} {group['errors']:>4} "
+            f"{group['total_ms'] / 1000:>9.2f} {group['mean_ms']:>9.1f} {group['max_ms']:>9.1f} "
+            f"{group['bytes'] / (1024 * 1024):>8.1f} {share:>6.0f}%"
+        )
+
+    slowest = sorted(
+        (record for record in records if record.get("parent_id")),
+        key=lambda record: record["duration_ms"], reverse=True,
+    )[:top]
+    if slowest:
+        lines += ["", f"Slowest {len(slowest)} spans:"]
+        for record in slowest:
+            attributes = record.get("attributes", {})
+            detail = attributes.get("key") or attributes.get("prefix") or ""
+            lines.append(f"  {record['duration_ms']:>9.1f} ms  {record['name']:<24} {detail}")
+
+    lines.append("")
+    lines.append(f"Wall time: {wall_ms / 1000:.2f}s across {len(roots)} root span(s); "
+                 "child spans on transfer threads overlap, so totals can exceed 100%.")
+    return "\n".join(lines)
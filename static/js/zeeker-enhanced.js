@@ -94,6 +94,9 @@ class ZeekerEnhancer {
 
         if (!heroSearchInput || !heroSearchForm) return;
 
+        // Registered first so it can take Enter/arrow keys over the handlers below
+        this.setupSearchSuggestions(heroSearchInput, heroSearchForm);
+
         // Enhanced form submission
         heroSearchForm.addEventListener('submit', (e) => {
             e.preventDefault();
@@ -146,6 +149,110 @@ class ZeekerEnhancer {
         });
     }
 
+    setupSearchSuggestions(input, form) {
+        const list = document.createElement('ul');
+        list.className = 'hero-suggestions';
+        list.id = 'hero-suggestions';
+        list.setAttribute('role', 'listbox');
+        list.hidden = true;
+        form.appendChild(list);
+
+        input.setAttribute('autocomplete', 'off');
+        input.setAttribute('aria-autocomplete', 'list');
+        input.setAttribute('aria-controls', list.id);
+
+        let suggestions = [];
+        let active = -1;
+        let controller = null;
+
+        const hide = () => {
+            list.hidden = true;
+            suggestions = [];
+            active = -1;
+        };
+
+        const highlight = (index) => {
+            active = index;
+            list.querySelectorAll('li').forEach((item, i) => {
+                item.classList.toggle('active', i === active);
+                item.setAttribute('aria-selected', i === active ? 'true' : 'false');
+            });
+        };
+
+        const render = (items) => {
+            suggestions = items;
+            active = -1;
+            list.replaceChildren(...items.map((suggestion, i) => {
+                const item = document.createElement('li');
+                item.setAttribute('role', 'option');
+                const text = document.createElement('span');
+                text.className = 'hero-suggestion-text';
+                text.textContent = suggestion.text;
+                const source = document.createElement('span');
+                source.className = 'hero-suggestion-source';
+                source.textContent = suggestion.kind === 'title'
+                    ? suggestion.database
+                    : `${suggestion.kind} · ${suggestion.database}`;
+                item.append(text, source);
+                // mousedown fires before the input's blur hides the list
+                item.addEventListener('mousedown', (e) => {
+                    e.preventDefault();
+                    window.location.href = suggestion.url;
+                });
+                item.addEventListener('mouseenter', () => highlight(i));
+                return item;
+            }));
+            list.hidden = items.length === 0;
+        };
+
+        const fetchSuggestions = this.debounce(async (query) => {
+            if (controller) controller.abort();
+            controller = new AbortController();
+            try {
+                const url = new URL('/-/suggest.json', window.location.origin);
+                url.searchParams.set('q', query);
+                const response = await fetch(url, { signal: controller.signal });
+                const data = await response.json();
+                // Ignore answers to input the user has already changed
+                if (input.value.trim() === query) {
+                    render(data.suggestions || []);
+                }
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.warn('Zeeker Enhanced: suggestions unavailable', error);
+                }
+            }
+        }, 150);
+
+        input.addEventListener('input', () => {
+            const query = input.value.trim();
+            if (query.length < 2) {
+                if (controller) controller.abort();
+                hide();
+                return;
+            }
+            fetchSuggestions(query);
+        });
+
+        input.addEventListener('keydown', (e) => {
+            if (list.hidden) return;
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                const step = e.key === 'ArrowDown' ? 1 : -1;
+                highlight((active + step + suggestions.length) % suggestions.length);
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                e.stopImmediatePropagation();
+                window.location.href = suggestions[active].url;
+            } else if (e.key === 'Escape') {
+                e.stopImmediatePropagation();
+                hide();
+            }
+        });
+
+        input.addEventListener('blur', hide);
+    }
+
     setupParallax(heroImage) {
         // Only on larger screens and if motion is allowed
         if (window.innerWidth <= 768 || window.matchMedia('(prefers-reduced-motion: reduce)').matches) {
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark recording helpers for zeeker-datasette tests
+
+Benchmarks run only with `pytest --benchmark`. Each measurement records the
+best and median wall time, throughput and peak RSS growth, and is compared
+against:
+- the absolute target from PerformanceData.get_benchmark_targets()
+- the previous baseline in .benchmarks/baseline.json, failing when the
+  best time is slower than baseline × ZEEKER_BENCH_THRESHOLD (default 1.25)
+  and by more than ZEEKER_BENCH_MIN_DELTA_MS (default 5ms, to absorb noise)
+
+Results are written to .benchmarks/latest.json. Run with
+`--benchmark-save-baseline` to store them as the new baseline.
+"""
+
+import json
+import os
+import platform
+import resource
+import statistics
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_MIN_DELTA_MS = 5
+BENCHMARK_DIR = Path(__file__).parent.parent / ".benchmarks"
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the high-water mark (KB on Linux, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if platform.system() == "Darwin" else maxrss * 1024
+
+
+class PeakRSS:
+    """Context manager sampling RSS in a background thread to find the peak growth"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def growth(self):
+        return max(self.peak - self.baseline, 0)
+
+
+class BenchmarkRecorder:
+    """Collects benchmark results for a test session"""
+
+    def __init__(self, baseline_file=None, threshold=None, min_delta_ms=None):
+        self.baseline_file = Path(baseline_file or BENCHMARK_DIR / "baseline.json")
+        self.threshold = float(threshold or os.environ.get("ZEEKER_BENCH_THRESHOLD", DEFAULT_THRESHOLD))
+        self.min_delta = float(
+            min_delta_ms or os.environ.get("ZEEKER_BENCH_MIN_DELTA_MS", DEFAULT_MIN_DELTA_MS)
+        ) / 1000
+        self.results = {}
+        self.baseline = {}
+        if self.baseline_file.exists():
+            self.baseline = json.loads(self.baseline_file.read_text()).get("results", {})
+
+    def measure(self, name, fn, *, repeat=5, setup=None, items=None, nbytes=None):
+        """
+        Time fn() `repeat` times and record the result under name
+
+        setup, if given, runs before each repetition and is not timed.
+        items and nbytes are used to report throughput.
+        """
+        timings = []
+        peak_growth = 0
+        value = None
+        for _ in range(repeat):
+            if setup:
+                setup()
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                value = fn()
+                timings.append(time.perf_counter() - start)
+            peak_growth = max(peak_growth, rss.growth)
+
+        median = statistics.median(timings)
+        result = {
+            "best_s": min(timings),
+            "median_s": median,
+            "repeat": repeat,
+            "peak_rss_growth_bytes": peak_growth,
+        }
+        if items:
+            result["items_per_s"] = items / median
+        if nbytes:
+            result["mb_per_s"] = nbytes / (1024 ** 2) / median
+
+        self.results[name] = result
+        return value, result
+
+    def regression(self, name):
+        """Return a failure message if name regressed against the baseline, else None"""
+        previous = self.baseline.get(name)
+        current = self.results.get(name)
+        if not previous or not current:
+            return None
+
+        # Best-of-N is the least noisy estimate of the achievable time
+        allowed = max(previous["best_s"] * self.threshold, previous["best_s"] + self.min_delta)
+        if current["best_s"] > allowed:
+            return (
+                f"{name} regressed: best {current['best_s'] * 1000:.1f}ms vs baseline "
+                f"{previous['best_s'] * 1000:.1f}ms (threshold ×{self.threshold})"
+            )
+        return None
+
+    def write(self, path=None):
+        """Write results as JSON, returning the file path"""
+        path = Path(path or BENCHMARK_DIR / "latest.json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.time(),
+            "results": self.results,
+        }
+        path.write_text(json.dumps(payload, indent=2, sort_keys=True))
+        return path
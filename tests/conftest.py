@@ -83,6 +83,25 @@ def mock_environment():
         yield env_vars
 
 
+@pytest.fixture(autouse=True)
+def isolated_metrics_snapshot(tmp_path, monkeypatch):
+    """
+    Point run metrics at a temporary file so tests never write
+    .zeeker-metrics.json into the project's data directory
+    """
+    metrics_file = tmp_path / ".zeeker-metrics.json"
+    monkeypatch.setenv("ZEEKER_METRICS_FILE", str(metrics_file))
+    return metrics_file
+
+
+@pytest.fixture(autouse=True)
+def isolated_trace_file(tmp_path, monkeypatch):
+    """Same for the download timing spans (.zeeker-trace.jsonl)"""
+    trace_file = tmp_path / ".zeeker-trace.jsonl"
+    monkeypatch.setenv("ZEEKER_TRACE_FILE", str(trace_file))
+    return trace_file
+
+
 @pytest.fixture
 def mock_boto3_client():
     """
@@ -258,6 +277,37 @@ pytest.mark.s3 = pytest.mark.s3
 pytest.mark.slow = pytest.mark.slow
 pytest.mark.docker = pytest.mark.docker
 pytest.mark.network = pytest.mark.network
+pytest.mark.benchmark = pytest.mark.benchmark
+
+
+def pytest_addoption(parser):
+    """
+    Command line options for the benchmark suite
+    """
+    parser.addoption(
+        "--benchmark", action="store_true", default=False,
+        help="Run benchmarks (tests marked 'benchmark')",
+    )
+    parser.addoption(
+        "--benchmark-save-baseline", action="store_true", default=False,
+        help="Store this run's benchmark results as the regression baseline",
+    )
+
+
+@pytest.fixture(scope="session")
+def benchmark_recorder(request):
+    """
+    Session-wide benchmark recorder; results are written when the session ends
+    """
+    from tests.benchmarks import BENCHMARK_DIR, BenchmarkRecorder
+
+    recorder = BenchmarkRecorder()
+    yield recorder
+
+    if recorder.results:
+        recorder.write()
+        if request.config.getoption("--benchmark-save-baseline"):
+            recorder.write(BENCHMARK_DIR / "baseline.json")
 
 
 def pytest_configure(config):
@@ -271,13 +321,20 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "slow: Slow running tests")
     config.addinivalue_line("markers", "docker: Tests requiring Docker")
     config.addinivalue_line("markers", "network: Tests requiring network access")
+    config.addinivalue_line("markers", "benchmark: Benchmarks, run with --benchmark")
 
 
 def pytest_collection_modifyitems(config, items):
     """
     Modify test collection to add markers automatically
     """
+    skip_benchmark = pytest.mark.skip(reason="benchmarks run with --benchmark")
+    run_benchmarks = config.getoption("--benchmark")
+
     for item in items:
+        if item.get_closest_marker("benchmark") and not run_benchmarks:
+            item.add_marker(skip_benchmark)
+
         # Mark all test functions in test_download_from_s3.py as s3 tests
         if "test_download_from_s3" in str(item.fspath):
             item.add_marker(pytest.mark.s3)
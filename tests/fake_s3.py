@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Filesystem-backed stand-in for the boto3 S3 client used in benchmarks
+
+Objects live under <root>/<bucket>/<key>. Only the client methods used by
+scripts/download_from_s3.py and scripts/manage.py are implemented.
+"""
+
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3Paginator:
+    """Paginator for list_objects_v2 returning pages of at most 1000 keys"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix="", PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get("PageSize", 1000)
+        keys = self.client._keys(Bucket, Prefix)
+        if not keys:
+            self.client._request()
+            yield {"KeyCount": 0}
+            return
+
+        for start in range(0, len(keys), page_size):
+            self.client._request()
+            page = keys[start:start + page_size]
+            yield {
+                "KeyCount": len(page),
+                "Contents": [self.client._listing_entry(Bucket, key) for key in page],
+            }
+
+
+class FilesystemS3Client:
+    """
+    Minimal S3 client backed by a local directory
+
+    latency adds a fixed delay to every request, approximating the round
+    trip to a remote endpoint. request_count counts requests made.
+    """
+
+    def __init__(self, root, latency=0.0):
+        self.root = Path(root)
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def seed(self, bucket, objects):
+        """Create objects from a {key: bytes} mapping"""
+        for key, content in objects.items():
+            path = self._path(bucket, key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+    def _request(self):
+        with self._lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _path(self, bucket, key):
+        return self.root / bucket / key
+
+    def _keys(self, bucket, prefix):
+        bucket_dir = self.root / bucket
+        if not bucket_dir.exists():
+            return []
+        keys = (
+            path.relative_to(bucket_dir).as_posix()
+            for path in bucket_dir.rglob("*")
+            if path.is_file()
+        )
+        return sorted(key for key in keys if key.startswith(prefix))
+
+    def _listing_entry(self, bucket, key):
+        stat = self._path(bucket, key).stat()
+        return {
+            "Key": key,
+            "Size": stat.st_size,
+            "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            "LastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+        }
+
+    def _missing(self, key, operation):
+        return ClientError({"Error": {"Code": "NoSuchKey", "Message": key}}, operation)
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2", operation
+        return FakeS3Paginator(self)
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, Delimiter=None):
+        self._request()
+        keys = self._keys(Bucket, Prefix)
+        response = {"KeyCount": 0}
+
+        if Delimiter:
+            prefixes = sorted({
+                Prefix + key[len(Prefix):].split(Delimiter, 1)[0] + Delimiter
+                for key in keys
+                if Delimiter in key[len(Prefix):]
+            })
+            keys = [key for key in keys if Delimiter not in key[len(Prefix):]]
+            if prefixes:
+                response["CommonPrefixes"] = [{"Prefix": prefix} for prefix in prefixes]
+
+        keys = keys[:MaxKeys]
+        if keys:
+            response["Contents"] = [self._listing_entry(Bucket, key) for key in keys]
+            response["KeyCount"] = len(keys)
+        return response
+
+    def head_object(self, Bucket, Key):
+        self._request()
+        if not self._path(Bucket, Key).is_file():
+            raise self._missing(Key, "HeadObject")
+        entry = self._listing_entry(Bucket, Key)
+        return {"ContentLength": entry["Size"], "ETag": entry["ETag"]}
+
+    def get_object(self, Bucket, Key):
+        self._request()
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._missing(Key, "GetObject")
+        return {"Body": open(path, "rb"), "ContentLength": path.stat().st_size}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._request()
+        path = self._path(Bucket, Key)
+        if not path.is_file():
+            raise self._missing(Key, "GetObject")
+        shutil.copyfile(path, Filename)
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._request()
+        path = self._path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(Filename, path)
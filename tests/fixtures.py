@@ -614,6 +614,20 @@ class PerformanceData:
             },
         }
 
+    @staticmethod
+    def parse_target(target):
+        """
+        Convert a target such as "< 200ms", "< 2s" or "< 50MB" into a number.
+
+        Durations are returned in seconds, sizes in bytes.
+        """
+        value = target.strip().lstrip("<").strip()
+        units = {"ms": 0.001, "s": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+        for suffix in sorted(units, key=len, reverse=True):
+            if value.endswith(suffix):
+                return float(value[: -len(suffix)]) * units[suffix]
+        raise ValueError(f"Unrecognised benchmark target: {target}")
+
     @staticmethod
     def create_performance_test_data(size_category="medium"):
         """Create test data for performance testing"""
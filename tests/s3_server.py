@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Local S3-compatible HTTP server for offline, end-to-end transfer tests
+
+Serves path-style requests (http://127.0.0.1:<port>/<bucket>/<key>) from a
+directory laid out like tests/fake_s3.py (<root>/<bucket>/<key>), so the real
+boto3 client, s3transfer and ZeekerS3Downloader code paths run unmodified.
+
+Supported: ListObjectsV2 (with pagination and delimiters), HeadObject,
+GetObject (including Range requests used by multipart downloads) and
+PutObject. Request signatures are not checked.
+
+Shaping:
+- latency: seconds added before every response (simulated round trip)
+- bandwidth: bytes/second shared by all connections, like a single uplink
+
+Usage:
+    with LocalS3Server(root, latency=0.02, bandwidth=50 * 1024 ** 2) as server:
+        os.environ["S3_ENDPOINT_URL"] = server.endpoint_url
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from scripts.synthetic_data import create_database
+
+S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+CHUNK_SIZE = 256 * 1024
+
+
+class BandwidthThrottle:
+    """Paces writes so that all connections together stay under a byte rate"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + nbytes / self.rate
+            wait = self._next_free - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+class S3RequestHandler(BaseHTTPRequestHandler):
+    """Path-style S3 request handler; configuration lives on self.server"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep test output quiet
+
+    # Helpers -----------------------------------------------------------
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = parts.path.lstrip("/").partition("/")
+        query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        return unquote(bucket), unquote(key), query
+
+    def _object_path(self, bucket, key):
+        return self.server.root / bucket / key
+
+    def _etag(self, path):
+        stat = path.stat()
+        digest = hashlib.md5(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+        return f'"{digest}"'
+
+    def _begin(self):
+        with self.server.stats_lock:
+            self.server.request_count += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _send_xml(self, status, body):
+        payload = f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self._write(payload)
+
+    def _send_error(self, status, code, message=""):
+        if self.command == "HEAD":
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send_xml(status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+    def _write(self, data):
+        self.server.throttle.consume(len(data))
+        self.wfile.write(data)
+        with self.server.stats_lock:
+            self.server.bytes_sent += len(data)
+
+    def _object_headers(self, path, length):
+        stat = path.stat()
+        self.send_header("Content-Length", str(length))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("ETag", self._etag(path))
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.send_header("Accept-Ranges", "bytes")
+
+    # Operations --------------------------------------------------------
+
+    def do_GET(self):
+        self._begin()
+        bucket, key, query = self._route()
+        if not key:
+            return self._list_objects(bucket, query)
+        self._get_object(bucket, key, head=False)
+
+    def do_HEAD(self):
+        self._begin()
+        bucket, key, _ = self._route()
+        self._get_object(bucket, key, head=True)
+
+    def do_PUT(self):
+        self._begin()
+        bucket, key, query = self._route()
+        if "uploadId" in query:
+            return self._send_error(501, "NotImplemented", "Multipart uploads are not supported")
+
+        length = int(self.headers.get("Content-Length", 0))
+        path = self._object_path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        self.send_response(200)
+        self.send_header("ETag", self._etag(path))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        self._begin()
+        self._send_error(501, "NotImplemented", "Multipart uploads are not supported")
+
+    def _get_object(self, bucket, key, head):
+        path = self._object_path(bucket, key)
+        if not path.is_file():
+            return self._send_error(404, "NoSuchKey", key)
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[len("bytes="):].partition("-")
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:  # Suffix range: last N bytes
+                start = max(size - int(last), 0)
+            if start >= size:
+                return self._send_error(416, "InvalidRange", range_header)
+            status = 206
+
+        length = end - start + 1 if size else 0
+        self.send_response(status)
+        self._object_headers(path, length)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if head:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self._write(chunk)
+                remaining -= len(chunk)
+
+    def _list_objects(self, bucket, query):
+        bucket_dir = self.server.root / bucket
+        if not bucket_dir.is_dir():
+            return self._send_error(404, "NoSuchBucket", bucket)
+
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        max_keys = int(query.get("max-keys", 1000))
+        after = query.get("continuation-token") or query.get("start-after", "")
+
+        keys = sorted(
+            path.relative_to(bucket_dir).as_posix()
+            for path in bucket_dir.rglob("*")
+            if path.is_file()
+        )
+        entries = []  # (sort key, kind, value)
+        prefixes = set()
+        for key in keys:
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+            else:
+                entries.append((key, "key", key))
+        entries.extend((p, "prefix", p) for p in prefixes)
+        entries.sort()
+        entries = [entry for entry in entries if entry[0] > after]
+
+        page, truncated = entries[:max_keys], len(entries) > max_keys
+        body = [
+            f'<ListBucketResult xmlns="{S3_XMLNS}">',
+            f"<Name>{escape(bucket)}</Name>",
+            f"<Prefix>{escape(prefix)}</Prefix>",
+            f"<KeyCount>{len(page)}</KeyCount>",
+            f"<MaxKeys>{max_keys}</MaxKeys>",
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>",
+        ]
+        if delimiter:
+            body.append(f"<Delimiter>{escape(delimiter)}</Delimiter>")
+        if truncated:
+            body.append(f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>")
+
+        for _, kind, value in page:
+            if kind == "prefix":
+                body.append(f"<CommonPrefixes><Prefix>{escape(value)}</Prefix></CommonPrefixes>")
+                continue
+            path = bucket_dir / value
+            stat = path.stat()
+            modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            body.append(
+                "<Contents>"
+                f"<Key>{escape(value)}</Key>"
+                f"<LastModified>{modified.strftime('%Y-%m-%dT%H:%M:%S.000Z')}</LastModified>"
+                f"<ETag>{escape(self._etag(path))}</ETag>"
+                f"<Size>{stat.st_size}</Size>"
+                "<StorageClass>STANDARD</StorageClass>"
+                "</Contents>"
+            )
+        body.append("</ListBucketResult>")
+        self._send_xml(200, "".join(body))
+
+
+class LocalS3Server:
+    """
+    Threaded S3-compatible server on 127.0.0.1, run as a context manager
+
+    root:      directory holding <bucket>/<key> files
+    latency:   seconds added to every request
+    bandwidth: total bytes/second across all connections (None = unlimited)
+    """
+
+    def __init__(self, root, latency=0.0, bandwidth=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self):
+        return self._httpd.request_count
+
+    @property
+    def bytes_sent(self):
+        return self._httpd.bytes_sent
+
+    def create_bucket(self, bucket):
+        (self.root / bucket).mkdir(parents=True, exist_ok=True)
+
+    def put_object(self, bucket, key, content):
+        path = self.root / bucket / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        return path
+
+    def seed_databases(self, bucket, names, size_mb=8, seed=0, prefix="latest"):
+        """Generate synthetic SQLite databases directly into <bucket>/<prefix>/"""
+        return [
+            create_database(self.root / bucket / prefix / f"{name}.db", size_mb=size_mb, seed=seed)
+            for name in names
+        ]
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), S3RequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.root = self.root
+        self._httpd.latency = self.latency
+        self._httpd.throttle = BandwidthThrottle(self.bandwidth)
+        self._httpd.stats_lock = threading.Lock()
+        self._httpd.request_count = 0
+        self._httpd.bytes_sent = 0
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def object_url(endpoint_url, bucket, key):
+    """Path-style URL for an object on the local server"""
+    return f"{endpoint_url}/{quote(bucket)}/{quote(key)}"
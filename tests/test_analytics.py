@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/analytics.py
+
+Needs pyarrow (to write the Parquet mirror) and duckdb. The benchmark runs
+the same GROUP BY through Datasette's SQLite query view and through
+/-/analytics over the mirror:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_analytics.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+from urllib.parse import urlencode
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.analytics import get_analytics
+from scripts.bench import PROJECT_DIR
+from scripts.export_artifacts import EXPORTS_DIRNAME, build_exports
+from scripts.synthetic_data import create_database
+
+pytest.importorskip("pyarrow.parquet")
+pytest.importorskip("duckdb")
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+GROUP_BY = "SELECT court, substr(date, 1, 4) AS year, count(*) AS n FROM documents GROUP BY 1, 2 ORDER BY 1, 2"
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("analytics") / "courts.db", size_mb=0.2)
+
+
+@pytest.fixture
+def data_dir(source_database, tmp_path):
+    shutil.copy(source_database, tmp_path / "courts.db")
+    build_exports(tmp_path / EXPORTS_DIRNAME, {"courts": tmp_path / "courts.db"}, ["parquet"])
+    return tmp_path
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("analytics-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def make_datasette(database_file, settings=None, metadata=None, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        settings=settings,
+        # Without the query cache, so repeated requests run every time
+        metadata=dict(metadata or {}, plugins={"zeeker-analytics": config, "zeeker-query-cache": {"max_bytes": 0}}),
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def analytics_path(sql=None, **args):
+    return "/-/analytics.json?" + urlencode(dict({"sql": sql} if sql else {}, **args))
+
+
+def get(datasette, *paths):
+    async def fetch():
+        return [await datasette.client.get(path) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+def rows(database_file, sql):
+    conn = sqlite3.connect(database_file)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class TestAnalytics:
+    """Queries over the Parquet mirror"""
+
+    def test_group_by_matches_sqlite(self, data_dir):
+        datasette = make_datasette(data_dir / "courts.db")
+
+        result, qualified, objects = get(
+            datasette, analytics_path(GROUP_BY),
+            analytics_path("SELECT count(*) AS n FROM courts.documents"),
+            analytics_path("SELECT id, title FROM documents ORDER BY id LIMIT 2", _shape="objects"),
+        )
+
+        data = result.json()
+        assert data["ok"] and data["columns"] == ["court", "year", "n"]
+        assert [tuple(row) for row in data["rows"]] == rows(data_dir / "courts.db", GROUP_BY)
+        assert data["truncated"] is False
+        assert qualified.json()["rows"] == [[rows(data_dir / "courts.db", "SELECT count(*) FROM documents")[0][0]]]
+        assert [row["id"] for row in objects.json()["rows"]] == [1, 2]
+
+    def test_truncated(self, data_dir):
+        datasette = make_datasette(data_dir / "courts.db", max_rows=5)
+
+        (response,) = get(datasette, analytics_path("SELECT id FROM documents", _shape="array"))
+        (wrapped,) = get(datasette, analytics_path("SELECT id FROM documents"))
+
+        assert len(response.json()) == 5
+        assert wrapped.json()["truncated"] is True
+
+    def test_lists_tables(self, data_dir):
+        (response,) = get(make_datasette(data_dir / "courts.db"), analytics_path())
+
+        assert response.json()["databases"] == {"courts": ["documents"]}
+
+    def test_read_only(self, data_dir):
+        (data_dir / "secret.csv").write_text("a\n1\n")
+        datasette = make_datasette(data_dir / "courts.db")
+
+        responses = get(
+            datasette,
+            analytics_path("SELECT 1; SELECT 2"),
+            analytics_path(f"COPY (SELECT 1) TO '{data_dir / EXPORTS_DIRNAME / 'out.csv'}'"),
+            analytics_path(f"SELECT * FROM read_csv('{data_dir / 'secret.csv'}')"),
+            analytics_path("SELECT * FROM duckdb_settings() WHERE name = 'threads'"),
+            analytics_path("SELECT nope FROM documents"),
+        )
+
+        assert [response.status_code for response in responses] == [400, 400, 400, 200, 400]
+        assert responses[0].json()["error"] == "Statement must be a single SELECT"
+        assert "Permission" in responses[2].json()["error"]
+        assert not (data_dir / EXPORTS_DIRNAME / "out.csv").exists()
+
+    def test_needs_execute_sql(self, data_dir):
+        metadata = {"databases": {"courts": {"allow_sql": {"id": "root"}}}}
+        datasette = make_datasette(data_dir / "courts.db", metadata=metadata)
+        cookies = {"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")}
+
+        async def fetch():
+            # The first request, before anything has loaded the mirror
+            anonymous = await datasette.client.get(analytics_path("SELECT count(*) FROM documents"))
+            root = await datasette.client.get(analytics_path("SELECT count(*) FROM documents"), cookies=cookies)
+            return anonymous, root
+
+        anonymous, root = asyncio.run(fetch())
+
+        assert anonymous.status_code == 403
+        assert root.status_code == 200
+
+    def test_needs_view_permissions(self, data_dir):
+        private_database = {"databases": {"courts": {"allow": {"id": "root"}}}}
+        private_table = {"databases": {"courts": {"tables": {"documents": {"allow": {"id": "root"}}}}}}
+        sql = analytics_path("SELECT count(*) FROM courts.documents")
+
+        for metadata in (private_database, private_table):
+            datasette = make_datasette(data_dir / "courts.db", metadata=metadata)
+            cookies = {"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")}
+
+            async def fetch():
+                return [
+                    await datasette.client.get("/courts/documents.json"),
+                    await datasette.client.get(analytics_path()),
+                    await datasette.client.get(sql),
+                    await datasette.client.get(analytics_path(), cookies=cookies),
+                    await datasette.client.get(sql, cookies=cookies),
+                ]
+
+            table, listing, query, root_listing, root_query = asyncio.run(fetch())
+
+            assert (table.status_code, query.status_code, root_query.status_code) == (403, 403, 200)
+            assert listing.json()["databases"] == {}
+            assert root_listing.json()["databases"] == {"courts": ["documents"]}
+
+    def test_reloads_changed_mirror(self, data_dir):
+        datasette = make_datasette(data_dir / "courts.db")
+        (before,) = get(datasette, analytics_path("SELECT count(*) FROM documents"))
+
+        conn = sqlite3.connect(data_dir / "courts.db")
+        conn.execute("DELETE FROM documents WHERE id > 10")
+        conn.commit()
+        conn.close()
+        build_exports(data_dir / EXPORTS_DIRNAME, {"courts": data_dir / "courts.db"}, ["parquet"])
+        (after,) = get(datasette, analytics_path("SELECT count(*) FROM documents"))
+
+        assert before.json()["rows"][0][0] > 10
+        assert after.json()["rows"] == [[10]]
+
+    def test_no_mirror_and_timeout(self, data_dir):
+        shutil.rmtree(data_dir / EXPORTS_DIRNAME)
+        (missing,) = get(make_datasette(data_dir / "courts.db"), analytics_path("SELECT 1"))
+
+        build_exports(data_dir / EXPORTS_DIRNAME, {"courts": data_dir / "courts.db"}, ["parquet"])
+        datasette = make_datasette(data_dir / "courts.db", time_limit_ms=50)
+        (slow,) = get(datasette, analytics_path(
+            "SELECT count(*) FROM documents a, documents b, documents c WHERE a.body < b.body || c.title"))
+
+        assert missing.status_code == 503
+        assert (slow.status_code, slow.json()["error"]) == (400, "Analytics query took too long")
+        assert get_analytics(datasette).stats()["timeouts"] == 1
+
+
+@pytest.mark.benchmark
+class TestAnalyticsBenchmarks:
+    """Row-oriented SQLite versus the columnar mirror"""
+
+    def test_group_by(self, benchmark_recorder, bench_database, tmp_path):
+        shutil.copy(bench_database, tmp_path / "courts.db")
+        build_exports(tmp_path / EXPORTS_DIRNAME, {"courts": tmp_path / "courts.db"}, ["parquet"])
+        datasette = make_datasette(tmp_path / "courts.db", {"sql_time_limit_ms": 60000})
+        expected = rows(tmp_path / "courts.db", GROUP_BY)
+
+        def sqlite():
+            (response,) = get(datasette, "/courts.json?" + urlencode({"sql": GROUP_BY, "_shape": "array"}))
+            assert len(response.json()) == len(expected)
+
+        def analytics():
+            (response,) = get(datasette, analytics_path(GROUP_BY, _shape="array"))
+            assert len(response.json()) == len(expected)
+
+        best = {}
+        for name, workload in (("sqlite", sqlite), ("duckdb", analytics)):
+            workload()  # Warm connections and page cache
+            _, result = benchmark_recorder.measure(f"analytics.{name}", workload, repeat=3)
+            best[name] = result["best_s"]
+
+        print(f"\nGROUP BY over {len(expected)} groups: SQLite {best['sqlite'] * 1000:.0f}ms, "
+              f"DuckDB on Parquet {best['duckdb'] * 1000:.0f}ms ({best['sqlite'] / best['duckdb']:.2f}x)")
+        assert best["duckdb"] < best["sqlite"]
+        for name in best:
+            regression = benchmark_recorder.regression(f"analytics.{name}")
+            assert regression is None, regression
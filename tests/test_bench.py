@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/bench.py and the manage.py bench command
+"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from scripts import manage
+from scripts.bench import RouteStats, format_report, percentile, run_benchmark, summarize
+from scripts.synthetic_data import create_database
+
+
+@pytest.fixture(scope="module")
+def small_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("bench") / "courts.db", size_mb=0.1)
+
+
+class TestReport:
+    """Percentiles and report formatting"""
+
+    def test_percentile_nearest_rank(self):
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 95) == 95.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([], 99) == 0.0
+
+    def test_summarize_and_compare(self):
+        stats = {"a": RouteStats(latencies=[0.01, 0.02], requests=3, errors=1)}
+
+        report = summarize(stats, {"a": "/a"}, elapsed=1.0, concurrency=2)
+
+        assert report["routes"]["a"]["requests"] == 3
+        assert report["routes"]["a"]["p99_ms"] == pytest.approx(20.0)
+        assert report["total"]["rps"] == 2.0
+
+        baseline = json.loads(json.dumps(report))
+        baseline["routes"]["a"]["p95_ms"] = 10.0
+        table = format_report(report, baseline)
+        assert "+100%" in table
+
+
+class TestLoadRun:
+    """In-process Datasette with the repo's plugins and templates"""
+
+    def test_default_route_mix(self, small_database):
+        report = run_benchmark([small_database], concurrency=4, requests=40)
+
+        routes = report["routes"]
+        assert {"sources", "status", "search_all", "table_json", "table_search_json"} <= set(routes)
+        assert routes["table_search_json"]["path"] == "/courts/documents.json?_search=appeal"
+        assert report["total"]["requests"] == 40
+        assert report["total"]["errors"] == 0
+
+    def test_bench_command(self, small_database, tmp_path):
+        output = tmp_path / "report.json"
+
+        result = CliRunner().invoke(manage.bench, [
+            "--data-dir", str(small_database.parent),
+            "-n", "10", "-c", "2",
+            "--route", "status=/status",
+            "--output", str(output),
+        ])
+
+        assert result.exit_code == 0, result.output
+        assert "p95 ms" in result.output
+        report = json.loads(output.read_text())
+        assert list(report["routes"]) == ["status"]
+        assert report["databases"] == ["courts.db"]
+
+    def test_bench_command_rejects_bad_route(self, small_database):
+        result = CliRunner().invoke(manage.bench, [
+            "--data-dir", str(small_database.parent), "--route", "status",
+        ])
+
+        assert result.exit_code != 0
+        assert "LABEL=/path" in result.output
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite enforcing PerformanceData.get_benchmark_targets()
+
+Run with:  pytest tests/test_benchmarks.py --benchmark
+"""
+
+import json
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from scripts import manage
+from scripts.download_from_s3 import S3ObjectIndex, ZeekerS3Downloader
+from tests.fake_s3 import FilesystemS3Client
+from tests.fixtures import PerformanceData, SampleData
+
+pytestmark = pytest.mark.benchmark
+
+TARGETS = PerformanceData.get_benchmark_targets()
+BUCKET = "bench-bucket"
+
+
+def assert_within_target(recorder, name, result, target):
+    """Fail if the median misses the absolute target or regressed against the baseline"""
+    limit = PerformanceData.parse_target(target)
+    assert result["median_s"] < limit, (
+        f"{name}: median {result['median_s'] * 1000:.1f}ms misses target {target}"
+    )
+    regression = recorder.regression(name)
+    assert regression is None, regression
+
+
+@pytest.fixture
+def fake_s3(tmp_path):
+    return FilesystemS3Client(tmp_path / "s3")
+
+
+@pytest.fixture
+def downloader(tmp_path, fake_s3):
+    with patch.dict(os.environ, {"S3_BUCKET": BUCKET}):
+        downloader = ZeekerS3Downloader()
+
+    downloader.s3_client = fake_s3
+    downloader.data_dir = tmp_path / "data"
+    downloader.templates_dir = tmp_path / "templates"
+    downloader.static_dir = tmp_path / "static"
+    downloader.plugins_dir = tmp_path / "plugins"
+    downloader.metadata_file = tmp_path / "metadata.json"
+    downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+    return downloader
+
+
+class TestHashCalculationBenchmarks:
+    """calculate_directory_hash throughput"""
+
+    @pytest.mark.parametrize("size", ["small_files", "medium_files", "large_files"])
+    def test_calculate_directory_hash(self, benchmark_recorder, tmp_path, size):
+        spec = TARGETS["hash_calculation"][size]
+        chunk = os.urandom(spec["size_kb"] * 1024)
+        for i in range(spec["files"]):
+            (tmp_path / f"db_{i:03d}.db").write_bytes(chunk)
+
+        name = f"hash_calculation.{size}"
+        _, result = benchmark_recorder.measure(
+            name,
+            lambda: manage.calculate_directory_hash(tmp_path),
+            items=spec["files"],
+            nbytes=spec["files"] * len(chunk),
+        )
+        assert_within_target(benchmark_recorder, name, result, spec["target"])
+
+
+class TestMetadataMergeBenchmarks:
+    """_deep_merge_metadata and _merge_all_metadata against the filesystem S3 fake"""
+
+    @staticmethod
+    def _overlay(i, settings):
+        return {
+            "databases": {f"overlay_{i:04d}": {f"setting_{k}": k for k in range(settings)}},
+            "extra_css_urls": [f"/static/databases/overlay_{i:04d}/theme.css"],
+        }
+
+    @pytest.mark.parametrize("size", ["small", "medium", "large"])
+    def test_deep_merge_metadata(self, benchmark_recorder, downloader, size):
+        spec = TARGETS["metadata_merge"][size]
+        base = SampleData.sample_metadata()["large_metadata"]
+        overlays = [self._overlay(i, spec["settings"]) for i in range(spec["databases"])]
+
+        def merge_all():
+            merged = base
+            for overlay in overlays:
+                merged = downloader._deep_merge_metadata(merged, overlay)
+            return merged
+
+        name = f"metadata_merge.{size}"
+        merged, result = benchmark_recorder.measure(name, merge_all, items=spec["databases"])
+
+        assert len(merged["extra_css_urls"]) == spec["databases"]
+        assert_within_target(benchmark_recorder, name, result, spec["target"])
+
+    def test_merge_all_metadata_from_s3(self, benchmark_recorder, downloader, fake_s3):
+        spec = TARGETS["metadata_merge"]["medium"]
+        databases = {f"overlay_{i:04d}" for i in range(spec["databases"])}
+        fake_s3.seed(BUCKET, {
+            f"assets/databases/{name}/metadata.json": json.dumps(
+                self._overlay(int(name.split("_")[1]), 10)
+            ).encode()
+            for name in databases
+        })
+        base = json.dumps(SampleData.sample_metadata()["base_comprehensive"])
+
+        name = "metadata_merge.from_s3"
+        _, result = benchmark_recorder.measure(
+            name,
+            lambda: downloader._merge_all_metadata(databases),
+            setup=lambda: downloader.metadata_file.write_text(base),
+            items=len(databases),
+        )
+
+        merged = json.loads(downloader.metadata_file.read_text())
+        assert len(merged["databases"]) == 3 + len(databases)
+        # Listing-free fallback still has a target: one GET per database
+        assert_within_target(benchmark_recorder, name, result, "< 1s")
+
+
+class TestS3OperationBenchmarks:
+    """Downloader S3 operations against the filesystem S3 fake"""
+
+    def test_list_objects(self, benchmark_recorder, fake_s3):
+        spec = TARGETS["s3_operations"]["list_objects"]
+        fake_s3.seed(BUCKET, {
+            f"assets/databases/db_{i % 50}/static/file_{i:04d}.css": b"body{}"
+            for i in range(spec["objects"])
+        })
+
+        name = "s3_operations.list_objects"
+        index, result = benchmark_recorder.measure(
+            name,
+            lambda: S3ObjectIndex.from_listing(fake_s3, BUCKET, "assets/"),
+            items=spec["objects"],
+        )
+
+        assert len(index) == spec["objects"]
+        assert_within_target(benchmark_recorder, name, result, spec["target"])
+
+    def test_download_simulation(self, benchmark_recorder, downloader, fake_s3):
+        spec = TARGETS["s3_operations"]["download_simulation"]
+        payload = os.urandom(64 * 1024)
+        fake_s3.seed(BUCKET, {
+            f"assets/default/static/file_{i}.bin": payload for i in range(spec["files"])
+        })
+
+        def download():
+            with downloader._transfer_session():
+                downloader._download_s3_directory("assets/default/static/", downloader.static_dir)
+
+        name = "s3_operations.download_simulation"
+        _, result = benchmark_recorder.measure(
+            name, download, items=spec["files"], nbytes=spec["files"] * len(payload)
+        )
+
+        assert len(list(downloader.static_dir.glob("*.bin"))) == spec["files"]
+        assert_within_target(benchmark_recorder, name, result, spec["target"])
+
+    def test_upload_simulation(self, benchmark_recorder, downloader, fake_s3, tmp_path):
+        spec = TARGETS["s3_operations"]["upload_simulation"]
+        source = tmp_path / "upload"
+        source.mkdir()
+        payload = os.urandom(64 * 1024)
+        for i in range(spec["files"]):
+            (source / f"file_{i}.bin").write_bytes(payload)
+
+        name = "s3_operations.upload_simulation"
+        _, result = benchmark_recorder.measure(
+            name,
+            lambda: downloader._upload_directory_to_s3(source, "assets/default/static/"),
+            items=spec["files"],
+            nbytes=spec["files"] * len(payload),
+        )
+
+        assert len(fake_s3._keys(BUCKET, "assets/default/static/")) == spec["files"]
+        assert_within_target(benchmark_recorder, name, result, spec["target"])
+
+
+class TestMemoryBenchmarks:
+    """Peak RSS growth targets"""
+
+    def test_hash_large_files(self, benchmark_recorder, tmp_path):
+        spec = TARGETS["memory_usage"]["hash_large_files"]
+        limit = PerformanceData.parse_target(spec["target"])
+        block = os.urandom(1024 * 1024)
+        with open(tmp_path / "large.db", "wb") as f:
+            for _ in range(spec["file_size_mb"]):
+                f.write(block)
+
+        _, result = benchmark_recorder.measure(
+            "memory_usage.hash_large_files",
+            lambda: manage.calculate_directory_hash(tmp_path),
+            repeat=1,
+            nbytes=spec["file_size_mb"] * len(block),
+        )
+
+        assert result["peak_rss_growth_bytes"] < limit, (
+            f"hashing grew RSS by {result['peak_rss_growth_bytes'] / 1024 ** 2:.1f}MB "
+            f"(target {spec['target']})"
+        )
+
+    def test_metadata_large(self, benchmark_recorder, downloader):
+        spec = TARGETS["memory_usage"]["metadata_large"]
+        limit = PerformanceData.parse_target(spec["target"])
+        items = spec["metadata_items"]
+        base = {
+            "databases": {"*": {"allow_sql": True}},
+            "plugins": {f"plugin_{i}": {"enabled": True, "config": {"value": i}} for i in range(items)},
+        }
+        overlays = [
+            {"databases": {f"overlay_{i}": {"title": f"Overlay {i}"}}} for i in range(100)
+        ]
+
+        def merge_all():
+            merged = base
+            for overlay in overlays:
+                merged = downloader._deep_merge_metadata(merged, overlay)
+            return merged
+
+        _, result = benchmark_recorder.measure("memory_usage.metadata_large", merge_all, repeat=1)
+
+        assert result["peak_rss_growth_bytes"] < limit, (
+            f"merging grew RSS by {result['peak_rss_growth_bytes'] / 1024 ** 2:.1f}MB "
+            f"(target {spec['target']})"
+        )
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/cross_search.py
+
+The benchmarks compare querying every searchable table one after another
+(as datasette-search-all's page does) with the plugin's concurrent fan-out,
+and an uncached /-/search.json request with a cached one:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_cross_search.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.cross_search import LRUCache, get_index, search_table, snippet_html
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+BENCH_DATABASES = 4
+
+
+@pytest.fixture(scope="module")
+def source_databases(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("search")
+    return [
+        create_database(directory / "courts.db", size_mb=0.2, seed=1),
+        create_database(directory / "news.db", size_mb=0.2, seed=2),
+    ]
+
+
+@pytest.fixture
+def databases(source_databases, tmp_path):
+    return [shutil.copy(path, tmp_path / path.name) for path in source_databases]
+
+
+@pytest.fixture(scope="module")
+def bench_databases(tmp_path_factory):
+    """BENCH_DATABASES databases of ZEEKER_BENCH_DB_SIZE_MB each, generated once"""
+    directory = tmp_path_factory.mktemp("search-bench")
+    return [
+        create_database(directory / f"db{i}.db", size_mb=BENCH_DB_SIZE_MB / BENCH_DATABASES, seed=i)
+        for i in range(BENCH_DATABASES)
+    ]
+
+
+def make_datasette(paths, metadata=None):
+    return Datasette(
+        [str(path) for path in paths],
+        metadata=metadata or {},
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+        template_dir=str(PROJECT_DIR / "templates"),
+    )
+
+
+def common_term(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT title FROM documents ORDER BY id LIMIT 1").fetchone()[0].split()[0].lower()
+    finally:
+        conn.close()
+
+
+def get(datasette, *paths, actor=None):
+    cookies = {"ds_actor": datasette.sign({"a": actor}, "actor")} if actor else None
+
+    async def fetch():
+        return [await datasette.client.get(path, cookies=cookies) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+class TestLRUCache:
+    """Bounded, least recently used eviction"""
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert list(cache.entries) == ["a", "c"]
+        assert cache.get("b") is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+class TestSearchJson:
+    """/-/search.json across databases"""
+
+    def test_merged_by_rank(self, databases):
+        datasette = make_datasette(databases)
+        term = common_term(databases[0])
+
+        (response,) = get(datasette, f"/-/search.json?q={term.upper()}&limit=10")
+
+        data = response.json()
+        assert response.status_code == 200
+        assert data["q"] == term
+        assert data["tables_searched"] == 2
+        assert data["errors"] == []
+        assert data["source"] == "tables"
+        assert len(data["results"]) == 10
+        assert {hit["database"] for hit in data["results"]} == {"courts", "news"}
+        ranks = [hit["rank"] for hit in data["results"]]
+        assert ranks == sorted(ranks)
+        hit = data["results"][0]
+        assert hit["url"] == f"/{hit['database']}/documents/{hit['key'][0]}"
+        assert "<mark>" in hit["snippet"]
+
+    def test_cached_until_data_changes(self, databases):
+        datasette = make_datasette(databases)
+        term = common_term(databases[0])
+
+        first, second, spaced = get(
+            datasette, f"/-/search.json?q={term}", f"/-/search.json?q={term}", f"/-/search.json?q=+{term}++",
+        )
+        assert (first.json()["cached"], second.json()["cached"], spaced.json()["cached"]) == (False, True, True)
+
+        conn = sqlite3.connect(databases[1])
+        conn.execute("DELETE FROM documents WHERE id IN (SELECT rowid FROM documents_fts WHERE documents_fts MATCH ?)",
+                     [term])
+        conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+        conn.commit()
+        conn.close()
+        os.utime(databases[1], ns=(0, 0))
+
+        (after,) = get(datasette, f"/-/search.json?q={term}")
+        assert after.json()["cached"] is False
+        assert {hit["database"] for hit in after.json()["results"]} == {"courts"}
+
+    def test_private_tables_excluded(self, databases):
+        datasette = make_datasette(databases, {"databases": {"news": {"allow": {"id": "root"}}}})
+        term = common_term(databases[1])
+
+        (private,) = get(datasette, "/news/documents.json")
+        anonymous, repeated = get(datasette, f"/-/search.json?q={term}", f"/-/search.json?q={term}")
+        (root,) = get(datasette, f"/-/search.json?q={term}", actor={"id": "root"})
+
+        assert private.status_code == 403
+        assert anonymous.json()["tables_searched"] == 1
+        assert {hit["database"] for hit in anonymous.json()["results"]} == {"courts"}
+        assert repeated.json()["cached"] is True
+        assert root.json()["cached"] is False
+        assert root.json()["tables_searched"] == 2
+        assert "news" in {hit["database"] for hit in root.json()["results"]}
+
+    def test_limits_and_empty_query(self, databases):
+        datasette = make_datasette(databases, {"plugins": {"zeeker-search": {"max_limit": 5}}})
+        term = common_term(databases[0])
+
+        big, bad, empty = get(
+            datasette, f"/-/search.json?q={term}&limit=500", f"/-/search.json?q={term}&limit=x", "/-/search.json",
+        )
+
+        assert len(big.json()["results"]) == 5
+        assert bad.status_code == 400
+        assert empty.json()["results"] == []
+
+    def test_fts_syntax_is_escaped(self, databases):
+        datasette = make_datasette(databases)
+
+        (response,) = get(datasette, '/-/search.json?q=contract" OR (')
+
+        assert response.status_code == 200
+        assert response.json()["errors"] == []
+
+    def test_awkward_identifiers(self, tmp_path):
+        conn = sqlite3.connect(tmp_path / "notes.db")
+        conn.executescript("""
+            CREATE TABLE "case notes" ("order" INTEGER PRIMARY KEY, "note text" TEXT);
+            INSERT INTO "case notes" VALUES (1, 'contract breach'), (2, 'tort');
+            CREATE VIRTUAL TABLE "case notes_fts" USING fts5("note text", content="case notes", content_rowid="order");
+            INSERT INTO "case notes_fts" ("case notes_fts") VALUES ('rebuild');
+        """)
+        conn.close()
+
+        (response,) = get(make_datasette([tmp_path / "notes.db"]), "/-/search.json?q=contract")
+
+        assert response.json()["errors"] == []
+        assert [hit["key"] for hit in response.json()["results"]] == [[1]]
+
+    def test_snippet_html_escaped(self):
+        assert snippet_html("<b>\x02court\x03</b>") == "&lt;b&gt;<mark>court</mark>&lt;/b&gt;"
+
+    def test_search_page_uses_endpoint(self, databases):
+        datasette = make_datasette(databases)
+
+        (response,) = get(datasette, "/-/search?q=court")
+
+        assert response.status_code == 200
+        assert "/-/search.json" in response.text
+        assert "Searching 2 tables" in response.text
+
+
+@pytest.mark.benchmark
+class TestCrossSearchBenchmarks:
+    """Fan-out and result cache"""
+
+    def test_fan_out(self, benchmark_recorder, bench_databases):
+        datasette = make_datasette(bench_databases)
+        terms = [common_term(path) for path in bench_databases]
+
+        async def tables():
+            await datasette.invoke_startup()
+            return await get_index(datasette).searchable_tables(datasette)
+
+        searchable = asyncio.run(tables())
+        assert len(searchable) == BENCH_DATABASES
+
+        async def sequential():
+            for term in terms:
+                for info in searchable:
+                    await search_table(datasette, info, term, 20)
+
+        async def concurrent():
+            for term in terms:
+                await asyncio.gather(*(search_table(datasette, info, term, 20) for info in searchable))
+
+        best = {}
+        for name, workload in (("sequential", sequential), ("concurrent", concurrent)):
+            asyncio.run(workload())  # Warm connections and page cache
+            _, result = benchmark_recorder.measure(f"cross_search.{name}", lambda: asyncio.run(workload()))
+            best[name] = result["best_s"]
+
+        print(f"\nfan-out: sequential {best['sequential'] * 1000:.1f}ms, "
+              f"concurrent {best['concurrent'] * 1000:.1f}ms ({best['sequential'] / best['concurrent']:.2f}x)")
+        assert best["concurrent"] <= best["sequential"] * benchmark_recorder.threshold + benchmark_recorder.min_delta
+        for name in best:
+            regression = benchmark_recorder.regression(f"cross_search.{name}")
+            assert regression is None, regression
+
+    def test_cached_endpoint(self, benchmark_recorder, bench_databases):
+        datasette = make_datasette(bench_databases)
+        term = common_term(bench_databases[0])
+        index = get_index(datasette)
+
+        async def request():
+            response = await datasette.client.get(f"/-/search.json?q={term}")
+            assert response.status_code == 200
+
+        def uncached():
+            index.cache.entries.clear()
+            asyncio.run(request())
+
+        best = {}
+        for name, workload in (("uncached", uncached), ("cached", lambda: asyncio.run(request()))):
+            workload()
+            _, result = benchmark_recorder.measure(f"cross_search.endpoint.{name}", workload)
+            best[name] = result["best_s"]
+
+        print(f"\nendpoint: uncached {best['uncached'] * 1000:.1f}ms, cached {best['cached'] * 1000:.1f}ms "
+              f"({best['uncached'] / best['cached']:.2f}x)")
+        assert best["cached"] < best["uncached"]
+        for name in best:
+            regression = benchmark_recorder.regression(f"cross_search.endpoint.{name}")
+            assert regression is None, regression
@@ -12,7 +12,12 @@ from unittest.mock import Mock, patch, ANY
 import pytest
 from botocore.exceptions import ClientError
 
-from scripts.download_from_s3 import ZeekerS3Downloader, download_from_s3
+from scripts.download_from_s3 import (
+    AssetManifest,
+    S3TransferQueue,
+    ZeekerS3Downloader,
+    download_from_s3,
+)
 
 
 class TestZeekerS3Downloader:
@@ -161,6 +166,56 @@ class TestZeekerS3Downloader:
 
         assert result is False
 
+    def test_check_base_assets_exist_uses_asset_index(self, downloader):
+        """Test base asset checks are answered from one listing of assets/"""
+        mock_s3_client = Mock()
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {
+                "Contents": [
+                    {"Key": "assets/default/metadata.json"},
+                    {"Key": "assets/default/templates/index.html"},
+                    {"Key": "assets/default/static/css/zeeker-theme.css"},
+                ]
+            }
+        ]
+        downloader.s3_client = mock_s3_client
+
+        assert downloader._check_base_assets_exist() is True
+        mock_s3_client.head_object.assert_not_called()
+        mock_s3_client.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="test-bucket", Prefix="assets/"
+        )
+
+    def test_asset_index_answers_prefix_checks(self, downloader):
+        """Test per-database path checks and metadata lookups need no extra S3 calls"""
+        mock_s3_client = Mock()
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "assets/databases/courts/templates/table.html"}]},
+            {"Contents": [{"Key": "assets/databases/courts/static/courts.css"}]},
+        ]
+        downloader.s3_client = mock_s3_client
+        downloader._get_asset_index()
+
+        assert downloader._check_s3_path_exists("assets/databases/courts") is True
+        assert downloader._check_s3_path_exists("assets/databases/courts/templates/") is True
+        assert downloader._check_s3_path_exists("assets/databases/news") is False
+        assert downloader._merge_all_metadata({"courts", "news"}) is True
+
+        mock_s3_client.list_objects_v2.assert_not_called()
+        mock_s3_client.download_file.assert_not_called()
+        assert mock_s3_client.get_paginator.return_value.paginate.call_count == 1
+
+    def test_asset_index_failure_falls_back(self, downloader):
+        """Test an unusable listing falls back to per-object checks"""
+        mock_s3_client = Mock()
+        mock_s3_client.get_paginator.return_value.paginate.side_effect = ClientError(
+            {"Error": {"Code": "AccessDenied"}}, "ListObjectsV2"
+        )
+        downloader.s3_client = mock_s3_client
+
+        assert downloader._check_base_assets_exist() is True
+        assert mock_s3_client.head_object.call_count == 3
+
     def test_deep_merge_metadata(self, downloader):
         """Test metadata merging functionality"""
         base = {
@@ -334,7 +389,7 @@ class TestZeekerS3Downloader:
     def test_merge_all_metadata_no_db_metadata(self, mock_boto3, downloader, temp_directories):
         """Test metadata merging when no database-specific metadata exists"""
         mock_s3_client = Mock()
-        mock_s3_client.download_file.side_effect = ClientError(
+        mock_s3_client.get_object.side_effect = ClientError(
             {"Error": {"Code": "NoSuchKey"}}, "GetObject"
         )
         downloader.s3_client = mock_s3_client
@@ -349,6 +404,35 @@ class TestZeekerS3Downloader:
             metadata = json.load(f)
         assert metadata["title"] == "Test Zeeker"
 
+    def test_merge_all_metadata_in_memory(self, downloader, temp_directories):
+        """Test database metadata is read from get_object streams and written atomically"""
+        import io
+
+        overlays = {
+            "assets/databases/courts/metadata.json": {"databases": {"courts": {"title": "Courts"}}},
+        }
+
+        def get_object(Bucket, Key):
+            if Key not in overlays:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            return {"Body": io.BytesIO(json.dumps(overlays[Key]).encode())}
+
+        mock_s3_client = Mock()
+        mock_s3_client.get_object.side_effect = get_object
+        downloader.s3_client = mock_s3_client
+
+        result = downloader._merge_all_metadata({"courts", "news"})
+
+        assert result is True
+        mock_s3_client.download_file.assert_not_called()
+        with open(downloader.metadata_file) as f:
+            metadata = json.load(f)
+        assert metadata["databases"]["courts"] == {"title": "Courts"}
+        assert metadata["databases"]["*"] == {"allow_sql": True}
+
+        # Only metadata.json remains; no temp files are left behind
+        assert [p.name for p in temp_directories["temp_dir"].glob("*.json")] == ["metadata.json"]
+
     @patch("scripts.download_from_s3.boto3.client")
     def test_download_complete_setup_success(self, mock_boto3, downloader):
         """Test complete download setup process"""
@@ -386,6 +470,178 @@ class TestZeekerS3Downloader:
         assert result is False
 
 
+class TestS3TransferQueue:
+    """Test suite for the shared S3 transfer queue"""
+
+    def test_same_destination_runs_in_submission_order(self, tmp_path):
+        """Test an overlay transfer never finishes before the base transfer it replaces"""
+        import threading
+        import time
+
+        order = []
+        lock = threading.Lock()
+
+        def transfer(name, delay):
+            time.sleep(delay)
+            with lock:
+                order.append(name)
+
+        queue = S3TransferQueue(max_workers=4)
+        try:
+            target = tmp_path / "index.html"
+            queue.submit(target, transfer, "base", 0.05)
+            queue.submit(target, transfer, "overlay", 0)
+            assert queue.join() == 2
+        finally:
+            queue.shutdown()
+
+        assert order == ["base", "overlay"]
+
+    def test_join_raises_first_failure(self, tmp_path):
+        """Test join waits for every transfer and re-raises a failure"""
+        done = []
+
+        def fail():
+            raise ClientError({"Error": {"Code": "500"}}, "GetObject")
+
+        queue = S3TransferQueue(max_workers=2)
+        try:
+            queue.submit(tmp_path / "a", fail)
+            queue.submit(tmp_path / "b", done.append, "b")
+            with pytest.raises(ClientError):
+                queue.join()
+        finally:
+            queue.shutdown()
+
+        assert done == ["b"]
+
+    def test_optional_failures_are_logged_not_raised(self, tmp_path):
+        """Test a failed transfer that is not required is kept in failures"""
+        def fail():
+            raise ClientError({"Error": {"Code": "404"}}, "GetObject")
+
+        queue = S3TransferQueue(max_workers=2)
+        try:
+            queue.submit(tmp_path / "a", fail, required=False)
+            queue.submit(tmp_path / "b", lambda: None)
+            assert queue.join() == 2
+        finally:
+            queue.shutdown()
+
+        assert [destination for destination, _ in queue.failures] == [tmp_path / "a"]
+
+    def test_failed_asset_does_not_fail_setup(self, tmp_path):
+        """Test a failed overlay download is logged while the run still succeeds"""
+        with patch.dict(os.environ, {"S3_BUCKET": "test-bucket"}):
+            downloader = ZeekerS3Downloader()
+        downloader.data_dir = tmp_path
+        downloader.templates_dir = tmp_path / "templates"
+        downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+
+        def download_file(bucket, key, local_path):
+            if "overlay" in key:
+                raise ClientError({"Error": {"Code": "500"}}, "GetObject")
+            Path(local_path).write_text(key)
+
+        downloader.s3_client = Mock()
+        downloader.s3_client.download_file = Mock(side_effect=download_file)
+        downloader.s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "latest/courts.db"}]}
+        ]
+        downloader._setup_base_assets = Mock(return_value=True)
+        downloader._apply_database_customizations = Mock(
+            side_effect=lambda db_name: downloader._download_file("assets/overlay.html",
+                                                                  downloader.templates_dir / "overlay.html"))
+        downloader._merge_all_metadata = Mock(return_value=True)
+
+        assert downloader.download_complete_setup() is True
+        assert (tmp_path / "courts.db").read_text() == "latest/courts.db"
+        assert downloader.transfer_stats["files_failed"] == 1
+
+    def test_downloads_are_queued_inside_transfer_session(self, tmp_path):
+        """Test downloads run through the queue during a session and inline otherwise"""
+        with patch.dict(os.environ, {"S3_BUCKET": "test-bucket"}):
+            downloader = ZeekerS3Downloader()
+
+        mock_s3_client = Mock()
+        mock_s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": f"assets/default/static/file{i}.css"} for i in range(20)]}
+        ]
+        downloader.s3_client = mock_s3_client
+
+        with downloader._transfer_session() as transfers:
+            assert downloader._transfers is transfers
+            downloader._download_s3_directory("assets/default/static/", tmp_path)
+
+        assert downloader._transfers is None
+        assert mock_s3_client.download_file.call_count == 20
+
+
+class TestAssetManifest:
+    """Test suite for skipping unchanged assets"""
+
+    @pytest.fixture
+    def downloader(self, tmp_path):
+        with patch.dict(os.environ, {"S3_BUCKET": "test-bucket"}):
+            downloader = ZeekerS3Downloader()
+
+        contents = {"assets/default/static/app.css": b"body {}"}
+
+        def fake_download(bucket, key, local_path):
+            Path(local_path).write_bytes(contents[key])
+
+        downloader.s3_client = Mock()
+        downloader.s3_client.download_file = Mock(side_effect=fake_download)
+        downloader.s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "assets/default/static/app.css", "ETag": '"v1"', "Size": 7}]}
+        ]
+        downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+        downloader.static_dir = tmp_path / "static"
+        return downloader
+
+    def _sync(self, downloader, force=False):
+        downloader._asset_manifest = AssetManifest(downloader.asset_manifest_file, load=not force)
+        downloader._download_s3_directory("assets/default/static/", downloader.static_dir)
+        downloader._asset_manifest.save()
+
+    def test_unchanged_asset_is_skipped(self, downloader):
+        """Test a warm run does not download an asset with the same ETag, size and hash"""
+        self._sync(downloader)
+        self._sync(downloader)
+
+        assert downloader.s3_client.download_file.call_count == 1
+        manifest = json.loads(downloader.asset_manifest_file.read_text())
+        entry = manifest["objects"]["assets/default/static/app.css"]
+        assert entry["etag"] == '"v1"'
+        assert entry["size"] == 7
+
+    def test_changed_etag_is_downloaded(self, downloader):
+        """Test an object whose ETag changed in S3 is fetched again"""
+        self._sync(downloader)
+        downloader.s3_client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "assets/default/static/app.css", "ETag": '"v2"', "Size": 7}]}
+        ]
+        self._sync(downloader)
+
+        assert downloader.s3_client.download_file.call_count == 2
+
+    def test_locally_modified_asset_is_downloaded(self, downloader):
+        """Test a local file that no longer matches its recorded hash is restored"""
+        self._sync(downloader)
+        (downloader.static_dir / "app.css").write_bytes(b"edited!")
+        self._sync(downloader)
+
+        assert downloader.s3_client.download_file.call_count == 2
+        assert (downloader.static_dir / "app.css").read_bytes() == b"body {}"
+
+    def test_force_ignores_manifest(self, downloader):
+        """Test a forced sync downloads every asset"""
+        self._sync(downloader)
+        self._sync(downloader, force=True)
+
+        assert downloader.s3_client.download_file.call_count == 2
+
+
 class TestDownloadFromS3Function:
     """Test suite for the download_from_s3 function"""
 
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/export_artifacts.py and the /-/downloads route in
+plugins/sources_page.py
+
+The benchmark compares serving a pre-built NDJSON export from disk with
+streaming the same table through /-/export on demand:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_export_artifacts.py --benchmark
+"""
+
+import asyncio
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+from click.testing import CliRunner
+from datasette.app import Datasette
+
+from scripts import manage
+from scripts.bench import PROJECT_DIR
+from scripts.download_from_s3 import update_exports
+from scripts.export_artifacts import EXPORTS_DIRNAME, MANIFEST_FILENAME, build_exports, read_manifest
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    path = create_database(tmp_path_factory.mktemp("artifacts") / "courts.db", size_mb=0.2, fts=True)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE notes (note TEXT, data BLOB)")
+    conn.executemany("INSERT INTO notes VALUES (?, ?)", [(f"note {i}", bytes([i])) for i in range(20)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def data_dir(source_database, tmp_path):
+    shutil.copy(source_database, tmp_path / "courts.db")
+    return tmp_path
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("artifacts-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def build(data_dir, formats=("ndjson", "csv")):
+    databases = {path.stem: path for path in sorted(data_dir.glob("*.db"))}
+    return build_exports(data_dir / EXPORTS_DIRNAME, databases, formats)
+
+
+def make_datasette(database_file, metadata=None, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        metadata=dict(metadata or {}, plugins={"zeeker-downloads": config}),
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def get(datasette, *requests):
+    async def fetch():
+        return [await datasette.client.get(path, headers=headers) for path, headers in requests]
+
+    return asyncio.run(fetch())
+
+
+def rows(database_file, sql):
+    conn = sqlite3.connect(database_file)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class TestBuildExports:
+    """Files, manifest and incremental rebuilds"""
+
+    def test_builds_every_table(self, data_dir):
+        report = build(data_dir)
+        exports_dir = data_dir / EXPORTS_DIRNAME
+        manifest = read_manifest(exports_dir)
+        tables = manifest["databases"]["courts"]["tables"]
+
+        assert report["courts"]["action"] == "exported"
+        assert set(tables) == {"documents", "notes"}  # Not the FTS table or its shadow tables
+        documents = tables["documents"]
+        assert documents["rows"] == rows(data_dir / "courts.db", "SELECT count(*) FROM documents")[0][0]
+        for entry in documents["files"].values():
+            path = exports_dir / entry["path"]
+            assert entry["bytes"] == path.stat().st_size
+            assert entry["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+
+        with gzip.open(exports_dir / "courts/documents.csv.gz", "rt", newline="") as f:
+            header, *records = list(csv.reader(f))
+        assert header[:2] == ["id", "title"]
+        assert [int(record[0]) for record in records] == [row[0] for row in rows(
+            data_dir / "courts.db", "SELECT id FROM documents ORDER BY id")]
+        with gzip.open(exports_dir / "courts/notes.ndjson.gz", "rt") as f:
+            first = json.loads(f.readline())
+        assert first == {"note": "note 0", "data": {"$base64": True, "encoded": "AA=="}}
+
+    def test_incremental_and_deterministic(self, data_dir):
+        build(data_dir)
+        manifest = read_manifest(data_dir / EXPORTS_DIRNAME)
+
+        assert build(data_dir)["courts"] == {"action": "unchanged", "tables": 2}
+
+        conn = sqlite3.connect(data_dir / "courts.db")
+        conn.execute("DROP TABLE notes")
+        conn.commit()
+        conn.close()
+        report = build(data_dir)["courts"]
+        rebuilt = read_manifest(data_dir / EXPORTS_DIRNAME)["databases"]["courts"]["tables"]
+
+        assert report["action"] == "exported"
+        assert list(rebuilt) == ["documents"]
+        assert rebuilt["documents"] == manifest["databases"]["courts"]["tables"]["documents"]  # Same bytes
+        assert not (data_dir / EXPORTS_DIRNAME / "courts/notes.csv.gz").exists()
+
+    def test_awkward_table_names(self, data_dir):
+        conn = sqlite3.connect(data_dir / "courts.db")
+        for table in ("../escape", "a/b", "notes.csv"):
+            conn.execute(f'CREATE TABLE "{table}" (value TEXT)')
+            conn.execute(f'INSERT INTO "{table}" VALUES (?)', [table])
+        conn.commit()
+        conn.close()
+
+        build(data_dir)
+        exports_dir = data_dir / EXPORTS_DIRNAME
+        tables = read_manifest(exports_dir)["databases"]["courts"]["tables"]
+
+        assert {path.name for path in data_dir.iterdir()} == {"courts.db", EXPORTS_DIRNAME}
+        assert {path.parent for path in exports_dir.rglob("*.gz")} == {exports_dir / "courts"}
+        assert tables["../escape"]["files"]["csv"]["path"] == "courts/~2E~2E~2Fescape.csv.gz"
+        with gzip.open(exports_dir / tables["a/b"]["files"]["ndjson"]["path"], "rt") as f:
+            assert json.loads(f.readline()) == {"value": "a/b"}
+        assert [path.name for path in exports_dir.glob(".*")] == []  # No temporary files left
+
+    def test_removed_database(self, data_dir):
+        build(data_dir)
+        (data_dir / "courts.db").unlink()
+
+        report = build(data_dir)
+
+        assert report == {"courts": {"action": "removed"}}
+        assert read_manifest(data_dir / EXPORTS_DIRNAME)["databases"] == {}
+        assert not (data_dir / EXPORTS_DIRNAME / "courts").exists()
+
+    def test_parquet(self, data_dir):
+        pq = pytest.importorskip("pyarrow.parquet")
+
+        build(data_dir, ["parquet"])
+
+        table = pq.read_table(data_dir / EXPORTS_DIRNAME / "courts/notes.parquet")
+        assert [str(field.type) for field in table.schema] == ["string", "binary"]
+        assert table.num_rows == 20
+
+
+class TestDownloads:
+    """Range requests and links from /sources"""
+
+    def test_full_and_range(self, data_dir):
+        build(data_dir)
+        datasette = make_datasette(data_dir / "courts.db")
+        content = (data_dir / EXPORTS_DIRNAME / "courts/documents.csv.gz").read_bytes()
+        path = "/-/downloads/courts/documents.csv.gz"
+
+        full, head, tail, suffix, bad, stale = get(
+            datasette, (path, {}), (path, {"range": "bytes=0-99"}), (path, {"range": "bytes=100-"}),
+            (path, {"range": "bytes=-10"}), (path, {"range": f"bytes={len(content)}-"}),
+            (path, {"range": "bytes=0-99", "if-range": '"other"'}),
+        )
+
+        assert full.status_code == 200
+        assert full.content == content
+        assert full.headers["accept-ranges"] == "bytes"
+        assert full.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}"'
+        assert full.headers["content-type"] == "application/gzip"
+        assert (head.status_code, head.content) == (206, content[:100])
+        assert head.headers["content-range"] == f"bytes 0-99/{len(content)}"
+        assert tail.content == content[100:]
+        assert suffix.content == content[-10:]
+        assert bad.status_code == 416
+        assert bad.headers["content-range"] == f"bytes */{len(content)}"
+        assert stale.status_code == 200  # If-Range no longer matches: whole file
+
+    def test_only_manifest_files(self, data_dir):
+        build(data_dir)
+        datasette = make_datasette(data_dir / "courts.db")
+        (data_dir / EXPORTS_DIRNAME / "secret.txt").write_text("no")
+
+        missing, outside, manifest = get(datasette, ("/-/downloads/secret.txt", {}),
+                                         ("/-/downloads/../courts.db", {}), (f"/-/downloads/{MANIFEST_FILENAME}", {}))
+
+        assert missing.status_code == 404
+        assert outside.status_code == 404
+        assert manifest.json()["databases"]["courts"]["formats"] == ["ndjson", "csv"]
+
+    def test_private_tables(self, data_dir):
+        build(data_dir)
+        datasette = make_datasette(
+            data_dir / "courts.db", metadata={"databases": {"courts": {"tables": {"notes": {"allow": {"id": "root"}}}}}}
+        )
+        root = {"cookie": f"ds_actor={datasette.sign({'a': {'id': 'root'}}, 'actor')}"}
+        notes, manifest = "/-/downloads/courts/notes.csv.gz", f"/-/downloads/{MANIFEST_FILENAME}"
+
+        responses = get(datasette, ("/-/downloads/courts/documents.csv.gz", {}), (notes, {}), (manifest, {}),
+                        (notes, root), (manifest, root))
+        page, root_page = get(datasette, ("/sources", {}), ("/sources", root))
+
+        assert [response.status_code for response in responses] == [200, 403, 403, 200, 200]
+        assert "/-/downloads/courts/documents.csv.gz" in page.text
+        assert "/-/downloads/courts/notes.csv.gz" not in page.text
+        assert "/-/downloads/courts/notes.csv.gz" in root_page.text
+
+    def test_sources_links(self, data_dir):
+        build(data_dir)
+
+        (page,) = get(make_datasette(data_dir / "courts.db"), ("/sources", {}))
+        (remote,) = get(make_datasette(data_dir / "courts.db", base_url="https://downloads.example/exports/"),
+                        ("/sources", {}))
+
+        assert 'href="/-/downloads/courts/documents.ndjson.gz"' in page.text
+        assert "Bulk Downloads" in page.text
+        assert 'href="https://downloads.example/exports/courts/notes.csv.gz"' in remote.text
+
+
+class TestPipeline:
+    """Exports after downloads and refreshes"""
+
+    def test_update_exports_stats_and_upload(self, data_dir):
+        uploaded = []
+
+        stats = update_exports(data_dir, lambda path, key: uploaded.append((path.exists(), key)))
+
+        assert stats["exports_built"] == 1
+        assert stats["export_bytes"] == sum(
+            path.stat().st_size for path in (data_dir / EXPORTS_DIRNAME / "courts").iterdir())
+        assert stats["export_files_uploaded"] == len(uploaded) == stats["export_files"] + 1
+        assert uploaded[-1] == (True, MANIFEST_FILENAME)
+        assert all(exists for exists, _ in uploaded)
+
+        uploaded.clear()
+        assert update_exports(data_dir, lambda path, key: uploaded.append(key))["exports_built"] == 0
+        assert uploaded == []
+
+    def test_refresh_option(self):
+        option = next(param for param in manage.refresh.params if param.name == "exports")
+
+        assert option.envvar == "ZEEKER_EXPORTS"
+        result = CliRunner().invoke(manage.refresh, ["--help"])
+        assert "--exports" in result.output
+
+
+@pytest.mark.benchmark
+class TestExportArtifactBenchmarks:
+    """On-demand streaming versus a pre-built file"""
+
+    def test_prebuilt_download(self, benchmark_recorder, bench_database, tmp_path):
+        data_dir = tmp_path
+        shutil.copy(bench_database, data_dir / "courts.db")
+        build(data_dir, ["ndjson"])
+        datasette = make_datasette(data_dir / "courts.db")
+        total = rows(data_dir / "courts.db", "SELECT count(*) FROM documents")[0][0]
+
+        async def on_demand():
+            response = await datasette.client.get("/-/export/courts/documents.ndjson")
+            assert response.text.count("\n") == total
+
+        async def prebuilt():
+            response = await datasette.client.get("/-/downloads/courts/documents.ndjson.gz")
+            assert gzip.decompress(response.content).count(b"\n") == total
+
+        best = {}
+        for name, workload in (("on_demand", on_demand), ("prebuilt", prebuilt)):
+            asyncio.run(workload())  # Warm connections and page cache
+            _, result = benchmark_recorder.measure(f"export_artifacts.{name}", lambda: asyncio.run(workload()),
+                                                   repeat=3)
+            best[name] = result["best_s"]
+
+        print(f"\nfull table ({total:,} rows): on-demand export {best['on_demand'] * 1000:.0f}ms, "
+              f"pre-built {best['prebuilt'] * 1000:.0f}ms ({best['on_demand'] / best['prebuilt']:.2f}x)")
+        assert best["prebuilt"] < best["on_demand"]
+        for name in best:
+            regression = benchmark_recorder.regression(f"export_artifacts.{name}")
+            assert regression is None, regression
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/fts_builder.py and the FTS step of the optimization stage
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+from datasette.app import Datasette
+
+from scripts.download_from_s3 import OPTIMIZE_MANIFEST_FILENAME, DatabaseOptimizer, ZeekerS3Downloader
+from scripts.fts_builder import PLUGIN_NAME, ensure_fts, format_report, fts_config, fts_tables
+from scripts.synthetic_data import create_database
+from tests.fake_s3 import FilesystemS3Client
+
+
+def searchable(columns, **settings):
+    return {"databases": {"courts": {"tables": {"documents": dict(
+        settings, plugins={PLUGIN_NAME: {"columns": columns}},
+    )}}}}
+
+
+@pytest.fixture(scope="module")
+def plain_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("fts") / "courts.db", size_mb=0.2, fts=False)
+
+
+@pytest.fixture
+def database(plain_database, tmp_path):
+    return shutil.copy(plain_database, tmp_path / "courts.db")
+
+
+def search(path, fts_table, term):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT count(*) FROM {fts_table} WHERE {fts_table} MATCH ?", [term]).fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestFtsConfig:
+    """Searchable columns from metadata"""
+
+    def test_config(self):
+        config = fts_config(searchable(["title", "summary"], fts_table="docs_search"), "courts")
+
+        assert config == {"documents": {
+            "columns": ["title", "summary"],
+            "tokenize": "porter unicode61 remove_diacritics 2",
+            "fts_table": "docs_search",
+        }}
+        assert fts_config(searchable(["title"]), "other") == {}
+
+
+class TestEnsureFts:
+    """Build, verify and optimize"""
+
+    def test_builds_missing_index(self, database):
+        (report,) = ensure_fts(database, fts_config(searchable(["title", "summary"]), "courts"))
+
+        assert report["action"] == "built"
+        assert report["fts_table"] == "documents_fts"
+        assert report["bytes"] > 0
+        conn = sqlite3.connect(database)
+        term = conn.execute("SELECT title FROM documents LIMIT 1").fetchone()[0].split()[0]
+        conn.close()
+        assert search(database, "documents_fts", term) > 0
+        assert fts_tables(sqlite3.connect(database))["documents_fts"] == {"module": "fts5", "content": "documents"}
+        assert "built in" in format_report(report)
+
+    def test_datasette_detects_built_index(self, database):
+        ensure_fts(database, fts_config(searchable(["title"]), "courts"))
+
+        datasette = Datasette(immutables=[str(database)])
+        assert asyncio.run(datasette.get_database("courts").fts_table("documents")) == "documents_fts"
+
+    def test_existing_index_optimized_and_missing_columns_rebuilt(self, database):
+        ensure_fts(database, fts_config(searchable(["title"]), "courts"))
+
+        (report,) = ensure_fts(database, fts_config(searchable(["title"]), "courts"))
+        assert report["action"] == "optimized"
+
+        (report,) = ensure_fts(database, fts_config(searchable(["title", "parties"]), "courts"))
+        assert report["action"] == "rebuilt"
+        conn = sqlite3.connect(database)
+        assert "parties" in {row[1] for row in conn.execute("PRAGMA table_info(documents_fts)")}
+        conn.close()
+
+    def test_out_of_sync_index_rebuilt(self, database):
+        ensure_fts(database, fts_config(searchable(["title"]), "courts"))
+        conn = sqlite3.connect(database)
+        conn.execute("DELETE FROM documents WHERE id <= 10")  # Content changed behind the index
+        conn.commit()
+        conn.close()
+
+        (report,) = ensure_fts(database, {})
+
+        assert report["action"] == "rebuilt"
+        assert "integrity check failed" in report["reason"]
+
+    def test_unknown_columns_skipped(self, database):
+        (report,) = ensure_fts(database, fts_config(searchable(["title", "nope"]), "courts"))
+
+        assert report["action"] == "skipped"
+        assert fts_tables(sqlite3.connect(database)) == {}
+
+
+class TestOptimizationStage:
+    """FTS built during the download optimization stage from merged metadata"""
+
+    def test_download_builds_fts_from_database_metadata(self, plain_database, tmp_path, isolated_metrics_snapshot):
+        fake_s3 = FilesystemS3Client(tmp_path / "s3")
+        fake_s3.seed("bucket", {
+            "latest/courts.db": plain_database.read_bytes(),
+            "assets/default/metadata.json": b"{}",
+            "assets/default/templates/index.html": b"<html></html>",
+            "assets/default/static/css/zeeker-theme.css": b"body{}",
+            # Arrives with this run, so the stage must read the merged metadata
+            "assets/databases/courts/metadata.json": json.dumps(searchable(["title", "summary"])).encode(),
+        })
+        with patch.dict(os.environ, {"S3_BUCKET": "bucket", "ZEEKER_OPTIMIZE_DATABASES": "1"}):
+            downloader = ZeekerS3Downloader()
+            downloader.s3_client = fake_s3
+            for name in ("data", "templates", "static", "plugins"):
+                setattr(downloader, f"{name}_dir", tmp_path / name)
+            downloader.data_dir.mkdir()
+            downloader.metadata_file = tmp_path / "metadata.json"
+            downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+
+            assert downloader.download_complete_setup()
+
+        live = downloader.data_dir / "courts.db"
+        assert "documents_fts" in fts_tables(sqlite3.connect(live))
+        entry = json.loads((downloader.data_dir / OPTIMIZE_MANIFEST_FILENAME).read_text())["databases"]["courts.db"]
+        assert "fts" in entry["steps"]
+        last = json.loads(isolated_metrics_snapshot.read_text())["jobs"]["download"]["last"]
+        assert last["fts_built"] == 1
+
+    def test_searchable_columns_change_reoptimizes(self, plain_database, tmp_path):
+        live = tmp_path / "courts.db"
+        manifest = tmp_path / OPTIMIZE_MANIFEST_FILENAME
+        optimizer = DatabaseOptimizer(manifest, metadata={})
+        optimizer.install(shutil.copy(plain_database, tmp_path / "a.download"), live)
+        optimizer.save({"courts.db"})
+
+        optimizer = DatabaseOptimizer(manifest, metadata=searchable(["title"]))
+        assert optimizer.install(shutil.copy(plain_database, tmp_path / "b.download"), live) == "optimized"
+        assert optimizer.stats["fts_built"] == 1
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/index_advisor.py
+"""
+
+import json
+import shutil
+import sqlite3
+
+import pytest
+from click.testing import CliRunner
+
+from scripts import manage
+from scripts.download_from_s3 import OPTIMIZE_MANIFEST_FILENAME, DatabaseOptimizer
+from scripts.index_advisor import (
+    IndexAdvisor, candidates_from_metadata, candidates_from_sql, format_report, load_query_log,
+)
+from scripts.synthetic_data import create_database
+
+# Datasette's facet query for ?category=...&_facet=court
+FACET_SQL = """
+    select court as value, count(*) as count from (
+        select * from [documents] where "category" = :p0
+    )
+    where court is not null
+    group by court order by count desc, value limit 31
+"""
+
+METADATA = {
+    "databases": {
+        "courts": {
+            "tables": {
+                "documents": {"facets": ["court", {"date": "date"}, "missing"], "sort_desc": "date"},
+            },
+        },
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("advisor") / "courts.db", size_mb=2, fts=False)
+
+
+@pytest.fixture
+def database(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+def index_names(path, table="documents"):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+    finally:
+        conn.close()
+
+
+class TestCandidates:
+    """Candidates from metadata and logged SQL"""
+
+    def test_metadata(self):
+        candidates = candidates_from_metadata(METADATA, "courts")
+
+        assert [(c.columns, c.kind) for c in candidates] == [
+            (("court",), "facet"), (("date",), "facet"), (("missing",), "facet"), (("date",), "sort"),
+        ]
+        assert candidates_from_metadata(METADATA, "other") == []
+
+    def test_facet_query_with_filter(self):
+        (candidate,) = candidates_from_sql(FACET_SQL, count=4)
+
+        assert candidate.table == "documents"
+        assert candidate.columns == ("category", "court")
+        assert candidate.kind == "facet"
+        assert candidate.hits == 4
+        assert candidate.index_name == "idx_zeeker_documents_category_court"
+
+    def test_table_query(self):
+        candidates = candidates_from_sql(
+            'select id, title from documents where "court" = :p0 order by date desc limit 101'
+        )
+
+        assert [(c.columns, c.kind) for c in candidates] == [(("court",), "filter"), (("date",), "sort")]
+
+    def test_query_log_hits_are_merged(self, tmp_path):
+        snapshot = {"sql": {
+            "top": [{"database": "courts", "sql": FACET_SQL, "count": 10}],
+            "slow": [{"database": "courts", "sql": FACET_SQL}],
+        }}
+        (tmp_path / "perf.json").write_text(json.dumps(snapshot))
+
+        advisor = IndexAdvisor(METADATA, load_query_log([tmp_path / "perf.json"]))
+        top = advisor.candidates("courts")[0]
+
+        assert top.columns == ("category", "court")
+        assert top.hits == 11
+
+
+class TestAdvise:
+    """Measured proposals and builds"""
+
+    def test_propose_leaves_file_unchanged(self, database):
+        advisor = IndexAdvisor(METADATA, min_speedup=1.0)
+
+        reports = {(tuple(r["columns"]), r["kind"]): r for r in advisor.advise(database)}
+
+        court = reports[(("court",), "facet")]
+        assert court["status"] == "proposed"
+        assert "SCAN documents" in court["plan_before"]
+        assert "COVERING INDEX idx_zeeker_documents_court" in court["plan_after"]
+        assert court["estimated_speedup"] > 1
+        assert court["measured_speedup"] > 1
+        assert reports[(("missing",), "facet")]["status"] == "skipped"
+        assert index_names(database) == set()
+
+    def test_build_and_existing(self, database):
+        advisor = IndexAdvisor(METADATA, min_speedup=1.0)
+
+        advisor.advise(database, build=True)
+        reports = advisor.advise(database, build=True)
+
+        assert "idx_zeeker_documents_court" in index_names(database)
+        assert {r["status"] for r in reports} == {"exists", "skipped"}
+        assert "exists" in format_report(reports)
+
+    def test_threshold_rejects(self, database):
+        advisor = IndexAdvisor(METADATA, min_speedup=1e9)
+
+        assert {r["status"] for r in advisor.advise(database, build=True)} == {"rejected", "skipped"}
+        assert index_names(database) == set()
+
+    def test_name_collisions_and_failures(self, tmp_path):
+        conn = sqlite3.connect(tmp_path / "notes.db")
+        conn.executescript("""
+            CREATE TABLE notes ("case no" TEXT, case_no TEXT);
+            CREATE VIEW recent AS SELECT * FROM notes;
+        """)
+        conn.executemany("INSERT INTO notes VALUES (?, ?)", [(f"a{i % 50}", f"b{i % 40}") for i in range(5000)])
+        conn.commit()
+        conn.close()
+        metadata = {"databases": {"notes": {"tables": {
+            "recent": {"facets": ["case_no"]},
+            "notes": {"facets": ["case no", "case_no"]},
+        }}}}
+
+        reports = {(r["table"], r["columns"][0]): r for r in IndexAdvisor(metadata, min_speedup=0).advise(
+            tmp_path / "notes.db", build=True)}
+
+        # Views cannot be indexed; the other candidates are still evaluated
+        assert reports[("recent", "case_no")]["status"] == "failed"
+        assert "views may not be indexed" in reports[("recent", "case_no")]["reason"]
+        first, second = reports[("notes", "case no")], reports[("notes", "case_no")]
+        assert first["status"] == second["status"] == "built"
+        assert first["index"] == "idx_zeeker_notes_case_no"
+        assert second["index"].startswith("idx_zeeker_notes_case_no_")
+        assert {first["index"], second["index"]} <= index_names(tmp_path / "notes.db", "notes")
+
+    def test_optimizer_builds_indexes(self, database, tmp_path):
+        live = tmp_path / "live" / "courts.db"
+        live.parent.mkdir()
+        optimizer = DatabaseOptimizer(tmp_path / OPTIMIZE_MANIFEST_FILENAME,
+                                      index_advisor=IndexAdvisor(METADATA, min_speedup=1.0))
+
+        assert optimizer.install(database, live) == "optimized"
+
+        assert "idx_zeeker_documents_court" in index_names(live)
+        assert optimizer.stats["indexes_built"] >= 1
+        assert "idx_zeeker_documents_court" in optimizer.entries["courts.db"]["indexes"]
+        assert optimizer.entries["courts.db"]["settings"]["indexes"]
+
+
+class TestAdviseIndexesCommand:
+    """manage.py advise-indexes works on copies"""
+
+    def test_report(self, database, tmp_path):
+        (tmp_path / "metadata.json").write_text(json.dumps(METADATA))
+
+        result = CliRunner().invoke(manage.advise_indexes, [
+            "--data-dir", str(tmp_path), "--metadata", str(tmp_path / "metadata.json"), "--min-speedup", "1",
+        ])
+
+        assert result.exit_code == 0, result.output
+        assert "documents" in result.output and "proposed" in result.output
+        assert index_names(database) == set()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/metadata_merge.py
+"""
+
+import copy
+import time
+import tracemalloc
+
+import pytest
+
+from scripts.metadata_merge import MetadataMerger, merge_metadata, merge_overlays
+from tests.fixtures import PerformanceData, SampleData
+
+
+class TestMergeMetadata:
+    """Test suite for single-overlay merges"""
+
+    def test_matches_expected_merge_rules(self, sample_metadata):
+        """Test scalars override, lists append, databases replace and '*' is kept"""
+        result = merge_metadata(sample_metadata["base"], sample_metadata["overlay"])
+
+        assert result["title"] == "Custom Zeeker"
+        assert result["description"] == "Base instance"
+        assert result["extra_css_urls"] == ["/static/base.css", "/static/custom.css"]
+        assert result["databases"]["*"] == {"allow_sql": True, "allow_facet": True}
+        assert result["databases"]["base_db"] == {"override_setting": "overridden"}
+        assert result["databases"]["custom_db"] == {"new_setting": True}
+        assert result["new_field"] == "new_value"
+
+    def test_global_database_defaults_are_never_overridden(self):
+        """Test an overlay cannot replace the '*' database defaults"""
+        base = {"databases": {"*": {"allow_sql": True}}}
+        overlay = {"databases": {"*": {"allow_sql": False}}}
+
+        assert merge_metadata(base, overlay)["databases"]["*"] == {"allow_sql": True}
+
+    def test_inputs_are_not_modified(self, sample_metadata):
+        """Test neither base nor overlay is mutated"""
+        base = sample_metadata["base"]
+        overlay = sample_metadata["overlay"]
+        base_before = copy.deepcopy(base)
+        overlay_before = copy.deepcopy(overlay)
+
+        merge_metadata(base, overlay)
+
+        assert base == base_before
+        assert overlay == overlay_before
+
+    def test_untouched_subtrees_are_shared(self, sample_metadata):
+        """Test subtrees the overlay does not touch are reused, not copied"""
+        base = sample_metadata["base"]
+        result = merge_metadata(base, sample_metadata["overlay"])
+
+        assert result is not base
+        assert result["plugins"] is base["plugins"]
+        assert result["databases"]["*"] is base["databases"]["*"]
+
+    def test_list_append_is_deduplicated(self):
+        """Test re-applying the same overlay does not grow extra_css_urls"""
+        base = {"extra_css_urls": ["/static/base.css"], "extra_js_urls": ["/static/app.js"]}
+        overlay = {"extra_css_urls": ["/static/base.css", "/static/courts.css"],
+                   "extra_js_urls": ["/static/app.js"]}
+
+        once = merge_metadata(base, overlay)
+        twice = merge_metadata(once, overlay)
+
+        assert twice["extra_css_urls"] == ["/static/base.css", "/static/courts.css"]
+        assert twice["extra_js_urls"] == ["/static/app.js"]
+
+    def test_nested_dictionaries_are_deep_merged(self):
+        """Test nested plugin configuration is merged key by key"""
+        base = {"plugins": {"search": {"template": "base", "limit": 10}}}
+        overlay = {"plugins": {"search": {"limit": 20}}}
+
+        result = merge_metadata(base, overlay)
+
+        assert result["plugins"]["search"] == {"template": "base", "limit": 20}
+        assert base["plugins"]["search"]["limit"] == 10
+
+
+class TestMergeOverlays:
+    """Test suite for merging many overlays"""
+
+    def test_result_is_independent_of_overlay_order(self):
+        """Test merging produces the same result whatever order overlays arrive in"""
+        base = {"title": "Base", "extra_css_urls": []}
+        overlays = {
+            name: {"title": name, "extra_css_urls": [f"/static/{name}.css"]}
+            for name in ["news", "courts", "parliament"]
+        }
+        reversed_overlays = dict(reversed(list(overlays.items())))
+
+        first = merge_overlays(base, overlays)
+        second = merge_overlays(base, reversed_overlays)
+
+        assert first == second
+        assert first["title"] == "parliament"
+        assert first["extra_css_urls"] == [
+            "/static/courts.css", "/static/news.css", "/static/parliament.css"
+        ]
+
+    def test_overlay_subtrees_are_not_mutated_by_later_overlays(self):
+        """Test a later overlay merging into an earlier overlay's subtree copies it first"""
+        first = {"plugins": {"search": {"limit": 10}}}
+        second = {"plugins": {"search": {"template": "courts"}}}
+
+        merger = MetadataMerger({})
+        merger.apply(first)
+        merger.apply(second)
+
+        assert merger.result["plugins"]["search"] == {"limit": 10, "template": "courts"}
+        assert first == {"plugins": {"search": {"limit": 10}}}
+
+
+@pytest.mark.benchmark
+class TestMergePerformance:
+    """Benchmarks for the metadata_merge targets in tests/fixtures.py"""
+
+    @staticmethod
+    def _overlays(databases, settings):
+        return {
+            f"overlay_{i:04d}": {
+                "databases": {
+                    f"overlay_{i:04d}": {f"setting_{k}": k for k in range(settings // databases or 1)}
+                },
+                "extra_css_urls": ["/static/css/zeeker-theme.css", f"/static/databases/overlay_{i:04d}.css"],
+            }
+            for i in range(databases)
+        }
+
+    @pytest.mark.parametrize("size", ["small", "medium", "large"])
+    def test_merge_time_targets(self, size):
+        """Test merging N database overlays stays within the PerformanceData target"""
+        spec = PerformanceData.get_benchmark_targets()["metadata_merge"][size]
+        limit = PerformanceData.parse_target(spec["target"])
+        base = SampleData.sample_metadata()["large_metadata"]
+        overlays = self._overlays(spec["databases"], spec["settings"] * spec["databases"])
+
+        start = time.perf_counter()
+        result = merge_overlays(base, overlays)
+        elapsed = time.perf_counter() - start
+
+        assert len(result["databases"]) == len(base["databases"]) + spec["databases"]
+        assert len(result["extra_css_urls"]) == spec["databases"] + 1
+        assert elapsed < limit, f"{size} merge took {elapsed * 1000:.1f}ms (target {spec['target']})"
+
+    def test_merge_memory_target(self):
+        """Test merging 1,000 overlays onto 10,000-item metadata stays within the memory target"""
+        spec = PerformanceData.get_benchmark_targets()["memory_usage"]["metadata_large"]
+        limit = PerformanceData.parse_target(spec["target"])
+        items = spec["metadata_items"]
+        base = {
+            "databases": {"*": {"allow_sql": True}},
+            "plugins": {f"plugin_{i}": {"enabled": True, "config": {"value": i}} for i in range(items)},
+            "extra_css_urls": [f"/static/css/{i}.css" for i in range(items)],
+        }
+        overlays = self._overlays(1000, 10 * 1000)
+
+        tracemalloc.start()
+        try:
+            result = merge_overlays(base, overlays)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # The 10,000 untouched plugin entries are shared, not copied
+        assert result["plugins"] is base["plugins"]
+        assert peak < limit, f"merge peaked at {peak / 1024 ** 2:.1f}MB (target {spec['target']})"
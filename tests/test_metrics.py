@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/metrics.py and the run metrics snapshot
+"""
+
+import asyncio
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+from datasette.app import Datasette
+
+from plugins.metrics import CONTENT_TYPE, MetricsWriter
+from scripts import manage
+from scripts.bench import PROJECT_DIR
+from scripts.download_from_s3 import ZeekerS3Downloader, record_metrics_run
+from scripts.synthetic_data import create_database
+from tests.fake_s3 import FilesystemS3Client
+
+
+@pytest.fixture(scope="module")
+def database_file(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("metrics") / "courts.db", size_mb=0.1)
+
+
+class TestMetricsSnapshot:
+    """record_metrics_run accumulates counters and last-run gauges"""
+
+    def test_record_runs(self, isolated_metrics_snapshot):
+        record_metrics_run(isolated_metrics_snapshot, "refresh", True, 2.5, bytes_downloaded=100, changed=1)
+        record_metrics_run(isolated_metrics_snapshot, "refresh", False, 1.0, bytes_downloaded=50)
+
+        entry = json.loads(isolated_metrics_snapshot.read_text())["jobs"]["refresh"]
+        assert entry["runs_total"] == {"success": 1, "failure": 1}
+        assert entry["bytes_downloaded_total"] == 150
+        assert entry["last_status"] == "failure"
+        assert entry["last_success_duration_seconds"] == 2.5
+        assert entry["last"] == {"duration_seconds": 1.0, "bytes_downloaded": 50}
+
+    def test_unreadable_snapshot_is_replaced(self, isolated_metrics_snapshot):
+        isolated_metrics_snapshot.write_text("not json")
+
+        record_metrics_run(isolated_metrics_snapshot, "download", True, 1.0)
+
+        assert json.loads(isolated_metrics_snapshot.read_text())["jobs"]["download"]["runs_total"] == {"success": 1}
+
+    def test_downloader_records_bytes(self, tmp_path, isolated_metrics_snapshot):
+        fake_s3 = FilesystemS3Client(tmp_path / "s3")
+        fake_s3.seed("bucket", {
+            "latest/courts.db": b"x" * 1000,
+            "assets/default/metadata.json": b"{}",
+            "assets/default/templates/index.html": b"<html></html>",
+            "assets/default/static/css/zeeker-theme.css": b"body{}",
+            "assets/default/plugins/__init__.py": b"",
+        })
+        with patch.dict(os.environ, {"S3_BUCKET": "bucket"}):
+            downloader = ZeekerS3Downloader()
+        downloader.s3_client = fake_s3
+        for name in ("data", "templates", "static", "plugins"):
+            setattr(downloader, f"{name}_dir", tmp_path / name)
+        downloader.data_dir.mkdir()
+        downloader.metadata_file = tmp_path / "metadata.json"
+        downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+
+        assert downloader.download_complete_setup()
+        assert downloader.download_complete_setup()
+
+        entry = json.loads(isolated_metrics_snapshot.read_text())["jobs"]["download"]
+        assert entry["runs_total"] == {"success": 2}
+        assert entry["last"]["files_skipped"] == 3  # Unchanged template, static and plugin files
+        assert entry["bytes_downloaded_total"] >= 2000
+
+    @patch("scripts.manage.calculate_directory_hash", return_value="same")
+    @patch("scripts.manage.download_from_s3_to_dir", return_value=True)
+    def test_refresh_records_run(self, mock_download, mock_hash, tmp_path, isolated_metrics_snapshot):
+        result = CliRunner().invoke(manage.refresh, ["--staging-dir", str(tmp_path / "staging")])
+
+        assert result.exit_code == 0, result.output
+        entry = json.loads(isolated_metrics_snapshot.read_text())["jobs"]["refresh"]
+        assert entry["runs_total"] == {"success": 1}
+        assert entry["last"]["changed"] == 0
+
+
+class TestMetricsEndpoint:
+    """/-/metrics exposition"""
+
+    def test_label_escaping(self):
+        writer = MetricsWriter()
+        writer.sample("m", 1, route='a"b\\c\nd')
+        assert writer.lines == ['m{route="a\\"b\\\\c\\nd"} 1']
+
+    def test_metrics(self, database_file, isolated_metrics_snapshot):
+        record_metrics_run(isolated_metrics_snapshot, "refresh", True, 3.0, bytes_downloaded=2048)
+        datasette = Datasette(
+            immutables=[str(database_file)],
+            plugins_dir=str(PROJECT_DIR / "plugins"),
+        )
+
+        async def scrape():
+            await datasette.invoke_startup()
+            await datasette.client.get("/courts/documents.json")
+            return await datasette.client.get("/-/metrics")
+
+        response = asyncio.run(scrape())
+        text = response.text
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == CONTENT_TYPE
+        assert text.endswith("# EOF\n")
+        assert 'zeeker_http_requests_total{route="table.json",status="200"} 1' in text
+        assert 'zeeker_http_request_duration_seconds_bucket{route="table.json",le="+Inf"} 1' in text
+        assert "zeeker_sqlite_query_duration_seconds_count" in text
+        size = database_file.stat().st_size
+        assert f'zeeker_database_size_bytes{{database="courts"}} {size}' in text
+        assert 'zeeker_job_runs_total{job="refresh",status="success"} 1' in text
+        assert 'zeeker_job_downloaded_bytes_total{job="refresh"} 2048' in text
+        assert 'zeeker_job_last_run_value{job="refresh",field="duration_seconds"} 3.0' in text
+
+    def test_private_instance(self, database_file, isolated_metrics_snapshot):
+        datasette = Datasette(
+            immutables=[str(database_file)],
+            metadata={"allow": {"id": "root"}},
+            plugins_dir=str(PROJECT_DIR / "plugins"),
+        )
+
+        async def scrape():
+            return [
+                await datasette.client.get("/-/metrics"),
+                await datasette.client.get(
+                    "/-/metrics", cookies={"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")}),
+            ]
+
+        assert [response.status_code for response in asyncio.run(scrape())] == [403, 200]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/perf_monitor.py
+"""
+
+import asyncio
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.perf_monitor import MAX_ROUTES, Histogram, PerfRecorder, normalize_sql, route_label
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+
+@pytest.fixture(scope="module")
+def database_file(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("perf") / "courts.db", size_mb=0.1)
+
+
+def make_datasette(database_file, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        metadata={"plugins": {"zeeker-perf": config}},
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def as_root(datasette):
+    return {"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")}
+
+
+class TestRecorder:
+    """Histograms, caps and labels"""
+
+    def test_route_label(self):
+        databases = {"courts"}
+        assert route_label("/", databases) == "index"
+        assert route_label("/courts", databases) == "database"
+        assert route_label("/courts.json", databases) == "database.json"
+        assert route_label("/courts/documents.json", databases) == "table.json"
+        assert route_label("/courts/documents/12", databases) == "row"
+        assert route_label("/sources", databases) == "/sources"
+        assert route_label("/-/perf.json", databases) == "/-/perf.json"
+        assert route_label("/static/css/theme.css", databases) == "static"
+
+    def test_histogram(self):
+        histogram = Histogram(ring_size=3)
+        for seconds in (0.001, 0.02, 0.3, 20):
+            histogram.observe(seconds)
+
+        cumulative = dict(histogram.cumulative())
+        assert cumulative[0.005] == 1
+        assert cumulative[0.025] == 2
+        assert cumulative[float("inf")] == 4
+        assert list(histogram.recent) == [0.02, 0.3, 20]  # Ring buffer is bounded
+        assert histogram.percentile(50) == 0.3
+
+    def test_routes_and_queries_are_capped(self):
+        recorder = PerfRecorder(slow_query_ms=10, slow_samples=2)
+        for i in range(MAX_ROUTES + 5):
+            recorder.record_request(f"/page{i}", 200, 0.001)
+        for i in range(3):
+            recorder.record_query("db", f"select {i}", 0.05)
+
+        assert len(recorder.routes) == MAX_ROUTES + 1
+        assert recorder.routes["other"].count == 5
+        assert [q["sql"] for q in recorder.slow_queries] == ["select 1", "select 2"]
+
+    def test_normalize_sql(self):
+        assert normalize_sql("select *\n  from   t") == "select * from t"
+        assert len(normalize_sql("x" * 1000)) == 501
+
+
+class TestPerfEndpoints:
+    """Instrumentation through the ASGI app"""
+
+    def test_records_routes_and_sql(self, database_file):
+        asyncio.run(self._records_routes_and_sql(database_file))
+
+    def test_sampling_disabled(self, database_file):
+        asyncio.run(self._sampling_disabled(database_file))
+
+    def test_needs_view_perf(self, database_file):
+        asyncio.run(self._needs_view_perf(database_file))
+
+    async def _records_routes_and_sql(self, database_file):
+        datasette = make_datasette(database_file, slow_query_ms=0)
+        await datasette.invoke_startup()
+
+        assert (await datasette.client.get("/courts/documents.json?_size=5")).status_code == 200
+        await datasette.client.get("/courts/missing.json")
+        perf = (await datasette.client.get("/-/perf.json", cookies=as_root(datasette))).json()
+
+        assert perf["routes"]["table.json"]["count"] == 2
+        assert perf["routes"]["table.json"]["statuses"] == {"200": 1, "404": 1}
+        assert perf["sql"]["time"]["count"] > 0
+        assert any("from [documents]" in query["sql"] for query in perf["sql"]["top"])
+        assert perf["sql"]["slow"][0]["route"] == "table.json"
+
+        page = await datasette.client.get("/-/perf", cookies=as_root(datasette))
+        assert page.status_code == 200
+        assert "table.json" in page.text
+
+    async def _sampling_disabled(self, database_file):
+        datasette = make_datasette(database_file, sample_rate=0)
+        await datasette.invoke_startup()
+
+        await datasette.client.get("/courts/documents.json")
+        perf = (await datasette.client.get("/-/perf.json", cookies=as_root(datasette))).json()
+
+        assert perf["routes"] == {}
+        assert perf["sql"]["time"]["count"] == 0
+
+    async def _needs_view_perf(self, database_file):
+        datasette = make_datasette(database_file)
+        ops = make_datasette(database_file, allow={"id": "ops"})
+        ops_actor = {"ds_actor": ops.sign({"a": {"id": "ops"}}, "actor")}
+
+        statuses = [
+            (await datasette.client.get("/-/perf.json")).status_code,
+            (await datasette.client.get("/-/perf")).status_code,
+            (await datasette.client.get("/-/perf.json", cookies=as_root(datasette))).status_code,
+            (await ops.client.get("/-/perf.json", cookies=ops_actor)).status_code,
+            (await ops.client.get("/-/perf.json", cookies=as_root(ops))).status_code,
+        ]
+
+        assert statuses == [403, 403, 200, 200, 403]
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/query_cache.py
+
+The benchmark compares an analytical query served by Datasette with the
+same request answered from the cache:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_query_cache.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.query_cache import ByteLRU, DiskTier, get_cache
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+FACET_SQL = "select court, count(*) from documents group by court order by 2 desc"
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("cache") / "courts.db", size_mb=0.2)
+
+
+@pytest.fixture
+def database_file(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("cache-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def make_datasette(database_file, mutable=False, **config):
+    files = {"files": [str(database_file)]} if mutable else {"immutables": [str(database_file)]}
+    return Datasette(
+        **files,
+        metadata={"plugins": {"zeeker-query-cache": config}},
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def query_path(sql, extension=".json"):
+    return f"/courts{extension}?sql={quote(sql)}"
+
+
+def get(datasette, *paths, **kwargs):
+    async def fetch():
+        return [await datasette.client.get(path, **kwargs) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+class TestByteLRU:
+    """Bounded by total entry size"""
+
+    def test_eviction_by_bytes(self):
+        lru = ByteLRU(max_bytes=10)
+        lru.set("a", "A", 4)
+        lru.set("b", "B", 4)
+        lru.get("a")
+        lru.set("c", "C", 4)
+
+        assert list(lru.entries) == ["a", "c"]
+        assert lru.bytes == 8
+        assert lru.evictions == 1
+
+        lru.set("huge", "H", 11)
+        assert "huge" not in lru.entries
+
+
+class TestQueryCache:
+    """Cached SQL responses"""
+
+    def test_hit_after_miss(self, database_file):
+        datasette = make_datasette(database_file)
+
+        first, second, reordered = get(
+            datasette, query_path(FACET_SQL), query_path(FACET_SQL), query_path(FACET_SQL) + "&_shape=array",
+        )
+
+        assert first.headers["x-zeeker-cache"] == "miss"
+        assert second.headers["x-zeeker-cache"] == "hit"
+        assert second.content == first.content
+        assert reordered.headers["x-zeeker-cache"] == "miss"  # Different parameters
+        stats = get_cache(datasette).stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+        assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+    def test_parameter_order_shares_entry(self, database_file):
+        datasette = make_datasette(database_file)
+        sql = quote("select * from documents where court = :court limit 5")
+
+        first, second = get(
+            datasette, f"/courts.json?sql={sql}&court=High", f"/courts.json?court=High&sql={sql}",
+        )
+
+        assert second.headers["x-zeeker-cache"] == "hit"
+
+    def test_not_cached(self, database_file):
+        datasette = make_datasette(database_file, max_entry_bytes=200)
+
+        large, table, error = get(
+            datasette, query_path("select * from documents limit 50"), "/courts/documents.json",
+            query_path("select * from nope"),
+        )
+        private, _ = get(datasette, query_path(FACET_SQL), query_path(FACET_SQL), cookies={"ds_actor": "x"})
+
+        assert large.headers["x-zeeker-cache"] == "miss"
+        assert "x-zeeker-cache" not in table.headers
+        assert error.status_code == 400
+        assert "x-zeeker-cache" not in private.headers
+        stats = get_cache(datasette).stats()
+        assert stats["entries"] == 0
+        assert stats["too_large"] == 1
+
+    def test_mutable_database_not_cached(self, database_file):
+        datasette = make_datasette(database_file, mutable=True)
+
+        (response,) = get(datasette, query_path(FACET_SQL))
+
+        assert "x-zeeker-cache" not in response.headers
+
+    def test_replaced_file_misses(self, database_file):
+        datasette = make_datasette(database_file)
+        get(datasette, query_path(FACET_SQL))
+        os.utime(database_file, ns=(0, 0))
+
+        (response,) = get(datasette, query_path(FACET_SQL))
+
+        assert response.headers["x-zeeker-cache"] == "miss"
+
+    def test_disk_tier_survives_restart(self, database_file, tmp_path):
+        config = {"disk_dir": str(tmp_path / "cache")}
+        (first,) = get(make_datasette(database_file, **config), query_path(FACET_SQL, ".csv"))
+
+        datasette = make_datasette(database_file, **config)
+        (second,) = get(datasette, query_path(FACET_SQL, ".csv"))
+
+        assert second.headers["x-zeeker-cache"] == "hit"
+        assert second.text == first.text
+        assert second.headers["content-type"] == first.headers["content-type"]
+        assert get_cache(datasette).stats()["disk_hits"] == 1
+
+    def test_disk_tier_bounded(self, tmp_path):
+        disk = DiskTier(tmp_path, max_bytes=350)  # Room for two entries with their headers
+        for key in ("a", "b", "c"):
+            disk.write(key, 200, [(b"content-type", b"text/plain")], b"x" * 100)
+
+        assert sorted(path.stem for path in tmp_path.glob("*.cache")) == ["b", "c"]
+        assert disk.read("a") is None
+        assert disk.read("c") == (200, [(b"content-type", b"text/plain")], b"x" * 100)
+
+    def test_disk_tier_concurrent_writes(self, tmp_path):
+        disk = DiskTier(tmp_path, max_bytes=1000)
+        bodies = [bytes([65 + i % 4]) * 100 for i in range(200)]
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda body: disk.write(f"k{body[0]}", 200, [], body), bodies))
+
+        assert list(tmp_path.glob("*.tmp")) == []
+        assert sorted(path.stem for path in tmp_path.glob("*.cache")) == sorted(disk.index.entries)
+        assert disk.index.bytes == sum(size for _, size in disk.index.entries.values())
+        assert disk.read("k65") == (200, [], b"A" * 100)
+
+    def test_hit_rate_on_perf_page(self, database_file):
+        datasette = make_datasette(database_file)
+
+        get(datasette, query_path(FACET_SQL), query_path(FACET_SQL))
+        # As root, who may view /-/perf; the signed-in requests themselves are never cached
+        perf_json, perf_page = get(datasette, "/-/perf.json", "/-/perf",
+                                   cookies={"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")})
+
+        assert perf_json.json()["caches"]["query"]["hits"] == 1
+        assert "Caches" in perf_page.text
+        assert "50%" in perf_page.text
+
+
+@pytest.mark.benchmark
+class TestQueryCacheBenchmarks:
+    """Executed versus cached analytical query"""
+
+    def test_cached_query(self, benchmark_recorder, bench_database):
+        datasette = make_datasette(bench_database)
+        cache = get_cache(datasette)
+        path = query_path("select court, category, count(*), avg(length(body)) from documents group by 1, 2")
+
+        async def request():
+            response = await datasette.client.get(path)
+            assert response.status_code == 200
+
+        def uncached():
+            cache.memory.entries.clear()
+            cache.memory.bytes = 0
+            asyncio.run(request())
+
+        best = {}
+        for name, workload in (("uncached", uncached), ("cached", lambda: asyncio.run(request()))):
+            workload()
+            _, result = benchmark_recorder.measure(f"query_cache.{name}", workload)
+            best[name] = result["best_s"]
+
+        print(f"\nquery: uncached {best['uncached'] * 1000:.1f}ms, cached {best['cached'] * 1000:.1f}ms "
+              f"({best['uncached'] / best['cached']:.2f}x)")
+        assert best["cached"] < best["uncached"]
+        for name in best:
+            regression = benchmark_recorder.regression(f"query_cache.{name}")
+            assert regression is None, regression
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/query_guard.py
+
+The benchmark measures a cheap query issued while several expensive ones
+are running, with the guard disabled and with expensive queries limited to
+one executor thread:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_query_guard.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import time
+from urllib.parse import quote
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.query_guard import CostEstimate, get_guard, table_aliases, table_rows
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+CROSS_JOIN = "select count(*) from documents a, documents b where a.body like b.title"
+UNINDEXED_LIKE = "select id from documents where body like '%zzz%'"
+
+
+def analyzed(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE INDEX documents_court ON documents (court)")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    return analyzed(create_database(tmp_path_factory.mktemp("guard") / "courts.db", size_mb=0.5))
+
+
+@pytest.fixture
+def database_file(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return analyzed(create_database(tmp_path_factory.mktemp("guard-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB))
+
+
+def make_datasette(database_file, metadata=None, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        # Without the query cache, so repeated queries run every time
+        metadata=dict(metadata or {}, plugins={"zeeker-query-guard": config, "zeeker-query-cache": {"max_bytes": 0}}),
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def query_path(sql, extension=".json"):
+    return f"/courts{extension}?sql={quote(sql)}"
+
+
+def get(datasette, *paths):
+    async def fetch():
+        return [await datasette.client.get(path) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+def plan(database_file, sql):
+    conn = sqlite3.connect(database_file)
+    try:
+        return conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    finally:
+        conn.close()
+
+
+class TestCostEstimate:
+    """Rows visited according to the query plan"""
+
+    COUNTS = {"documents": 10_000, "documents_fts": 10_000}
+
+    def estimate(self, database_file, sql):
+        return CostEstimate(plan(database_file, sql), self.COUNTS, table_aliases(sql, self.COUNTS))
+
+    def test_scans_and_searches(self, database_file):
+        scan = self.estimate(database_file, UNINDEXED_LIKE)
+        lookup = self.estimate(database_file, "select * from documents where id = 5")
+        indexed = self.estimate(database_file, "select * from documents where court = 'High Court'")
+        fts = self.estimate(database_file, "select rowid from documents_fts where documents_fts match 'court'")
+
+        assert scan.cost == 10_000
+        assert scan.scans == [("documents", 10_000)]
+        assert lookup.cost < 20
+        assert indexed.cost < 20
+        assert fts.cost < 1000
+
+    def test_nested_loops_multiply(self, database_file):
+        cross = self.estimate(database_file, CROSS_JOIN)
+        correlated = self.estimate(
+            database_file, "select (select count(*) from documents b where b.body = a.title) from documents a",
+        )
+
+        assert cross.cost >= 10_000 ** 2
+        assert "2 full scans of documents (10,000 rows each)" in cross.describe()
+        assert correlated.cost >= 10_000 ** 2
+
+    def test_aliases(self):
+        sql = "select * from documents as a join [documents] b on a.id = b.id, documents where 'from x y'"
+
+        assert table_aliases(sql, self.COUNTS) == {"a": "documents", "b": "documents"}
+
+
+class TestQueryGuard:
+    """Admission of custom SQL"""
+
+    def test_cheap_queries_admitted(self, database_file):
+        datasette = make_datasette(database_file, queue_cost=2000)
+
+        bare, limited, lookup = get(
+            datasette, query_path("select * from documents"), query_path("select title from documents limit 5"),
+            query_path("select * from documents where id = :id") + "&id=3",
+        )
+
+        assert bare.status_code == limited.status_code == lookup.status_code == 200
+        assert int(bare.headers["x-zeeker-query-cost"]) == 1001  # Stops at max_returned_rows
+        assert int(limited.headers["x-zeeker-query-cost"]) == 5
+        assert int(lookup.headers["x-zeeker-query-cost"]) < 20
+        assert get_guard(datasette).stats()["queued"] == 0
+
+    def test_expensive_query_rejected(self, database_file):
+        datasette = make_datasette(database_file, max_cost=100_000)
+
+        as_json, as_html, table = get(
+            datasette, query_path(CROSS_JOIN), query_path(CROSS_JOIN, ""), "/courts/documents.json",
+        )
+
+        assert as_json.status_code == 400
+        assert as_json.json()["title"] == "Query too expensive"
+        assert "2 full scans of documents" in as_json.json()["error"]
+        assert "/courts.db" in as_json.json()["error"]
+        assert as_html.status_code == 400
+        assert "Query too expensive" in as_html.text
+        assert table.status_code == 200
+        assert "x-zeeker-query-cost" not in table.headers
+        assert get_guard(datasette).stats()["rejected"] == 2
+
+    def test_needs_execute_sql(self, database_file):
+        datasette = make_datasette(database_file, {"allow_sql": {"id": "root"}}, max_cost=100_000)
+        cookies = {"ds_actor": datasette.sign({"a": {"id": "root"}}, "actor")}
+
+        async def fetch():
+            return [
+                await datasette.client.get(query_path(CROSS_JOIN)),
+                await datasette.client.get(query_path(CROSS_JOIN), cookies=cookies),
+            ]
+
+        anonymous, root = asyncio.run(fetch())
+
+        assert anonymous.status_code == 403
+        assert "rows" not in anonymous.text
+        assert root.status_code == 400
+        assert get_guard(datasette).stats()["rejected"] == 1
+
+    def test_undecodable_query_string(self, database_file):
+        datasette = make_datasette(database_file, max_cost=100_000)
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        async def request():
+            await datasette.app()({
+                "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": "/courts.json",
+                "raw_path": b"/courts.json", "query_string": b"sql=" + quote(CROSS_JOIN).encode() + b"&x=\xff",
+                "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1234),
+            }, receive, send)
+
+        asyncio.run(request())
+
+        assert sent[0]["status"] == 400
+        assert get_guard(datasette).stats()["rejected"] == 1
+
+    def test_uncounted_tables_estimated_from_rowid(self, database_file):
+        conn = sqlite3.connect(database_file)
+        conn.execute("DELETE FROM sqlite_stat1")
+        conn.commit()
+        (max_rowid,) = conn.execute("select max(rowid) from documents").fetchone()
+        conn.close()
+        db = make_datasette(database_file).get_database("courts")
+
+        async def timed_out(limit):
+            return {}
+
+        db.table_counts = timed_out
+
+        assert asyncio.run(table_rows(db))["documents"] == max_rowid
+
+    def test_unplannable_query_left_to_datasette(self, database_file):
+        datasette = make_datasette(database_file)
+
+        (response,) = get(datasette, query_path("select * from nope"))
+
+        assert response.status_code == 400
+        assert "no such table" in response.json()["error"]
+
+    def test_expensive_queries_queue(self, database_file):
+        datasette = make_datasette(database_file, queue_cost=100, queue_timeout=0.2, max_queued=1)
+        guard = get_guard(datasette)
+
+        async def requests():
+            await guard.heavy_slots.acquire()  # A long-running expensive query
+            try:
+                queued = await asyncio.gather(
+                    datasette.client.get(query_path(UNINDEXED_LIKE)),
+                    datasette.client.get(query_path(UNINDEXED_LIKE, ".csv")),
+                )
+            finally:
+                guard.heavy_slots.release()
+            admitted = await datasette.client.get(query_path(UNINDEXED_LIKE))
+            return queued, admitted
+
+        queued, admitted = asyncio.run(requests())
+
+        assert [response.status_code for response in queued] == [503, 503]
+        assert all(response.headers["retry-after"] == "1" for response in queued)
+        messages = " ".join(response.text for response in queued)
+        assert "already waiting" in messages  # Queue full on arrival
+        assert "waited 0.2s" in messages  # Timed out in the queue
+        assert admitted.status_code == 200
+        assert guard.stats() == {"admitted": 1, "queued": 2, "throttled": 2, "rejected": 0, "waiting": 0}
+
+
+@pytest.mark.benchmark
+class TestQueryGuardBenchmarks:
+    """Cheap query latency while expensive queries run"""
+
+    def test_interactive_latency(self, benchmark_recorder, bench_database):
+        expensive = [query_path(f"select count(*) from documents where body like '%{word}%'")
+                     for word in ("zzz", "yyy", "xxx", "www")]
+        cheap = query_path("select * from documents where id = 1")
+
+        def under_load(datasette):
+            async def run():
+                heavy = [asyncio.create_task(datasette.client.get(path)) for path in expensive]
+                await asyncio.sleep(0.01)  # Let them take the executor threads
+                start = time.perf_counter()
+                response = await datasette.client.get(cheap)
+                latency = time.perf_counter() - start
+                assert response.status_code == 200
+                await asyncio.gather(*heavy)
+                return latency
+
+            return asyncio.run(run())
+
+        latency = {}
+        for name, config in (("unguarded", {"queue_cost": None}), ("guarded", {"queue_cost": 1000})):
+            datasette = make_datasette(bench_database, **config)
+            under_load(datasette)  # Warm connections and page cache
+            latency[name] = min(under_load(datasette) for _ in range(3))
+            benchmark_recorder.measure(f"query_guard.{name}", lambda: under_load(datasette), repeat=3)
+
+        print(f"\ncheap query under load: unguarded {latency['unguarded'] * 1000:.1f}ms, "
+              f"guarded {latency['guarded'] * 1000:.1f}ms")
+        assert latency["guarded"] < latency["unguarded"]
+        for name in latency:
+            regression = benchmark_recorder.regression(f"query_guard.{name}")
+            assert regression is None, regression
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/rate_limit.py
+
+The benchmark measures an interactive client's table page while a scraper
+has many page requests outstanding, with requests served first come first
+served and through the fair-share queue:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_rate_limit.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+import time
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.rate_limit import MAX_RETRY_AFTER, FairQueue, TokenBuckets, asgi_wrapper, client_id, get_limiter, route_cost
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+COSTS = {"sql": 5, "export": 10, "default": 1}
+
+SCRAPER = {"x-forwarded-for": "81.2.69.142"}
+VISITOR = {"x-forwarded-for": "81.2.69.143"}
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("limit") / "courts.db", size_mb=0.2)
+
+
+@pytest.fixture
+def database_file(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("limit-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def make_datasette(database_file, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        # Without the query cache, so repeated requests run every time
+        metadata={"plugins": {"zeeker-rate-limit": config, "zeeker-query-cache": {"max_bytes": 0}}},
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def scope(path="/courts/documents.json", query_string=b"", client=("10.0.0.2", 5000), **headers):
+    return {
+        "type": "http", "path": path, "query_string": query_string, "client": client,
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    }
+
+
+class TestClassification:
+    """Route costs and client identity"""
+
+    def test_route_cost(self):
+        assert route_cost(scope("/static/css/zeeker-theme.css"), COSTS) == 0
+        assert route_cost(scope(), COSTS) == 1
+        assert route_cost(scope("/courts.json", b"sql=select+1"), COSTS) == 5
+        assert route_cost(scope("/courts/documents.csv"), COSTS) == 10
+        assert route_cost(scope(query_string=b"_stream=1"), COSTS) == 10
+
+    def test_client_id(self):
+        forwarded = client_id(scope(x_forwarded_for="1.2.3.4, 93.184.216.34, 10.0.0.1"))
+        direct = client_id(scope(client=("93.184.216.35", 1)))
+        keyed = client_id(scope(authorization="Bearer secret", x_forwarded_for="93.184.216.34"),
+                          clients={"secret": {"rate": None}})
+        unknown = client_id(scope(x_api_key="made-up", x_forwarded_for="93.184.216.34"),
+                            clients={"secret": {"rate": None}})
+
+        assert forwarded == ("ip:93.184.216.34", "93.184.216.34")  # Last public hop; 1.2.3.4 may be forged
+        assert direct == ("ip:93.184.216.35", "93.184.216.35")
+        assert keyed[0].startswith("key:") and "secret" not in keyed[0]
+        assert keyed[1] == "secret"
+        assert unknown == ("ip:93.184.216.34", "93.184.216.34")  # Unconfigured keys do not get their own bucket
+        assert client_id(scope()) is None  # Local
+        assert client_id(scope(), exempt_local=False) == ("ip:10.0.0.2", "10.0.0.2")
+
+
+class TestTokenBuckets:
+    """Refill, overrides and debt"""
+
+    def test_refill_and_retry_after(self):
+        buckets = TokenBuckets(rate=2, burst=4)
+
+        assert [buckets.take("a", "a", 1, now=0) for _ in range(4)] == [0, 0, 0, 0]
+        assert buckets.take("a", "a", 1, now=0) == pytest.approx(0.5)
+        assert buckets.take("b", "b", 1, now=0) == 0  # Separate bucket
+        assert buckets.take("a", "a", 3, now=1) == pytest.approx(0.5)  # Two tokens back
+        assert buckets.take("a", "a", 3, now=1.5) == 0
+
+    def test_overrides_and_debt(self):
+        buckets = TokenBuckets(rate=1, burst=2, clients={"vip": {"rate": None}, "bulk": {"burst": 10}})
+
+        assert all(buckets.take("vip", "vip", 5, now=0) == 0 for _ in range(10))
+        assert buckets.take("big", "big", 5, now=0) == 0  # Costs more than burst, from a full bucket
+        assert buckets.take("big", "big", 1, now=2) == pytest.approx(2)  # Paid back at 1/s first
+        assert buckets.take("bulk", "bulk", 10, now=0) == 0
+
+    def test_zero_rate_capped(self):
+        buckets = TokenBuckets(rate=0.0001, burst=2, clients={"blocked": {"rate": 0}})
+
+        assert buckets.take("blocked", "blocked", 2, now=0) == 0  # The burst, then nothing more
+        assert buckets.take("blocked", "blocked", 1, now=100) == MAX_RETRY_AFTER
+        assert buckets.take("slow", "slow", 2, now=0) == 0
+        assert buckets.take("slow", "slow", 1, now=0) == MAX_RETRY_AFTER  # 10000s until one token
+
+    def test_bounded(self):
+        buckets = TokenBuckets(rate=1, burst=1, max_clients=2)
+        for key in ("a", "b", "c"):
+            buckets.take(key, key, 1, now=0)
+
+        assert list(buckets.buckets) == ["b", "c"]
+
+
+class TestFairQueue:
+    """Round-robin admission across clients"""
+
+    def test_round_robin(self):
+        async def run():
+            queue = FairQueue(max_active=1, max_queued_per_client=3)
+            order = []
+
+            async def request(client, label):
+                await queue.acquire(client)
+                order.append(label)
+                await asyncio.sleep(0)
+                queue.release()
+
+            assert await queue.acquire("holder")
+            tasks = [asyncio.create_task(request("scraper", f"s{i}")) for i in range(3)]
+            tasks.append(asyncio.create_task(request("visitor", "v")))
+            await asyncio.sleep(0)
+            assert await queue.acquire("scraper") is False  # Already three waiting
+            queue.release()
+            await asyncio.gather(*tasks)
+            return order, queue
+
+        order, queue = asyncio.run(run())
+
+        assert order == ["s0", "v", "s1", "s2"]
+        assert (queue.active, queue.queued) == (0, 0)
+
+    def test_cancelled_waiter_leaves_queue(self):
+        async def run():
+            queue = FairQueue(max_active=1, max_queued_per_client=3)
+            await queue.acquire("a")
+            waiter = asyncio.create_task(queue.acquire("b"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            queue.release()
+            return queue
+
+        queue = asyncio.run(run())
+
+        assert (queue.active, queue.queued) == (0, 0)
+
+
+class TestRateLimit:
+    """429 responses from the ASGI wrapper"""
+
+    def test_limited_with_retry_after(self, database_file):
+        datasette = make_datasette(database_file, rate=0.5, burst=3)
+
+        async def requests():
+            pages = [await datasette.client.get("/courts/documents.json", headers=SCRAPER) for _ in range(4)]
+            other = await datasette.client.get("/courts/documents.json", headers=VISITOR)
+            html = await datasette.client.get("/courts/documents", headers=SCRAPER)
+            static = await datasette.client.get("/-/static/app.css", headers=SCRAPER)
+            local = await datasette.client.get("/courts/documents.json")
+            return pages, other, html, static, local
+
+        pages, other, html, static, local = asyncio.run(requests())
+
+        assert [page.status_code for page in pages] == [200, 200, 200, 429]
+        assert pages[3].headers["retry-after"] == "2"
+        assert pages[3].json()["title"] == "Too many requests"
+        assert other.status_code == 200
+        assert html.status_code == 429
+        assert "Rate limit exceeded" in html.text
+        assert static.status_code == 200
+        assert local.status_code == 200
+        assert get_limiter(datasette).stats()["limited"] == 2
+
+    def test_zero_rate_client(self, database_file):
+        datasette = make_datasette(database_file, burst=1, clients={"81.2.69.142": {"rate": 0}})
+
+        async def requests():
+            return [await datasette.client.get("/courts/documents.json", headers=SCRAPER) for _ in range(2)]
+
+        first, blocked = asyncio.run(requests())
+
+        assert first.status_code == 200
+        assert blocked.status_code == 429
+        assert blocked.headers["retry-after"] == str(MAX_RETRY_AFTER)
+
+    def test_slot_released_when_response_starts(self, database_file):
+        datasette = make_datasette(database_file, rate=None, max_active=1)
+        streaming = None
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            if scope["path"] == "/-/export/courts.db":
+                await streaming.wait()  # Still sending the body
+            await send({"type": "http.response.body", "body": b""})
+
+        async def run():
+            nonlocal streaming
+            streaming = asyncio.Event()
+            limited_app = asgi_wrapper(datasette)(app)
+            sent = []
+
+            async def send(message):
+                sent.append(message.get("status"))
+
+            export = asyncio.create_task(limited_app(
+                scope("/-/export/courts.db", client=("81.2.69.142", 1)), None, send))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(limited_app(scope(client=("81.2.69.143", 1)), None, send), 1)
+            streaming.set()
+            await export
+            return sent, get_limiter(datasette).queue
+
+        sent, queue = asyncio.run(run())
+
+        assert sent.count(200) == 2
+        assert (queue.active, queue.queued) == (0, 0)
+
+    def test_sql_costs_more(self, database_file):
+        datasette = make_datasette(database_file, rate=0.1, burst=6)
+
+        async def requests():
+            return [await datasette.client.get("/courts.json?sql=select+1", headers=SCRAPER) for _ in range(2)]
+
+        first, second = asyncio.run(requests())
+
+        assert (first.status_code, second.status_code) == (200, 429)
+
+
+@pytest.mark.benchmark
+class TestRateLimitBenchmarks:
+    """Interactive latency while a scraper has many requests outstanding"""
+
+    def test_fair_queue_latency(self, benchmark_recorder, bench_database):
+        scraper_pages = [f"/courts/documents.json?_size=200&_next={i * 200}" for i in range(48)]
+
+        def under_load(datasette):
+            async def run():
+                scraper = [asyncio.create_task(datasette.client.get(path, headers=SCRAPER)) for path in scraper_pages]
+                await asyncio.sleep(0.005)
+                start = time.perf_counter()
+                response = await datasette.client.get("/courts/documents.json?id=1", headers=VISITOR)
+                latency = time.perf_counter() - start
+                assert response.status_code == 200
+                await asyncio.gather(*scraper)
+                return latency
+
+            return asyncio.run(run())
+
+        latency = {}
+        for name, config in (("fifo", {"rate": None, "max_active": None}),
+                             ("fair", {"rate": None, "max_active": 4, "max_queued_per_client": 64})):
+            datasette = make_datasette(bench_database, **config)
+            under_load(datasette)  # Warm connections and page cache
+            latency[name] = min(under_load(datasette) for _ in range(3))
+            benchmark_recorder.measure(f"rate_limit.{name}", lambda: under_load(datasette), repeat=3)
+
+        print(f"\nvisitor under scraper load: first come first served {latency['fifo'] * 1000:.1f}ms, "
+              f"fair queue {latency['fair'] * 1000:.1f}ms")
+        assert latency["fair"] < latency["fifo"]
+        for name in latency:
+            regression = benchmark_recorder.regression(f"rate_limit.{name}")
+            assert regression is None, regression
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+End-to-end downloader tests against the local S3-compatible server
+
+The functional tests run by default with small files. Throughput benchmarks
+only run with `pytest --benchmark`; their database size is set by
+ZEEKER_BENCH_DB_SIZE_MB (default 64) so multi-GB runs stay opt-in:
+
+    ZEEKER_BENCH_DB_SIZE_MB=2048 pytest tests/test_s3_server.py --benchmark
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from scripts import manage
+from scripts.download_from_s3 import ZeekerS3Downloader
+from tests.s3_server import LocalS3Server
+
+BUCKET = "local-bucket"
+DATABASES = ["judgments", "legislation", "news"]
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+
+def seed_assets(server):
+    """Base assets plus one database customization"""
+    server.put_object(BUCKET, "assets/default/metadata.json", json.dumps({
+        "title": "Local Zeeker",
+        "databases": {"*": {"allow_sql": True}},
+        "extra_css_urls": ["/static/css/zeeker-theme.css"],
+    }).encode())
+    server.put_object(BUCKET, "assets/default/templates/index.html", b"<html></html>")
+    server.put_object(BUCKET, "assets/default/static/css/zeeker-theme.css", b"body{}")
+    server.put_object(BUCKET, "assets/default/plugins/__init__.py", b"")
+    server.put_object(BUCKET, "assets/databases/judgments/metadata.json", json.dumps({
+        "databases": {"judgments": {"title": "Judgments"}},
+        "extra_css_urls": ["/static/databases/judgments/custom.css"],
+    }).encode())
+    server.put_object(BUCKET, "assets/databases/judgments/static/custom.css", b".j{}")
+
+
+@pytest.fixture
+def s3_env(monkeypatch):
+    """Dummy credentials so boto3 signs requests without touching real AWS"""
+    monkeypatch.setenv("S3_BUCKET", BUCKET)
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "local")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "local")
+    return monkeypatch
+
+
+@pytest.fixture
+def server(tmp_path, s3_env):
+    with LocalS3Server(tmp_path / "s3") as server:
+        server.create_bucket(BUCKET)
+        s3_env.setenv("S3_ENDPOINT_URL", server.endpoint_url)
+        yield server
+
+
+@pytest.fixture(scope="module")
+def seeded_root(tmp_path_factory):
+    """Bucket directory with ZEEKER_BENCH_DB_SIZE_MB databases, generated once"""
+    root = tmp_path_factory.mktemp("s3")
+    seeder = LocalS3Server(root)
+    seed_assets(seeder)
+    seeder.seed_databases(BUCKET, DATABASES, size_mb=BENCH_DB_SIZE_MB)
+    return root
+
+
+def make_downloader(tmp_path):
+    downloader = ZeekerS3Downloader()
+    downloader.data_dir = tmp_path / "data"
+    downloader.templates_dir = tmp_path / "templates"
+    downloader.static_dir = tmp_path / "static"
+    downloader.plugins_dir = tmp_path / "plugins"
+    downloader.metadata_file = tmp_path / "metadata.json"
+    downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+    return downloader
+
+
+class TestLocalS3Server:
+    """The server speaks enough S3 for boto3"""
+
+    @pytest.fixture
+    def client(self, server):
+        return boto3.client("s3", endpoint_url=server.endpoint_url, config=Config(
+            response_checksum_validation="when_required",
+            request_checksum_calculation="when_required",
+        ))
+
+    def test_put_get_head(self, client):
+        client.put_object(Bucket=BUCKET, Key="a/b.txt", Body=b"hello")
+
+        assert client.get_object(Bucket=BUCKET, Key="a/b.txt")["Body"].read() == b"hello"
+        assert client.head_object(Bucket=BUCKET, Key="a/b.txt")["ContentLength"] == 5
+
+    def test_range_request(self, client, server):
+        server.put_object(BUCKET, "data.bin", bytes(range(100)))
+
+        response = client.get_object(Bucket=BUCKET, Key="data.bin", Range="bytes=10-19")
+
+        assert response["Body"].read() == bytes(range(10, 20))
+        assert response["ContentRange"] == "bytes 10-19/100"
+
+    def test_missing_key(self, client):
+        with pytest.raises(ClientError) as exc:
+            client.get_object(Bucket=BUCKET, Key="missing")
+        assert exc.value.response["Error"]["Code"] == "NoSuchKey"
+
+        with pytest.raises(ClientError):
+            client.head_object(Bucket=BUCKET, Key="missing")
+
+    def test_list_pagination_and_delimiter(self, client, server):
+        for i in range(25):
+            server.put_object(BUCKET, f"assets/databases/db_{i:02d}/metadata.json", b"{}")
+
+        pages = list(client.get_paginator("list_objects_v2").paginate(
+            Bucket=BUCKET, Prefix="assets/", PaginationConfig={"PageSize": 10}
+        ))
+        keys = [obj["Key"] for page in pages for obj in page["Contents"]]
+        assert len(pages) == 3
+        assert keys == sorted(keys) and len(keys) == 25
+
+        response = client.list_objects_v2(Bucket=BUCKET, Prefix="assets/databases/", Delimiter="/")
+        assert len(response["CommonPrefixes"]) == 25
+        assert "Contents" not in response
+
+    def test_latency_is_applied(self, tmp_path, s3_env):
+        with LocalS3Server(tmp_path / "slow", latency=0.05) as server:
+            server.put_object(BUCKET, "k", b"x")
+            client = boto3.client("s3", endpoint_url=server.endpoint_url)
+            start = time.perf_counter()
+            client.head_object(Bucket=BUCKET, Key="k")
+            assert time.perf_counter() - start >= 0.05
+
+
+class TestDownloaderEndToEnd:
+    """ZeekerS3Downloader and manage.py against real HTTP transfers"""
+
+    def test_complete_setup(self, server, tmp_path):
+        seed_assets(server)
+        server.seed_databases(BUCKET, DATABASES, size_mb=0.25)
+
+        downloader = make_downloader(tmp_path)
+        assert downloader.download_complete_setup()
+
+        assert sorted(p.stem for p in downloader.data_dir.glob("*.db")) == DATABASES
+        metadata = json.loads(downloader.metadata_file.read_text())
+        assert metadata["databases"]["judgments"]["title"] == "Judgments"
+        assert "/static/databases/judgments/custom.css" in metadata["extra_css_urls"]
+        assert (downloader.static_dir / "databases/judgments/custom.css").exists()
+
+    def test_incremental_sync_skips_unchanged_assets(self, server, tmp_path):
+        seed_assets(server)
+        server.seed_databases(BUCKET, DATABASES, size_mb=0.25)
+
+        assert make_downloader(tmp_path).download_complete_setup()
+        asset = tmp_path / "static/databases/judgments/custom.css"
+        modified = asset.stat().st_mtime_ns
+        assert make_downloader(tmp_path).download_complete_setup()
+
+        # The asset manifest leaves unchanged files in place
+        assert asset.stat().st_mtime_ns == modified
+
+    def test_refresh_download(self, server, tmp_path):
+        server.seed_databases(BUCKET, DATABASES, size_mb=0.25)
+
+        assert manage.download_from_s3_to_dir(tmp_path / "staging", logging.getLogger("test"))
+        assert sorted(p.stem for p in (tmp_path / "staging").glob("*.db")) == DATABASES
+
+
+@pytest.mark.benchmark
+class TestDownloaderThroughputBenchmarks:
+    """Wall-clock transfer throughput with shaped latency"""
+
+    @pytest.mark.parametrize("concurrency", [1, 16])
+    def test_download_complete_setup(self, benchmark_recorder, seeded_root, tmp_path, s3_env, concurrency):
+        s3_env.setenv("S3_MAX_CONCURRENCY", str(concurrency))
+        nbytes = sum(p.stat().st_size for p in (seeded_root / BUCKET / "latest").glob("*.db"))
+
+        with LocalS3Server(seeded_root, latency=0.005) as server:
+            s3_env.setenv("S3_ENDPOINT_URL", server.endpoint_url)
+
+            def download():
+                shutil.rmtree(tmp_path / "run", ignore_errors=True)
+                (tmp_path / "run").mkdir()
+                return make_downloader(tmp_path / "run").download_complete_setup(force=True)
+
+            ok, result = benchmark_recorder.measure(
+                f"s3_server.download_complete_setup.c{concurrency}", download,
+                repeat=3, items=len(DATABASES), nbytes=nbytes,
+            )
+
+        assert ok
+        assert result["mb_per_s"] > 0
+
+    def test_incremental_sync(self, benchmark_recorder, seeded_root, tmp_path, s3_env):
+        with LocalS3Server(seeded_root, latency=0.005) as server:
+            s3_env.setenv("S3_ENDPOINT_URL", server.endpoint_url)
+            assert make_downloader(tmp_path).download_complete_setup()
+
+            ok, _ = benchmark_recorder.measure(
+                "s3_server.incremental_sync",
+                lambda: make_downloader(tmp_path).download_complete_setup(),
+                items=len(DATABASES),
+            )
+
+        assert ok
+
+    def test_refresh_download(self, benchmark_recorder, seeded_root, tmp_path, s3_env):
+        nbytes = sum(p.stat().st_size for p in (seeded_root / BUCKET / "latest").glob("*.db"))
+
+        with LocalS3Server(seeded_root, latency=0.005) as server:
+            s3_env.setenv("S3_ENDPOINT_URL", server.endpoint_url)
+            logger = logging.getLogger("bench")
+
+            ok, result = benchmark_recorder.measure(
+                "s3_server.refresh_download",
+                lambda: manage.download_from_s3_to_dir(tmp_path / "staging", logger),
+                repeat=3, nbytes=nbytes,
+            )
+
+        assert ok
+        assert result["mb_per_s"] > 0
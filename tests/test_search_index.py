@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/search_index.py and its use by plugins/cross_search.py
+
+The benchmarks compare the per-table fan-out with one query against the
+unified index over the same databases, and check that uncached
+/-/suggest.json requests stay in single-digit milliseconds:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_search_index.py --benchmark
+"""
+
+import asyncio
+import gc
+import json
+import os
+import shutil
+import sqlite3
+import weakref
+
+import pytest
+from click.testing import CliRunner
+
+from plugins.cross_search import get_index, search_all, search_unified
+from scripts import manage, search_index
+from scripts.download_from_s3 import update_search_index
+from scripts.search_index import SEARCH_INDEX_FILENAME, build_search_index, format_report, searchable_tables
+from scripts.synthetic_data import create_database
+from tests.test_cross_search import common_term, get, make_datasette
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+BENCH_DATABASES = 4
+
+# news has no FTS index of its own; its searchable columns come from metadata
+METADATA = {"databases": {"news": {"tables": {"documents": {
+    "label_column": "parties",
+    "plugins": {"zeeker-fts": {"columns": ["title", "parties", "summary"], "suggest": ["court"]}},
+}}}}}
+
+
+@pytest.fixture(scope="module")
+def source_databases(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("index")
+    return [
+        create_database(directory / "courts.db", size_mb=0.2, seed=1),
+        create_database(directory / "news.db", size_mb=0.2, seed=2, fts=False),
+    ]
+
+
+@pytest.fixture
+def databases(source_databases, tmp_path):
+    return [shutil.copy(path, tmp_path / path.name) for path in source_databases]
+
+
+@pytest.fixture(scope="module")
+def bench_databases(tmp_path_factory):
+    """BENCH_DATABASES databases of ZEEKER_BENCH_DB_SIZE_MB in total, with a unified index"""
+    directory = tmp_path_factory.mktemp("index-bench")
+    paths = [
+        create_database(directory / f"db{i}.db", size_mb=BENCH_DB_SIZE_MB / BENCH_DATABASES, seed=i)
+        for i in range(BENCH_DATABASES)
+    ]
+    build_search_index(directory / SEARCH_INDEX_FILENAME, {path.stem: path for path in paths})
+    return paths
+
+
+def by_name(paths):
+    return {path.stem: path for path in paths}
+
+
+def indexed_rows(index_path):
+    conn = sqlite3.connect(index_path)
+    try:
+        return dict(conn.execute("SELECT database, count(*) FROM search GROUP BY database").fetchall())
+    finally:
+        conn.close()
+
+
+class TestSearchableTables:
+    """Tables, columns and titles to index"""
+
+    def test_from_fts_index_and_metadata(self, databases):
+        courts, news = (sqlite3.connect(path) for path in databases)
+
+        (from_fts,) = searchable_tables(courts, {}, "courts")
+        (from_metadata,) = searchable_tables(news, METADATA, "news")
+
+        assert from_fts["table"] == "documents"
+        assert from_fts["title"] == "title"
+        assert from_fts["pks"] == ["id"]
+        assert from_metadata["columns"] == ["title", "parties", "summary"]
+        assert from_metadata["title"] == "parties"
+        assert from_metadata["suggest"] == ["court"]
+        assert from_fts["suggest"] == []
+        assert searchable_tables(news, {}, "news") == []
+
+
+class TestBuildSearchIndex:
+    """Incremental builds keyed by file hash and table settings"""
+
+    def test_build_unchanged_and_removed(self, databases, tmp_path):
+        index_path = tmp_path / SEARCH_INDEX_FILENAME
+
+        report = build_search_index(index_path, by_name(databases), METADATA)
+        assert {name: entry["action"] for name, entry in report.items()} == {"courts": "indexed", "news": "indexed"}
+        assert indexed_rows(index_path) == {"courts": report["courts"]["rows"], "news": report["news"]["rows"]}
+        assert "rows from 1 table(s)" in format_report("courts", report["courts"])
+
+        mtime = index_path.stat().st_mtime_ns
+        report = build_search_index(index_path, by_name(databases), METADATA)
+        assert {entry["action"] for entry in report.values()} == {"unchanged"}
+        assert index_path.stat().st_mtime_ns == mtime  # Not rewritten
+
+        report = build_search_index(index_path, by_name(databases[:1]), METADATA)
+        assert report["news"] == {"action": "removed"}
+        assert set(indexed_rows(index_path)) == {"courts"}
+
+    def test_only_changed_database_reindexed(self, databases, tmp_path):
+        index_path = tmp_path / SEARCH_INDEX_FILENAME
+        build_search_index(index_path, by_name(databases), METADATA)
+        conn = sqlite3.connect(databases[1])
+        conn.execute("DELETE FROM documents WHERE id > 10")
+        conn.commit()
+        conn.close()
+
+        report = build_search_index(index_path, by_name(databases), METADATA)
+
+        assert report["courts"]["action"] == "unchanged"
+        assert report["news"]["action"] == "indexed"
+        assert indexed_rows(index_path)["news"] == 10
+
+    def test_unchanged_skips_copy_and_hashing(self, databases, tmp_path, monkeypatch):
+        index_path = tmp_path / SEARCH_INDEX_FILENAME
+        build_search_index(index_path, by_name(databases), METADATA)
+        hashed, copied = [], []
+        real_sha256, real_copyfile = search_index.file_sha256, shutil.copyfile
+        monkeypatch.setattr(search_index, "file_sha256", lambda path: hashed.append(path.name) or real_sha256(path))
+        monkeypatch.setattr(search_index.shutil, "copyfile", lambda *args: copied.append(args) or real_copyfile(*args))
+
+        build_search_index(index_path, by_name(databases), METADATA)
+        assert (hashed, copied) == ([], [])
+
+        # Same content, new mtime: hashed once, then recorded with the next change
+        os.utime(databases[0], ns=(0, 0))
+        report = build_search_index(index_path, by_name(databases), METADATA)
+        assert report["courts"]["action"] == "unchanged"
+        assert (hashed, copied) == (["courts.db"], [])
+
+        report = build_search_index(index_path, by_name(databases[:1]), METADATA)
+        assert report["news"] == {"action": "removed"}
+        hashed.clear()
+        build_search_index(index_path, by_name(databases[:1]), METADATA)
+        assert hashed == []
+
+    def test_settings_change_reindexes(self, databases, tmp_path):
+        index_path = tmp_path / SEARCH_INDEX_FILENAME
+        build_search_index(index_path, by_name(databases), METADATA)
+
+        report = build_search_index(index_path, by_name(databases), {})
+
+        assert report["news"]["action"] == "skipped"
+        assert "news" not in indexed_rows(index_path)
+
+
+class TestUnifiedSearch:
+    """/-/search.json answered from the unified index"""
+
+    def test_one_ranked_query(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        datasette = make_datasette(databases)
+        term = common_term(databases[0])
+
+        (response,) = get(datasette, f"/-/search.json?q={term}&limit=10")
+
+        data = response.json()
+        assert data["source"] == "index"
+        assert data["tables_searched"] == 2
+        assert len(data["results"]) == 10
+        ranks = [hit["rank"] for hit in data["results"]]
+        assert ranks == sorted(ranks)
+        hit = data["results"][0]
+        assert hit["url"] == f"/{hit['database']}/documents/{hit['key'][0]}"
+        assert "<mark>" in hit["snippet"]
+        assert SEARCH_INDEX_FILENAME.split(".")[0] not in datasette.databases
+
+    def test_replaced_index_reopened_once(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        datasette = make_datasette(databases)
+        term = common_term(databases[0])
+        get(datasette, f"/-/search.json?q={term}")
+        previous = weakref.ref(get_index(datasette).index_db)
+
+        # A rebuilt index replaces the file; the old connections go with the old object
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases[:1]), METADATA)
+        os.utime(tmp_path / SEARCH_INDEX_FILENAME, ns=(1, 1))
+        (response,) = get(datasette, f"/-/search.json?q={term}")
+        gc.collect()
+
+        assert response.json()["source"] == "index"
+        assert {hit["database"] for hit in response.json()["results"]} == {"courts"}
+        assert previous() is None
+        assert set(datasette.databases) == {"_internal", "courts", "news"}
+
+    def test_private_tables_excluded(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        datasette = make_datasette(databases, {"databases": {"news": {"allow": {"id": "root"}}}})
+        term = common_term(databases[1])
+
+        (anonymous,) = get(datasette, f"/-/search.json?q={term}&limit=50")
+        (root,) = get(datasette, f"/-/search.json?q={term}&limit=50", actor={"id": "root"})
+
+        assert anonymous.json()["source"] == root.json()["source"] == "index"
+        assert anonymous.json()["tables_searched"] == 1
+        assert {hit["database"] for hit in anonymous.json()["results"]} == {"courts"}
+        assert root.json()["tables_searched"] == 2
+        assert "news" in {hit["database"] for hit in root.json()["results"]}
+
+    def test_index_failure_falls_back_to_tables(self, databases, tmp_path):
+        (tmp_path / SEARCH_INDEX_FILENAME).write_bytes(b"not a database")
+        datasette = make_datasette(databases)
+
+        (response,) = get(datasette, f"/-/search.json?q={common_term(databases[0])}")
+
+        assert response.json()["source"] == "tables"
+        assert response.json()["results"]
+
+
+class TestSuggest:
+    """/-/suggest.json from the prefix-indexed suggest table"""
+
+    def test_suggest_table(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        conn = sqlite3.connect(tmp_path / SEARCH_INDEX_FILENAME)
+        courts = conn.execute("SELECT text FROM suggest WHERE kind = 'court' ORDER BY rowid").fetchall()
+        titles = conn.execute("SELECT count(*) FROM suggest WHERE kind = 'title'").fetchone()[0]
+        conn.close()
+        source = sqlite3.connect(databases[1])
+        expected = source.execute(
+            "SELECT court FROM documents GROUP BY court ORDER BY count(*) DESC"
+        ).fetchall()
+        source.close()
+
+        assert courts == expected  # Distinct values, most frequent first
+        assert titles == sum(indexed_rows(tmp_path / SEARCH_INDEX_FILENAME).values())
+
+    def test_prefix_suggestions(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        datasette = make_datasette(databases)
+        prefix = common_term(databases[1])[:3]
+
+        response, short = get(datasette, f"/-/suggest.json?q={prefix.upper()}", "/-/suggest.json?q=a")
+
+        data = response.json()
+        assert data["source"] == "index"
+        assert 0 < len(data["suggestions"]) <= 8
+        for suggestion in data["suggestions"]:
+            assert any(word.lower().startswith(prefix) for word in suggestion["text"].split())
+            if suggestion["kind"] == "title":
+                assert suggestion["url"].startswith(f"/{suggestion['database']}/documents/")
+            else:
+                assert suggestion["url"].startswith("/-/search?q=")
+        assert short.json()["suggestions"] == []
+
+    def test_private_tables_excluded(self, databases, tmp_path):
+        build_search_index(tmp_path / SEARCH_INDEX_FILENAME, by_name(databases), METADATA)
+        datasette = make_datasette(databases, {"databases": {"news": {"allow": {"id": "root"}}}})
+        # "State Courts" is a court value suggested from news; no generated title has the word
+
+        anonymous, repeated = get(datasette, "/-/suggest.json?q=state", "/-/suggest.json?q=state")
+        (root,) = get(datasette, "/-/suggest.json?q=state", actor={"id": "root"})
+
+        assert anonymous.json()["suggestions"] == []
+        assert repeated.json()["cached"] is True
+        assert root.json()["cached"] is False
+        assert [(suggestion["text"], suggestion["database"]) for suggestion in root.json()["suggestions"]] == [
+            ("State Courts", "news")
+        ]
+
+    def test_falls_back_to_tables(self, databases):
+        datasette = make_datasette(databases[:1])
+        prefix = common_term(databases[0])[:4]
+
+        (response,) = get(datasette, f"/-/suggest.json?q={prefix}")
+
+        data = response.json()
+        assert data["source"] == "tables"
+        assert data["suggestions"]
+        assert all(suggestion["kind"] == "title" for suggestion in data["suggestions"])
+
+
+class TestPipeline:
+    """Index updates after downloads and refreshes"""
+
+    def test_update_search_index_stats(self, databases, tmp_path):
+        (tmp_path / "metadata.json").write_text(json.dumps(METADATA))
+
+        stats = update_search_index(tmp_path, METADATA)
+        assert stats["search_indexed"] == 2
+        assert stats["search_index_rows"] == sum(indexed_rows(tmp_path / SEARCH_INDEX_FILENAME).values())
+
+        assert update_search_index(tmp_path, METADATA)["search_indexed"] == 0
+
+    def test_refresh_option(self):
+        option = next(param for param in manage.refresh.params if param.name == "search_index")
+
+        assert option.envvar == "ZEEKER_SEARCH_INDEX"
+        result = CliRunner().invoke(manage.refresh, ["--help"])
+        assert "--search-index" in result.output
+
+
+@pytest.mark.benchmark
+class TestSearchIndexBenchmarks:
+    """Per-table fan-out versus the unified index"""
+
+    def test_unified_query(self, benchmark_recorder, bench_databases):
+        datasette = make_datasette(bench_databases)
+        terms = [common_term(path) for path in bench_databases]
+        index = get_index(datasette)
+        visible = asyncio.run(index.visible_tables(datasette, None))
+        assert index.index_db is not None
+
+        async def fan_out():
+            for term in terms:
+                await search_all(datasette, term, 20, visible)
+
+        async def unified():
+            for term in terms:
+                await search_unified(datasette, index.index_db, term, 20, visible)
+
+        best = {}
+        for name, workload in (("fan_out", fan_out), ("unified", unified)):
+            asyncio.run(workload())  # Warm connections and page cache
+            _, result = benchmark_recorder.measure(f"search_index.{name}", lambda: asyncio.run(workload()))
+            best[name] = result["best_s"]
+
+        print(f"\nsearch: fan-out {best['fan_out'] * 1000:.1f}ms, unified {best['unified'] * 1000:.1f}ms "
+              f"({best['fan_out'] / best['unified']:.2f}x)")
+        assert best["unified"] <= best["fan_out"] * benchmark_recorder.threshold + benchmark_recorder.min_delta
+        for name in best:
+            regression = benchmark_recorder.regression(f"search_index.{name}")
+            assert regression is None, regression
+
+    def test_suggest_latency(self, benchmark_recorder, bench_databases):
+        datasette = make_datasette(bench_databases)
+        index = get_index(datasette)
+        prefixes = [common_term(path)[:length] for path in bench_databases for length in (2, 3, 5)]
+
+        async def suggest():
+            for prefix in prefixes:
+                response = await datasette.client.get(f"/-/suggest.json?q={prefix}")
+                assert response.json()["source"] == "index"
+
+        def uncached():
+            index.cache.entries.clear()
+            asyncio.run(suggest())
+
+        uncached()
+        _, result = benchmark_recorder.measure("search_index.suggest", uncached)
+        per_request_ms = result["best_s"] * 1000 / len(prefixes)
+
+        print(f"\nsuggest: {per_request_ms:.2f}ms per uncached request")
+        assert per_request_ms < 10
+        regression = benchmark_recorder.regression("search_index.suggest")
+        assert regression is None, regression
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/sort_indexes.py and plugins/keyset_pages.py
+
+The benchmark walks deep into a large table sorted by date, in both
+directions, and times the _next pages with and without the sort indexes:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_sort_indexes.py --benchmark
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+from urllib.parse import urlencode
+
+import pytest
+from click.testing import CliRunner
+from datasette.app import Datasette
+
+from plugins.keyset_pages import get_keyset_pages
+from scripts import manage
+from scripts.bench import PROJECT_DIR
+from scripts.download_from_s3 import OPTIMIZE_MANIFEST_FILENAME, DatabaseOptimizer
+from scripts.sort_indexes import ensure_sort_indexes, index_name
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+# Rows skipped before the timed pages in the benchmark
+BENCH_DEPTH = 10_000
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    # Short bodies: over 10,000 rows, with only the summary too large to index
+    return create_database(tmp_path_factory.mktemp("sort") / "courts.db", size_mb=6, body_words=5, fts=False)
+
+
+@pytest.fixture
+def database(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("sort-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def make_datasette(database_file, metadata=None, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        settings={"suggest_facets": False},
+        # Without the query cache, so repeated requests run every time
+        metadata=dict(metadata or {}, plugins={"zeeker-keyset": config, "zeeker-query-cache": {"max_bytes": 0}}),
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def get(datasette, *paths):
+    async def fetch():
+        await datasette.invoke_startup()
+        return [await datasette.client.get(path) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+def table_path(**args):
+    return "/courts/documents.json?" + urlencode(dict({"_nocount": 1, "_nofacet": 1}, **args))
+
+
+def rows(database_file, sql):
+    conn = sqlite3.connect(database_file)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def index_keys(database_file, name):
+    return [(row[2], row[3]) for row in rows(database_file, f"PRAGMA index_xinfo('{name}')") if row[5]]
+
+
+def by_action(reports):
+    return {report["column"]: report["action"] for report in reports}
+
+
+class TestEnsureSortIndexes:
+    """Which columns get an index, and what it looks like"""
+
+    def test_builds_descending_indexes(self, database):
+        reports = ensure_sort_indexes(database, {}, "courts")
+        actions = by_action(reports)
+
+        assert actions == {"id": "skipped", "title": "built", "court": "built", "category": "built",
+                           "date": "built", "parties": "built", "summary": "skipped", "body": "built",
+                           "url": "built"}
+        reasons = {report["column"]: report.get("reason") for report in reports}
+        assert reasons["id"] == "rowid order"
+        assert reasons["summary"].startswith("values average")
+        assert index_keys(database, index_name("documents", "date")) == [("date", 1)]
+
+        plan = rows(database, "EXPLAIN QUERY PLAN SELECT id FROM documents WHERE (date < '2020' OR date IS NULL "
+                              "OR (date = '2020' AND id > 5)) ORDER BY date DESC, id LIMIT 101")
+        assert not any("TEMP B-TREE" in row[3] for row in plan)
+
+        assert set(by_action(ensure_sort_indexes(database, {}, "courts")).values()) == {"exists", "skipped"}
+
+    def test_uses_existing_ascending_index(self, database):
+        # As created by scripts/index_advisor.py for the same column
+        conn = sqlite3.connect(database)
+        conn.execute("CREATE INDEX idx_zeeker_documents_date ON documents (date)")
+        conn.close()
+
+        reports = ensure_sort_indexes(database, {}, "courts")
+
+        (date,) = [report for report in reports if report["column"] == "date"]
+        assert (date["action"], date["index"]) == ("exists", "idx_zeeker_documents_date")
+        assert not rows(database, f"SELECT name FROM sqlite_master WHERE name = '{index_name('documents', 'date')}'")
+        plan = rows(database, "EXPLAIN QUERY PLAN SELECT id FROM documents ORDER BY date DESC, id LIMIT 101")
+        assert "idx_zeeker_documents_date" in " ".join(row[3] for row in plan)
+
+    def test_metadata_and_small_tables(self, database):
+        metadata = {"databases": {"courts": {"tables": {"documents": {
+            "sortable_columns": ["date", "nope"], "sort_desc": "summary",
+        }}}}}
+
+        reports = ensure_sort_indexes(database, metadata, "courts")
+
+        assert by_action(reports) == {"date": "built", "nope": "skipped", "summary": "built"}
+        assert ensure_sort_indexes(database, {}, "courts", min_rows=1_000_000) == []
+
+    def test_compound_primary_key(self, tmp_path):
+        conn = sqlite3.connect(tmp_path / "notes.db")
+        conn.execute("CREATE TABLE notes (court TEXT, number INTEGER, note TEXT, PRIMARY KEY (court, number))")
+        conn.executemany("INSERT INTO notes VALUES (?, ?, ?)", [(f"c{i % 7}", i, f"n{i % 13}") for i in range(50)])
+        conn.commit()
+        conn.close()
+
+        reports = ensure_sort_indexes(tmp_path / "notes.db", {}, "notes", min_rows=0)
+
+        # The primary key's own index is led by court, with number to break ties
+        assert by_action(reports) == {"court": "exists", "number": "built", "note": "built"}
+        assert reports[0]["index"] == "sqlite_autoindex_notes_1"
+        # Datasette breaks ties on the primary key
+        assert index_keys(tmp_path / "notes.db", index_name("notes", "note")) == [
+            ("note", 1), ("court", 0), ("number", 0)]
+        assert index_keys(tmp_path / "notes.db", index_name("notes", "number")) == [("number", 1), ("court", 0)]
+
+    def test_optimizer_builds_sort_indexes(self, database, tmp_path):
+        live = tmp_path / "live" / "courts.db"
+        live.parent.mkdir()
+        optimizer = DatabaseOptimizer(tmp_path / OPTIMIZE_MANIFEST_FILENAME, metadata={}, sort_indexes=True)
+
+        assert optimizer.install(database, live) == "optimized"
+
+        assert index_keys(live, index_name("documents", "date")) == [("date", 1)]
+        assert optimizer.stats["sort_indexes_built"] == 7
+        assert index_name("documents", "date") in optimizer.entries["courts.db"]["indexes"]
+
+    def test_refresh_option(self):
+        option = next(param for param in manage.refresh.params if param.name == "sort_indexes")
+
+        assert option.envvar == "ZEEKER_SORT_INDEXES"
+        assert "--sort-indexes" in CliRunner().invoke(manage.refresh, ["--help"]).output
+
+
+class TestKeysetPages:
+    """Sorting limited to indexed columns, and pages in index order"""
+
+    def test_restricts_to_indexed_columns(self, database):
+        ensure_sort_indexes(database, {}, "courts")
+        datasette = make_datasette(database)
+
+        body, summary, date = get(datasette, table_path(_sort="body"), table_path(_sort="summary"),
+                                  table_path(_sort_desc="date"))
+
+        assert body.status_code == 200
+        assert summary.status_code != 200  # Datasette's own error for columns not in sortable_columns
+        assert "Cannot sort table by summary" in summary.json()["error"]
+        assert date.status_code == 200
+        assert "summary" not in get_keyset_pages(datasette).sortable["courts"]["documents"]
+        assert "id" in get_keyset_pages(datasette).sortable["courts"]["documents"]
+
+    def test_pages_follow_sort_order(self, database):
+        ensure_sort_indexes(database, {}, "courts")
+        datasette = make_datasette(database)
+        expected = [row[0] for row in rows(database, "SELECT id FROM documents ORDER BY date DESC, id LIMIT 250")]
+
+        seen, path = [], table_path(_sort_desc="date", _size=100, _shape="objects")
+        while len(seen) < 250:
+            (response,) = get(datasette, path)
+            data = response.json()
+            seen.extend(row["id"] for row in data["rows"])
+            path = table_path(_sort_desc="date", _size=100, _shape="objects", _next=data["next"])
+
+        assert seen[:250] == expected
+
+    def test_explicit_metadata_and_unindexed_tables(self, database):
+        (unindexed,) = get(make_datasette(database), table_path(_sort="summary"))
+
+        ensure_sort_indexes(database, {}, "courts")
+        metadata = {"databases": {"courts": {"tables": {"documents": {"sortable_columns": ["summary"]}}}}}
+        (explicit,) = get(make_datasette(database, metadata), table_path(_sort="summary"))
+        (unrestricted,) = get(make_datasette(database, restrict_sorts=False), table_path(_sort="summary"))
+        (small,) = get(make_datasette(database, min_rows=1_000_000), table_path(_sort="summary"))
+
+        assert [response.status_code for response in (unindexed, explicit, unrestricted, small)] == [200] * 4
+
+
+@pytest.mark.benchmark
+class TestSortIndexBenchmarks:
+    """Deep sorted pages with and without sort indexes"""
+
+    def test_deep_pages(self, benchmark_recorder, bench_database, tmp_path):
+        (tmp_path / "plain").mkdir()
+        (tmp_path / "indexed").mkdir()
+        plain = shutil.copy(bench_database, tmp_path / "plain" / "courts.db")
+        indexed = shutil.copy(bench_database, tmp_path / "indexed" / "courts.db")
+        ensure_sort_indexes(indexed, {}, "courts")
+
+        def deep_token(datasette, **sort):
+            # The _next token BENCH_DEPTH rows in, walked once per database
+            path = table_path(_size=1000, _shape="objects", **sort)
+            for _ in range(BENCH_DEPTH // 1000):
+                (response,) = get(datasette, path)
+                path = table_path(_size=1000, _shape="objects", _next=response.json()["next"], **sort)
+            return response.json()["next"]
+
+        best = {}
+        for name, database_file in (("plain", plain), ("indexed", indexed)):
+            datasette = make_datasette(database_file)
+            for direction, sort in (("asc", {"_sort": "date"}), ("desc", {"_sort_desc": "date"})):
+                token = deep_token(datasette, **sort)
+                paths = [table_path(_size=100, _next=token, **sort)] * 5
+
+                def pages():
+                    assert all(response.status_code == 200 for response in get(datasette, *paths))
+
+                _, result = benchmark_recorder.measure(f"sort_indexes.{name}.{direction}", pages, repeat=3)
+                best[name, direction] = result["best_s"] / len(paths)
+
+        for direction in ("asc", "desc"):
+            print(f"\n{direction} page {BENCH_DEPTH // 100 + 1}: without sort indexes "
+                  f"{best['plain', direction] * 1000:.1f}ms, with {best['indexed', direction] * 1000:.1f}ms "
+                  f"({best['plain', direction] / best['indexed', direction]:.2f}x)")
+            assert best["indexed", direction] < best["plain", direction]
+        for name, direction in best:
+            regression = benchmark_recorder.regression(f"sort_indexes.{name}.{direction}")
+            assert regression is None, regression
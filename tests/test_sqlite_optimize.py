@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/sqlite_optimize.py and the download optimization stage
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+
+from scripts.download_from_s3 import OPTIMIZE_MANIFEST_FILENAME, DatabaseOptimizer, ZeekerS3Downloader
+from scripts.sqlite_optimize import optimize_database
+from scripts.synthetic_data import create_database
+from tests.fake_s3 import FilesystemS3Client
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    path = create_database(tmp_path_factory.mktemp("optimize") / "courts.db", size_mb=0.1, fts=False)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE INDEX idx_documents_court ON documents (court)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def stat_tables(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT tbl FROM sqlite_stat1")}
+    finally:
+        conn.close()
+
+
+def page_size(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestOptimizeDatabase:
+    """ANALYZE, VACUUM and page size changes"""
+
+    def test_analyze(self, source_database, tmp_path):
+        path = shutil.copy(source_database, tmp_path / "courts.db")
+
+        timings = optimize_database(path)
+
+        assert set(timings) == {"analyze", "optimize"}
+        assert "documents" in stat_tables(path)
+
+    def test_page_size_implies_vacuum(self, source_database, tmp_path):
+        path = shutil.copy(source_database, tmp_path / "courts.db")
+
+        timings = optimize_database(path, page_size=8192)
+
+        assert "vacuum" in timings
+        assert page_size(path) == 8192
+
+    def test_invalid_page_size(self, source_database):
+        with pytest.raises(ValueError):
+            optimize_database(source_database, page_size=3000)
+
+
+class TestDatabaseOptimizer:
+    """Skipping unchanged sources and installing results"""
+
+    def test_unchanged_source_not_optimized_again(self, source_database, tmp_path):
+        live = tmp_path / "data" / "courts.db"
+        live.parent.mkdir()
+        manifest = tmp_path / "data" / OPTIMIZE_MANIFEST_FILENAME
+
+        optimizer = DatabaseOptimizer(manifest)
+        assert optimizer.prepare(shutil.copy(source_database, tmp_path / "staged.db"), live) == "optimized"
+        shutil.move(tmp_path / "staged.db", live)
+        optimizer.save({"courts.db"})
+
+        optimizer = DatabaseOptimizer(manifest)
+        staged = shutil.copy(source_database, tmp_path / "staged.db")
+        assert optimizer.prepare(staged, live) == "unchanged"
+        assert staged.read_bytes() == live.read_bytes()
+        assert optimizer.stats["databases_unchanged"] == 1
+
+        # Different settings optimize again
+        optimizer = DatabaseOptimizer(manifest, vacuum=True)
+        staged = shutil.copy(source_database, tmp_path / "staged.db")
+        assert optimizer.prepare(staged, live) == "optimized"
+
+    def test_install(self, source_database, tmp_path):
+        live = tmp_path / "courts.db"
+        optimizer = DatabaseOptimizer(tmp_path / OPTIMIZE_MANIFEST_FILENAME)
+
+        assert optimizer.install(shutil.copy(source_database, tmp_path / "a.download"), live) == "optimized"
+        assert optimizer.install(shutil.copy(source_database, tmp_path / "b.download"), live) == "unchanged"
+
+        assert "documents" in stat_tables(live)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["courts.db"]
+
+    def test_corrupt_file_installed_as_downloaded(self, tmp_path):
+        downloaded = tmp_path / "broken.download"
+        downloaded.write_bytes(b"not a database" * 100)
+        optimizer = DatabaseOptimizer(tmp_path / OPTIMIZE_MANIFEST_FILENAME)
+
+        assert optimizer.install(downloaded, tmp_path / "broken.db") == "failed"
+        assert (tmp_path / "broken.db").read_bytes() == b"not a database" * 100
+        assert optimizer.stats["optimize_failures"] == 1
+
+
+class TestDownloaderOptimization:
+    """download_complete_setup with ZEEKER_OPTIMIZE_DATABASES"""
+
+    def test_download_optimizes_once(self, source_database, tmp_path, isolated_metrics_snapshot):
+        fake_s3 = FilesystemS3Client(tmp_path / "s3")
+        fake_s3.seed("bucket", {
+            "latest/courts.db": source_database.read_bytes(),
+            "assets/default/metadata.json": b"{}",
+            "assets/default/templates/index.html": b"<html></html>",
+            "assets/default/static/css/zeeker-theme.css": b"body{}",
+        })
+        with patch.dict(os.environ, {"S3_BUCKET": "bucket", "ZEEKER_OPTIMIZE_DATABASES": "1"}):
+            downloader = ZeekerS3Downloader()
+            downloader.s3_client = fake_s3
+            for name in ("data", "templates", "static", "plugins"):
+                setattr(downloader, f"{name}_dir", tmp_path / name)
+            downloader.data_dir.mkdir()
+            downloader.metadata_file = tmp_path / "metadata.json"
+            downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+
+            assert downloader.download_complete_setup()
+            assert downloader.download_complete_setup()
+
+        live = downloader.data_dir / "courts.db"
+        assert "documents" in stat_tables(live)
+        assert not list(downloader.data_dir.glob(".*.download"))
+        manifest = json.loads((downloader.data_dir / OPTIMIZE_MANIFEST_FILENAME).read_text())
+        assert list(manifest["databases"]) == ["courts.db"]
+
+        last = json.loads(isolated_metrics_snapshot.read_text())["jobs"]["download"]["last"]
+        assert last["databases_optimized"] == 0
+        assert last["databases_unchanged"] == 1
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/sqlite_tuning.py
+
+The benchmarks compare table scans and FTS queries on a connection with
+SQLite's default pragmas against one with the plugin's settings:
+
+    ZEEKER_BENCH_DB_SIZE_MB=512 pytest tests/test_sqlite_tuning.py --benchmark
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.sqlite_tuning import DEFAULTS, PLUGIN_NAME, pragma_statements
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+
+@pytest.fixture(scope="module")
+def database_file(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("sqlite") / "courts.db", size_mb=0.1)
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    """ZEEKER_BENCH_DB_SIZE_MB database for the benchmarks, generated once"""
+    return create_database(tmp_path_factory.mktemp("sqlite-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def connection_pragmas(database_file, metadata, database="courts"):
+    datasette = Datasette(
+        immutables=[str(database_file)],
+        metadata=metadata,
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+    async def read():
+        db = datasette.get_database(database)
+        values = {}
+        for name in ("mmap_size", "cache_size", "temp_store", "cache_spill"):
+            values[name] = (await db.execute(f"PRAGMA {name}")).first()[0]
+        return values
+
+    return asyncio.run(read())
+
+
+class TestPragmaStatements:
+    """Validation of configured values"""
+
+    def test_defaults(self):
+        assert pragma_statements(DEFAULTS) == [
+            "PRAGMA mmap_size=268435456",
+            "PRAGMA cache_size=-65536",
+            "PRAGMA temp_store=MEMORY",
+        ]
+
+    def test_invalid_values_skipped(self, caplog):
+        config = {"mmap_size": "lots", "temp_store": "disk", "cache_spill": False, "journal": 1}
+
+        with caplog.at_level(logging.WARNING, logger="zeeker-sqlite"):
+            statements = pragma_statements(config, "courts")
+
+        assert statements == ["PRAGMA cache_spill=OFF"]
+        assert "mmap_size" in caplog.text
+        assert "temp_store" in caplog.text
+        assert "unknown setting journal" in caplog.text
+
+
+class TestPrepareConnection:
+    """Pragmas applied to Datasette's connections"""
+
+    def test_validated_once(self, database_file, caplog):
+        datasette = Datasette(
+            immutables=[str(database_file)],
+            metadata={"plugins": {PLUGIN_NAME: {"mmap_size": "lots"}}},
+            plugins_dir=str(PROJECT_DIR / "plugins"),
+        )
+
+        async def connect():
+            await datasette.invoke_startup()
+            db = datasette.get_database("courts")
+            # Connections on several executor threads
+            await asyncio.gather(*(db.execute("select 1") for _ in range(8)))
+            return (await db.execute("PRAGMA cache_size")).first()[0]
+
+        with caplog.at_level(logging.WARNING, logger="zeeker-sqlite"):
+            cache_size = asyncio.run(connect())
+
+        assert caplog.text.count("Ignoring mmap_size") == 1
+        assert cache_size == DEFAULTS["cache_size"]
+
+    def test_defaults_applied(self, database_file):
+        values = connection_pragmas(database_file, {})
+
+        assert values["mmap_size"] == DEFAULTS["mmap_size"]
+        assert values["cache_size"] == DEFAULTS["cache_size"]
+        assert values["temp_store"] == 2  # MEMORY
+
+    def test_database_config_overrides_global(self, database_file):
+        metadata = {
+            "plugins": {PLUGIN_NAME: {"mmap_size": 0, "cache_size": -1024}},
+            "databases": {"courts": {"plugins": {PLUGIN_NAME: {"cache_size": -4096, "temp_store": None}}}},
+        }
+
+        values = connection_pragmas(database_file, metadata)
+
+        assert values["mmap_size"] == 0
+        assert values["cache_size"] == -4096
+        assert values["temp_store"] == 0  # Left at SQLite's default
+
+
+@pytest.mark.benchmark
+class TestSqliteTuningBenchmarks:
+    """Default versus tuned pragmas on the same immutable file"""
+
+    @staticmethod
+    def connect(path, tuned):
+        conn = sqlite3.connect(f"file:{path}?immutable=1", uri=True)
+        if tuned:
+            for statement in pragma_statements(DEFAULTS):
+                conn.execute(statement)
+        return conn
+
+    @staticmethod
+    def fts_terms(conn):
+        titles = conn.execute("SELECT title FROM documents ORDER BY id LIMIT 20").fetchall()
+        return [title.split()[0].lower() for (title,) in titles]
+
+    def compare(self, benchmark_recorder, name, bench_database, workload):
+        best = {}
+        for variant in ("default", "tuned"):
+            conn = self.connect(bench_database, tuned=variant == "tuned")
+            try:
+                workload(conn)  # Warm the page cache (and map) once
+                _, result = benchmark_recorder.measure(
+                    f"sqlite_tuning.{name}.{variant}", lambda: workload(conn),
+                    nbytes=os.path.getsize(bench_database),
+                )
+            finally:
+                conn.close()
+            best[variant] = result["best_s"]
+
+        print(f"\n{name}: default {best['default'] * 1000:.1f}ms, tuned {best['tuned'] * 1000:.1f}ms "
+              f"({best['default'] / best['tuned']:.2f}x)")
+        assert best["tuned"] <= best["default"] * benchmark_recorder.threshold + benchmark_recorder.min_delta
+        for variant in best:
+            regression = benchmark_recorder.regression(f"sqlite_tuning.{name}.{variant}")
+            assert regression is None, regression
+
+    def test_table_scan(self, benchmark_recorder, bench_database):
+        def scan(conn):
+            return conn.execute("SELECT count(*), sum(length(body)) FROM documents").fetchone()
+
+        self.compare(benchmark_recorder, "table_scan", bench_database, scan)
+
+    def test_fts_queries(self, benchmark_recorder, bench_database):
+        conn = self.connect(bench_database, tuned=False)
+        terms = self.fts_terms(conn)
+        conn.close()
+
+        def search(conn):
+            for term in terms:
+                conn.execute(
+                    "SELECT d.id, d.title FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid "
+                    "WHERE documents_fts MATCH ? ORDER BY rank LIMIT 20",
+                    [term],
+                ).fetchall()
+
+        self.compare(benchmark_recorder, "fts", bench_database, search)
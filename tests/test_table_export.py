@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Tests for plugins/table_export.py
+
+The benchmark compares downloading a whole table by following _next links
+through /db/table.json with one streamed /-/export request:
+
+    ZEEKER_BENCH_DB_SIZE_MB=256 pytest tests/test_table_export.py --benchmark
+"""
+
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+from datasette.app import Datasette
+
+from plugins.table_export import ParquetEncoder, content_disposition, export_path, parquet_available
+from scripts.bench import PROJECT_DIR
+from scripts.synthetic_data import create_database
+
+BENCH_DB_SIZE_MB = float(os.environ.get("ZEEKER_BENCH_DB_SIZE_MB", 64))
+
+
+@pytest.fixture(scope="module")
+def source_database(tmp_path_factory):
+    path = create_database(tmp_path_factory.mktemp("export") / "courts.db", size_mb=0.2)
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE pairs (a TEXT, b INTEGER, data BLOB, score REAL, PRIMARY KEY (a, b)) WITHOUT ROWID;
+        CREATE TABLE notes (note TEXT, amount INTEGER);
+    """)
+    conn.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?)",
+                     [(f"k{i % 7}", i, bytes([i % 256]), i / 2) for i in range(250)])
+    conn.executemany("INSERT INTO notes VALUES (?, ?)", [(f"note {i}", i) for i in range(250)])
+    conn.execute("INSERT INTO notes VALUES ('typo', 'twelve')")  # Text in an INTEGER column
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def database_file(source_database, tmp_path):
+    return shutil.copy(source_database, tmp_path / "courts.db")
+
+
+@pytest.fixture(scope="module")
+def bench_database(tmp_path_factory):
+    return create_database(tmp_path_factory.mktemp("export-bench") / "courts.db", size_mb=BENCH_DB_SIZE_MB)
+
+
+def make_datasette(database_file, settings=None, **config):
+    return Datasette(
+        immutables=[str(database_file)],
+        settings=settings,
+        metadata={"plugins": {"zeeker-export": config}},
+        template_dir=str(PROJECT_DIR / "templates"),
+        plugins_dir=str(PROJECT_DIR / "plugins"),
+    )
+
+
+def get(datasette, *paths):
+    async def fetch():
+        return [await datasette.client.get(path) for path in paths]
+
+    return asyncio.run(fetch())
+
+
+def rows(database_file, sql):
+    conn = sqlite3.connect(database_file)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class TestExport:
+    """Whole tables in one streamed response"""
+
+    def test_csv_and_ndjson(self, database_file):
+        datasette = make_datasette(database_file, chunk_size=100)
+        expected = rows(database_file, "SELECT * FROM documents ORDER BY id")
+
+        as_csv, as_ndjson = get(datasette, export_path("courts", "documents", "csv"),
+                                export_path("courts", "documents", "ndjson"))
+
+        assert as_csv.headers["content-type"] == "text/csv; charset=utf-8"
+        assert as_csv.headers["content-disposition"] == (
+            'attachment; filename="documents.csv"; filename*=UTF-8\'\'documents.csv'
+        )
+        header, *records = list(csv.reader(io.StringIO(as_csv.text)))
+        assert header[:3] == ["id", "title", "court"]
+        assert [int(record[0]) for record in records] == [row[0] for row in expected]
+        lines = [json.loads(line) for line in as_ndjson.text.splitlines()]
+        assert [tuple(line.values()) for line in lines] == expected
+
+    def test_content_disposition(self):
+        assert content_disposition('a"b;c\\.csv') == (
+            'attachment; filename="a_b_c_.csv"; filename*=UTF-8\'\'a%22b%3Bc%5C.csv'
+        )
+        assert content_disposition("判决 2024.ndjson") == (
+            'attachment; filename="__ 2024.ndjson"; filename*=UTF-8\'\'%E5%88%A4%E5%86%B3%202024.ndjson'
+        )
+
+    def test_compound_key_and_rowid_tables(self, database_file):
+        datasette = make_datasette(database_file, chunk_size=30)
+
+        pairs, notes = get(datasette, export_path("courts", "pairs", "ndjson"), export_path("courts", "notes", "csv"))
+
+        exported = [json.loads(line) for line in pairs.text.splitlines()]
+        assert [(line["a"], line["b"]) for line in exported] == rows(database_file, "SELECT a, b FROM pairs ORDER BY a, b")
+        assert exported[1]["data"] == {"$base64": True, "encoded": "Bw=="}
+        assert len(list(csv.reader(io.StringIO(notes.text)))) == 252  # Header and every row
+
+    def test_streams_in_chunks(self, database_file):
+        datasette = make_datasette(database_file, chunk_size=100)
+        app = datasette.app()
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "raw_path": b"",
+                 "path": export_path("courts", "documents", "ndjson"), "query_string": b"", "headers": []}
+        asyncio.run(app(scope, receive, send))
+
+        bodies = [message for message in messages if message["type"] == "http.response.body"]
+        table_rows = len(rows(database_file, "SELECT id FROM documents"))
+        assert len(bodies) > table_rows // 100
+        assert max(len(body["body"].splitlines()) for body in bodies) <= 100
+
+    def test_missing_and_disabled(self, database_file):
+        datasette = make_datasette(database_file)
+        missing, bad_format = get(datasette, export_path("courts", "nope", "csv"), "/-/export/courts/documents.xml")
+        (disabled,) = get(make_datasette(database_file, {"allow_csv_stream": False}),
+                          export_path("courts", "documents", "csv"))
+
+        assert missing.status_code == 404
+        assert bad_format.status_code == 404
+        assert disabled.status_code == 403
+
+    def test_table_page_links(self, database_file, monkeypatch):
+        (page,) = get(make_datasette(database_file), "/courts/documents")
+        installed = parquet_available()
+        monkeypatch.setitem(sys.modules, "pyarrow", None)
+        (without_pyarrow,) = get(make_datasette(database_file), "/courts/documents")
+
+        assert "/-/export/courts/documents.ndjson" in page.text
+        assert ("/-/export/courts/documents.parquet" in page.text) == installed
+        assert "/-/export/courts/documents.ndjson" in without_pyarrow.text
+        assert "/-/export/courts/documents.parquet" not in without_pyarrow.text
+
+
+class TestParquet:
+    """Typed columns and row groups"""
+
+    def test_round_trip(self, database_file):
+        pq = pytest.importorskip("pyarrow.parquet")
+        datasette = make_datasette(database_file, chunk_size=40, row_group_rows=100)
+
+        pairs, notes = get(datasette, export_path("courts", "pairs", "parquet"),
+                           export_path("courts", "notes", "parquet"))
+
+        table = pq.read_table(io.BytesIO(pairs.content))
+        assert [str(field.type) for field in table.schema] == ["string", "int64", "binary", "double"]
+        assert table.num_rows == 250
+        assert pq.ParquetFile(io.BytesIO(pairs.content)).num_row_groups == 3
+        amounts = pq.read_table(io.BytesIO(notes.content)).column("amount").to_pylist()
+        assert amounts[:3] == [0, 1, 2]
+        assert amounts[-1] is None  # 'twelve' does not fit an int64 column
+
+    def test_encoder_buffers_row_groups(self):
+        pytest.importorskip("pyarrow")
+        encoder = ParquetEncoder(["n"], ["INTEGER"], row_group_rows=10)
+
+        assert encoder.encode([(i,) for i in range(5)]) == b""
+        assert encoder.encode([(i,) for i in range(5)]).startswith(b"PAR1")
+        assert encoder.finish().endswith(b"PAR1")
+
+
+@pytest.mark.benchmark
+class TestTableExportBenchmarks:
+    """_next crawling versus one streamed export"""
+
+    def test_full_table_download(self, benchmark_recorder, bench_database):
+        datasette = make_datasette(bench_database)
+        total = rows(bench_database, "SELECT count(*) FROM documents")[0][0]
+
+        async def crawl():
+            path, fetched = "/courts/documents.json?_size=max&_shape=objects", 0
+            while path:
+                data = (await datasette.client.get(path)).json()
+                fetched += len(data["rows"])
+                path = data["next_url"] and data["next_url"].replace("http://localhost", "")
+            assert fetched == total
+
+        async def export():
+            response = await datasette.client.get(export_path("courts", "documents", "ndjson"))
+            assert response.text.count("\n") == total
+
+        best = {}
+        for name, workload in (("crawl", crawl), ("export", export)):
+            asyncio.run(workload())  # Warm connections and page cache
+            _, result = benchmark_recorder.measure(f"table_export.{name}", lambda: asyncio.run(workload()), repeat=3)
+            best[name] = result["best_s"]
+
+        print(f"\nfull table ({total:,} rows): _next crawl {best['crawl'] * 1000:.0f}ms, "
+              f"export {best['export'] * 1000:.0f}ms ({best['crawl'] / best['export']:.2f}x)")
+        assert best["export"] < best["crawl"]
+        for name in best:
+            regression = benchmark_recorder.regression(f"table_export.{name}")
+            assert regression is None, regression
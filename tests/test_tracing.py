@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for scripts/tracing.py and the download timing spans
+"""
+
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from scripts import manage
+from scripts.download_from_s3 import S3TransferQueue, ZeekerS3Downloader
+from scripts.tracing import SpanTracer, format_summary, load_spans, summarize_spans
+from tests.fake_s3 import FilesystemS3Client
+
+
+class TestSpanTracer:
+    """Span nesting, status and output"""
+
+    def test_nesting_and_file_output(self, tmp_path):
+        tracer = SpanTracer(tmp_path / "trace.jsonl").start()
+        with tracer.span("root") as root:
+            with tracer.span("child", key="a") as child:
+                child.set(bytes=10)
+        tracer.close()
+
+        records = load_spans(tmp_path / "trace.jsonl")
+        assert [record["name"] for record in records] == ["child", "root"]
+        assert records[0]["parent_id"] == root.span_id
+        assert records[0]["attributes"] == {"key": "a", "bytes": 10}
+        assert records[1]["parent_id"] is None
+
+    def test_error_status(self):
+        tracer = SpanTracer()
+        with pytest.raises(ValueError):
+            with tracer.span("boom"):
+                raise ValueError("bad")
+
+        assert tracer.records[0]["status"] == "error"
+        assert tracer.records[0]["error"] == "ValueError: bad"
+
+    def test_parent_survives_transfer_queue(self):
+        tracer = SpanTracer()
+        queue = S3TransferQueue(max_workers=2)
+
+        def work():
+            with tracer.span("file"):
+                pass
+
+        with tracer.span("pass") as parent:
+            queue.submit("dest", work)
+            queue.join()
+        queue.shutdown()
+
+        file_span = next(record for record in tracer.records if record["name"] == "file")
+        assert file_span["parent_id"] == parent.span_id
+        assert file_span["thread"].startswith("s3-transfer")
+
+    def test_summary(self):
+        records = [
+            {"name": "root", "parent_id": None, "duration_ms": 100.0, "attributes": {}},
+            {"name": "s3.download_file", "parent_id": "r", "duration_ms": 60.0,
+             "attributes": {"key": "latest/a.db", "bytes": 1024}},
+            {"name": "s3.download_file", "parent_id": "r", "duration_ms": 20.0,
+             "status": "error", "attributes": {"key": "latest/b.db"}},
+        ]
+
+        downloads = next(group for group in summarize_spans(records) if group["name"] == "s3.download_file")
+        assert downloads["count"] == 2
+        assert downloads["errors"] == 1
+        assert downloads["total_ms"] == 80.0
+        assert downloads["bytes"] == 1024
+
+        table = format_summary(records, top=1)
+        assert "80%" in table
+        assert "latest/a.db" in table and "latest/b.db" not in table
+
+
+class TestDownloadSpans:
+    """download_complete_setup writes spans for passes, S3 calls and files"""
+
+    @pytest.fixture
+    def downloader(self, tmp_path):
+        fake_s3 = FilesystemS3Client(tmp_path / "s3")
+        fake_s3.seed("bucket", {
+            "latest/courts.db": b"x" * 1000,
+            "assets/default/metadata.json": b"{}",
+            "assets/default/templates/index.html": b"<html></html>",
+            "assets/default/static/css/zeeker-theme.css": b"body{}",
+            "assets/databases/courts/metadata.json": b'{"title": "Courts"}',
+        })
+        with patch.dict(os.environ, {"S3_BUCKET": "bucket"}):
+            downloader = ZeekerS3Downloader()
+        downloader.s3_client = fake_s3
+        for name in ("data", "templates", "static", "plugins"):
+            setattr(downloader, f"{name}_dir", tmp_path / name)
+        downloader.data_dir.mkdir()
+        downloader.metadata_file = tmp_path / "metadata.json"
+        downloader.asset_manifest_file = tmp_path / ".asset-manifest.json"
+        return downloader
+
+    def test_spans_written(self, downloader, isolated_trace_file):
+        assert downloader.download_complete_setup()
+
+        records = load_spans(isolated_trace_file)
+        names = {record["name"] for record in records}
+        assert {
+            "download_complete_setup", "pass1.database_files", "pass2.base_assets",
+            "pass3.customizations", "transfers.drain", "metadata.merge",
+            "s3.list", "s3.download_file", "s3.get_object",
+        } <= names
+
+        root = next(record for record in records if record["name"] == "download_complete_setup")
+        db_file = next(record for record in records if record["attributes"].get("key") == "latest/courts.db")
+        assert db_file["attributes"]["bytes"] == 1000
+        assert root["attributes"]["success"] is True
+        assert all(record["trace_id"] == root["trace_id"] for record in records)
+
+    def test_unwritable_trace_file(self, downloader, tmp_path, monkeypatch):
+        (tmp_path / "not-a-dir").write_text("")
+        monkeypatch.setenv("ZEEKER_TRACE_FILE", str(tmp_path / "not-a-dir" / "trace.jsonl"))
+
+        assert downloader.download_complete_setup()
+        assert any(record["name"] == "pass1.database_files" for record in downloader._tracer.records)
+
+    def test_trace_summary_command(self, downloader, isolated_trace_file):
+        downloader.download_complete_setup()
+
+        result = CliRunner().invoke(manage.trace_summary, ["--top", "3"])
+        assert result.exit_code == 0, result.output
+        assert "pass1.database_files" in result.output
+        assert "Slowest 3 spans" in result.output
+
+        result = CliRunner().invoke(manage.trace_summary, ["--json"])
+        assert any(group["name"] == "s3.download_file" for group in json.loads(result.output))
+
+    def test_trace_summary_missing_file(self, tmp_path):
+        result = CliRunner().invoke(manage.trace_summary, [str(tmp_path / "missing.jsonl")])
+
+        assert result.exit_code != 0
+        assert "No trace file found" in result.output